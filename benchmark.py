@@ -0,0 +1,1451 @@
+import os
+import sys
+import time
+import zlib
+import random
+import logging
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests'))
+
+import fake_excel  # noqa: E402
+
+# Benchmarks des moniteurs contre le faux modèle objet Excel (tests/fake_excel.py).
+# Usage : python benchmark.py [scénario ...] ; tests : python -m pytest
+
+fake_excel.install()
+
+
+def legacy_get_vba_components(wb):
+    """Boucle d'origine de get_vba_components : lecture complète à chaque cycle"""
+    components = {}
+    for comp in wb.VBProject.VBComponents:
+        if comp.Type == 100:
+            continue
+        count = comp.CodeModule.CountOfLines
+        code = ''
+        if count > 0:
+            code = comp.CodeModule.Lines(1, count)
+        components[comp.Name] = {
+            'type': comp.Type,
+            'code': code
+        }
+        logging.debug(f"Composant trouvé: {comp.Name} (Type: {comp.Type})")
+    return components
+
+
+class SimulatedClock:
+    """Horloge avancée à la main : un poll toutes les step secondes simulées"""
+
+    def __init__(self, step=0.5):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        return self.now
+
+    def tick(self):
+        self.now += self.step
+
+
+def make_vba_monitor(workdir, wb, origins=None, clock=time.monotonic):
+    from vba_monitor import ExcelVBAMonitor
+    monitor = ExcelVBAMonitor(os.path.join(workdir, wb.Name), origins=origins, clock=clock)
+    monitor.wb = wb
+    return monitor
+
+
+def bench_com_calls(modules=200, polls=5):
+    """Allers-retours COM par cycle : lecture complète contre empreinte"""
+    with tempfile.TemporaryDirectory() as workdir:
+        wb, counter = fake_excel.build_workbook(os.path.join(workdir, 'bench.xlsm'), modules)
+
+        legacy_get_vba_components(wb)
+        legacy, legacy_chars = counter.calls, counter.chars
+        counter.reset()
+
+        # Poll de secours toutes les 0,5 s (temps simulé)
+        clock = SimulatedClock(0.5)
+        monitor = make_vba_monitor(workdir, wb, clock=clock)
+        monitor.previous_components = monitor.forget_code(monitor.get_vba_components())
+        first = counter.calls
+        counter.reset()
+        for _ in range(polls):
+            clock.tick()
+            monitor.previous_components = monitor.forget_code(monitor.get_vba_components())
+        steady = counter.calls / polls
+        steady_chars = counter.chars / polls
+        lines_calls = counter.by_member.get('FakeCodeModule.Lines', 0) / polls
+
+        # Une modification d'une ligne dans un module
+        module = wb.VBProject.VBComponents('Module1').CodeModule
+        module.set_text(module.text().replace('Debug.Print 0 + 0', 'Debug.Print 0 + 42'))
+        original = monitor.previous_components['Module1']['hash']
+        cycles = 0
+        while cycles < modules:
+            cycles += 1
+            clock.tick()
+            current = monitor.get_vba_components()
+            if current['Module1']['hash'] != original:
+                break
+            monitor.previous_components = monitor.forget_code(current)
+
+    print(f"com_calls ({modules} modules)")
+    print(f"  avant (lecture complète)   : {legacy} appels/cycle, {legacy_chars} caractères transférés")
+    print(f"  après, premier cycle       : {first} appels")
+    print(f"  après, régime permanent    : {steady:.0f} appels/cycle dont {lines_calls:.0f} Lines, "
+          f"{steady_chars:.0f} caractères transférés")
+    print(f"  modification à nb de lignes constant détectée en {cycles} cycle(s), "
+          f"{cycles * clock.step:.1f} s (borne {monitor.staleness:.0f} s)")
+
+
+def bench_offline(modules=200, latency=0.0002, polls=5):
+    """Lecture hors-ligne de xl/vbaProject.bin (vba_extractor.py) contre le
+    parcours COM de VBComponents, sur le même projet de modules"""
+    from vba_extractor import VBAProjectReader
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'offline.xlsm')
+        wb, counter = fake_excel.build_workbook(path, modules, counter=fake_excel.ComCallCounter(latency))
+        components = legacy_get_vba_components(wb)
+        fake_excel.write_xlsm(path, components)
+        com_calls = counter.calls
+        counter.reset()
+        start = time.perf_counter()
+        legacy_get_vba_components(wb)
+        com_time = time.perf_counter() - start
+
+        clock = SimulatedClock(0.5)
+        monitor = make_vba_monitor(workdir, wb, clock=clock)
+        monitor.previous_components = monitor.forget_code(monitor.get_vba_components())
+        counter.reset()
+        start = time.perf_counter()
+        for _ in range(polls):
+            clock.tick()
+            monitor.previous_components = monitor.forget_code(monitor.get_vba_components())
+        fingerprint_time = (time.perf_counter() - start) / polls
+        fingerprint_calls = counter.calls / polls
+
+        reader = VBAProjectReader(path)
+        start = time.perf_counter()
+        extracted = reader.get_vba_components()
+        cold = time.perf_counter() - start
+        assert extracted == components
+        start = time.perf_counter()
+        for _ in range(polls):
+            reader.get_vba_components()
+        cached = (time.perf_counter() - start) / polls
+
+        # Classeur réenregistré, projet VBA identique : seule l'entrée du zip est relue
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        start = time.perf_counter()
+        reader.get_vba_components()
+        resaved = time.perf_counter() - start
+
+        components['Module1'] = {'type': 1, 'code': components['Module1']['code'] + "\r\n' modifié"}
+        fake_excel.write_xlsm(path, components)
+        start = time.perf_counter()
+        changed = reader.get_vba_components()
+        reparsed = time.perf_counter() - start
+        assert changed['Module1']['code'].endswith("' modifié")
+
+    print(f"offline ({modules} modules, latence COM simulée {latency * 1000:.1f} ms)")
+    print(f"  COM, lecture complète      : {com_time * 1000:7.1f} ms, {com_calls} appels")
+    print(f"  COM, empreintes            : {fingerprint_time * 1000:7.1f} ms/cycle, {fingerprint_calls:.0f} appels")
+    print(f"  hors-ligne, première passe : {cold * 1000:7.1f} ms, 0 appel")
+    print(f"  hors-ligne, inchangé       : {cached * 1000:7.3f} ms (stat seule)")
+    print(f"  hors-ligne, réenregistré   : {resaved * 1000:7.3f} ms (CRC de l'entrée inchangé)")
+    print(f"  hors-ligne, module modifié : {reparsed * 1000:7.1f} ms (projet relu)")
+
+
+def bench_events(scale=0.001, idle_hours=1.0):
+    """Latence événement -> scan et nombre de scans à vide, temps réduit d'un facteur 1/scale"""
+    from scheduler import AdaptiveScheduler, ExcelApplicationEvents
+
+    with tempfile.TemporaryDirectory() as workdir:
+        wb, counter = fake_excel.build_workbook(os.path.join(workdir, 'bench.xlsm'), 1)
+        scheduler = AdaptiveScheduler(min_interval=0.5 * scale, max_interval=60 * scale)
+        source = fake_excel.FakeEventSource(ExcelApplicationEvents, scheduler=scheduler,
+                                            workbook_path=wb.FullName)
+
+        # Poll à vide pendant l'équivalent d'une heure
+        end = time.monotonic() + 3600 * idle_hours * scale
+        while time.monotonic() < end:
+            scheduler.wait()
+            scheduler.record_activity(False)
+        idle_scans = scheduler.wakeups
+
+        # Latence d'un enregistrement pendant que l'ordonnanceur est au ralenti
+        scheduler.interval = scheduler.max_interval = 10.0
+        latencies = []
+        for _ in range(20):
+            fired = []
+            timer = threading.Timer(0.01, lambda: (fired.append(time.perf_counter()),
+                                                   source.fire('WorkbookAfterSave', wb, True)))
+            timer.start()
+            wakeup = scheduler.wait()
+            latencies.append(time.perf_counter() - fired[0])
+            timer.join()
+
+    fixed_scans = int(3600 * idle_hours / 10)
+    print(f"events (ralenti ×{1 / scale:.0f})")
+    print(f"  scans à vide sur {idle_hours:g} h : {idle_scans} (poll fixe 10 s : {fixed_scans})")
+    print(f"  latence événement -> scan : max {max(latencies) * 1000:.2f} ms ({wakeup.reason})")
+
+
+def bench_watch_burst(files=20, events_per_save=4):
+    """Rejoue une rafale d'événements watchdog et compte les imports résultants"""
+    from import_queue import DebouncedImportQueue
+
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = [os.path.join(workdir, f"Module{index}.bas") for index in range(files)]
+        for path in paths:
+            with open(path, 'w') as f:
+                f.write('Attribute VB_Name = "x"\r\n')
+        imported = []
+        queue = DebouncedImportQueue(lambda batch: imported.append(list(batch)), quiet_period=0.05)
+        queue.prime(paths)
+        queue.start()
+
+        # Chaque enregistrement émet plusieurs modified/created ; la moitié des
+        # fichiers est réellement modifiée, l'autre seulement réenregistrée
+        for index, path in enumerate(paths):
+            if index % 2 == 0:
+                with open(path, 'a') as f:
+                    f.write("' modification\r\n")
+            for _ in range(events_per_save):
+                queue.submit(path)
+        time.sleep(0.2)
+        queue.stop()
+
+    print(f"watch_burst ({files} fichiers, {events_per_save} événements par enregistrement)")
+    print(f"  événements bruts            : {queue.events} (imports sans file : {queue.events})")
+    print(f"  passes d'import             : {len(imported)}")
+    print(f"  imports                     : {queue.imports} (attendu : {files // 2 + files % 2})")
+    print(f"  enregistrements sans effet  : {queue.skipped}")
+
+
+def bench_echo(modules=20, edits=5):
+    """Export Excel -> disque puis import disque -> Excel sur le même dossier :
+    compte les réimports et réexports provoqués par les échos"""
+    from import_queue import DebouncedImportQueue
+    from origin_index import OriginIndex
+    from vba_importer import import_vba_component
+
+    with tempfile.TemporaryDirectory() as workdir:
+        wb, counter = fake_excel.build_workbook(os.path.join(workdir, 'bench.xlsm'), modules)
+        origins = OriginIndex()
+        monitor = make_vba_monitor(workdir, wb, origins)
+        exports = []
+        export_component = monitor.export_component
+        monitor.export_component = lambda *args: exports.append(args[0]) or export_component(*args)
+        imports = []
+        queue = DebouncedImportQueue(
+            lambda paths: [path for path in paths if import_vba_component(wb, path, origins) and not imports.append(path)],
+            origins=origins)
+
+        def poll():
+            current = monitor.get_vba_components()
+            monitor.handle_component_changes(current)
+            monitor.previous_components = monitor.forget_code(current)
+
+        def drain(paths):
+            # Équivalent synchrone du thread de la file pour chaque événement watchdog
+            changed = queue._changed(paths)
+            for path in queue.apply_batch(sorted(changed)):
+                queue.digests[path] = changed[path]
+
+        poll()
+        initial_exports = len(exports)
+        exported_files = [os.path.join(monitor.export_path, f) for f in sorted(os.listdir(monitor.export_path))
+                          if f.endswith('.bas')]
+        drain(exported_files)
+        echo_imports = len(imports)
+
+        # L'utilisateur modifie quelques fichiers ; le moniteur VBA voit les imports
+        del exports[:]
+        for path in exported_files[:edits]:
+            with open(path, 'a', encoding='utf-8', newline='') as f:
+                f.write("\r\n' modifié sur disque")
+        drain(exported_files)
+        monitor.verify_all = True
+        poll()
+        poll()
+
+    print(f"echo ({modules} modules, {edits} fichiers modifiés)")
+    print(f"  exports initiaux                  : {initial_exports}")
+    print(f"  réimports de ces exports          : {echo_imports} (échos écartés : {queue.echoes})")
+    print(f"  imports des fichiers modifiés     : {len(imports)}")
+    print(f"  réexports déclenchés par ces imports : {len(exports)}")
+
+
+def bench_patch(lines=5000, edits=(1, 10, 100)):
+    """Appels COM pour une édition dans un gros module : patch par hunks contre Remove + Import"""
+    from vba_importer import VBAPatcher, import_vba_component
+
+    print(f"patch (module de {lines} lignes)")
+    with tempfile.TemporaryDirectory() as workdir:
+        for count in edits:
+            results = {}
+            for mode in ('patch', 'import'):
+                wb, counter = fake_excel.build_workbook(os.path.join(workdir, 'bench.xlsm'), 1, lines)
+                component = wb.VBProject.VBComponents('Module1')
+                path = os.path.join(workdir, 'Module1.bas')
+                component.Export(path)
+                patcher = VBAPatcher()
+                patcher.prime([path])
+                with open(path, encoding='utf-8', newline='') as f:
+                    text = f.read().split('\r\n')
+                for index in range(count):
+                    line = 10 + index * (lines // max(count, 1))
+                    text[line] = text[line] + "  ' modifié"
+                with open(path, 'w', encoding='utf-8', newline='') as f:
+                    f.write('\r\n'.join(text))
+                counter.reset()
+                if mode == 'patch':
+                    patcher.apply(wb, path)
+                else:
+                    import_vba_component(wb, path)
+                calls, chars = counter.calls, counter.chars
+                expected = '\r\n'.join(text[1:])
+                ok = wb.VBProject.VBComponents('Module1').CodeModule.text() == expected
+                results[mode] = (calls, chars, ok)
+            patch_calls, patch_chars, patch_ok = results['patch']
+            import_calls, _, _ = results['import']
+            print(f"  {count:>3} ligne(s) modifiée(s) : patch {patch_calls} appels COM, "
+                  f"{patch_chars} caractères transférés (résultat {'identique' if patch_ok else 'DIFFÉRENT'}) ; "
+                  f"Remove+Import {import_calls} appels dont un Import complet de {lines} lignes")
+
+
+def bench_writer(modules=50, queries=200):
+    """Octets écrits par un réexport complet et par la sauvegarde de sortie
+    quand rien n'a changé depuis le dernier cycle"""
+    from export_manifest import ExportManifest
+    from export_writer import ExportWriter
+
+    with tempfile.TemporaryDirectory() as workdir:
+        wb, counter = fake_excel.build_workbook(os.path.join(workdir, 'bench.xlsm'), modules)
+        monitor = make_vba_monitor(workdir, wb)
+        current = monitor.get_vba_components()
+        monitor.handle_component_changes(current)
+        first = dict(monitor.writer.totals)
+        monitor.previous_components = monitor.forget_code(current)
+        monitor.handle_component_changes(monitor.get_vba_components(), force_export=True)
+        forced = {key: monitor.writer.totals[key] - first.get(key, 0) for key in first}
+
+        writer = ExportWriter(ExportManifest(os.path.join(workdir, 'queries')).load())
+        texts = {f"Requête{i}.m": fake_excel.synthetic_module(i, 40) for i in range(queries)}
+        for rel, text in texts.items():
+            writer.write_text(rel, text)
+        initial = writer.flush()
+        for rel, text in texts.items():
+            writer.write_text(rel, text)
+        exit_stats = writer.flush()
+
+    print(f"writer ({modules} modules, {queries} requêtes)")
+    print(f"  export initial VBA           : {first['files_written']} fichiers, {first['bytes_written']} octets")
+    print(f"  réexport forcé sans changement : {forced['files_written']} écrit(s), "
+          f"{forced['bytes_written']} octets ({forced['files_skipped']} inchangés)")
+    print(f"  requêtes, premier cycle      : {initial['files_written']} fichiers, {initial['bytes_written']} octets")
+    print(f"  requêtes, sauvegarde de sortie : {exit_stats['files_written']} écrit(s), "
+          f"{exit_stats['bytes_written']} octets ({exit_stats['files_skipped']} inchangés)")
+
+
+def bench_connections(files=3000, polls=10):
+    """Miroir du dossier de connexions : fichiers ouverts par passe en régime
+    permanent, contre la copie complète (deux fois) de l'ancien get_power_queries"""
+    import builtins
+    import shutil
+    from connections_mirror import ConnectionsMirror
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, 'bench_Connections')
+        target = os.path.join(workdir, 'powerquery_export', 'Connections')
+        os.makedirs(source)
+        for i in range(files):
+            with open(os.path.join(source, f"connexion{i}.json"), 'w', encoding='utf-8') as f:
+                f.write('{"name": "connexion%d", "connectionString": "%s"}' % (i, 'x' * 200))
+
+        start = time.perf_counter()
+        for _ in range(2):
+            for file in os.listdir(source):
+                shutil.copy2(os.path.join(source, file), os.path.join(workdir, file))
+        legacy = time.perf_counter() - start
+
+        mirror = ConnectionsMirror(lambda: source, target, fsync=False)
+        start = time.perf_counter()
+        mirror.scan()
+        initial = time.perf_counter() - start
+        initial_read = mirror.stats['bytes_read']
+
+        opened = []
+        real_open = builtins.open
+        builtins.open = lambda *args, **kwargs: opened.append(args[0]) or real_open(*args, **kwargs)
+        try:
+            start = time.perf_counter()
+            for _ in range(polls):
+                mirror.scan()
+            steady = (time.perf_counter() - start) / polls
+        finally:
+            builtins.open = real_open
+        steady_read = mirror.stats['bytes_read'] - initial_read
+
+        # Quelques modifications et suppressions côté source
+        for i in range(3):
+            with open(os.path.join(source, f"connexion{i}.json"), 'a', encoding='utf-8') as f:
+                f.write(' ')
+        for i in range(3, 5):
+            os.remove(os.path.join(source, f"connexion{i}.json"))
+        touched = mirror.scan()
+        in_sync = sorted(os.listdir(source)) == sorted(f for f in os.listdir(target) if f.endswith('.json') and not f.startswith('.'))
+
+    print(f"connections ({files} fichiers)")
+    print(f"  ancienne copie (2 × copy2 par cycle) : {legacy * 1000:.0f} ms/cycle")
+    print(f"  miroir, première passe       : {initial * 1000:.0f} ms, {initial_read} octets lus")
+    print(f"  miroir, régime permanent     : {steady * 1000:.1f} ms/passe, {len(opened)} fichier(s) ouvert(s), "
+          f"{steady_read} octets lus")
+    print(f"  3 modifiés + 2 supprimés     : {touched} opération(s), dossiers {'identiques' if in_sync else 'DIFFÉRENTS'}")
+
+
+def bench_git(files=2000, legacy_files=20, rounds=20, edits_per_round=50):
+    """Débit du committer git groupé contre un git add + git commit par fichier"""
+    import subprocess
+    from git_committer import GitCommitter
+
+    def write(path, text):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        git = ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@localhost']
+        subprocess.run(['git', 'init', '-q', workdir], check=True)
+        export = os.path.join(workdir, 'macros_export')
+        os.makedirs(export)
+
+        start = time.perf_counter()
+        for i in range(legacy_files):
+            name = f"Ancien{i}.bas"
+            write(os.path.join(export, name), fake_excel.synthetic_module(i, 40))
+            subprocess.run(git + ['add', os.path.join('macros_export', name)], cwd=workdir, check=True)
+            subprocess.run(git + ['commit', '-q', '-m', name], cwd=workdir, check=True)
+        legacy = (time.perf_counter() - start) / legacy_files
+
+        committer = GitCommitter(workdir, quiet_period=0.05, max_batch=500).start()
+        paths = [os.path.join(export, f"Module{i}.bas") for i in range(files)]
+        for i, path in enumerate(paths):
+            write(path, fake_excel.synthetic_module(i, 40))
+        start = time.perf_counter()
+        committer.submit(paths)
+        committer.stop()
+        initial = time.perf_counter() - start
+        initial_commits = committer.commits
+
+        # Rafales d'éditions : chaque cycle de surveillance soumet ses fichiers
+        committer.start()
+        start = time.perf_counter()
+        for round in range(rounds):
+            batch = paths[round * edits_per_round:(round + 1) * edits_per_round]
+            for path in batch:
+                with open(path, 'a', encoding='utf-8', newline='') as f:
+                    f.write(f"\r\n' édition {round}")
+            removed = []
+            if round < legacy_files:
+                removed.append(os.path.join(export, f"Ancien{round}.bas"))
+                os.remove(removed[0])
+            committer.submit(batch, removed)
+            time.sleep(0.01)
+        committer.stop()
+        bursts = time.perf_counter() - start
+        burst_commits = committer.commits - initial_commits
+        status = subprocess.run(['git', 'status', '--porcelain', '--', 'macros_export'], cwd=workdir,
+                                stdout=subprocess.PIPE, check=True).stdout.decode().split('\n')
+        subject = subprocess.run(['git', 'log', '-1', '--format=%s'], cwd=workdir,
+                                 stdout=subprocess.PIPE, check=True).stdout.decode().strip()
+
+    print(f"git ({files} fichiers)")
+    print(f"  git add + commit par fichier : {legacy * 1000:.0f} ms/fichier")
+    print(f"  committer, {files} fichiers     : {initial:.2f}s en {initial_commits} commit(s), "
+          f"{files / initial:.0f} fichiers/s")
+    print(f"  {rounds} rafales de {edits_per_round} éditions : {burst_commits} commit(s) en {bursts:.2f}s")
+    print(f"  dernier message              : {subject}")
+    print(f"  état de l'arbre              : {'propre' if not any(status) else 'MODIFIÉ'}")
+
+
+def bench_daemon(small=29, huge_cost=8.0, small_cost=0.2, minutes=30):
+    """Simulation (horloge virtuelle) d'un worker partagé entre un très gros
+    classeur prioritaire, actif en permanence, et des petits classeurs"""
+    from scheduler import SharedScheduler
+
+    def simulate(duty_cycle):
+        scheduler = SharedScheduler(duty_cycle=duty_cycle, aging=30.0, clock=lambda: 0.0)
+        scheduler.register('gros', priority=1, min_interval=1.0, max_interval=60.0)
+        keys = ['gros'] + [f"petit{i}" for i in range(small)]
+        for key in keys[1:]:
+            scheduler.register(key, min_interval=1.0, max_interval=10.0)
+        now, busy, next_event = 0.0, 0.0, 0.0
+        while now < minutes * 60:
+            if now >= next_event:
+                # Le gros classeur émet un événement par seconde
+                scheduler.notify('gros', 'WorkbookAfterSave')
+                next_event = now + 1.0
+            key, result = scheduler.pick(keys, now)
+            if key is None:
+                now = min(result, next_event)
+                continue
+            cost = huge_cost if key == 'gros' else small_cost
+            now += cost
+            if key == 'gros':
+                busy += cost
+            scheduler.done(key, key == 'gros', cost, now)
+        slots = scheduler.slots
+        return (max(slots[key].max_wait for key in keys[1:]), min(slots[key].scans for key in keys[1:]),
+                busy / now)
+
+    print(f"daemon (1 worker, 1 gros classeur de {huge_cost:.0f} s/scan + {small} petits, {minutes} min simulées)")
+    for label, duty_cycle in (("sans contre-pression", 1.0), ("contre-pression 25 %", 0.25)):
+        max_wait, min_scans, share = simulate(duty_cycle)
+        print(f"  {label:<22}: attente max d'un petit classeur {max_wait:.1f} s, "
+              f"{min_scans} scans minimum, gros classeur {share:.0%} du worker")
+
+
+def bench_engine(modules=50, queries=30, polls=20):
+    """Moniteurs VBA et Power Query séparés contre le moteur unifié : classeurs
+    ouverts, ordonnanceurs et appels COM par passe"""
+    from engine import ExtractionEngine
+    from powerquery_monitor import PowerQueryMonitor
+    from scheduler import POWERQUERY, VBA, Wakeup
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'bench.xlsm')
+        wb, counter = fake_excel.build_workbook(path, modules, queries=queries)
+        vba = make_vba_monitor(workdir, wb)
+        powerquery = PowerQueryMonitor(path, mirror_connections=False)
+        powerquery.wb = wb
+        vba.start_session()
+        powerquery.start_session()
+        counter.reset()
+        for _ in range(polls):
+            vba.poll()
+            powerquery.poll()
+        separate = counter.calls / polls
+
+        wb, counter = fake_excel.build_workbook(path, modules, queries=queries)
+        engine = ExtractionEngine(path, targets=(VBA, POWERQUERY), export_root=os.path.join(workdir, 'moteur'))
+        engine.attach(None, wb)
+        counter.reset()
+        for _ in range(polls):
+            engine.tick()
+        unified = counter.calls / polls
+
+        # Réveil par un événement VBE : seul l'extracteur VBA relève son instantané
+        counter.reset()
+        for _ in range(polls):
+            engine.tick(Wakeup('VBComponent modifié', {VBA}))
+        targeted = counter.calls / polls
+
+        # Une modification de chaque type dans la même passe ; fichiers réellement écrits par les writers
+        writers = [extractor.monitor.writer for extractor in engine.extractors]
+        before = [writer.totals['files_written'] for writer in writers]
+        wb.Queries.add('Requête1', fake_excel.synthetic_query(99))
+        module = wb.VBProject.VBComponents('Module1').CodeModule
+        module.set_text(module.text() + "\r\n' modifié")
+        changed = engine.tick()
+        written = [writer.totals['files_written'] - count for writer, count in zip(writers, before)]
+
+    print(f"engine ({modules} modules, {queries} requêtes)")
+    print(f"  moniteurs séparés : 2 ouvertures du classeur, 2 ordonnanceurs, {separate:.0f} appels COM/cycle")
+    print(f"  moteur unifié     : 1 ouverture, 1 ordonnanceur, {unified:.0f} appels COM/passe complète "
+          f"(pas de relevé partagé entre VBA et Power Query), {targeted:.0f} pour une passe ciblée VBA")
+    print(f"  passe avec une requête et un module modifiés : changement {'détecté' if changed else 'NON détecté'}, "
+          f"{written[0]} fichier(s) VBA et {written[1]} requête(s) écrits")
+
+
+def bench_metrics(modules=200, polls=50):
+    """Coût de l'instrumentation désactivée et activée sur un cycle VBA, et
+    lecture du point d'accès /metrics"""
+    import json
+    import urllib.request
+    from metrics import METRICS, serve_metrics
+
+    with tempfile.TemporaryDirectory() as workdir:
+        wb, counter = fake_excel.build_workbook(os.path.join(workdir, 'bench.xlsm'), modules)
+        monitor = make_vba_monitor(workdir, wb)
+        monitor.start_session()
+        timings = {}
+        for enabled in (False, True, False, True):
+            METRICS.enabled = enabled
+            start = time.perf_counter()
+            for _ in range(polls):
+                monitor.poll()
+            timings[enabled] = (time.perf_counter() - start) / polls
+
+        start = time.perf_counter()
+        null_timers = 100000
+        METRICS.enabled = False
+        for _ in range(null_timers):
+            with METRICS.timer('x'):
+                pass
+        null_cost = (time.perf_counter() - start) / null_timers
+
+        METRICS.enabled = True
+        server = serve_metrics(METRICS, 0)
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            exposition = response.read().decode('utf-8').splitlines()
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats.json") as response:
+            last_cycle = json.loads(response.read())['last_cycle']
+        server.shutdown()
+        METRICS.enabled = False
+
+    print(f"metrics ({modules} modules)")
+    print(f"  cycle VBA, mesures désactivées : {timings[False] * 1000:.2f} ms ; activées : {timings[True] * 1000:.2f} ms")
+    print(f"  timer() désactivé              : {null_cost * 1e9:.0f} ns par frontière")
+    print(f"  /metrics                       : {len(exposition)} lignes, dernier cycle : "
+          + ", ".join(f"{name} ×{data['count']}" for name, data in last_cycle.items()))
+
+
+def bench_logging(records=2000, write_latency=0.002, polls=500, queries=40):
+    """Latence d'un appel de journalisation sur le thread de surveillance quand
+    le disque est lent (écriture synchrone ou file + QueueListener), et
+    messages répétés à chaque cycle retenus par RepeatFilter"""
+    import queue
+    import logging.handlers
+    from log_setup import JsonFormatter, NonBlockingQueueHandler, RepeatFilter
+
+    class SlowHandler(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.lines = []
+
+        def emit(self, record):
+            time.sleep(write_latency)
+            self.lines.append(self.format(record))
+
+    def run(logger, count, message):
+        worst = 0.0
+        start = time.perf_counter()
+        for i in range(count):
+            t = time.perf_counter()
+            logger.info(message(i))
+            worst = max(worst, time.perf_counter() - t)
+        return (time.perf_counter() - start) / count, worst
+
+    logger = logging.getLogger('bench.logging')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    slow = SlowHandler()
+    slow.setFormatter(JsonFormatter())
+    logger.addHandler(slow)
+    sync = run(logger, records // 10, lambda i: f"Module{i} exporté")
+    logger.removeHandler(slow)
+
+    slow = SlowHandler()
+    slow.setFormatter(JsonFormatter())
+    queue_handler = NonBlockingQueueHandler(queue.Queue(records))
+    listener = logging.handlers.QueueListener(queue_handler.queue, slow)
+    listener.start()
+    logger.addHandler(queue_handler)
+    queued = run(logger, records, lambda i: f"Module{i} exporté")
+    drain_start = time.perf_counter()
+    listener.stop()
+    drain = time.perf_counter() - drain_start
+    logger.removeHandler(queue_handler)
+
+    # Cycles de surveillance répétant les mêmes messages (requêtes trouvées, scan impossible...)
+    repeat_filter = RepeatFilter(window=60.0)
+    written = []
+    for poll in range(polls):
+        for q in range(queries):
+            record = logger.makeRecord(logger.name, logging.INFO, __file__, 0, f"Requête trouvée: Query{q}",
+                                       None, None)
+            record.created = poll * 0.5
+            if repeat_filter.filter(record):
+                written.append(record.getMessage())
+
+    print(f"logging (écriture disque {write_latency * 1000:.0f} ms par enregistrement)")
+    print(f"  synchrone          : {sync[0] * 1e6:.0f} µs par appel (pire {sync[1] * 1000:.2f} ms)")
+    print(f"  file + listener    : {queued[0] * 1e6:.1f} µs par appel (pire {queued[1] * 1000:.2f} ms), "
+          f"{len(slow.lines)}/{records} écrits, {queue_handler.dropped} perdus, vidage {drain:.2f}s")
+    print(f"  messages répétés   : {polls * queries} émis sur {polls} cycles, {len(written)} écrits, "
+          f"{repeat_filter.suppressed} supprimés")
+    print(f"  exemple            : {written[-1]}")
+
+
+def bench_faults(modules=50, busy=0.5, outage=0.8, long_outage=4.0):
+    """Reprise après pannes COM injectées (fake_excel.ComCallCounter.fail) :
+    Excel occupé, connexion perdue puis rétablie, panne longue (disjoncteur)
+    et classeur fermé ; comparé au redémarrage du processus d'avant"""
+    import random
+    from com_session import Backoff, CircuitBreaker, CircuitOpen, COMSession, WorkbookClosed
+    from vba_monitor import ExcelVBAMonitor
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'bench.xlsm')
+        counter = fake_excel.ComCallCounter()
+        app = fake_excel.FakeApplication(counter)
+        wb, _ = fake_excel.build_workbook(path, modules, counter=counter)
+        app.register(wb)
+        app.Workbooks.Open(path)
+        fake_excel.install(app)
+
+        session = COMSession(path, backoff=Backoff(base=0.05, max_delay=0.25, rng=random.Random(1)),
+                             breaker=CircuitBreaker(reset_timeout=1.0))
+        session.open()
+        monitor = make_vba_monitor(workdir, session.wb)
+        session.on_reattach.append(lambda excel, wb: setattr(monitor, 'wb', wb))
+        monitor.start_session()
+
+        def recover(message, seconds):
+            """Durée entre la fin de la panne et le premier cycle réussi"""
+            counter.fail(message, seconds)
+            fault_end = time.monotonic() + seconds
+            retries, reattaches = session.retries, session.reattaches
+            while True:
+                try:
+                    session.call(monitor.poll)
+                    break
+                except CircuitOpen:
+                    time.sleep(session.breaker.remaining())
+                except Exception:
+                    # Essais épuisés : comme la boucle de surveillance, nouveau cycle
+                    pass
+            return (max(0.0, time.monotonic() - fault_end), session.retries - retries,
+                    session.reattaches - reattaches)
+
+        results = {
+            'occupé': recover(fake_excel.BUSY_ERROR, busy),
+            'déconnecté': recover(fake_excel.UNAVAILABLE_ERROR, outage),
+        }
+        failed_before, trips_before = counter.failed, session.breaker.trips
+        results['panne longue'] = recover(fake_excel.UNAVAILABLE_ERROR, long_outage)
+        long_attempts = counter.failed - failed_before
+        trips = session.breaker.trips - trips_before
+
+        # Ancien comportement : sys.exit à la première erreur, puis redémarrage à froid
+        start = time.perf_counter()
+        restarted = ExcelVBAMonitor(path)
+        restarted.wb = app.Workbooks.Open(path)
+        restarted.start_session()
+        restart = time.perf_counter() - start
+
+        start = time.perf_counter()
+        wb.Close()
+        try:
+            session.call(monitor.poll)
+            closed = "non détecté"
+        except WorkbookClosed:
+            closed = f"WorkbookClosed en {(time.perf_counter() - start) * 1000:.1f} ms"
+
+    print(f"faults ({modules} modules)")
+    for name, (recovery, retries, reattaches) in results.items():
+        print(f"  {name:<13}: reprise {recovery * 1000:.0f} ms après la panne, "
+              f"{retries} nouvel(s) essai(s), {reattaches} rattachement(s)")
+    print(f"  panne de {long_outage:.0f}s   : {long_attempts} appels COM tentés, disjoncteur ouvert {trips} fois")
+    print(f"  avant        : arrêt du processus à chaque panne, relance + réconciliation {restart * 1000:.0f} ms "
+          f"(hors démarrage d'Excel et de Python)")
+    print(f"  fermeture    : {closed}")
+
+
+def bench_bulk(modules=50, lines=200, recalc=0.01, repaint=0.003, events=0.001):
+    """Lot de modules modifiés d'un coup (git pull) : imports un par un contre
+    lot transactionnel avec recalcul, affichage et événements suspendus, puis
+    annulation complète d'un lot dont un fichier est invalide"""
+    from vba_importer import VBAPatcher, import_order
+
+    def prepare(workdir):
+        counter = fake_excel.ComCallCounter()
+        app = fake_excel.FakeApplication(counter, recalc, repaint, events)
+        wb, _ = fake_excel.build_workbook(os.path.join(workdir, 'bench.xlsm'), modules, lines, counter)
+        paths = []
+        for index in range(modules):
+            path = os.path.join(workdir, f"Module{index + 1}.bas")
+            wb.VBProject.VBComponents(f"Module{index + 1}").Export(path)
+            paths.append(path)
+        patcher = VBAPatcher()
+        patcher.prime(paths)
+        original = {comp.Name: comp.CodeModule.text() for comp in wb.VBProject.VBComponents}
+        # Le pull modifie tous les modules et ajoute une classe utilisée par le premier
+        for index, path in enumerate(paths):
+            with open(path, encoding='utf-8', newline='') as f:
+                text = f.read().split('\r\n')
+            text[5] += f"  ' pull {index}"
+            if index == 0:
+                text.insert(2, "Private client As New Client")
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.write('\r\n'.join(text))
+        class_path = os.path.join(workdir, 'Client.cls')
+        with open(class_path, 'w', encoding='utf-8', newline='') as f:
+            f.write('Attribute VB_Name = "Client"\r\nPublic Nom As String')
+        return app, wb, patcher, paths + [class_path], original
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        app, wb, patcher, paths, _ = prepare(workdir)
+        start = time.perf_counter()
+        applied = [path for path in import_order(paths) if patcher.apply(wb, path)]
+        results['un par un'] = (time.perf_counter() - start, len(applied), app.recalcs)
+        sequential = {comp.Name: comp.CodeModule.text() for comp in wb.VBProject.VBComponents}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app, wb, patcher, paths, _ = prepare(workdir)
+        start = time.perf_counter()
+        applied = patcher.apply_batch(wb, paths, app)
+        results['transactionnel'] = (time.perf_counter() - start, len(applied), app.recalcs)
+        identical = sequential == {comp.Name: comp.CodeModule.text() for comp in wb.VBProject.VBComponents}
+        order = [os.path.basename(path) for path in import_order(paths)][:2]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app, wb, patcher, paths, original = prepare(workdir)
+        broken = os.path.join(workdir, 'Cassé.bas')
+        with open(broken, 'w', encoding='utf-8') as f:
+            f.write("Sub sans_en_tete()\r\nEnd Sub")
+        applied = patcher.apply_batch(wb, paths + [broken], app)
+        restored = original == {comp.Name: comp.CodeModule.text() for comp in wb.VBProject.VBComponents}
+        state = (app.ScreenUpdating, app.EnableEvents, app.Calculation) == (True, True, -4105)
+
+    print(f"bulk ({modules} modules modifiés + 1 classe ajoutée, recalcul {recalc * 1000:.0f} ms)")
+    for name, (elapsed, count, recalcs) in results.items():
+        print(f"  {name:<15}: {elapsed:.2f}s, {count} fichiers appliqués, {recalcs} recalcul(s)")
+    print(f"  résultats identiques : {'oui' if identical else 'NON'} ; ordre : {', '.join(order)}...")
+    print(f"  lot avec un fichier invalide : {len(applied)} appliqué(s), projet {'restauré' if restored else 'NON RESTAURÉ'}, "
+          f"état d'Excel {'rétabli' if state else 'NON RÉTABLI'}")
+
+
+def bench_pqsync(queries=200, edits=3):
+    """Sens disque -> Excel des requêtes : réenregistrement de tous les .m
+    (pull sans changement de contenu), quelques formules modifiées, un ajout,
+    une suppression, puis un export du moniteur qui ne doit pas revenir"""
+    from import_queue import DebouncedImportQueue
+    from origin_index import OriginIndex
+    from powerquery_monitor import PowerQueryMonitor
+    from powerquery_importer import QueryImporter
+
+    with tempfile.TemporaryDirectory() as workdir:
+        wb, counter = fake_excel.build_workbook(os.path.join(workdir, 'bench.xlsm'), 0, queries=queries)
+        origins = OriginIndex()
+        exporter = PowerQueryMonitor(os.path.join(workdir, wb.Name), origins=origins, mirror_connections=False)
+        exporter.wb = wb
+        exporter.start_session()
+        importer = QueryImporter()
+        importer.prime(wb)
+        queue = DebouncedImportQueue(lambda paths: importer.apply_batch(wb, paths), quiet_period=0.05,
+                                     origins=origins, removals=True)
+        paths = sorted(os.path.join(exporter.export_path, name) for name in os.listdir(exporter.export_path)
+                       if name.endswith('.m'))
+        queue.prime(paths)
+        queue.start()
+
+        def settle(touched):
+            counter.reset()
+            for path in touched:
+                queue.submit(path)
+            time.sleep(0.3)
+            return counter.by_member.get('FakeQuery.Formula=', 0), dict(counter.by_member)
+
+        # Tous les fichiers réenregistrés, quelques-uns modifiés, un ajouté, un supprimé
+        for index, path in enumerate(paths):
+            formula = open(path, encoding='utf-8', newline='').read()
+            if index < edits:
+                formula += f"\n// édité {index}"
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.write(formula)
+        added = os.path.join(exporter.export_path, 'Nouvelle.m')
+        with open(added, 'w', encoding='utf-8', newline='') as f:
+            f.write('let\n    Source = 1\nin\n    Source')
+        os.remove(paths[-1])
+        writes, members = settle(paths + [added])
+        edited_ok = all(wb.Queries(os.path.splitext(os.path.basename(path))[0]).Formula.endswith(f"// édité {index}")
+                        for index, path in enumerate(paths[:edits]))
+
+        # Le moniteur réexporte les requêtes modifiées : écho, aucun appel COM en retour
+        exporter.poll()
+        wb.Queries(sorted(q.Name for q in wb.Queries)[-1]).Formula += "\n// édité dans Excel"
+        exporter.poll()
+        echo_writes, _ = settle(paths[:-1] + [added])
+        queue.stop()
+
+    print(f"pqsync ({queries} requêtes, {len(paths)} fichiers réenregistrés dont {edits} modifiés)")
+    print(f"  formules réécrites : {writes} (tout réappliquer : {queries}) ; "
+          f"ajouts {members.get('FakeQueries.Add', 0)}, suppressions {members.get('FakeQuery.Delete', 0)}, "
+          f"modifications {'appliquées' if edited_ok else 'MANQUANTES'}")
+    print(f"  exports du moniteur : {echo_writes} formule(s) réécrite(s), échos écartés {queue.echoes} ; "
+          f"fichiers réenregistrés à l'identique ignorés {queue.skipped}")
+
+
+def bench_querygraph(sources=10, staging=50, transforms=200, reports=40, duration=0.01):
+    """Graphe de dépendances M : construction depuis les .m exportés, mise à
+    jour incrémentale, plan de rafraîchissement d'une requête source comparé
+    au rafraîchissement de tout le classeur, puis exécution sur le faux modèle"""
+    from query_graph import QueryGraph, QueryRefresher
+
+    formulas = {}
+    for i in range(sources):
+        formulas[f"Source{i}"] = f'let\n    Source = Csv.Document(File.Contents("s{i}.csv"))\nin\n    Source'
+    for i in range(staging):
+        formulas[f"Etape{i}"] = (f'let\n    Source = Source{i % sources},\n'
+                                 f'    Filtre = Table.SelectRows(Source, each [Montant] > {i})\nin\n    Filtre')
+    for i in range(transforms):
+        formulas[f"Transfo{i}"] = (f'let\n    Source = Table.NestedJoin(Etape{i % staging}, {{"Id"}}, '
+                                   f'#"Etape{(i + 1) % staging}", {{"Id"}}, "J"),\n'
+                                   f'    Ajout = (x) => x + #shared[Seuil]\nin\n    Source')
+    for i in range(reports):
+        formulas[f"Rapport{i}"] = (f'let\n    Source = Table.Combine({{Transfo{i * 5 % transforms}, '
+                                   f'Transfo{(i * 5 + 1) % transforms}}})\nin\n    Source')
+    formulas['Seuil'] = '10'
+    total = len(formulas)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, formula in formulas.items():
+            with open(os.path.join(workdir, f"{name}.m"), 'w', encoding='utf-8', newline='') as f:
+                f.write(formula)
+        start = time.perf_counter()
+        graph = QueryGraph.from_folder(workdir)
+        build = time.perf_counter() - start
+
+    # Une seule formule modifiée : une seule réanalyse
+    graph.parsed = 0
+    edited = dict(formulas)
+    edited['Source0'] += '\n// modifiée'
+    start = time.perf_counter()
+    changed = graph.update_all(edited)
+    incremental = time.perf_counter() - start
+    reparsed = graph.parsed
+
+    levels = graph.refresh_plan(changed)
+    planned = sum(len(level) for level in levels)
+    threshold_levels = graph.refresh_plan({'Seuil'})
+
+    # Rafraîchissement sur le faux modèle : chaque requête dure duration secondes
+    counter = fake_excel.ComCallCounter()
+    wb = fake_excel.FakeWorkbook(counter, 'bench.xlsm')
+    for name in formulas:
+        wb.Connections.append(fake_excel.FakeConnection(counter, f"Requête - {name}", duration))
+    start = time.perf_counter()
+    refreshed = QueryRefresher(wb, poll_interval=duration / 5).run(levels)
+    elapsed = time.perf_counter() - start
+
+    print(f"querygraph ({total} requêtes en 4 couches)")
+    print(f"  construction : {build * 1000:.1f} ms ; mise à jour d'une formule : {incremental * 1000:.1f} ms, "
+          f"{reparsed} réanalyse(s)")
+    print(f"  Source0 modifiée : {planned} requête(s) à rafraîchir sur {total}, {len(levels)} niveau(x) "
+          f"{[len(level) for level in levels]}")
+    print(f"  Seuil (#shared) modifiée : {sum(len(level) for level in threshold_levels)} requête(s)")
+    print(f"  rafraîchi {refreshed} requête(s) en {elapsed * 1000:.0f} ms "
+          f"(séquentiel estimé : {planned * duration * 1000:.0f} ms, tout le classeur : {total * duration * 1000:.0f} ms)")
+
+
+def bench_versions(lines=2000, revisions=300, workbooks=2):
+    """Historique des révisions : un module de lines lignes édité revisions
+    fois (quelques lignes à chaque fois), recopié dans workbooks classeurs ;
+    taille sur disque, lecture à une date, restauration, compaction"""
+    from version_store import VersionStore
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as workdir:
+        store = VersionStore(os.path.join(workdir, '.versions'), keep_all_days=1, keep_days=30)
+        code = [f"    total = total + Cells({i}, 1).Value ' ligne {i}\r\n" for i in range(lines)]
+        paths = []
+        for index in range(workbooks):
+            folder = os.path.join(workdir, f"classeur{index}", 'macros_export')
+            os.makedirs(folder)
+            paths.append(os.path.join(folder, 'Module1.bas'))
+        # Révisions réparties sur 60 jours
+        start_ts = time.time() - 60 * 86400
+        timeline = []
+        raw = 0
+        start = time.perf_counter()
+        for revision in range(revisions):
+            for _ in range(3):
+                code[rng.randrange(lines)] = f"    total = total * {rng.random():.6f}\r\n"
+            data = ''.join(code).encode('utf-8')
+            ts = start_ts + revision * 60 * 86400 / revisions
+            for path in paths:
+                store.record(store.artifact(path), data, ts)
+            timeline.append((ts, data))
+            raw += len(data) * workbooks
+        record_time = time.perf_counter() - start
+        size = store.disk_usage()
+        zlib_only = sum(len(zlib.compress(data)) for _, data in timeline)
+
+        artifact = store.artifact(paths[0])
+        probes = rng.sample(timeline, 50)
+        start = time.perf_counter()
+        exact = all(store.at(artifact, ts + 1) == data for ts, data in probes)
+        lookup = (time.perf_counter() - start) / len(probes)
+
+        target_ts, target = timeline[revisions // 2]
+        store.restore(artifact, target_ts + 1)
+        with open(paths[0], 'rb') as f:
+            restored = f.read() == target
+
+        freed = store.compact()
+        compacted = store.disk_usage()
+        still_exact = store.at(artifact, timeline[-1][0] + 1) == timeline[-1][1]
+
+    print(f"versions ({revisions} révisions d'un module de {lines} lignes, {workbooks} classeurs)")
+    print(f"  enregistrement : {record_time / (revisions * workbooks) * 1000:.2f} ms/révision ; "
+          f"{store.stored} objet(s) stocké(s), {store.deduplicated} dédupliqué(s)")
+    print(f"  disque : {size // 1024} Kio (copies brutes : {raw // 1024} Kio, zlib seul : {zlib_only // 1024} Kio)")
+    print(f"  lecture à une date : {lookup * 1000:.2f} ms, {'exacte' if exact else 'INCORRECTE'} ; "
+          f"restauration {'exacte' if restored else 'INCORRECTE'}")
+    print(f"  compaction : {freed // 1024} Kio libérés, {compacted // 1024} Kio, "
+          f"{store.records} révision(s) indexée(s), dernière {'exacte' if still_exact else 'INCORRECTE'}")
+
+
+def bench_goalseek(latency=0.002, seed=3):
+    """Module2.bas : recherche colonne par colonne et cellule par cellule
+    (un recalcul par pas) contre la recherche groupée sur les 12 colonnes
+    (un Range.Value et un recalcul par itération), sur un modèle Python de
+    la feuille ; les deux doivent donner le même bloc D34:O49"""
+    import numpy as np
+    import goal_seek
+
+    rng = np.random.default_rng(seed)
+    weights = rng.uniform(0.05, 0.2, (goal_seek.ROWS, goal_seek.COLUMNS))
+    base = rng.uniform(-300, -200, goal_seek.COLUMNS)
+    # Prix arrondi à l'euro et plafonné : certaines colonnes atteignent la cible, d'autres non
+    caps = rng.uniform(60, 200, goal_seek.COLUMNS)
+
+    def sheet(calculations):
+        def evaluate(grid):
+            calculations.append(1)
+            time.sleep(latency)
+            return np.round(np.minimum(caps, base + (weights * grid).sum(axis=0)))
+        return evaluate
+
+    for target in (80.0, 150.0):
+        sequential_calcs, batched_calcs = [], []
+        start = time.perf_counter()
+        sequential = goal_seek.sequential_goal_seek(sheet(sequential_calcs), target)
+        sequential_time = time.perf_counter() - start
+        start = time.perf_counter()
+        batched = goal_seek.batched_goal_seek(sheet(batched_calcs), target)
+        batched_time = time.perf_counter() - start
+        same = np.array_equal(sequential.grid, batched.grid) and np.array_equal(sequential.found, batched.found)
+        print(f"goalseek cible {target:.0f} (recalcul {latency * 1000:.0f} ms)")
+        print(f"  cellule par cellule : {len(sequential_calcs)} recalculs, {sequential_time:.2f}s")
+        print(f"  12 colonnes groupées : {len(batched_calcs)} recalculs, {batched_time:.2f}s")
+        print(f"  colonnes atteintes {int(batched.found.sum())}/{goal_seek.COLUMNS}, "
+              f"résultats {'identiques' if same else 'DIFFÉRENTS'}")
+
+
+def bench_pipeline(queries=100, seconds=2.0, file_latency=0.02, edit_interval=0.005):
+    """Surveillance Power Query pendant des modifications continues, avec un
+    partage réseau lent (file_latency par fichier écrit) : scan, comparaison
+    et écriture sur le même thread (poll) contre étages séparés par des files
+    bornées (monitor), puis fermeture du classeur avec vidage des étages"""
+    from powerquery_monitor import PowerQueryMonitor
+    from scheduler import AdaptiveScheduler
+
+    class SlowShare:
+        def __init__(self):
+            self.files = 0
+
+        def submit(self, written=(), removed=()):
+            self.files += len(written)
+            time.sleep(file_latency * (len(written) + len(removed)))
+
+        def start(self):
+            pass
+
+        def stop(self, timeout=None):
+            pass
+
+    def editor(wb, stop):
+        rng = random.Random(5)
+        names = [query.Name for query in wb.Queries]
+        revision = 0
+        while not stop.is_set():
+            revision += 1
+            wb.Queries(rng.choice(names)).Formula += f"\n// révision {revision}"
+            time.sleep(edit_interval)
+
+    def timed_scans(monitor, method):
+        stamps = []
+        original = getattr(monitor, method)
+
+        def scan():
+            stamps.append(time.perf_counter())
+            return original()
+        setattr(monitor, method, scan)
+        return stamps
+
+    def gaps(stamps):
+        return max((b - a for a, b in zip(stamps, stamps[1:])), default=0.0)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in ('poll', 'pipeline'):
+            path = os.path.join(workdir, mode, 'bench.xlsm')
+            os.makedirs(os.path.dirname(path))
+            counter = fake_excel.ComCallCounter()
+            app = fake_excel.FakeApplication(counter)
+            wb, _ = fake_excel.build_workbook(path, 0, counter=counter, queries=queries)
+            app.register(wb)
+            app.Workbooks.Open(path)
+            fake_excel.install(app)
+            share = SlowShare()
+            monitor = PowerQueryMonitor(path, committer=share, mirror_connections=False)
+            monitor.scheduler = AdaptiveScheduler(min_interval=0.01, max_interval=0.01)
+            stop = threading.Event()
+            edits = threading.Thread(target=editor, args=(wb, stop))
+            if mode == 'poll':
+                monitor.wb = wb
+                monitor.start_session()
+                stamps = timed_scans(monitor, 'get_power_queries')
+                share.files = 0
+                edits.start()
+                deadline = time.perf_counter() + seconds
+                while time.perf_counter() < deadline:
+                    monitor.poll()
+                stop.set()
+                edits.join()
+                monitor.poll()
+                stats = None
+            else:
+                stamps = timed_scans(monitor, 'get_power_queries')
+                runner = threading.Thread(target=monitor.monitor)
+                runner.start()
+                monitor.opened.wait()
+                # Premier relevé et exports initiaux exclus, comme pour poll
+                time.sleep(0.05)
+                stamps.clear()
+                share.files = 0
+                edits.start()
+                time.sleep(seconds)
+                stop.set()
+                edits.join()
+                time.sleep(0.05)
+            final = {query.Name: query.Formula for query in wb.Queries}
+            if mode == 'pipeline':
+                start = time.perf_counter()
+                wb.Close()
+                runner.join()
+                drain = time.perf_counter() - start
+                stats = monitor.pipeline.stats()
+            exported = {}
+            for name in final:
+                with open(os.path.join(monitor.export_path, f"{name}.m"), encoding='utf-8', newline='') as f:
+                    exported[name] = f.read()
+            results[mode] = (len(stamps), gaps(stamps), share.files, exported == final, stats,
+                             drain if mode == 'pipeline' else None)
+
+    print(f"pipeline ({queries} requêtes, {seconds:.0f}s de modifications, {file_latency * 1000:.0f} ms par fichier écrit)")
+    for mode, (scans, gap, files, exact, stats, drain) in results.items():
+        print(f"  {mode:<8}: {scans} scans COM, écart max {gap * 1000:.0f} ms, {files} fichiers écrits, "
+              f"exports {'à jour' if exact else 'EN RETARD'}" + (f", vidage à la fermeture {drain * 1000:.0f} ms" if drain else ""))
+        for name, queue_stats in (stats or {}).items():
+            print(f"    {name}: profondeur max {queue_stats['max_depth']}, attente moyenne {queue_stats['wait_ms']:.1f} ms, "
+                  f"fusionnés {queue_stats['coalesced']}, bloqué {queue_stats['blocked_ms']:.0f} ms")
+
+
+def bench_sheets(sheets=4, rows=2500, columns=10, edits=200, seed=5):
+    """Export des feuilles d'un classeur de 100k formules : relevé complet,
+    puis coût d'une modification d'une cellule signalée par SheetChange"""
+    from engine import ExtractionEngine
+    from scheduler import SHEETS, ExcelApplicationEvents
+    from sheet_extractor import SHEETS_FOLDER, SheetsReader
+
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'bench.xlsm')
+        counter = fake_excel.ComCallCounter()
+        wb = fake_excel.FakeWorkbook(counter, path)
+        for index in range(sheets):
+            ws = wb.Worksheets.add(f"Feuille{index + 1}")
+            for row in range(1, rows + 1):
+                ws.set(row, 1, row)
+                for col in range(2, columns + 2):
+                    ws.set(row, col, f"=A{row}*{col}+{fake_excel.column_letter(col - 1)}{row}")
+            ws.set(1, columns + 3, 'Région')
+            ws.set(1, columns + 4, 'Prix')
+            ws.add_table(f"Tableau{index + 1}", f"{fake_excel.column_letter(columns + 3)}1:"
+                                                f"{fake_excel.column_letter(columns + 4)}50")
+            ws.add_validation(f"A2:A{rows}", 1, 1, '0', '1000000')
+        wb.Names.append(fake_excel.FakeName(counter, 'Taux', '=Feuille1!$B$2'))
+        formulas = sheets * rows * columns
+
+        engine = ExtractionEngine(path, targets=(SHEETS,), export_root=workdir)
+        engine.dirty.connected = True
+        counter.reset()
+        start = time.perf_counter()
+        engine.attach(None, wb)
+        full = (counter.calls, counter.chars, time.perf_counter() - start)
+        reader = engine.extractors[0].reader
+        events = fake_excel.FakeEventSource(ExcelApplicationEvents, scheduler=engine.scheduler, dirty=engine.dirty)
+
+        def edit(ws, address, formula):
+            ws.Range(address).Formula = formula
+            events.fire('SheetChange', ws, ws.Range(address))
+            counter.reset()
+            reads = reader.range_reads
+            start = time.perf_counter()
+            engine.tick()
+            return counter.calls, counter.chars, reader.range_reads - reads, time.perf_counter() - start
+
+        ws = wb.Worksheets('Feuille3')
+        single = edit(ws, 'E1234', '=SUM(B1:B10)')
+        export = os.path.join(workdir, SHEETS_FOLDER, 'Feuille3.formulas.txt')
+        with open(export, encoding='utf-8') as f:
+            exported = 'E1234\t=SUM(B1:B10)\n' in f.read()
+        # Insertion de ligne : adresses décalées, références des autres feuilles
+        # réécrites, tout le classeur est relu
+        structural = edit(ws, '$7:$7', '')
+
+        # Modifications aléatoires (plages, cellules vidées, zones multiples)
+        # puis comparaison avec un relevé complet indépendant
+        for _ in range(edits):
+            ws = wb.Worksheets(f"Feuille{rng.randint(1, sheets)}")
+            row, col = rng.randint(1, rows + 20), rng.randint(1, columns + 3)
+            address = f"{fake_excel.column_letter(col)}{row}:{fake_excel.column_letter(col + 1)}{row + 2}"
+            cell = f"=RAND()*{rng.randint(1, 99)}" if rng.random() < 0.8 else ''
+            ws.Range(address).Formula = cell
+            events.fire('SheetChange', ws, ws.Range(address))
+            if rng.random() < 0.3:
+                engine.tick()
+        wb.Worksheets('Feuille1').add_table('Ventes', 'A1:C3')
+        events.fire('SheetCalculate', wb.Worksheets('Feuille1'))
+        engine.tick()
+        expected = SheetsReader()
+        expected.update(wb)
+        identical = all(open(os.path.join(workdir, SHEETS_FOLDER, rel), encoding='utf-8', newline='').read() ==
+                        data['text'] for rel, data in expected.snapshot().items())
+
+    print(f"sheets ({sheets} feuilles, {formulas} formules)")
+    print(f"  relevé complet        : {full[0]} appels COM, {full[1] / 1e6:.1f} M caractères, {full[2] * 1000:.0f} ms")
+    print(f"  une cellule modifiée  : {single[0]} appels COM, {single[2]} lecture(s) de plage, "
+          f"{single[1]} caractères, {single[3] * 1000:.1f} ms, export {'à jour' if exported else 'PAS à jour'}")
+    print(f"  insertion de ligne    : {structural[2]} lecture(s) de plage, {structural[1] / 1e6:.1f} M caractères "
+          f"(classeur relu)")
+    print(f"  {edits} modifications    : exports {'identiques' if identical else 'DIFFÉRENTS'} d'un relevé complet")
+
+
+async def _stream_collect(address, results, key, cut=None, **filters):
+    """Abonné du scénario stream, comme change_stream.follow : reprise depuis
+    le dernier id reçu après overflow ou coupure"""
+    import asyncio
+    from change_stream import read_events
+
+    received, since = [], None
+    while True:
+        try:
+            async for seq, event, data in read_events(address, since=since, **filters):
+                if event == 'overflow':
+                    since = data['resume']
+                    results['reconnects'] += 1
+                    break
+                if data['artifact'] == 'fin':
+                    results[key].append(received)
+                    return
+                received.append(seq)
+                since = seq
+                results['latency'].append(time.time() - data['time'])
+                if cut and len(received) == cut:
+                    # Coupure volontaire en cours de flux
+                    cut = None
+                    break
+        except OSError:
+            await asyncio.sleep(0.05)
+
+
+def _stream_clients(address, roles, queue):
+    """Processus client (un outil local) : roles = [(clé, coupure, filtres)]"""
+    import asyncio
+
+    async def run():
+        results = {'fast': [], 'filtered': [], 'resumed': [], 'latency': [], 'reconnects': 0}
+        await asyncio.gather(*[_stream_collect(address, results, key, cut, **filters)
+                               for key, cut, filters in roles])
+        return results
+
+    queue.put(asyncio.run(run()))
+
+
+def bench_stream(subscribers=300, passes=30, per_pass=10, pass_interval=0.05, slow=20, filtered=100, modules=50,
+                 processes=4, buffer=32):
+    """Flux des changements sous charge : des centaines d'abonnés locaux
+    répartis sur plusieurs processus, filtrés ou non, des clients qui ne lisent
+    plus et un client qui se reconnecte en cours de route ; publish() ne doit
+    jamais ralentir la détection"""
+    import socket
+    import multiprocessing
+    from change_stream import MODIFIED, ChangeStreamServer
+
+    events = passes * per_pass
+    fast = subscribers - slow - filtered - 1
+    roles = [('fast', None, {'diff': 1})] * fast
+    roles += [('filtered', None, {'artifact': 'Module1*,fin', 'kind': MODIFIED})] * filtered
+    roles.append(('resumed', events // 3, {}))
+    with tempfile.TemporaryDirectory() as workdir:
+        server = ChangeStreamServer(f"unix:{os.path.join(workdir, 'flux.sock')}", history=events * 2,
+                                    buffer=buffer).start()
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        workers = [context.Process(target=_stream_clients, args=(server.address, roles[index::processes], queue),
+                                   daemon=True) for index in range(processes)]
+        for worker in workers:
+            worker.start()
+        # Clients abonnés aux diffs qui ne lisent plus rien
+        stalled = []
+        for _ in range(slow):
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(server.address[5:])
+            client.sendall(b"GET /events?diff=1 HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            stalled.append(client)
+        deadline = time.monotonic() + 60
+        while server.stats()['subscribers'] < subscribers and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        modules_text = {index: [f"    x = x + {line}\n" for line in range(40)] for index in range(modules)}
+        publish = []
+        start = time.perf_counter()
+        for index in range(events):
+            module = index % modules
+            lines = modules_text[module]
+            # Une dizaine de lignes réécrites par modification (diffs de quelques Ko)
+            for line in range(index % 4, len(lines), 4):
+                lines[line] = f"    x = x * {index} + {line}  ' ajusté pour la passe {index // per_pass}\n"
+            call = time.perf_counter()
+            server.publish('bench.xlsm', 'vba', f"Module{module}", MODIFIED, old=f"{index - 1:040x}",
+                           new=f"{index:040x}", text=''.join(lines))
+            publish.append(time.perf_counter() - call)
+            if index % per_pass == per_pass - 1:
+                # Rythme des passes de détection
+                time.sleep(pass_interval)
+        server.publish('bench.xlsm', 'vba', 'fin', MODIFIED)
+        results = {'fast': [], 'filtered': [], 'resumed': [], 'latency': [], 'reconnects': 0}
+        for _ in workers:
+            part = queue.get(timeout=120)
+            for key, value in part.items():
+                results[key] += value
+        elapsed = time.perf_counter() - start
+        for worker in workers:
+            worker.join()
+        stats = server.stats()
+        for client in stalled:
+            client.close()
+        server.stop()
+
+    expected = list(range(1, events + 1))
+    expected_filtered = [seq for seq in expected if f"Module{(seq - 1) % modules}".startswith('Module1')]
+    complete = sum(received == expected for received in results['fast'])
+    complete_filtered = sum(received == expected_filtered for received in results['filtered'])
+    latency = sorted(results['latency'])
+    publish.sort()
+    print(f"stream ({subscribers} abonnés sur {processes} processus dont {slow} bloqués, "
+          f"{events} événements en {passes} passes)")
+    print(f"  publish() : médiane {publish[len(publish) // 2] * 1e6:.0f} µs, "
+          f"max {publish[-1] * 1e6:.0f} µs (thread de détection)")
+    print(f"  abonnés complets : {complete}/{fast} sans filtre, {complete_filtered}/{filtered} filtrés "
+          f"({len(expected_filtered)} événements chacun)")
+    print(f"  reprise après coupure : {'sans trou ni doublon' if results['resumed'] == [expected] else 'INCOMPLÈTE'}")
+    print(f"  déconnexions pour retard : {stats['overflows']} ({slow} clients bloqués, "
+          f"{results['reconnects']} reprises de clients actifs)")
+    print(f"  latence de livraison : médiane {latency[len(latency) // 2] * 1000:.1f} ms, "
+          f"p99 {latency[int(len(latency) * 0.99)] * 1000:.1f} ms, {elapsed:.2f}s au total")
+
+
+def bench_suite(sizes=((10, 0), (200, 0), (1000, 0), (50, 500)), latency=0.0002, lines_per_module=200):
+    """Moteur unifié sur classeurs synthétiques ouverts via Workbooks.Open :
+    polls/s, appels COM par poll, délai de détection, mémoire par classeur"""
+    import tracemalloc
+    from engine import ExtractionEngine
+    from scheduler import POWERQUERY, VBA
+
+    def open_engine(workdir, modules, queries, latency=0.0):
+        path = os.path.join(workdir, f"suite_{modules}_{queries}.xlsm")
+        counter = fake_excel.ComCallCounter(latency)
+        wb, counter = fake_excel.build_workbook(path, modules, lines_per_module, counter, queries)
+        app = fake_excel.FakeApplication(counter)
+        app.register(wb)
+        fake_excel.install(app)
+        tracemalloc.start()
+        engine = ExtractionEngine(path, targets=(VBA, POWERQUERY), export_root=os.path.join(workdir, wb.Name))
+        # Un poll toutes les 0,5 s (temps simulé) pour la vérification tournante
+        engine.clock = SimulatedClock(0.5)
+        engine.extractors[0].monitor.clock = engine.clock
+        engine.attach(app, app.Workbooks.Open(path))
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        counter.reset()
+        return engine, wb, counter, memory
+
+    def ticks_until(engine, detected, limit):
+        start = time.perf_counter()
+        for ticks in range(1, limit + 1):
+            engine.clock.tick()
+            engine.tick()
+            if detected():
+                return ticks, time.perf_counter() - start
+        return None, time.perf_counter() - start
+
+    print("suite (moteur unifié, modules de {} lignes)".format(lines_per_module))
+    with tempfile.TemporaryDirectory() as workdir:
+        for modules, queries in sizes:
+            engine, wb, counter, memory = open_engine(workdir, modules, queries)
+            polls = max(3, min(50, 20000 // (modules + queries)))
+            start = time.perf_counter()
+            for _ in range(polls):
+                engine.clock.tick()
+                engine.tick()
+            elapsed = (time.perf_counter() - start) / polls
+            calls = counter.calls / polls
+
+            vba = engine.snapshots[VBA]
+            module = wb.VBProject.VBComponents('Module1').CodeModule
+            old_hash = vba['Module1']['hash']
+            module.set_text(module.text() + "\r\n' ligne ajoutée")
+            structural, structural_time = ticks_until(engine, lambda: engine.snapshots[VBA]['Module1']['hash'] != old_hash, 3)
+            old_hash = engine.snapshots[VBA]['Module1']['hash']
+            module.ReplaceLine(3, module.Lines(3, 1) + "  ' modifié")
+            in_place, in_place_time = ticks_until(engine, lambda: engine.snapshots[VBA]['Module1']['hash'] != old_hash,
+                                                  200)
+            label = f"{modules} modules" + (f", {queries} requêtes" if queries else "")
+            print(f"  {label:<24}: {1 / elapsed:7.1f} polls/s, {calls:6.0f} appels COM/poll, "
+                  f"mémoire {memory / 1024:7.0f} Kio ; ligne ajoutée détectée en {structural} poll(s) "
+                  f"({structural_time * 1000:.0f} ms), édition sur place en {in_place} poll(s) ({in_place * 0.5:.1f} s simulées)")
+            engine.stop()
+
+        engine, wb, counter, _ = open_engine(workdir, 200, 0, latency)
+        start = time.perf_counter()
+        engine.tick()
+        print(f"  200 modules, latence COM {latency * 1000:.1f} ms : {time.perf_counter() - start:.2f} s par poll "
+              f"({counter.calls} appels)")
+    fake_excel.install(None)
+
+
+SCENARIOS = {
+    'com_calls': bench_com_calls,
+    'offline': bench_offline,
+    'events': bench_events,
+    'watch_burst': bench_watch_burst,
+    'echo': bench_echo,
+    'patch': bench_patch,
+    'writer': bench_writer,
+    'connections': bench_connections,
+    'git': bench_git,
+    'daemon': bench_daemon,
+    'engine': bench_engine,
+    'metrics': bench_metrics,
+    'logging': bench_logging,
+    'faults': bench_faults,
+    'bulk': bench_bulk,
+    'pqsync': bench_pqsync,
+    'querygraph': bench_querygraph,
+    'versions': bench_versions,
+    'goalseek': bench_goalseek,
+    'pipeline': bench_pipeline,
+    'sheets': bench_sheets,
+    'stream': bench_stream,
+    'suite': bench_suite,
+}
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(message)s')
+    names = sys.argv[1:] or list(SCENARIOS)
+    for name in names:
+        start = time.perf_counter()
+        SCENARIOS[name]()
+        print(f"  durée: {time.perf_counter() - start:.2f}s")
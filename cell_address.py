@@ -0,0 +1,44 @@
+import re
+
+# Adresses de cellules au format A1 : lettres de colonne et zones
+# rectangulaires, sans dépendance à Excel (goal_seek.py, sheet_extractor.py).
+
+MAX_ROWS = 1048576
+MAX_COLUMNS = 16384
+
+AREA = re.compile(r'^\$?([A-Z]{1,3})?\$?(\d+)?(?::\$?([A-Z]{1,3})?\$?(\d+)?)?$')
+
+
+def column_letter(col):
+    letters = ''
+    while col:
+        col, rest = divmod(col - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+def column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number
+
+
+def parse_area(address):
+    """(ligne1, colonne1, ligne2, colonne2) d'une adresse A1 : $B$2, $B$2:$D$9, $5:$7, $A:$C"""
+    match = AREA.match(address.strip().upper())
+    if not match or not (match.group(1) or match.group(2)):
+        raise ValueError(f"Adresse non reconnue: {address}")
+    col1, row1, col2, row2 = match.groups()
+    if match.group(3) is None and match.group(4) is None:
+        col2, row2 = col1, row1
+    r1 = int(row1) if row1 else 1
+    r2 = int(row2) if row2 else MAX_ROWS
+    c1 = column_number(col1) if col1 else 1
+    c2 = column_number(col2) if col2 else MAX_COLUMNS
+    return min(r1, r2), min(c1, c2), max(r1, r2), max(c1, c2)
+
+
+def area_address(r1, c1, r2, c2):
+    first = f"{column_letter(c1)}{r1}"
+    return first if (r1, c1) == (r2, c2) else f"{first}:{column_letter(c2)}{r2}"
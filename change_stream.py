@@ -0,0 +1,434 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import difflib
+import fnmatch
+import logging
+import argparse
+import threading
+from collections import deque
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from metrics import METRICS
+
+# Flux local des changements détectés : le moteur publie chaque artefact
+# ajouté, modifié ou supprimé (anciennes et nouvelles empreintes, diff
+# unifié quand les deux textes sont connus) et les outils s'abonnent au lieu
+# de surveiller les dossiers d'export. Serveur asyncio dans son propre thread,
+# en Server-Sent Events sur HTTP (localhost ou socket Unix) :
+#
+#     GET /events?artifact=Module*&target=vba,powerquery&kind=modified&diff=1&since=120
+#     GET /status
+#
+# Chaque événement porte un numéro de séquence (id SSE) ; après une
+# reconnexion, since=N (ou l'en-tête Last-Event-ID) renvoie d'abord les
+# événements suivants encore dans l'historique. Chaque abonné a un tampon
+# borné : un client trop lent est déconnecté avec un événement « overflow »
+# indiquant où reprendre, publish() ne bloque jamais la détection.
+#
+#     python change_stream.py 127.0.0.1:8765 --artifact "Module*" --diff
+
+ADDED, MODIFIED, REMOVED = 'added', 'modified', 'removed'
+
+SSE_HEADERS = (b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+               b"Connection: keep-alive\r\n\r\n")
+
+
+def parse_address(address):
+    """'unix:/chemin', 'hôte:port' ou 'port' -> ('unix', chemin) ou ('tcp', hôte, port)"""
+    address = str(address)
+    if address.startswith('unix:'):
+        return 'unix', address[5:]
+    host, _, port = address.rpartition(':')
+    return 'tcp', host or '127.0.0.1', int(port)
+
+
+def sse_frame(event, data, seq=None):
+    head = f"id: {seq}\n" if seq is not None else ''
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+
+
+class ChangeFilter:
+    """Filtre d'un abonné ; chaque critère vide laisse tout passer"""
+
+    def __init__(self, artifacts=(), targets=(), kinds=(), workbooks=()):
+        self.artifacts = list(artifacts)
+        self.targets = set(targets)
+        self.kinds = set(kinds)
+        self.workbooks = list(workbooks)
+
+    @classmethod
+    def from_query(cls, query):
+        def values(key):
+            return [value for item in query.get(key, []) for value in item.split(',') if value]
+        return cls(values('artifact'), values('target'), values('kind'), values('workbook'))
+
+    def matches(self, event):
+        if self.targets and event['target'] not in self.targets:
+            return False
+        if self.kinds and event['kind'] not in self.kinds:
+            return False
+        if self.artifacts and not any(fnmatch.fnmatchcase(event['artifact'], pattern) for pattern in self.artifacts):
+            return False
+        if self.workbooks:
+            name = os.path.basename(event['workbook'])
+            return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(event['workbook'], pattern)
+                       for pattern in self.workbooks)
+        return True
+
+
+class StreamEntry:
+    """Événement publié ; les trames SSE (avec et sans diff) ne sont encodées
+    qu'une fois, quel que soit le nombre d'abonnés"""
+    __slots__ = ('event', '_frames')
+
+    def __init__(self, event):
+        self.event = event
+        self._frames = {}
+
+    @property
+    def seq(self):
+        return self.event['seq']
+
+    def frame(self, with_diff):
+        with_diff = with_diff and 'diff' in self.event
+        if with_diff not in self._frames:
+            data = self.event if with_diff else {key: value for key, value in self.event.items() if key != 'diff'}
+            self._frames[with_diff] = sse_frame('change', data, self.event['seq'])
+        return self._frames[with_diff]
+
+
+class Subscriber:
+    def __init__(self, change_filter, diff=False, maxsize=256):
+        self.filter = change_filter
+        self.diff = diff
+        self.maxsize = maxsize
+        self.items = deque()
+        self.wakeup = asyncio.Event()
+        self.overflowed = False
+        self.transport = None
+        self.ping = False
+        self.last_seq = None
+        self.sent = 0
+
+    def offer(self, entry):
+        """Retourne True si le tampon vient de déborder"""
+        if self.overflowed:
+            return False
+        self.wakeup.set()
+        if len(self.items) < self.maxsize:
+            self.items.append(entry)
+            return False
+        # Client en retard : il reprendra depuis last_seq après reconnexion
+        self.items.clear()
+        self.overflowed = True
+        return True
+
+
+class ChangeStreamServer:
+    def __init__(self, address='127.0.0.1:8765', history=10000, buffer=256, max_diff_bytes=64 * 1024,
+                 heartbeat=15.0, write_limit=64 * 1024, backlog=1024):
+        """history : événements gardés pour la reprise ; buffer : événements en
+        attente par abonné avant déconnexion ; max_diff_bytes : au-delà, pas de diff"""
+        self.address = str(address)
+        self.history = deque(maxlen=history)
+        self.buffer = buffer
+        self.max_diff_bytes = max_diff_bytes
+        self.heartbeat = heartbeat
+        self.write_limit = write_limit
+        # Des centaines d'outils peuvent se (re)connecter en même temps
+        self.backlog = backlog
+        self.seq = 0
+        self.subscribers = set()
+        # (classeur, cible, artefact) -> dernier texte publié, pour les diffs
+        self.texts = {}
+        self.overflows = 0
+        # Délai laissé à un client débordé pour lire l'événement overflow
+        self.grace = 2.0
+        self.resumed = 0
+        self.loop = None
+        self._server = None
+        self._thread = None
+        self._error = None
+        self._ready = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='change-stream', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error:
+            raise self._error
+        return self
+
+    def stop(self, timeout=5.0):
+        loop = self.loop
+        if loop is None or self._thread is None:
+            return
+        try:
+            loop.call_soon_threadsafe(loop.stop)
+        except RuntimeError:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._server = self.loop.run_until_complete(self._listen())
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            self.loop.close()
+            return
+        logging.info(f"Flux des changements disponible sur {self.address}")
+        self.loop.create_task(self._heartbeat())
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self._server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+            kind = parse_address(self.address)
+            if kind[0] == 'unix' and os.path.exists(kind[1]):
+                os.remove(kind[1])
+
+    async def _listen(self):
+        kind = parse_address(self.address)
+        if kind[0] == 'unix':
+            if os.path.exists(kind[1]):
+                # Socket laissé par un arrêt brutal
+                os.remove(kind[1])
+            return await asyncio.start_unix_server(self._handle, kind[1], backlog=self.backlog)
+        server = await asyncio.start_server(self._handle, kind[1], kind[2], backlog=self.backlog)
+        # Port 0 : port choisi par le système
+        self.address = f"{kind[1]}:{server.sockets[0].getsockname()[1]}"
+        return server
+
+    async def _heartbeat(self):
+        # Une seule tâche pour tous les abonnés inactifs : détecte les clients
+        # partis sans fermer la connexion
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for subscriber in self.subscribers:
+                if not subscriber.items:
+                    subscriber.ping = True
+                    subscriber.wakeup.set()
+
+    def publish(self, workbook, target, artifact, kind, old=None, new=None, text=None, old_text=None):
+        """Appelable depuis n'importe quel thread ; ne bloque jamais le thread
+        de détection (le tri vers les abonnés se fait dans la boucle du serveur).
+        old_text : texte précédent, si le flux ne l'a pas déjà vu passer"""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        event = {'workbook': workbook, 'target': target, 'artifact': artifact, 'kind': kind,
+                 'old': old, 'new': new, 'time': time.time()}
+        try:
+            loop.call_soon_threadsafe(self._dispatch, event, text, old_text)
+        except RuntimeError:
+            # Serveur arrêté entre-temps
+            pass
+
+    def _dispatch(self, event, text, old_text=None):
+        key = (event['workbook'], event['target'], event['artifact'])
+        previous = self.texts.pop(key, old_text)
+        if text is not None and len(text) <= self.max_diff_bytes:
+            if previous is not None:
+                artifact = event['artifact']
+                event['diff'] = ''.join(difflib.unified_diff(previous.splitlines(True), text.splitlines(True),
+                                                             f"a/{artifact}", f"b/{artifact}"))
+            self.texts[key] = text
+        self.seq += 1
+        event['seq'] = self.seq
+        entry = StreamEntry(event)
+        self.history.append(entry)
+        for subscriber in self.subscribers:
+            if subscriber.filter.matches(event) and subscriber.offer(entry):
+                self.overflows += 1
+                # Client qui ne lit plus du tout : coupé sans attendre qu'il vide son tampon
+                self.loop.call_later(self.grace, subscriber.transport.abort)
+        METRICS.observe('stream.dispatch', time.time() - event['time'])
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10.0)
+            lines = request.decode('latin-1').split('\r\n')
+            method, target, _ = lines[0].split(' ', 2)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError,
+                ConnectionError, ValueError):
+            writer.close()
+            return
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if value:
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        try:
+            if method != 'GET':
+                await self._respond(writer, '405 Method Not Allowed', b'')
+            elif url.path == '/events':
+                await self._stream(writer, parse_qs(url.query), headers)
+            elif url.path == '/status':
+                await self._respond(writer, '200 OK', json.dumps(self.stats()).encode('utf-8'), 'application/json')
+            else:
+                await self._respond(writer, '404 Not Found', b'')
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, body, content_type='text/plain'):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+
+    async def _stream(self, writer, query, headers):
+        try:
+            since = query['since'][0] if 'since' in query else headers.get('last-event-id')
+            since = int(since) if since not in (None, '') else None
+        except ValueError:
+            await self._respond(writer, '400 Bad Request', b'since invalide')
+            return
+        subscriber = Subscriber(ChangeFilter.from_query(query),
+                                query.get('diff', ['0'])[0].lower() in ('1', 'true', 'yes'), self.buffer)
+        subscriber.transport = writer.transport
+        # Mémoire bornée par client : tampon du noyau, tampon du transport, puis buffer événements
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.write_limit)
+            except OSError:
+                pass
+        writer.transport.set_write_buffer_limits(high=self.write_limit)
+        writer.write(SSE_HEADERS)
+        # Historique relevé et abonnement dans le même pas de la boucle : ni trou ni doublon
+        backlog = []
+        if since is not None:
+            self.resumed += 1
+            oldest = self.history[0].seq if self.history else self.seq + 1
+            if since + 1 < oldest:
+                writer.write(sse_frame('gap', {'since': since, 'oldest': oldest}))
+            backlog = [entry for entry in self.history
+                       if entry.seq > since and subscriber.filter.matches(entry.event)]
+            subscriber.last_seq = since
+        else:
+            # Point de reprise si le client décroche avant son premier événement
+            subscriber.last_seq = self.seq
+        self.subscribers.add(subscriber)
+        try:
+            for start in range(0, len(backlog), self.buffer):
+                chunk = backlog[start:start + self.buffer]
+                writer.write(b''.join(entry.frame(subscriber.diff) for entry in chunk))
+                subscriber.last_seq = chunk[-1].seq
+                subscriber.sent += len(chunk)
+                await writer.drain()
+            while True:
+                if not subscriber.items and not subscriber.overflowed:
+                    subscriber.wakeup.clear()
+                    await subscriber.wakeup.wait()
+                if subscriber.ping:
+                    subscriber.ping = False
+                    if not subscriber.items and not subscriber.overflowed:
+                        writer.write(b": ping\n\n")
+                        await writer.drain()
+                        continue
+                if subscriber.overflowed:
+                    writer.write(sse_frame('overflow', {'resume': subscriber.last_seq}))
+                    await writer.drain()
+                    return
+                entries = list(subscriber.items)
+                subscriber.items.clear()
+                writer.write(b''.join(entry.frame(subscriber.diff) for entry in entries))
+                subscriber.last_seq = entries[-1].seq
+                subscriber.sent += len(entries)
+                await writer.drain()
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def stats(self):
+        return {
+            'address': self.address,
+            'seq': self.seq,
+            'subscribers': len(self.subscribers),
+            'history': len(self.history),
+            'overflows': self.overflows,
+            'resumed': self.resumed,
+        }
+
+
+async def read_events(address, since=None, limit=2 ** 20, **filters):
+    """Client minimal : itère sur (id, type, données) ; après 'overflow' ou une
+    coupure, se reconnecter avec since = dernier id reçu"""
+    kind = parse_address(address)
+    if kind[0] == 'unix':
+        reader, writer = await asyncio.open_unix_connection(kind[1], limit=limit)
+    else:
+        reader, writer = await asyncio.open_connection(kind[1], kind[2], limit=limit)
+    params = {key: ','.join(value) if isinstance(value, (list, tuple, set)) else value
+              for key, value in dict(filters, since=since).items() if value is not None and value is not False}
+    writer.write(f"GET /events?{urlencode(params)} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Accept: text/event-stream\r\n\r\n".encode('latin-1'))
+    try:
+        await reader.readuntil(b'\r\n\r\n')
+        while True:
+            # Un événement SSE par lecture, terminé par une ligne vide
+            try:
+                block = await reader.readuntil(b'\n\n')
+            except asyncio.IncompleteReadError:
+                break
+            fields = {}
+            for line in block.decode('utf-8').split('\n'):
+                if line and not line.startswith(':'):
+                    name, _, value = line.partition(':')
+                    fields[name] = value[1:] if value.startswith(' ') else value
+            if 'data' in fields:
+                seq = fields.get('id')
+                yield (int(seq) if seq else None), fields.get('event', 'message'), json.loads(fields['data'])
+    finally:
+        writer.close()
+
+
+async def follow(address, since=None, **filters):
+    """Abonnement sans fin : reconnexion et reprise après overflow ou coupure"""
+    while True:
+        try:
+            async for seq, event, data in read_events(address, since=since, **filters):
+                if event == 'overflow':
+                    logging.warning(f"Client en retard - reprise après {data['resume']}")
+                    since = data['resume']
+                    break
+                if event == 'gap':
+                    logging.warning(f"Événements perdus entre {data['since']} et {data['oldest']}")
+                    continue
+                since = seq
+                print(json.dumps(data, ensure_ascii=False), flush=True)
+        except (ConnectionError, OSError) as e:
+            logging.info(f"Flux indisponible ({e}) - nouvel essai dans 2s")
+            await asyncio.sleep(2.0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Abonnement au flux des changements (une ligne JSON par événement)")
+    parser.add_argument('address', help="hôte:port ou unix:/chemin du flux (monitor.py --stream)")
+    parser.add_argument('--artifact', action='append', help="motif du nom d'artefact (Module*, *.m...)")
+    parser.add_argument('--target', action='append', help="vba, powerquery, connections, sheets")
+    parser.add_argument('--kind', action='append', help="added, modified, removed")
+    parser.add_argument('--workbook', action='append', help="motif du nom de classeur")
+    parser.add_argument('--since', type=int, help="reprendre après ce numéro de séquence")
+    parser.add_argument('--diff', action='store_true', help="inclure les diffs")
+    args = parser.parse_args()
+    try:
+        asyncio.run(follow(args.address, since=args.since, artifact=args.artifact, target=args.target,
+                           kind=args.kind, workbook=args.workbook, diff='1' if args.diff else None))
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,279 @@
+import os
+import time
+import random
+import logging
+import pythoncom
+import win32com.client
+
+# Session COM résiliente : un appel refusé parce qu'Excel est occupé (édition
+# de cellule, boîte de dialogue) ou une connexion perdue ne doit plus coûter
+# un arrêt du processus. Les appels passent par COMSession.call, qui réessaie
+# avec un délai exponentiel à gigue, se rattache au classeur déjà ouvert via
+# la Running Object Table, et coupe le circuit si Excel reste injoignable.
+# Seul un classeur réellement fermé (absent de la ROT) met fin à la session.
+
+RPC_E_CALL_REJECTED = -2147418111
+RPC_E_SERVERCALL_RETRYLATER = -2147417846
+RPC_E_DISCONNECTED = -2147417848
+RPC_S_SERVER_UNAVAILABLE = -2147023174
+RPC_S_CALL_FAILED = -2147023170
+CO_E_OBJNOTCONNECTED = -2147220995
+
+BUSY = {RPC_E_CALL_REJECTED: 'RPC_E_CALL_REJECTED', RPC_E_SERVERCALL_RETRYLATER: 'RPC_E_SERVERCALL_RETRYLATER'}
+DISCONNECTED = {RPC_E_DISCONNECTED: 'RPC_E_DISCONNECTED', RPC_S_SERVER_UNAVAILABLE: 'RPC_S_SERVER_UNAVAILABLE',
+                RPC_S_CALL_FAILED: 'RPC_S_CALL_FAILED', CO_E_OBJNOTCONNECTED: 'CO_E_OBJNOTCONNECTED'}
+
+# IMessageFilter
+SERVERCALL_ISHANDLED = 0
+SERVERCALL_RETRYLATER = 2
+PENDINGMSG_WAITDEFPROCESS = 2
+
+
+def _matches(error, codes):
+    hresult = getattr(error, 'hresult', None)
+    if hresult is None and error.args and isinstance(error.args[0], int):
+        hresult = error.args[0]
+    if hresult in codes:
+        return True
+    # Messages des exceptions relayées (et du faux modèle COM)
+    text = str(error)
+    return any(name in text for name in codes.values())
+
+
+def is_busy(error):
+    """Excel refuse l'appel pour l'instant : réessayer sur le même objet"""
+    return _matches(error, BUSY)
+
+
+def is_disconnected(error):
+    """Le proxy COM est mort : se rattacher au classeur avant de réessayer"""
+    return _matches(error, DISCONNECTED)
+
+
+def is_transient(error):
+    return is_busy(error) or is_disconnected(error)
+
+
+class WorkbookClosed(Exception):
+    """Le classeur n'est plus ouvert dans aucune instance Excel"""
+
+
+class CircuitOpen(Exception):
+    """Trop d'échecs consécutifs : plus d'appels COM avant la fin du délai"""
+
+
+class MessageFilter:
+    """IMessageFilter : COM réessaie lui-même les appels refusés par un Excel
+    occupé pendant timeout secondes, au lieu de lever RPC_E_CALL_REJECTED"""
+    _com_interfaces_ = [getattr(pythoncom, 'IID_IMessageFilter', None)]
+    _public_methods_ = ['HandleInComingCall', 'RetryRejectedCall', 'MessagePending']
+
+    def __init__(self, timeout=10.0, retry_delay=0.25):
+        self.timeout_ms = int(timeout * 1000)
+        self.retry_ms = max(100, int(retry_delay * 1000))
+
+    def HandleInComingCall(self, dwCallType, hTaskCaller, dwTickCount, lpInterfaceInfo):
+        return SERVERCALL_ISHANDLED
+
+    def RetryRejectedCall(self, hTaskCallee, dwTickCount, dwRejectType):
+        if dwRejectType == SERVERCALL_RETRYLATER and dwTickCount < self.timeout_ms:
+            return self.retry_ms
+        return -1
+
+    def MessagePending(self, hTaskCallee, dwTickCount, dwPendingType):
+        return PENDINGMSG_WAITDEFPROCESS
+
+
+def register_message_filter(timeout=10.0):
+    """Installe le filtre sur le thread courant (appartement STA) ; False si indisponible"""
+    register = getattr(pythoncom, 'CoRegisterMessageFilter', None)
+    if register is None:
+        logging.debug("Filtre de messages COM indisponible")
+        return False
+    try:
+        from win32com.server.util import wrap
+        register(wrap(MessageFilter(timeout)))
+        return True
+    except Exception as e:
+        logging.debug(f"Filtre de messages COM non installé: {e}")
+        return False
+
+
+class Backoff:
+    """Délai exponentiel plafonné, tiré uniformément dans [0, plafond] (gigue complète)"""
+
+    def __init__(self, base=0.2, factor=2.0, max_delay=10.0, rng=None):
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt):
+        return self.rng.uniform(0, min(self.max_delay, self.base * self.factor ** attempt))
+
+
+class CircuitBreaker:
+    """Fermé : appels autorisés. Ouvert après threshold appels échoués
+    consécutifs, pendant reset_timeout secondes. Puis un appel d'essai : un
+    succès referme le circuit, un échec le rouvre."""
+
+    def __init__(self, threshold=3, reset_timeout=15.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self.remaining() == 0 else 'open'
+
+    def remaining(self):
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def allow(self):
+        return self.state != 'open'
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logging.info("Excel de nouveau joignable - circuit refermé")
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                self.trips += 1
+                logging.warning(f"Excel injoignable ({self.failures} échecs) - "
+                                f"pause de {self.reset_timeout:.0f}s avant nouvel essai")
+            self.opened_at = self.clock()
+
+
+def running_workbook(path):
+    """Classeur déjà ouvert, retrouvé par son chemin dans la Running Object Table"""
+    key = os.path.normcase(os.path.abspath(path))
+    context = pythoncom.CreateBindCtx(0)
+    table = pythoncom.GetRunningObjectTable()
+    for moniker in table:
+        try:
+            name = moniker.GetDisplayName(context, None)
+        except pythoncom.com_error:
+            continue
+        if os.path.normcase(name) == key:
+            obj = table.GetObject(moniker)
+            return win32com.client.Dispatch(obj.QueryInterface(pythoncom.IID_IDispatch))
+    return None
+
+
+class COMSession:
+    def __init__(self, excel_path, visible=True, attempts=6, backoff=None, breaker=None,
+                 sleep=time.sleep, clock=time.monotonic, dispatch=None):
+        """dispatch() : instance Excel où ouvrir le classeur s'il n'est pas
+        déjà ouvert (par défaut Dispatch, l'instance courante)"""
+        self.excel_path = os.path.abspath(excel_path)
+        self.visible = visible
+        self.dispatch = dispatch or (lambda: win32com.client.Dispatch("Excel.Application"))
+        self.attempts = attempts
+        self.backoff = backoff or Backoff()
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.sleep = sleep
+        self.clock = clock
+        self.excel = None
+        self.wb = None
+        # Vrai si c'est nous qui avons ouvert le classeur (et pouvons le refermer)
+        self.opened_here = False
+        self.on_reattach = []
+        self.stale = False
+        self.retries = 0
+        self.reattaches = 0
+
+    def attach(self):
+        """Rattachement au classeur ouvert, sans Workbooks.Open ; None s'il n'est pas ouvert"""
+        wb = running_workbook(self.excel_path)
+        if wb is None:
+            return None
+        self.wb = wb
+        self.excel = wb.Application
+        return wb
+
+    def still_open(self):
+        """Faux seulement si la ROT confirme que le classeur n'est plus ouvert"""
+        try:
+            return running_workbook(self.excel_path) is not None
+        except Exception:
+            return True
+
+    def open(self):
+        """Classeur ouvert par l'utilisateur s'il l'est déjà, sinon ouverture"""
+        register_message_filter()
+        # Nouveaux proxys : rien à rattacher avant le prochain appel
+        self.stale = False
+        if self.attach() is not None:
+            logging.info(f"Rattaché au classeur déjà ouvert: {self.excel_path}")
+            return self.wb
+        self.excel = self.dispatch()
+        self.excel.Visible = self.visible
+        self.wb = self.excel.Workbooks.Open(self.excel_path)
+        self.opened_here = True
+        return self.wb
+
+    def reattach(self):
+        """Après une déconnexion : nouveau proxy vers le même classeur, ou WorkbookClosed"""
+        if self.attach() is None:
+            raise WorkbookClosed(self.excel_path)
+        self.reattaches += 1
+        logging.info(f"Connexion COM rétablie: {self.excel_path}")
+        for callback in self.on_reattach:
+            callback(self.excel, self.wb)
+
+    def call(self, fn, *args):
+        """Appelle fn en réessayant les erreurs COM transitoires ; un appel qui
+        épuise ses essais compte comme un échec pour le disjoncteur"""
+        if not self.breaker.allow():
+            raise CircuitOpen(f"Excel injoignable, nouvel essai dans {self.breaker.remaining():.1f}s")
+        # Circuit à demi ouvert : un seul essai, qui le referme ou le rouvre
+        attempts = 1 if self.breaker.state == 'half-open' else self.attempts
+        attempt = 0
+        while True:
+            try:
+                if self.stale:
+                    self.reattach()
+                    self.stale = False
+                result = fn(*args)
+            except WorkbookClosed:
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    if not self.still_open():
+                        raise WorkbookClosed(self.excel_path) from e
+                    raise
+                # Proxy mort : rattachement avant l'essai suivant, même lors d'un prochain appel
+                self.stale = self.stale or is_disconnected(e)
+                attempt += 1
+                if attempt >= attempts:
+                    self.breaker.record_failure()
+                    raise
+                self.retries += 1
+                delay = self.backoff.delay(attempt - 1)
+                logging.info(f"Appel COM refusé ({e}) - essai {attempt + 1}/{attempts} dans {delay:.2f}s")
+                self.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def close(self, quit=True):
+        """Referme le classeur seulement si la session l'a ouvert ; quit :
+        quitte aussi Excel (pas quand l'instance sert à d'autres classeurs)"""
+        if self.opened_here and self.wb:
+            try:
+                self.wb.Close(False)
+                if quit:
+                    self.excel.Quit()
+            except:
+                pass
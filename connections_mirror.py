@@ -0,0 +1,125 @@
+import os
+import logging
+import threading
+
+from export_manifest import ExportManifest, content_digest
+from export_writer import ExportWriter
+
+# Miroir incrémental du dossier de connexions (.json) d'un classeur, tenu par
+# un thread dédié pour ne pas occuper le thread COM. Un index (mtime, taille,
+# empreinte) du dossier source évite de relire les fichiers inchangés : en
+# régime permanent une passe ne fait que lister le dossier.
+
+
+def find_connections_folder(excel_path):
+    """<classeur>_Connections à côté du classeur, sinon Connections"""
+    excel_dir = os.path.dirname(os.path.abspath(excel_path))
+    workbook_name = os.path.splitext(os.path.basename(excel_path))[0]
+    # Chercher avec les deux formats possibles
+    source_connections = os.path.join(excel_dir, f"{workbook_name}_Connections")
+    if not os.path.exists(source_connections):
+        source_connections = os.path.join(excel_dir, "Connections")
+    return source_connections
+
+
+class ConnectionsMirror:
+    def __init__(self, find_source, target_path, interval=2.0, fsync=True, on_change=None):
+        """find_source : fonction retournant le dossier source, réévaluée à
+        chaque passe (le dossier <classeur>_Connections peut apparaître plus tard) ;
+        on_change : transmis à l'ExportWriter du miroir"""
+        self.find_source = find_source
+        self.target_path = os.path.abspath(target_path)
+        os.makedirs(self.target_path, exist_ok=True)
+        self.manifest = ExportManifest(self.target_path).load()
+        self.writer = ExportWriter(self.manifest, fsync=fsync, on_change=on_change)
+        self.interval = interval
+        self.source = None
+        # Nom de fichier -> (mtime_ns, taille, empreinte) côté source
+        self.index = {}
+        self.stats = {'scans': 0, 'files_read': 0, 'bytes_read': 0, 'copied': 0, 'removed': 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.stats['files_read'] += 1
+        self.stats['bytes_read'] += len(data)
+        return data
+
+    def _list_source(self, source):
+        try:
+            return [entry for entry in os.scandir(source)
+                    if entry.name.endswith('.json') and entry.is_file()]
+        except FileNotFoundError:
+            if self.source != source or self.index:
+                logging.warning(f"Aucun dossier de connexions trouvé à: {source}")
+            return []
+
+    def scan(self):
+        """Une passe : copie les fichiers nouveaux ou modifiés, propage les
+        suppressions ; retourne le nombre de fichiers copiés ou supprimés"""
+        self.stats['scans'] += 1
+        source = self.find_source()
+        first = source != self.source
+        if first:
+            self.index = {}
+        entries = self._list_source(source)
+        self.source = source
+
+        current = {}
+        changed = {}
+        for entry in entries:
+            stat = entry.stat()
+            known = self.index.get(entry.name)
+            if known and known[:2] == (stat.st_mtime_ns, stat.st_size):
+                current[entry.name] = known
+                continue
+            data = self._read(entry.path)
+            digest = content_digest(data)
+            current[entry.name] = (stat.st_mtime_ns, stat.st_size, digest)
+            if not known or known[2] != digest:
+                changed[entry.name] = data
+
+        if first:
+            # Premier passage : adoption des copies existantes et suppression
+            # des fichiers sans source, sans récrire ce qui est déjà à jour
+            expected = {name: value[2] for name, value in current.items()}
+            to_write = self.manifest.reconcile(expected, ('.json',))
+            changed = {name: data for name, data in changed.items() if name in to_write}
+            removed = []
+        else:
+            removed = [name for name in self.index if name not in current]
+        self.index = current
+
+        for name, data in changed.items():
+            if self.writer.write_bytes(name, data, current[name][2]):
+                logging.info(f"Fichier de connexion copié: {name}")
+                self.stats['copied'] += 1
+        for name in removed:
+            self.writer.remove(name)
+            self.stats['removed'] += 1
+        if changed or removed or self.manifest.dirty:
+            self.writer.flush()
+        return len(changed) + len(removed)
+
+    def _run(self):
+        while True:
+            try:
+                self.scan()
+            except Exception as e:
+                logging.error(f"Erreur miroir des connexions: {e}")
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='connections-mirror', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
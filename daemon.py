@@ -0,0 +1,319 @@
+import os
+import sys
+import json
+import logging
+import threading
+import pythoncom
+import win32com.client
+import metrics
+from com_session import Backoff, CircuitOpen, COMSession, WorkbookClosed, register_message_filter
+from engine import ExtractionEngine
+from scheduler import SharedScheduler, VBA, POWERQUERY, CONNECTIONS, attach_excel_events
+from log_setup import configure_logging
+
+# Démon multi-classeurs : un seul processus surveille tous les classeurs d'une
+# configuration JSON. Un pool borné de workers COM (un appartement et une
+# instance Excel chacun) se partage les classeurs, et un ordonnanceur commun
+# applique priorités, limites de débit et contre-pression. Chaque classeur
+# est extrait par un ExtractionEngine (engine.py) attaché au worker, et ses
+# appels COM passent par une COMSession (com_session.py) : appels refusés
+# réessayés avec délai, rattachement par la ROT après une coupure. Un
+# classeur fermé ou perdu avec son Excel reste surveillé : sauvegarde depuis
+# le cache, puis réouverture avec un délai croissant.
+#
+# Exemple de configuration :
+# {
+#     "workers": 4,
+#     "git": false,
+#     "versions": ".versions",
+#     "stream": "127.0.0.1:8765",
+#     "metrics": {"stats": "daemon_stats.json", "interval": 10, "port": 9100},
+#     "workbooks": [
+#         {"path": "Ventes.xlsm", "priority": 2, "min_interval": 1},
+#         {"path": "Archives/Historique.xlsm", "export": "exports/historique",
+#          "extract": ["vba", "sheets"], "min_interval": 30}
+#     ]
+# }
+
+
+def load_config(path):
+    """Lit la configuration ; les chemins relatifs partent du fichier de configuration"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    workbooks = []
+    export_roots = {}
+    for entry in config.get('workbooks', []):
+        entry = dict({'path': entry} if isinstance(entry, str) else entry)
+        entry['path'] = os.path.abspath(os.path.join(base, entry['path']))
+        if entry.get('export'):
+            entry['export'] = os.path.abspath(os.path.join(base, entry['export']))
+        entry.setdefault('extract', [VBA, POWERQUERY, CONNECTIONS])
+        export_root = os.path.normcase(entry.get('export') or os.path.dirname(entry['path']))
+        if export_root in export_roots:
+            raise ValueError(f"Dossier d'export partagé par {export_roots[export_root]} et {entry['path']} : "
+                             f"préciser 'export'")
+        export_roots[export_root] = entry['path']
+        workbooks.append(entry)
+    config['workbooks'] = workbooks
+    if config.get('versions'):
+        config['versions'] = os.path.abspath(os.path.join(base, config['versions']))
+    if config.get('metrics', {}).get('stats'):
+        config['metrics']['stats'] = os.path.abspath(os.path.join(base, config['metrics']['stats']))
+    return config
+
+
+class WorkbookJob:
+    """Un classeur de la configuration, sa session COM et son moteur d'extraction"""
+
+    def __init__(self, entry, scheduler, committer=None, stream=None):
+        self.entry = entry
+        self.path = entry['path']
+        # Le moteur borne lui-même max_interval à ce qu'exigent ses extracteurs
+        self.handle = scheduler.register(self.path, entry.get('priority', 0), entry.get('min_interval', 1.0),
+                                         entry.get('max_interval', 60.0))
+        self.engine = ExtractionEngine(self.path, targets=entry['extract'], committer=committer,
+                                       export_root=entry.get('export'), stream=stream, scheduler=self.handle)
+        # Estimation du coût d'un scan, pour répartir les classeurs entre workers
+        self.weight = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.session = None
+        self.wb = None
+        self.event_handlers = []
+        # Réouverture après une perte du classeur : échecs consécutifs et prochain essai
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def bind(self, session):
+        self.session = session
+        session.on_reattach.append(self.reattach)
+
+    def open(self):
+        """Rattachement au classeur déjà ouvert (ROT) ou ouverture"""
+        wb = self.session.open()
+        excel = self.session.excel
+        if self.engine.wb is None:
+            self.engine.attach(excel, wb)
+        else:
+            # Réouverture : instantanés conservés, la passe suivante exporte les différences
+            self.engine.rebind(excel, wb)
+        self.wb = wb
+        self.attach_events(excel, wb)
+        # Écritures, fsync et commits hors du thread du worker
+        self.engine.start_pipeline()
+        self.failures = 0
+        logging.info(f"Classeur ouvert: {self.path}")
+
+    def reattach(self, excel, wb):
+        """Connexion COM rétablie par la session : même classeur, nouveaux proxys"""
+        self.wb = wb
+        self.engine.rebind(excel, wb)
+        self.attach_events(excel, wb)
+
+    def attach_events(self, excel, wb):
+        self.event_handlers = attach_excel_events(excel, wb, self.handle, self.path, dirty=self.engine.dirty)
+
+    def scan(self, wakeup):
+        return self.session.call(self.engine.tick, wakeup)
+
+    def retry_later(self, backoff, now):
+        """Prochain essai d'ouverture ; retourne le délai"""
+        delay = backoff.delay(self.failures)
+        self.failures += 1
+        self.retry_at = now + delay
+        return delay
+
+    def lost(self, backoff, now):
+        """Classeur fermé ou Excel perdu : sauvegarde depuis le cache, réouverture plus tard"""
+        self.event_handlers = []
+        self.wb = None
+        self.engine.save_from_cache()
+        return self.retry_later(backoff, now)
+
+    def close(self):
+        self.event_handlers = []
+        self.engine.stop()
+        if self.session:
+            # L'instance Excel du worker sert aux autres classeurs
+            self.session.close(quit=False)
+        self.wb = None
+
+
+class COMWorker(threading.Thread):
+    """Un appartement COM et une instance Excel dédiée pour ses classeurs"""
+
+    def __init__(self, index, scheduler, visible=True, pump_interval=0.1, backoff=None):
+        super().__init__(name=f'com-worker-{index}', daemon=True)
+        self.scheduler = scheduler
+        self.visible = visible
+        self.pump_interval = pump_interval
+        # Délai avant de rouvrir un classeur perdu
+        self.backoff = backoff or Backoff(base=1.0, max_delay=60.0)
+        self.jobs = {}
+        self.weight = 0
+        self.excel = None
+        self.stopping = threading.Event()
+
+    def assign(self, job):
+        self.jobs[job.path] = job
+        self.weight += job.weight
+        job.bind(COMSession(job.path, visible=self.visible, dispatch=self.application))
+
+    def application(self):
+        """Instance Excel du worker, recréée si elle a disparu"""
+        if self.excel is None or not self.excel_alive():
+            # DispatchEx : une instance Excel par worker, jamais partagée
+            self.excel = win32com.client.DispatchEx("Excel.Application")
+            self.excel.Visible = self.visible
+            self.excel.DisplayAlerts = False
+        return self.excel
+
+    def excel_alive(self):
+        try:
+            _ = self.excel.Workbooks.Count
+            return True
+        except Exception:
+            return False
+
+    def open_job(self, job):
+        try:
+            job.open()
+            return True
+        except Exception as e:
+            delay = job.retry_later(self.backoff, self.scheduler.clock())
+            logging.error(f"Erreur lors de l'ouverture de {job.path}: {e} - nouvel essai dans {delay:.0f}s")
+            return False
+
+    def step(self):
+        """Un scan du classeur le plus prioritaire prêt, ou sa réouverture"""
+        key, wakeup = self.scheduler.next_for(list(self.jobs), self.pump_interval)
+        if key is None:
+            return
+        job = self.jobs[key]
+        start = self.scheduler.clock()
+        if job.wb is None and (start < job.retry_at or not self.open_job(job)):
+            self.scheduler.done(key, False, 0.0)
+            return
+        changed = False
+        try:
+            changed = job.scan(wakeup)
+        except WorkbookClosed:
+            delay = job.lost(self.backoff, self.scheduler.clock())
+            logging.info(f"Classeur fermé - sauvegardé depuis le cache, réouverture dans {delay:.0f}s: {job.path}")
+        except CircuitOpen as e:
+            logging.info(f"{e}: {job.path}")
+        except Exception as e:
+            # Essais de la session épuisés ou erreur inattendue : le classeur reste surveillé
+            logging.error(f"Scan reporté ({e}): {job.path}")
+        self.scheduler.done(key, changed, self.scheduler.clock() - start)
+
+    def run(self):
+        pythoncom.CoInitialize()
+        # Appels refusés par un Excel occupé : réessayés par COM plutôt que levés
+        register_message_filter()
+        try:
+            for job in list(self.jobs.values()):
+                self.open_job(job)
+            while self.jobs and not self.stopping.is_set():
+                # Les événements COM ne sont délivrés que pendant le pompage des messages
+                pythoncom.PumpWaitingMessages()
+                self.step()
+        except Exception as e:
+            logging.error(f"Erreur du worker {self.name}: {e}")
+        finally:
+            for job in list(self.jobs.values()):
+                job.close()
+            try:
+                if self.excel:
+                    self.excel.Quit()
+            except:
+                pass
+            pythoncom.CoUninitialize()
+
+
+class ExcelDaemon:
+    def __init__(self, config):
+        self.config = config
+        self.setup_logging()
+        self.scheduler = SharedScheduler(duty_cycle=config.get('duty_cycle', 0.25),
+                                         aging=config.get('aging', 30.0))
+        self.committers = {}
+        # Historique des révisions partagé par tous les classeurs (contenus dédupliqués)
+        self.versions = None
+        if config.get('versions'):
+            from version_store import VersionStore
+            self.versions = VersionStore(config['versions'])
+        # Flux des changements de tous les classeurs (change_stream.py)
+        self.stream = None
+        if config.get('stream'):
+            from change_stream import ChangeStreamServer
+            self.stream = ChangeStreamServer(config['stream'])
+        self.jobs = []
+        for entry in config['workbooks']:
+            committer = self.committer_for(entry) if entry.get('git', config.get('git', False)) else None
+            if self.versions:
+                from version_store import combine_sinks
+                committer = combine_sinks(committer, self.versions)
+            self.jobs.append(WorkbookJob(entry, self.scheduler, committer, self.stream))
+
+        count = max(1, min(config.get('workers', 4), len(self.jobs)))
+        self.workers = [COMWorker(index, self.scheduler, config.get('visible', True)) for index in range(count)]
+        # Les plus gros classeurs d'abord, chacun vers le worker le moins chargé
+        for job in sorted(self.jobs, key=lambda job: job.weight, reverse=True):
+            min(self.workers, key=lambda worker: worker.weight).assign(job)
+
+    def setup_logging(self):
+        configure_logging('daemon.log', console_format='%(asctime)s - %(threadName)s - %(message)s')
+
+    def committer_for(self, entry):
+        """Un GitCommitter par dépôt, partagé par les classeurs qui y exportent"""
+        from git_committer import GitCommitter
+        root = entry.get('export') or os.path.dirname(entry['path'])
+        key = os.path.normcase(root)
+        if key not in self.committers:
+            self.committers[key] = GitCommitter(root)
+        return self.committers[key]
+
+    def run(self):
+        logging.info(f"Démon: {len(self.jobs)} classeur(s), {len(self.workers)} worker(s) COM")
+        dumper = server = None
+        if self.config.get('metrics'):
+            options = self.config['metrics']
+            dumper, server = metrics.enable(options.get('stats'), options.get('interval', 10.0), options.get('port'))
+        for committer in self.committers.values():
+            committer.start()
+        if self.versions:
+            self.versions.start()
+        if self.stream:
+            self.stream.start()
+        for worker in self.workers:
+            worker.start()
+        try:
+            while any(worker.is_alive() for worker in self.workers):
+                for worker in self.workers:
+                    worker.join(1.0)
+        except KeyboardInterrupt:
+            logging.info("Arrêt demandé")
+        finally:
+            for worker in self.workers:
+                worker.stopping.set()
+            for worker in self.workers:
+                worker.join()
+            for committer in self.committers.values():
+                committer.stop()
+            if self.versions:
+                self.versions.stop()
+            if self.stream:
+                self.stream.stop()
+            if dumper:
+                dumper.stop()
+            if server:
+                server.shutdown()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python daemon.py configuration.json")
+        sys.exit(1)
+
+    daemon = ExcelDaemon(load_config(sys.argv[1]))
+    daemon.run()
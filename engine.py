@@ -0,0 +1,263 @@
+import os
+import sys
+import time
+import logging
+import pythoncom
+from change_stream import ADDED, MODIFIED, REMOVED
+from com_session import COMSession, CircuitOpen, WorkbookClosed, is_transient
+from extractors import EXTRACTORS
+from metrics import METRICS
+from origin_index import OriginIndex
+from pipeline import ExportPipeline
+from scheduler import AdaptiveScheduler, VBA, POWERQUERY, CONNECTIONS, attach_excel_events
+from log_setup import configure_logging
+
+# Moteur d'extraction unifié : une seule session COM et un seul classeur
+# ouvert, un seul ordonnanceur, et à chaque réveil une passe qui relève
+# d'abord l'instantané de tous les extracteurs concernés (vue cohérente du
+# classeur) puis exporte les différences et regroupe les écritures. Avec le
+# pipeline (start_pipeline, pipeline.py), le thread COM ne fait que relever :
+# comparaison, écritures, fsync, publication et commits se font sur les
+# threads du pipeline. Seuls les exports qui passent par COM (Export des
+# composants VBA, préparés dans .staging) restent sur le thread COM.
+
+
+def diff_snapshots(previous, current):
+    """(ajoutés ou modifiés, supprimés) en comparant les empreintes 'hash'"""
+    changed = {name: data for name, data in current.items()
+               if name not in previous or previous[name]['hash'] != data['hash']}
+    removed = {name: data for name, data in previous.items() if name not in current}
+    return changed, removed
+
+
+def flatten(snapshots):
+    """{cible: {nom: données}} -> {(cible, nom): données}"""
+    return {(target, name): data for target, snapshot in snapshots.items() for name, data in snapshot.items()}
+
+
+def diff_changes(previous, current):
+    """{(cible, nom): (ancien, nouveau)} entre deux instantanés aplatis ;
+    ancien None si ajouté, nouveau None si supprimé"""
+    changes = {key: (data, None) for key, data in previous.items() if key not in current}
+    for key, data in current.items():
+        old = previous.get(key)
+        if old is None or old['hash'] != data['hash']:
+            changes[key] = (old, data)
+    return changes
+
+
+class ExtractionEngine:
+    def __init__(self, excel_path, targets=(VBA, POWERQUERY, CONNECTIONS), committer=None, export_root=None,
+                 stream=None, scheduler=None):
+        """export_root : dossier contenant macros_export/ et powerquery_export/
+        (par défaut celui du classeur) ; stream : ChangeStreamServer qui
+        publie chaque changement détecté (change_stream.py) ; scheduler :
+        ordonnanceur qui reçoit les événements (par défaut un
+        AdaptiveScheduler propre au moteur, le démon passe le SchedulerHandle
+        du classeur)"""
+        self.excel_path = os.path.abspath(excel_path)
+        self.export_root = os.path.abspath(export_root or os.path.dirname(self.excel_path))
+        self.excel = None
+        self.wb = None
+        self.committer = committer
+        self.stream = stream
+        self.origins = OriginIndex()
+        self.scheduler = scheduler or AdaptiveScheduler(pump=pythoncom.PumpWaitingMessages)
+        self.event_handlers = []
+        self.session = None
+        self.setup_logging()
+        # Zones modifiées des feuilles, créées par SheetsExtractor
+        self.dirty = None
+        self.extractors = [EXTRACTORS[target](self) for target in targets]
+        if self.poll_bound():
+            self.scheduler.max_interval = min(self.scheduler.max_interval, self.poll_bound())
+        self.snapshots = {}
+        self.passes = 0
+        # Étages d'export hors du thread COM (start_pipeline) ; sans lui, tout se fait dans tick
+        self.pipeline = None
+
+    def setup_logging(self):
+        configure_logging('monitor.log')
+
+    def export_path(self, folder):
+        return os.path.join(self.export_root, folder)
+
+    def poll_bound(self):
+        """Intervalle maximal du poll de secours exigé par les extracteurs (None : libre)"""
+        bounds = [extractor.max_interval for extractor in self.extractors if extractor.max_interval]
+        return min(bounds) if bounds else None
+
+    def attach(self, excel, wb):
+        """Branche les extracteurs sur un classeur déjà ouvert"""
+        self.excel = excel
+        self.wb = wb
+        for extractor in self.extractors:
+            self.snapshots[extractor.target] = extractor.remember(extractor.start())
+
+    def start_pipeline(self):
+        """Comparaisons et écritures sur les threads du pipeline, après attach"""
+        if self.pipeline is None:
+            self.pipeline = ExportPipeline(diff_changes, self.write_changes, writers=1,
+                                           name='engine').start(flatten(self.snapshots))
+        return self.pipeline
+
+    def stop_pipeline(self):
+        """Attend que les changements en cours soient écrits"""
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+
+    def rebind(self, excel, wb):
+        """Nouveaux proxys vers le même classeur : les instantanés sont
+        conservés, seuls les objets COM des extracteurs sont remplacés"""
+        self.excel = excel
+        self.wb = wb
+        for extractor in self.extractors:
+            extractor.rebind()
+
+    def reattach(self, excel, wb):
+        """Connexion COM rétablie (COMSession.on_reattach) : proxys et événements"""
+        self.rebind(excel, wb)
+        self.event_handlers = attach_excel_events(excel, wb, self.scheduler, self.excel_path,
+                                                  dirty=self.dirty)
+
+    def tick(self, wakeup=None):
+        """Une passe : instantanés, puis exports des différences ; retourne True si changement"""
+        with METRICS.cycle('cycle.engine'):
+            return self._tick(wakeup)
+
+    def _tick(self, wakeup):
+        _ = self.wb.Name
+        wanted = [extractor for extractor in self.extractors
+                  if wakeup is None or wakeup.wants(extractor.target)]
+        current = {}
+        for extractor in wanted:
+            if wakeup is not None:
+                extractor.wake(wakeup)
+            try:
+                with METRICS.timer(f"scan.{extractor.target}"):
+                    current[extractor.target] = extractor.scan()
+            except Exception as e:
+                if is_transient(e):
+                    raise
+                # Requête en cours de chargement, VBE occupé... : l'instantané précédent reste la référence
+                logging.info(f"Scan {extractor.target} impossible ({e}) - nouvel essai au prochain cycle")
+        self.passes += 1
+
+        changed = False
+        for extractor in wanted:
+            if extractor.target not in current:
+                continue
+            updated, removed = diff_snapshots(self.snapshots.get(extractor.target, {}), current[extractor.target])
+            if extractor.com_export:
+                # Export par COM : préparé ici, publié avec les autres écritures
+                for name, data in updated.items():
+                    extractor.export(name, data)
+            changed = changed or bool(updated or removed)
+        previous = self.snapshots
+        self.snapshots = dict(previous)
+        for extractor in wanted:
+            if extractor.target in current:
+                self.snapshots[extractor.target] = extractor.remember(current[extractor.target])
+        if not changed:
+            return False
+        snapshot = flatten(dict(previous, **current))
+        if self.pipeline is not None:
+            self.pipeline.submit(snapshot)
+        else:
+            try:
+                self.write_changes(0, diff_changes(flatten(previous), snapshot))
+            except Exception as e:
+                # Instantané non publié : la passe suivante retrouve les mêmes différences
+                self.snapshots = previous
+                logging.error(f"Erreur d'écriture des exports: {e} - nouvel essai au prochain cycle")
+        return True
+
+    def write_changes(self, index, changes):
+        """Écrit les changements d'une ou plusieurs passes, puis les publie"""
+        by_target = {}
+        for (target, name), change in changes.items():
+            by_target.setdefault(target, {})[name] = change
+        for extractor in self.extractors:
+            entries = by_target.get(extractor.target)
+            if not entries:
+                continue
+            previous = {name: old for name, (old, new) in entries.items() if old is not None}
+            updated = {name: new for name, (old, new) in entries.items() if new is not None}
+            removed = {name: old for name, (old, new) in entries.items() if new is None}
+            for name, data in removed.items():
+                extractor.remove(name, data)
+            if not extractor.com_export:
+                for name, data in updated.items():
+                    extractor.export(name, data)
+            extractor.flush()
+            if self.stream:
+                self.publish(extractor, previous, updated, removed)
+
+    def publish(self, extractor, previous, updated, removed):
+        """Changements de la passe vers le flux, une fois les exports écrits"""
+        for name, data in removed.items():
+            self.stream.publish(self.excel_path, extractor.target, name, REMOVED, old=data['hash'])
+        for name, data in updated.items():
+            old = previous.get(name)
+            self.stream.publish(self.excel_path, extractor.target, name, MODIFIED if old else ADDED,
+                                old=old and old['hash'], new=data['hash'], text=extractor.text(data),
+                                old_text=old and extractor.text(old))
+
+    def save_from_cache(self):
+        self.stop_pipeline()
+        for extractor in self.extractors:
+            try:
+                extractor.save_from_cache()
+            except Exception as e:
+                logging.error(f"Erreur sauvegarde cache {extractor.target}: {e}")
+
+    def stop(self):
+        self.stop_pipeline()
+        for extractor in self.extractors:
+            extractor.stop()
+
+    def cleanup(self):
+        if self.session:
+            self.session.close()
+
+    def monitor(self):
+        self.session = COMSession(self.excel_path)
+        self.session.on_reattach.append(self.reattach)
+        try:
+            wb = self.session.open()
+            self.excel = self.session.excel
+            logging.info(f"Surveillance du fichier: {self.excel_path}")
+            self.event_handlers = attach_excel_events(self.excel, wb, self.scheduler, self.excel_path,
+                                                      dirty=self.dirty)
+            if self.committer:
+                self.committer.start()
+            self.attach(self.excel, wb)
+            self.start_pipeline()
+
+            while True:
+                wakeup = self.scheduler.wait()
+                try:
+                    changed = self.session.call(self.tick, wakeup)
+                except WorkbookClosed:
+                    logging.info("Excel fermé par l'utilisateur - Sauvegarde depuis le cache...")
+                    self.save_from_cache()
+                    sys.exit(0)
+                except CircuitOpen as e:
+                    logging.info(f"{e}")
+                    time.sleep(self.session.breaker.remaining())
+                    continue
+                except Exception as e:
+                    # Erreur passagère ou inattendue : la session continue, le disjoncteur limite les essais
+                    logging.error(f"Erreur pendant la surveillance: {e}")
+                    changed = False
+                self.scheduler.record_activity(changed)
+
+        except Exception as e:
+            logging.error(f"Erreur lors de l'ouverture du fichier: {e}")
+            sys.exit(1)
+        finally:
+            self.stop()
+            if self.committer:
+                self.committer.stop()
+            self.cleanup()
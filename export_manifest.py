@@ -0,0 +1,163 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+MANIFEST_NAME = '.export_manifest.json'
+
+
+def content_digest(content):
+    """Empreinte SHA-1 d'un texte ou d'un contenu binaire"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha1(content).hexdigest()
+
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ExportManifest:
+    """Manifeste persistant des fichiers exportés et de leurs empreintes.
+
+    Chaque entrée (chemin relatif au dossier d'export) retient l'empreinte
+    de la source (formule, code du module, fichier de connexion), l'empreinte
+    du fichier écrit et son (mtime, taille) pour éviter de le relire.
+    """
+
+    def __init__(self, root, name=MANIFEST_NAME):
+        self.root = os.path.abspath(root)
+        self.path = os.path.join(self.root, name)
+        self.entries = {}
+        self.dirty = False
+        # Plusieurs écrivains peuvent partager le manifeste (pipeline.py)
+        self.lock = threading.RLock()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get('files', {})
+        except FileNotFoundError:
+            entries = {}
+        except (ValueError, OSError) as e:
+            logging.warning(f"Manifeste illisible, reconstruction: {e}")
+            entries = {}
+        with self.lock:
+            self.entries = entries
+            self.dirty = False
+        return self
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'files': self.entries}, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def full_path(self, rel):
+        return os.path.join(self.root, rel)
+
+    def _disk_digest(self, rel, entry=None):
+        """Empreinte du fichier sur disque, sans le relire si son stat est inchangé"""
+        try:
+            stat = os.stat(self.full_path(rel))
+        except FileNotFoundError:
+            return None
+        if entry and entry.get('mtime') == stat.st_mtime_ns and entry.get('size') == stat.st_size:
+            return entry['digest']
+        return file_digest(self.full_path(rel))
+
+    def matches(self, rel, source):
+        """Vrai si le fichier exporté correspond déjà à cette source"""
+        entry = self.entries.get(rel)
+        if not entry or entry.get('source') != source:
+            return False
+        return self._disk_digest(rel, entry) == entry['digest']
+
+    def record(self, rel, source, digest=None):
+        """Enregistre l'état du fichier qui vient d'être écrit pour cette source"""
+        path = self.full_path(rel)
+        stat = os.stat(path)
+        entry = {
+            'source': source,
+            'digest': digest or file_digest(path),
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+        }
+        with self.lock:
+            self.entries[rel] = entry
+            self.dirty = True
+
+    def forget(self, rel):
+        with self.lock:
+            if self.entries.pop(rel, None) is not None:
+                self.dirty = True
+
+    def remove(self, rel):
+        """Supprime le fichier exporté et son entrée"""
+        path = self.full_path(rel)
+        if os.path.exists(path):
+            os.remove(path)
+            logging.info(f"Fichier supprimé: {path}")
+        self.forget(rel)
+
+    def reconcile(self, expected, managed):
+        """Aligne le dossier d'export sur l'état attendu {chemin relatif: empreinte source}.
+
+        Les fichiers déjà à jour sont conservés, ceux dont le contenu est
+        identique à la source sont adoptés ou renommés, les fichiers gérés
+        (extensions ``managed``) enregistrés au manifeste qui n'ont plus de
+        source sont supprimés ; les fichiers absents du manifeste et les
+        entrées d'autres extensions ne sont pas concernés.
+        Retourne l'ensemble des chemins relatifs restant à écrire.
+        """
+        # Manifeste partagé par les écrivains du pipeline : pas de record/save concurrent
+        with self.lock:
+            to_write = set()
+            for rel, source in expected.items():
+                if self.matches(rel, source):
+                    continue
+                # Fichier présent sans entrée (premier lancement) : on l'adopte
+                # si son contenu est exactement la source
+                if os.path.exists(self.full_path(rel)) and self._disk_digest(rel) == source:
+                    self.record(rel, source)
+                    continue
+                to_write.add(rel)
+
+            # Seuls les fichiers que le manifeste a enregistrés nous appartiennent :
+            # un fichier inconnu du dossier d'export est laissé à l'utilisateur
+            stale = [rel for rel in self.entries if rel not in expected and rel.endswith(managed)]
+
+            # Renommages : un fichier orphelin dont le contenu est la source attendue
+            by_source = {}
+            for rel in stale:
+                entry = self.entries.get(rel)
+                if entry and entry['digest'] == entry['source'] and self._disk_digest(rel, entry) == entry['digest']:
+                    by_source.setdefault(entry['source'], []).append(rel)
+            for rel in sorted(to_write):
+                candidates = by_source.get(expected[rel])
+                if not candidates:
+                    continue
+                old_rel = candidates.pop()
+                os.makedirs(os.path.dirname(self.full_path(rel)), exist_ok=True)
+                os.replace(self.full_path(old_rel), self.full_path(rel))
+                logging.info(f"Fichier renommé: {old_rel} -> {rel}")
+                self.forget(old_rel)
+                self.record(rel, expected[rel])
+                stale.remove(old_rel)
+                to_write.discard(rel)
+
+            for rel in stale:
+                try:
+                    self.remove(rel)
+                except OSError as e:
+                    logging.error(f"Erreur suppression {rel}: {e}")
+            return to_write
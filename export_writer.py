@@ -0,0 +1,215 @@
+import os
+import shutil
+import logging
+import threading
+
+from export_manifest import content_digest, file_digest
+from metrics import METRICS
+from origin_index import path_key
+
+# Écriture des exports partagée par les moniteurs : un fichier n'est écrit que
+# si son contenu change, toujours via un fichier temporaire puis os.replace
+# (jamais de .m/.bas tronqué), et les fsync sont regroupés en fin de cycle.
+# Préparation et flush peuvent se faire sur deux threads (thread COM et
+# pipeline du moteur) : flush renomme les fichiers qu'il publie, un export
+# suivant vers le dossier de préparation ne peut donc pas les remplacer.
+
+STAGING_DIR = '.staging'
+FLUSH_SUFFIX = '.flush'
+
+
+class ExportWriter:
+    def __init__(self, manifest, fsync=True, origins=None, origin=None, on_change=None, staging=None):
+        """origins/origin : index d'origine (OriginIndex) où déclarer chaque
+        fichier écrit avant qu'il n'apparaisse dans le dossier surveillé ;
+        on_change(écrits, supprimés) reçoit les chemins touchés à chaque flush ;
+        staging : sous-dossier de préparation propre à cet écrivain, quand
+        plusieurs écrivains partagent le manifeste (discard n'efface que le sien)"""
+        self.manifest = manifest
+        self.fsync = fsync
+        self.origins = origins
+        self.origin = origin
+        self.on_change = on_change
+        self.staging_path = os.path.join(manifest.root, STAGING_DIR, *([staging] if staging else []))
+        self.staged = {}
+        # Fichiers pris par un flush en cours : le manifeste et le disque ne
+        # reflètent pas encore ce qui va y être publié
+        self.flushing = set()
+        self.removed = []
+        self.reset_stats()
+        self.totals = dict(self.stats)
+        self._lock = threading.RLock()
+
+    def reset_stats(self):
+        self.stats = {'files_written': 0, 'bytes_written': 0, 'files_skipped': 0, 'bytes_skipped': 0,
+                      'files_removed': 0}
+
+    def _count(self, written, size):
+        prefix = 'written' if written else 'skipped'
+        self.stats[f'files_{prefix}'] += 1
+        self.stats[f'bytes_{prefix}'] += size
+
+    def _unchanged(self, rel, digest):
+        entry = self.manifest.entries.get(rel)
+        if entry:
+            return self.manifest._disk_digest(rel, entry) == digest
+        path = self.manifest.full_path(rel)
+        return os.path.exists(path) and file_digest(path) == digest
+
+    def _stage_path(self, rel):
+        path = os.path.join(self.staging_path, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def _unstage(self, rel):
+        """Abandonne la préparation en attente de rel (retour à l'état publié)"""
+        if self.staged.pop(rel, None) is not None:
+            stage_path = os.path.join(self.staging_path, rel)
+            if os.path.exists(stage_path):
+                os.remove(stage_path)
+
+    def write_bytes(self, rel, data, source=None):
+        """Prépare l'écriture de data ; retourne False si le fichier est déjà identique"""
+        with self._lock:
+            digest = content_digest(data)
+            source = source or digest
+            if rel not in self.flushing:
+                if self.manifest.matches(rel, source):
+                    # Modification préparée puis annulée avant le flush
+                    self._unstage(rel)
+                    self._count(False, len(data))
+                    return False
+                if self._unchanged(rel, digest):
+                    # Même contenu sur disque : on met seulement le manifeste à jour
+                    self._unstage(rel)
+                    self.manifest.record(rel, source, digest)
+                    self._count(False, len(data))
+                    return False
+            stage_path = self._stage_path(rel)
+            with METRICS.timer('io.stage') as timer, open(stage_path, 'wb') as f:
+                f.write(data)
+                timer.bytes = len(data)
+            self.staged[rel] = (source, digest)
+            self._count(True, len(data))
+            return True
+
+    def write_text(self, rel, text, source=None):
+        """Le texte est écrit tel quel (newline=''), encodé en UTF-8"""
+        return self.write_bytes(rel, text.encode('utf-8'), source or content_digest(text))
+
+    def copy_file(self, source_file, rel, source=None):
+        with open(source_file, 'rb') as f:
+            return self.write_bytes(rel, f.read(), source)
+
+    def export_component(self, component, rels, source):
+        """Export COM vers le dossier de préparation, puis seulement les fichiers modifiés"""
+        with self._lock:
+            if source is not None and not self.flushing.intersection(rels) \
+                    and all(self.manifest.matches(rel, source) for rel in rels):
+                for rel in rels:
+                    self._unstage(rel)
+                self.stats['files_skipped'] += len(rels)
+                return False
+            with METRICS.timer('com.Export'):
+                component.Export(self._stage_path(rels[0]))
+            written = False
+            for rel in rels:
+                stage_path = os.path.join(self.staging_path, rel)
+                if not os.path.exists(stage_path):
+                    continue
+                size = os.path.getsize(stage_path)
+                digest = file_digest(stage_path)
+                if rel not in self.flushing and self._unchanged(rel, digest):
+                    self._unstage(rel)
+                    if os.path.exists(stage_path):
+                        os.remove(stage_path)
+                    self.manifest.record(rel, source, digest)
+                    self._count(False, size)
+                    continue
+                self.staged[rel] = (source, digest)
+                self._count(True, size)
+                written = True
+            return written
+
+    def remove(self, rel):
+        with self._lock:
+            self._unstage(rel)
+            if os.path.exists(self.manifest.full_path(rel)) or rel in self.manifest.entries:
+                self.manifest.remove(rel)
+                self.removed.append(self.manifest.full_path(rel))
+                self.stats['files_removed'] += 1
+
+    def _sync_file(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _sync_directory(self, path):
+        # Pas de fsync de répertoire sous Windows
+        if os.name == 'nt':
+            return
+        self._sync_file(path)
+
+    def _commit_staged(self, staged):
+        """fsync groupé puis os.replace des fichiers préparés, et manifeste"""
+        if self.fsync:
+            for rel in staged:
+                self._sync_file(os.path.join(self.staging_path, rel + FLUSH_SUFFIX))
+        directories = set()
+        for rel, (source, digest) in staged.items():
+            target = self.manifest.full_path(rel)
+            if self.origins is not None:
+                self.origins.record(path_key(target), digest, self.origin)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(os.path.join(self.staging_path, rel + FLUSH_SUFFIX), target)
+            self.manifest.record(rel, source, digest)
+            directories.add(os.path.dirname(target))
+            logging.info(f"Fichier écrit: {target}")
+        if self.fsync:
+            for directory in directories:
+                self._sync_directory(directory)
+        self.manifest.save()
+
+    def _take(self):
+        """Préparations à publier ; les fichiers sont renommés pour que la
+        préparation suivante puisse commencer pendant le flush"""
+        with self._lock:
+            staged, self.staged = self.staged, {}
+            removed, self.removed = self.removed, []
+            stats = self.stats
+            self.reset_stats()
+            for rel in staged:
+                stage_path = os.path.join(self.staging_path, rel)
+                os.replace(stage_path, stage_path + FLUSH_SUFFIX)
+            self.flushing = set(staged)
+            for key, value in stats.items():
+                self.totals[key] = self.totals.get(key, 0) + value
+        return staged, removed, stats
+
+    def flush(self):
+        """Fin de cycle : fsync groupé des fichiers préparés, os.replace, manifeste"""
+        staged, removed, stats = self._take()
+        try:
+            with METRICS.timer('io.flush') as timer:
+                self._commit_staged(staged)
+                timer.bytes = stats['bytes_written']
+        finally:
+            with self._lock:
+                self.flushing = set()
+        if self.on_change and (staged or removed):
+            self.on_change([self.manifest.full_path(rel) for rel in staged], removed)
+
+        if stats['files_written'] or stats['files_removed']:
+            logging.info(f"Exports: {stats['files_written']} écrit(s) ({stats['bytes_written']} octets), "
+                         f"{stats['files_skipped']} inchangé(s), {stats['files_removed']} supprimé(s)")
+        return stats
+
+    def discard(self):
+        """Abandonne les écritures préparées (erreur en cours de cycle)"""
+        with self._lock:
+            self.staged = {}
+            self.removed = []
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+
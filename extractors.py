@@ -0,0 +1,247 @@
+import os
+import logging
+
+from export_manifest import ExportManifest, content_digest
+from export_writer import ExportWriter
+from origin_index import EXCEL
+from sheet_extractor import SHEETS_FOLDER, DirtyRanges, SheetsReader
+from connections_mirror import ConnectionsMirror, find_connections_folder
+from scheduler import VBA, POWERQUERY, CONNECTIONS, SHEETS
+from vba_monitor import ExcelVBAMonitor
+from powerquery_monitor import PowerQueryMonitor
+
+# Extracteurs du moteur unifié (engine.py) : chaque type d'artefact fournit un
+# instantané {nom: données avec au moins 'hash'}, le moteur calcule les
+# différences et appelle export/remove, puis flush en fin de passe. Avec le
+# pipeline du moteur, export/remove/flush s'exécutent hors du thread COM,
+# sauf export pour les extracteurs com_export.
+# Pour un nouveau type d'artefact : sous-classe d'Extractor + entrée dans EXTRACTORS.
+
+
+class Extractor:
+    target = None
+    # Intervalle maximal entre deux scans exigé par l'extracteur (None : libre)
+    max_interval = None
+    # export passe par COM : appelé sur le thread COM, le reste sur le pipeline
+    com_export = False
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def start(self):
+        """Classeur ouvert : réconcilie les exports et retourne l'instantané initial"""
+        return {}
+
+    def wake(self, wakeup):
+        """Réveil de l'ordonnanceur qui déclenche la passe, avant scan"""
+        pass
+
+    def scan(self):
+        """Instantané courant ; ne doit qu'interroger le classeur, sans écrire"""
+        raise NotImplementedError
+
+    def export(self, name, data):
+        """Prépare l'écriture d'un artefact ajouté ou modifié ; publiée par flush"""
+        raise NotImplementedError
+
+    def remove(self, name, data):
+        pass
+
+    def flush(self):
+        pass
+
+    def remember(self, snapshot):
+        """Instantané de référence pour la prochaine passe (libre d'alléger)"""
+        return snapshot
+
+    def text(self, data):
+        """Texte d'un artefact modifié, pour les diffs du flux des changements"""
+        return None
+
+    def rebind(self):
+        """Connexion COM rétablie : reprendre engine.excel et engine.wb"""
+        pass
+
+    def save_from_cache(self):
+        """Classeur fermé : sauvegarde de ce qui n'a pas pu être exporté"""
+        pass
+
+    def stop(self):
+        pass
+
+
+class VBAExtractor(Extractor):
+    target = VBA
+    # VBComponent.Export vers le dossier de préparation
+    com_export = True
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        self.monitor = ExcelVBAMonitor(engine.excel_path, origins=engine.origins, committer=engine.committer,
+                                       export_path=engine.export_path('macros_export'))
+        # Borne de la vérification tournante des modules
+        self.max_interval = self.monitor.staleness
+
+    def start(self):
+        self.rebind()
+        self.monitor.start_session()
+        return self.monitor.previous_components
+
+    def rebind(self):
+        self.monitor.excel = self.engine.excel
+        self.monitor.wb = self.engine.wb
+
+    def wake(self, wakeup):
+        self.monitor.request_verification(wakeup)
+
+    def scan(self):
+        return self.monitor.get_vba_components()
+
+    def export(self, name, data):
+        self.monitor.export_component_change(name, data)
+
+    def remove(self, name, data):
+        self.monitor.remove_component(name, data)
+
+    def flush(self):
+        self.monitor.writer.flush()
+
+    def text(self, data):
+        return data.get('code')
+
+    def remember(self, snapshot):
+        snapshot = self.monitor.forget_code(snapshot)
+        # Base des sondes par empreinte et de la vérification tournante
+        self.monitor.previous_components = self.monitor.last_known_components = snapshot
+        return snapshot
+
+    def save_from_cache(self):
+        self.monitor.save_components_from_cache()
+
+
+class PowerQueryExtractor(Extractor):
+    target = POWERQUERY
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        # Les connexions ont leur propre extracteur
+        self.monitor = PowerQueryMonitor(engine.excel_path, committer=engine.committer,
+                                         export_path=engine.export_path('powerquery_export'),
+                                         mirror_connections=False, origins=engine.origins)
+
+    def with_hashes(self, queries):
+        return {name: dict(data, hash=content_digest(data['formula'])) for name, data in queries.items()}
+
+    def start(self):
+        self.rebind()
+        self.monitor.start_session()
+        return self.with_hashes(self.monitor.previous_queries)
+
+    def rebind(self):
+        self.monitor.excel = self.engine.excel
+        self.monitor.wb = self.engine.wb
+
+    def scan(self):
+        return self.with_hashes(self.monitor.get_power_queries())
+
+    def export(self, name, data):
+        logging.info(f"Modification détectée pour {name}")
+        if not self.monitor.save_query(name, data['formula']):
+            raise OSError(f"Requête non exportée: {name}")
+
+    def remove(self, name, data):
+        logging.info(f"Requête supprimée: {name}")
+        self.monitor.writer.remove(f"{name}.m")
+
+    def flush(self):
+        self.monitor.writer.flush()
+
+    def text(self, data):
+        return data.get('formula')
+
+    def remember(self, snapshot):
+        # Les formules restent en mémoire pour la sauvegarde de sortie
+        self.monitor.previous_queries = self.monitor.last_known_queries = snapshot
+        return snapshot
+
+    def save_from_cache(self):
+        self.monitor.save_queries_from_cache()
+
+
+class ConnectionsExtractor(Extractor):
+    """Les fichiers de connexion sont copiés par le thread du miroir ; la passe
+    ne fait que relever son index en mémoire, sans E/S sur le thread COM"""
+    target = CONNECTIONS
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        target_path = os.path.join(engine.export_path('powerquery_export'), 'Connections')
+        self.mirror = ConnectionsMirror(lambda: find_connections_folder(engine.excel_path), target_path,
+                                        on_change=engine.committer.submit if engine.committer else None)
+
+    def start(self):
+        self.mirror.start()
+        return {}
+
+    def scan(self):
+        return {name: {'hash': entry[2]} for name, entry in list(self.mirror.index.items())}
+
+    def export(self, name, data):
+        pass
+
+    def stop(self):
+        self.mirror.stop()
+
+
+class SheetsExtractor(Extractor):
+    """Formules, noms, tableaux et validations (sheet_extractor.py) ; après
+    le premier relevé, seules les zones signalées par les événements sont relues"""
+    target = SHEETS
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        # Alimenté par les événements Excel (attach_excel_events)
+        engine.dirty = self.dirty = DirtyRanges()
+        self.reader = SheetsReader(self.dirty)
+        export_path = engine.export_path(SHEETS_FOLDER)
+        os.makedirs(export_path, exist_ok=True)
+        self.manifest = ExportManifest(export_path).load()
+        self.writer = ExportWriter(self.manifest, origins=engine.origins, origin=EXCEL,
+                                   on_change=engine.committer.submit if engine.committer else None)
+
+    def start(self):
+        snapshot = self.scan()
+        to_write = self.manifest.reconcile({rel: data['hash'] for rel, data in snapshot.items()}, ('.txt',))
+        for rel in to_write:
+            self.writer.write_text(rel, snapshot[rel]['text'])
+        logging.info(f"Exports des feuilles réconciliés: {len(to_write)} fichier(s) réécrit(s)")
+        self.writer.flush()
+        return snapshot
+
+    def scan(self):
+        return self.reader.update(self.engine.wb)
+
+    def export(self, name, data):
+        logging.info(f"Modification détectée pour {name}")
+        self.writer.write_text(name, data['text'])
+
+    def remove(self, name, data):
+        self.writer.remove(name)
+
+    def flush(self):
+        self.writer.flush()
+
+    def text(self, data):
+        return data.get('text')
+
+    def remember(self, snapshot):
+        # Les formules restent dans le lecteur ; seules les empreintes servent au diff
+        return {name: {'hash': data['hash']} for name, data in snapshot.items()}
+
+
+EXTRACTORS = {
+    VBA: VBAExtractor,
+    POWERQUERY: PowerQueryExtractor,
+    CONNECTIONS: ConnectionsExtractor,
+    SHEETS: SheetsExtractor,
+}
@@ -0,0 +1,210 @@
+import os
+import time
+import logging
+import threading
+import subprocess
+
+# Commits groupés des exports : les fichiers écrits ou supprimés par
+# ExportWriter sont accumulés, puis chaque lot (après une période calme ou
+# au-delà d'une taille maximale) devient un seul commit construit par la
+# plomberie git (hash-object, update-index, write-tree, commit-tree,
+# update-ref) : un nombre fixe de processus par lot, quel que soit le nombre
+# de fichiers, sur un thread dédié qui ne bloque jamais la boucle de
+# surveillance. Un index privé évite d'embarquer ce que l'utilisateur a indexé.
+
+ZERO_SHA = '0' * 40
+SYNC_INDEX = 'excel-sync-index'
+
+# Extension -> (singulier, pluriel, féminin)
+KINDS = {
+    '.bas': ('module', 'modules', False),
+    '.cls': ('module', 'modules', False),
+    '.frm': ('module', 'modules', False),
+    '.m': ('requête', 'requêtes', True),
+    '.json': ('connexion', 'connexions', True),
+}
+ACTIONS = {'A': 'ajouté', 'M': 'modifié', 'D': 'supprimé'}
+
+
+def describe_changes(changes):
+    """Message de commit à partir de {chemin: 'A'|'M'|'D'}"""
+    counts = {}
+    for path, action in changes.items():
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.frx':
+            # Accompagne le .frm, déjà compté
+            continue
+        kind = KINDS.get(ext, ('fichier', 'fichiers', False))
+        counts[(kind, action)] = counts.get((kind, action), 0) + 1
+    parts = []
+    for (kind, action), count in sorted(counts.items(), key=lambda item: ('AMD'.index(item[0][1]), item[0][0][0])):
+        singular, plural, feminine = kind
+        verb = ACTIONS[action] + ('e' if feminine else '') + ('s' if count > 1 else '')
+        parts.append(f"{count} {plural if count > 1 else singular} {verb}")
+    subject = "Synchro Excel : " + (", ".join(parts) or "fichiers annexes")
+    body = "\n".join(f"{action}\t{path}" for path, action in sorted(changes.items()))
+    return f"{subject}\n\n{body}\n"
+
+
+class GitCommitter:
+    def __init__(self, repo_path, quiet_period=2.0, max_batch=500, clock=time.monotonic):
+        """repo_path : n'importe quel dossier du dépôt (initialisé s'il n'existe pas)"""
+        self.quiet_period = quiet_period
+        self.max_batch = max_batch
+        self.clock = clock
+        repo_path = os.path.abspath(repo_path)
+        os.makedirs(repo_path, exist_ok=True)
+        try:
+            self.root = self._git(['rev-parse', '--show-toplevel'], cwd=repo_path).strip()
+        except subprocess.CalledProcessError:
+            self._git(['init', '-q'], cwd=repo_path)
+            logging.info(f"Dépôt git initialisé: {repo_path}")
+            self.root = self._git(['rev-parse', '--show-toplevel'], cwd=repo_path).strip()
+        git_dir = self._git(['rev-parse', '--absolute-git-dir']).strip()
+        self.env = dict(os.environ, GIT_INDEX_FILE=os.path.join(git_dir, SYNC_INDEX))
+        if not self._git(['config', 'user.name'], check=False).strip():
+            self.env.update(GIT_AUTHOR_NAME='Excel Live Synchronization', GIT_COMMITTER_NAME='Excel Live Synchronization')
+        if not self._git(['config', 'user.email'], check=False).strip():
+            self.env.update(GIT_AUTHOR_EMAIL='excel-sync@localhost', GIT_COMMITTER_EMAIL='excel-sync@localhost')
+        # Commit sur lequel l'index privé est aligné et son contenu {chemin: blob}
+        self.base = None
+        self.tracked = {}
+        self.pending = {}
+        self.last_submit = None
+        self.commits = 0
+        self.files = 0
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def _git(self, args, input=None, env=None, cwd=None, check=True):
+        result = subprocess.run(['git'] + args, cwd=cwd or self.root, input=input, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, ['git'] + args, result.stdout, result.stderr)
+        return result.stdout.decode('utf-8', errors='replace')
+
+    def submit(self, written=(), removed=()):
+        """Appelé par ExportWriter.flush() : ne fait que mémoriser les chemins"""
+        with self._condition:
+            for path in written:
+                self.pending[os.path.abspath(path)] = 'write'
+            for path in removed:
+                self.pending[os.path.abspath(path)] = 'remove'
+            self.last_submit = self.clock()
+            self._condition.notify()
+
+    def start(self):
+        # Peut être partagé par plusieurs moniteurs : un seul thread
+        if self._thread:
+            return self
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='git-committer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Arrête le thread après avoir commité ce qui est en attente"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                if self.pending:
+                    waited = self.clock() - self.last_submit
+                    if self._stopping or waited >= self.quiet_period or len(self.pending) >= self.max_batch:
+                        batch, self.pending = self.pending, {}
+                        return batch
+                    self._condition.wait(max(self.quiet_period - waited, 0.001))
+                elif self._stopping:
+                    return None
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            try:
+                self.commit(batch)
+            except Exception as e:
+                logging.error(f"Erreur commit git: {e}")
+                # Le dépôt a pu bouger : réaligner l'index privé au prochain lot
+                self.base = None
+                with self._condition:
+                    for path, action in batch.items():
+                        self.pending.setdefault(path, action)
+                    self.last_submit = self.clock()
+
+    def _sync_index(self, head):
+        """Aligne l'index privé sur HEAD s'il a bougé (commit de l'utilisateur)"""
+        if head == self.base and self.base is not None:
+            return
+        if head:
+            self._git(['read-tree', head], env=self.env)
+        else:
+            self._git(['read-tree', '--empty'], env=self.env)
+        self.tracked = {}
+        for record in self._git(['ls-files', '-s', '-z'], env=self.env).split('\0'):
+            if record:
+                info, path = record.split('\t', 1)
+                self.tracked[path] = info.split(' ')[1]
+        self.base = head
+
+    def _rel(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def commit(self, batch):
+        """Un commit pour tout le lot {chemin absolu: 'write'|'remove'} ; retourne son sha ou None"""
+        head = self._git(['rev-parse', '-q', '--verify', 'HEAD'], check=False).strip() or None
+        self._sync_index(head)
+
+        written = sorted(path for path, action in batch.items() if action == 'write' and os.path.isfile(path))
+        removed = sorted(set(batch) - set(written))
+        blobs = []
+        if written:
+            blobs = self._git(['hash-object', '-w', '--stdin-paths'],
+                              input='\n'.join(written).encode('utf-8') + b'\n').split()
+
+        changes = {}
+        records = []
+        new_tracked = dict(self.tracked)
+        for path, blob in zip(written, blobs):
+            rel = self._rel(path)
+            if self.tracked.get(rel) == blob:
+                continue
+            changes[rel] = 'M' if rel in self.tracked else 'A'
+            records.append(f"100644 {blob}\t{rel}")
+            new_tracked[rel] = blob
+        for path in removed:
+            rel = self._rel(path)
+            if rel not in self.tracked:
+                continue
+            changes[rel] = 'D'
+            records.append(f"0 {ZERO_SHA}\t{rel}")
+            del new_tracked[rel]
+        if not changes:
+            return None
+
+        index_info = ('\0'.join(records) + '\0').encode('utf-8')
+        self._git(['update-index', '-z', '--index-info'], input=index_info, env=self.env)
+        tree = self._git(['write-tree'], env=self.env).strip()
+        message = describe_changes(changes)
+        parents = ['-p', head] if head else []
+        commit = self._git(['commit-tree', tree] + parents + ['-F', '-'],
+                           input=message.encode('utf-8'), env=self.env).strip()
+        self._git(['update-ref', '-m', message.splitlines()[0], 'HEAD', commit, head or ''])
+        # L'index de l'utilisateur suit HEAD pour les fichiers commités
+        self._git(['update-index', '-z', '--index-info'], input=index_info)
+        self.base = commit
+        self.tracked = new_tracked
+        self.commits += 1
+        self.files += len(changes)
+        logging.info(f"Commit {commit[:8]}: {message.splitlines()[0]}")
+        return commit
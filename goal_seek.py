@@ -0,0 +1,225 @@
+import sys
+import time
+import logging
+import numpy as np
+
+from metrics import METRICS
+from cell_address import column_letter
+
+# Recherche des valeurs de AdjustValuesAcrossColumns (Module2.bas) pour les
+# 12 colonnes à la fois : au lieu d'une cellule écrite, d'un ws.Calculate et
+# d'une lecture de la ligne 89 par pas et par colonne, chaque itération écrit
+# tout le bloc D34:O49 en un seul Range.Value, recalcule une fois et relit
+# D89:O89 en une fois. L'état de la recherche (ligne en cours, bornes,
+# meilleure valeur) est un vecteur NumPy par colonne ; chaque colonne suit
+# exactement les pas de TryFindValue, avec les mêmes EPSILON et FINE_STEP.
+# Le calcul de la feuille passe par un évaluateur interchangeable : Excel via
+# COM (SheetEvaluator) ou n'importe quelle fonction Python du bloc.
+#
+#     python goal_seek.py fichier.xlsm cible [feuille]
+
+MIN_VALUE = 100.0
+MAX_VALUE = 220.0
+EPSILON = 0.01
+FINE_STEP = 5.0
+START_ROW = 34
+END_ROW = 49
+TARGET_ROW = 89
+START_COL = 4   # Colonne D
+END_COL = 15    # Colonne O
+
+ROWS = END_ROW - START_ROW + 1
+COLUMNS = END_COL - START_COL + 1
+# bestValue - FINE_STEP à bestValue + FINE_STEP par pas de FINE_STEP / 4
+FINE_OFFSETS = np.arange(-4, 5) * (FINE_STEP / 4)
+
+BISECT, FINE, FOUND, FAILED = 0, 1, 2, 3
+
+
+class SheetEvaluator:
+    """Évaluateur Excel : un Range.Value pour le bloc, un Calculate, une lecture de la ligne cible"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.inputs = ws.Range(f"{column_letter(START_COL)}{START_ROW}:{column_letter(END_COL)}{END_ROW}")
+        self.outputs = ws.Range(f"{column_letter(START_COL)}{TARGET_ROW}:{column_letter(END_COL)}{TARGET_ROW}")
+        self.calculations = 0
+
+    def __call__(self, grid):
+        with METRICS.timer('com.goalseek.write'):
+            self.inputs.Value = tuple(tuple(float(value) for value in row) for row in grid)
+        with METRICS.timer('com.goalseek.calculate'):
+            self.ws.Calculate()
+        self.calculations += 1
+        with METRICS.timer('com.goalseek.read'):
+            return np.array(self.outputs.Value[0], dtype=float)
+
+
+class GoalSeekResult:
+    def __init__(self, grid, found, rows, iterations, evaluations):
+        self.grid = grid
+        # Colonne par colonne : cible atteinte, et ligne (0 = START_ROW) qui l'a atteinte
+        self.found = found
+        self.rows = rows
+        self.iterations = iterations
+        self.evaluations = evaluations
+
+    def failed_columns(self):
+        return [column_letter(START_COL + index) for index in np.flatnonzero(~self.found)]
+
+
+def batched_goal_seek(evaluator, target, grid=None, max_iterations=10000):
+    """Toutes les colonnes avancent d'un pas de TryFindValue par évaluation ;
+    suppose, comme la macro, que la ligne cible d'une colonne ne dépend que
+    de cette colonne et croît avec ses valeurs"""
+    target = np.broadcast_to(np.asarray(target, dtype=float), (COLUMNS,))
+    grid = np.full((ROWS, COLUMNS), MIN_VALUE) if grid is None else np.array(grid, dtype=float)
+    columns = np.arange(COLUMNS)
+    row = np.zeros(COLUMNS, dtype=int)
+    phase = np.full(COLUMNS, BISECT)
+    low = np.full(COLUMNS, MIN_VALUE)
+    high = np.full(COLUMNS, MAX_VALUE)
+    best_value = np.full(COLUMNS, MIN_VALUE)
+    best_diff = np.full(COLUMNS, MAX_VALUE)
+    fine = np.zeros(COLUMNS, dtype=int)
+    iterations = 0
+    reverted = False
+
+    def next_fine(index, start):
+        # Prochain pas fin dans [MIN_VALUE, MAX_VALUE] (les autres ne sont pas évalués)
+        candidates = best_value[index, None] + FINE_OFFSETS[None, :]
+        valid = (candidates >= MIN_VALUE) & (candidates <= MAX_VALUE) & (np.arange(len(FINE_OFFSETS)) >= start[:, None])
+        return np.where(valid.any(axis=1), valid.argmax(axis=1), len(FINE_OFFSETS))
+
+    while True:
+        active = (phase == BISECT) | (phase == FINE)
+        if not active.any() or iterations >= max_iterations:
+            break
+        bisecting = phase == BISECT
+        trial = np.where(bisecting, (low + high) / 2,
+                         best_value + FINE_OFFSETS[np.minimum(fine, len(FINE_OFFSETS) - 1)])
+        grid[row[active], columns[active]] = trial[active]
+        with METRICS.timer('goalseek.iteration'):
+            current = np.asarray(evaluator(grid), dtype=float)
+        iterations += 1
+        diff = np.abs(current - target)
+
+        # Dichotomie : meilleure valeur, cible atteinte ou resserrement des bornes
+        better = bisecting & (diff < best_diff)
+        best_diff = np.where(better, diff, best_diff)
+        best_value = np.where(better, trial, best_value)
+        found = better & (diff <= EPSILON)
+        searching = bisecting & ~found
+        below = current < target
+        low = np.where(searching & below, trial, low)
+        high = np.where(searching & ~below, trial, high)
+        to_fine = searching & (high - low <= FINE_STEP)
+        if to_fine.any():
+            fine[to_fine] = next_fine(np.flatnonzero(to_fine), np.zeros(to_fine.sum(), dtype=int))
+
+        # Affinage : cible atteinte, ou pas suivant
+        fining = phase == FINE
+        found |= fining & (diff <= EPSILON)
+        stepping = fining & ~found
+        if stepping.any():
+            fine[stepping] = next_fine(np.flatnonzero(stepping), fine[stepping] + 1)
+
+        phase = np.where(found, FOUND, np.where(to_fine, FINE, phase))
+        # Affinage épuisé : meilleure valeur conservée, ligne suivante
+        exhausted = (phase == FINE) & (fine >= len(FINE_OFFSETS))
+        reverted = exhausted.any()
+        if reverted:
+            grid[row[exhausted], columns[exhausted]] = best_value[exhausted]
+            row = row + exhausted
+            done = exhausted & (row >= ROWS)
+            restart = exhausted & ~done
+            phase = np.where(done, FAILED, np.where(restart, BISECT, phase))
+            row = np.minimum(row, ROWS - 1)
+            low = np.where(restart, MIN_VALUE, low)
+            high = np.where(restart, MAX_VALUE, high)
+            best_value = np.where(restart, MIN_VALUE, best_value)
+            best_diff = np.where(restart, MAX_VALUE, best_diff)
+
+    evaluations = iterations
+    if reverted:
+        # Meilleures valeurs remises après le dernier essai : bloc final
+        evaluator(grid)
+        evaluations += 1
+    return GoalSeekResult(grid, phase == FOUND, row, iterations, evaluations)
+
+
+def sequential_goal_seek(evaluator, target, grid=None):
+    """Déroulé cellule par cellule de AdjustValuesAcrossColumns (une
+    évaluation par pas et par colonne), pour comparer les résultats"""
+    target = np.broadcast_to(np.asarray(target, dtype=float), (COLUMNS,))
+    grid = np.full((ROWS, COLUMNS), MIN_VALUE) if grid is None else np.array(grid, dtype=float)
+    found = np.zeros(COLUMNS, dtype=bool)
+    rows = np.zeros(COLUMNS, dtype=int)
+    evaluations = 0
+
+    def evaluate(row, col, value):
+        nonlocal evaluations
+        grid[row, col] = value
+        evaluations += 1
+        return evaluator(grid)[col]
+
+    def try_find_value(row, col):
+        low, high = MIN_VALUE, MAX_VALUE
+        best_diff, best_value = MAX_VALUE, low
+        while high - low > FINE_STEP:
+            mid = (low + high) / 2
+            current = evaluate(row, col, mid)
+            if abs(current - target[col]) < best_diff:
+                best_diff = abs(current - target[col])
+                best_value = mid
+                if best_diff <= EPSILON:
+                    return True
+            if current < target[col]:
+                low = mid
+            else:
+                high = mid
+        for offset in FINE_OFFSETS:
+            fine_value = best_value + offset
+            if MIN_VALUE <= fine_value <= MAX_VALUE:
+                if abs(evaluate(row, col, fine_value) - target[col]) <= EPSILON:
+                    return True
+        grid[row, col] = best_value
+        return best_diff <= EPSILON
+
+    for col in range(COLUMNS):
+        grid[:, col] = MIN_VALUE
+        for row in range(ROWS):
+            rows[col] = row
+            if try_find_value(row, col):
+                found[col] = True
+                break
+    return GoalSeekResult(grid, found, rows, evaluations, evaluations)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python goal_seek.py chemin_vers_fichier.xlsm cible [feuille]")
+        sys.exit(1)
+
+    from com_session import COMSession
+    from vba_importer import ExcelSuspended
+
+    target = float(sys.argv[2])
+    if not 0 <= target <= MAX_VALUE * 2:
+        print(f"Cible invalide : entre 0 et {MAX_VALUE * 2:.0f}")
+        sys.exit(1)
+    session = COMSession(sys.argv[1])
+    wb = session.open()
+    try:
+        ws = wb.Worksheets(sys.argv[3] if len(sys.argv) == 4 else "Power mix price forecast")
+        evaluator = SheetEvaluator(ws)
+        start = time.perf_counter()
+        with ExcelSuspended(session.excel):
+            result = batched_goal_seek(evaluator, target)
+        logging.info(f"{result.iterations} itération(s), {evaluator.calculations} recalcul(s) "
+                     f"en {time.perf_counter() - start:.2f}s")
+        for letter in result.failed_columns():
+            logging.warning(f"Cible non atteinte pour la colonne {letter}")
+    finally:
+        session.close()
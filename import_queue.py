@@ -0,0 +1,151 @@
+import os
+import time
+import logging
+import threading
+
+from export_manifest import file_digest
+from origin_index import DISK, path_key
+
+# File d'import anti-rebond pour les surveillances de dossier : les événements
+# watchdog d'un même enregistrement (modified, created, moved...) sont regroupés
+# par fichier, les contenus inchangés ignorés, et tout ce qui est prêt est
+# importé en une seule passe sur un thread dédié (un seul appartement COM).
+
+
+class DebouncedImportQueue:
+    def __init__(self, apply_batch, quiet_period=0.5, thread_init=None, thread_exit=None,
+                 origins=None, removals=False, clock=time.monotonic):
+        """apply_batch(paths) importe une liste de fichiers et retourne ceux
+        réellement importés (None : tous) ; thread_init/thread_exit encadrent
+        le thread d'import (CoInitialize, ouverture du classeur...) ; origins
+        (OriginIndex) écarte les fichiers que le moniteur VBA vient d'exporter ;
+        removals : les fichiers connus qui disparaissent sont aussi transmis"""
+        self.apply_batch = apply_batch
+        self.origins = origins
+        self.removals = removals
+        self.quiet_period = quiet_period
+        self.thread_init = thread_init
+        self.thread_exit = thread_exit
+        self.clock = clock
+        self.pending = {}
+        self.digests = {}
+        self.events = 0
+        self.batches = 0
+        self.imports = 0
+        self.skipped = 0
+        self.echoes = 0
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def prime(self, paths):
+        """Mémorise le contenu actuel des fichiers : un enregistrement sans
+        modification ne déclenchera pas d'import"""
+        for path in paths:
+            try:
+                self.digests[os.path.abspath(path)] = file_digest(path)
+            except OSError:
+                pass
+
+    def submit(self, path):
+        """Appelé depuis le thread watchdog pour chaque événement brut"""
+        with self._condition:
+            self.events += 1
+            self.pending[os.path.abspath(path)] = self.clock()
+            self._condition.notify()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='import-queue', daemon=True)
+        self._thread.start()
+        return self
+
+    def is_alive(self):
+        """Faux si le thread n'a pas démarré ou s'est arrêté (échec de thread_init)"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self, timeout=None):
+        """Arrête le thread après avoir importé ce qui est en attente"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _next_batch(self):
+        """Attend qu'au moins un fichier soit resté calme pendant quiet_period"""
+        with self._condition:
+            while True:
+                now = self.clock()
+                if self._stopping:
+                    ready = list(self.pending)
+                else:
+                    ready = [path for path, last in self.pending.items() if now - last >= self.quiet_period]
+                if ready or (self._stopping and not self.pending):
+                    for path in ready:
+                        del self.pending[path]
+                    return ready
+                if self.pending:
+                    timeout = min(self.quiet_period - (now - last) for last in self.pending.values())
+                    self._condition.wait(max(timeout, 0.001))
+                else:
+                    self._condition.wait()
+
+    def _changed(self, paths):
+        changed = {}
+        for path in paths:
+            try:
+                digest = file_digest(path)
+            except OSError:
+                if self.removals and path in self.digests:
+                    changed[path] = None
+                # Sinon fichier temporaire d'éditeur déjà supprimé
+                continue
+            if self.digests.get(path) == digest:
+                self.skipped += 1
+                logging.debug(f"Contenu inchangé, import ignoré: {path}")
+                continue
+            if self.origins is not None and self.origins.is_echo(path_key(path), digest, DISK):
+                # Écrit par l'export Excel -> disque : ne pas le réimporter
+                self.echoes += 1
+                self.digests[path] = digest
+                logging.debug(f"Export du moniteur VBA, import ignoré: {path}")
+                continue
+            changed[path] = digest
+        return changed
+
+    def _run(self):
+        try:
+            if self.thread_init:
+                self.thread_init()
+        except Exception as e:
+            logging.error(f"Erreur d'initialisation du thread d'import: {e}")
+            if self.thread_exit:
+                self.thread_exit()
+            return
+        try:
+            while True:
+                paths = self._next_batch()
+                if not paths:
+                    if self._stopping:
+                        break
+                    continue
+                changed = self._changed(paths)
+                if not changed:
+                    continue
+                self.batches += 1
+                try:
+                    imported = self.apply_batch(sorted(changed))
+                except Exception as e:
+                    logging.error(f"Erreur lors de l'import groupé: {e}")
+                    continue
+                if imported is None:
+                    imported = changed
+                for path in imported:
+                    if changed[path] is None:
+                        self.digests.pop(path, None)
+                    else:
+                        self.digests[path] = changed[path]
+                    self.imports += 1
+        finally:
+            if self.thread_exit:
+                self.thread_exit()
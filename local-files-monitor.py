@@ -6,6 +6,9 @@ import logging
 import pythoncom
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from import_queue import DebouncedImportQueue
+from vba_importer import VBAPatcher
+from log_setup import configure_logging
 
 class LocalFilesMonitor:
     def __init__(self, excel_path, watch_folder):
@@ -14,16 +17,19 @@ class LocalFilesMonitor:
         self.excel = None
         self.wb = None
         self.setup_logging()
+        self.patcher = VBAPatcher()
+        # À partir de ce nombre de fichiers (git pull, changement de branche),
+        # import transactionnel avec Excel suspendu
+        self.bulk_threshold = 5
+        # Les imports COM se font tous sur le thread de la file
+        self.queue = DebouncedImportQueue(
+            self.import_batch,
+            thread_init=self.initialize_excel,
+            thread_exit=self.cleanup
+        )
 
     def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(message)s',
-            handlers=[
-                logging.FileHandler('local_files_monitor.log'),
-                logging.StreamHandler()
-            ]
-        )
+        configure_logging('local_files_monitor.log')
 
     def find_workbook(self):
         excel_instances = self.get_running_instances()
@@ -73,32 +79,26 @@ class LocalFilesMonitor:
             pass
 
     def import_vba_component(self, file_path):
-        try:
-            file_name = os.path.basename(file_path)
-            name, ext = os.path.splitext(file_name)
-            
-            if ext.lower() not in ['.bas', '.cls', '.frm', '.frx']:
-                logging.warning(f"Extension non supportée: {ext}")
-                return
+        # Patch par hunks dans le CodeModule, Remove + Import si nécessaire
+        return self.patcher.apply(self.wb, file_path)
 
-            # Supprimer le composant s'il existe déjà
-            try:
-                existing_comp = self.wb.VBProject.VBComponents(name)
-                self.wb.VBProject.VBComponents.Remove(existing_comp)
-            except:
-                pass
-
-            # Importer le nouveau composant
-            self.wb.VBProject.VBComponents.Import(file_path)
-            logging.info(f"Composant {name} importé avec succès")
-            
-        except Exception as e:
-            logging.error(f"Erreur lors de l'import de {file_path}: {str(e)}")
+    def import_batch(self, file_paths):
+        """Importe en une passe les fichiers prêts ; retourne ceux importés"""
+        logging.info(f"Import groupé de {len(file_paths)} fichier(s)")
+        if len(file_paths) >= self.bulk_threshold:
+            return self.patcher.apply_batch(self.wb, file_paths, self.excel)
+        return [path for path in file_paths if self.import_vba_component(path)]
 
     def start_monitoring(self):
         try:
-            self.initialize_excel()
             logging.info(f"Surveillance du dossier: {self.watch_folder}")
+            watched_files = [
+                os.path.join(self.watch_folder, file) for file in os.listdir(self.watch_folder)
+                if file.lower().endswith(('.bas', '.cls', '.frm'))
+            ]
+            self.queue.prime(watched_files)
+            self.patcher.prime(watched_files)
+            self.queue.start()
             
             event_handler = VBAFileHandler(self)
             observer = Observer()
@@ -115,7 +115,7 @@ class LocalFilesMonitor:
         except Exception as e:
             logging.error(f"Erreur: {e}")
         finally:
-            self.cleanup()
+            self.queue.stop()
 
 class VBAFileHandler(FileSystemEventHandler):
     def __init__(self, monitor):
@@ -125,14 +125,21 @@ class VBAFileHandler(FileSystemEventHandler):
         if event.is_directory:
             return
             
-        file_path = event.src_path
+        self.submit(event.src_path)
+
+    def submit(self, file_path):
         if file_path.lower().endswith(('.bas', '.cls', '.frm')):
-            logging.info(f"Modification détectée: {file_path}")
-            self.monitor.import_vba_component(file_path)
+            logging.debug(f"Modification détectée: {file_path}")
+            self.monitor.queue.submit(file_path)
             
     def on_created(self, event):
         self.on_modified(event)
 
+    def on_moved(self, event):
+        # Enregistrement atomique des éditeurs : fichier temporaire renommé
+        if not event.is_directory:
+            self.submit(event.dest_path)
+
 if __name__ == "__main__":
     if len(sys.argv) != 3:
         print("Usage: python script.py chemin_excel dossier_surveillance")
@@ -0,0 +1,160 @@
+import copy
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime
+
+# Journalisation commune aux moniteurs : les threads de surveillance ne font
+# que déposer l'enregistrement dans une file (jamais d'E/S disque), un
+# QueueListener écrit en JSONL dans un fichier à rotation par taille et sur
+# la console. Les messages DEBUG/INFO identiques répétés à chaque cycle sont
+# limités ; avertissements, erreurs et changements exportés passent toujours.
+
+CONSOLE_FORMAT = '%(asctime)s - %(message)s'
+
+# Début des messages de changement et d'export, jamais limités
+CHANGE_MESSAGES = ('Modification détectée', 'Composant exporté', 'Composant sauvegardé', 'Fichier écrit',
+                   'Fichier supprimé', 'Macro supprimée', 'Requête exportée', 'Requête supprimée',
+                   'Requête sauvegardée', 'Requête ajoutée', 'Exports:', 'Import', 'Commit')
+
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+_listener = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par ligne"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        repeated = getattr(record, 'repeated', None)
+        if repeated:
+            entry['repeated'] = repeated
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RepeatFilter(logging.Filter):
+    """Laisse passer un message identique (même niveau, même texte) au plus
+    burst fois par fenêtre de window secondes ; le suivant hors fenêtre
+    porte le nombre de répétitions supprimées. Seuls les niveaux jusqu'à
+    max_level sont limités, et jamais les messages commençant par exempt."""
+
+    def __init__(self, window=60.0, burst=1, max_keys=1000, max_level=logging.INFO, exempt=CHANGE_MESSAGES):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.max_keys = max_keys
+        self.max_level = max_level
+        self.exempt = exempt
+        self.seen = {}
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        text = record.msg if not record.args else record.getMessage()
+        if isinstance(text, str) and text.startswith(self.exempt):
+            return True
+        key = (record.levelno, text)
+        with self._lock:
+            start, count, dropped = self.seen.get(key, (record.created, 0, 0))
+            if record.created - start >= self.window:
+                start, count = record.created, 0
+            if count >= self.burst:
+                self.seen[key] = (start, count, dropped + 1)
+                self.suppressed += 1
+                return False
+            self.seen[key] = (start, count + 1, 0)
+            if len(self.seen) > self.max_keys:
+                # Les plus anciennes clés sont en tête (ordre d'insertion)
+                for old_key in list(self.seen)[:len(self.seen) - self.max_keys]:
+                    del self.seen[old_key]
+        if dropped:
+            record.repeated = dropped
+            record.msg = f"{record.getMessage()} (répété {dropped} fois)"
+            record.args = None
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """File bornée : si l'écriture prend du retard, on perd des messages
+    plutôt que de bloquer le thread de surveillance"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Message et pile d'appels mis en texte ici : le listener n'a plus
+        # besoin des arguments ni des objets de l'exception
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(log_file, level=logging.INFO, max_bytes=5 * 1024 * 1024, backups=3,
+                      console=True, console_format=CONSOLE_FORMAT, repeat_window=60.0, queue_size=10000):
+    """Installe la journalisation partagée (une seule fois par processus, comme basicConfig)"""
+    global _listener
+    with _lock:
+        # Comme basicConfig : rien à faire si la journalisation est déjà configurée
+        if _listener is not None or logging.getLogger().handlers:
+            return _listener
+        handlers = []
+        file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backups,
+                                                            encoding='utf-8', delay=True)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+        if console:
+            stream_handler = logging.StreamHandler()
+            stream_handler.setFormatter(logging.Formatter(console_format))
+            handlers.append(stream_handler)
+
+        queue_handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+        if repeat_window:
+            queue_handler.addFilter(RepeatFilter(repeat_window))
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+
+        _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.queue_handler = queue_handler
+        _listener.start()
+        atexit.register(stop_logging)
+        return _listener
+
+
+def stop_logging():
+    """Vide la file et arrête l'écriture (appelé automatiquement à la sortie)"""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        logging.getLogger().removeHandler(_listener.queue_handler)
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+
+# Instrumentation des frontières COM et des écritures de fichiers : durées
+# (histogrammes), nombre d'appels et octets, par cycle de surveillance et en
+# cumul. Désactivée par défaut : timer() retourne alors un contexte vide
+# partagé et observe() sort immédiatement. Chaque thread a ses mesures de
+# cycle (thread COM, écrivains du pipeline, miroir, workers du démon) : un
+# cycle ne garde que celles de son thread, les mesures prises hors cycle vont
+# directement aux cumuls.
+#
+#     with METRICS.timer('com.CodeModule.Lines') as t:
+#         code = module.Lines(1, count)
+#         t.bytes = len(code)
+
+# Bornes supérieures des classes d'histogramme, en millisecondes
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000, 30000)
+
+
+class Series:
+    """Compteurs d'une mesure : appels, durée totale et maximale, octets, histogramme"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, seconds, size=0):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.bytes += size
+        self.buckets[bisect.bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.bytes += other.bytes
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+            'bytes': self.bytes,
+            'buckets': {(f"le_{bound}" if bound != float('inf') else 'inf'): n
+                        for bound, n in zip(BUCKETS_MS + (float('inf'),), self.buckets) if n},
+        }
+
+
+class _NullTimer:
+    bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'bytes', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.bytes = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, self.bytes)
+        return False
+
+
+class Metrics:
+    def __init__(self, enabled=False, clock=time.time):
+        self.enabled = enabled
+        self.clock = clock
+        # Mesures du cycle en cours, propres à chaque thread
+        self._local = threading.local()
+        self.last_cycle = {}
+        self.totals = {}
+        self.cycles = Series()
+        self.started = clock()
+        self._lock = threading.Lock()
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def observe(self, name, seconds, size=0):
+        if not self.enabled:
+            return
+        current = getattr(self._local, 'current', None)
+        if current is None:
+            # Hors cycle (écrivains du pipeline...) : directement dans les cumuls
+            with self._lock:
+                self.totals.setdefault(name, Series()).add(seconds, size)
+            return
+        series = current.get(name)
+        if series is None:
+            series = current[name] = Series()
+        series.add(seconds, size)
+
+    def cycle(self, name='cycle'):
+        """Contexte englobant un cycle de surveillance : à sa sortie, les mesures
+        du cycle deviennent last_cycle et s'ajoutent aux cumuls"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _CycleTimer(self, name)
+
+    def begin_cycle(self):
+        """Ouvre les mesures du cycle du thread courant ; retourne celles d'un
+        cycle englobant, rétablies à la fin de celui-ci"""
+        outer = getattr(self._local, 'current', None)
+        self._local.current = {}
+        return outer
+
+    def end_cycle(self, name, seconds, outer=None):
+        if not self.enabled:
+            return
+        current = getattr(self._local, 'current', None) or {}
+        self._local.current = outer
+        with self._lock:
+            series = current.setdefault(name, Series())
+            series.add(seconds)
+            self.cycles.add(seconds)
+            for key, value in current.items():
+                self.totals.setdefault(key, Series()).merge(value)
+            self.last_cycle = current
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'uptime_s': round(self.clock() - self.started, 3),
+                'cycles': self.cycles.to_dict(),
+                'last_cycle': {name: series.to_dict() for name, series in sorted(self.last_cycle.items())},
+                'totals': {name: series.to_dict() for name, series in sorted(self.totals.items())},
+            }
+
+    def prometheus(self):
+        """Format texte Prometheus des cumuls"""
+        with self._lock:
+            totals = dict(self.totals)
+            totals['cycle_all'] = self.cycles
+        lines = []
+        for name, series in sorted(totals.items()):
+            metric = 'excel_sync_' + ''.join(c if c.isalnum() else '_' for c in name)
+            lines.append(f"# TYPE {metric}_seconds histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS_MS + (float('inf'),), series.buckets):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f"{bound / 1000:g}"
+                lines.append(f'{metric}_seconds_bucket{{le="{le}"}} {cumulative}')
+            lines.append(f"{metric}_seconds_sum {series.total:.6f}")
+            lines.append(f"{metric}_seconds_count {series.count}")
+            lines.append(f"{metric}_bytes_total {series.bytes}")
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(tmp_path, path)
+
+
+class _CycleTimer(_Timer):
+    __slots__ = ('outer',)
+
+    def __enter__(self):
+        self.outer = self.metrics.begin_cycle()
+        return super().__enter__()
+
+    def __exit__(self, *exc):
+        self.metrics.end_cycle(self.name, time.perf_counter() - self.start, self.outer)
+        return False
+
+
+class StatsDumper:
+    """Écrit périodiquement l'instantané JSON des mesures"""
+
+    def __init__(self, metrics, path, interval=10.0):
+        self.metrics = metrics
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+        self.write()
+
+    def write(self):
+        try:
+            self.metrics.dump(self.path)
+        except OSError as e:
+            logging.error(f"Erreur écriture des statistiques {self.path}: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stats-dumper', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+def serve_metrics(metrics, port, host='127.0.0.1'):
+    """Point d'accès HTTP local : /metrics (Prometheus) et /stats.json"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = metrics.prometheus(), 'text/plain; version=0.0.4'
+            elif self.path == '/stats.json':
+                body, content_type = json.dumps(metrics.snapshot(), indent=1), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logging.debug(f"metrics: {format % args}")
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    logging.info(f"Mesures disponibles sur http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def enable(stats_path=None, interval=10.0, http_port=None):
+    """Active les mesures globales ; retourne (dumper, serveur) à arrêter en fin de session"""
+    METRICS.enabled = True
+    dumper = StatsDumper(METRICS, stats_path, interval).start() if stats_path else None
+    server = serve_metrics(METRICS, http_port) if http_port is not None else None
+    return dumper, server
+
+
+METRICS = Metrics()
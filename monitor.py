@@ -1,12 +1,47 @@
-﻿import sys
-import logging
-from powerquery_monitor import PowerQueryMonitor
-from vba_monitor import ExcelVBAMonitor  # On garde l'import pour plus tard
+﻿import os
+import argparse
+import metrics
+from engine import ExtractionEngine
+from scheduler import VBA, POWERQUERY, CONNECTIONS, SHEETS
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python script.py chemin_vers_fichier.xlsm")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Surveillance des macros VBA, requêtes Power Query et connexions")
+    parser.add_argument('excel_path', help="chemin_vers_fichier.xlsm")
+    parser.add_argument('--git', action='store_true', help="commiter les exports dans le dépôt git du classeur")
+    parser.add_argument('--versions', nargs='?', const='.versions', metavar='DOSSIER',
+                        help="historique local de chaque révision exportée (défaut : .versions à côté du classeur)")
+    parser.add_argument('--sheets', action='store_true',
+                        help="exporter aussi formules, noms, tableaux et validations des feuilles")
+    parser.add_argument('--stream', metavar='ADRESSE',
+                        help="publier les changements en direct (hôte:port ou unix:/chemin, voir change_stream.py)")
+    parser.add_argument('--stats', help="fichier JSON des mesures, réécrit périodiquement")
+    parser.add_argument('--metrics-port', type=int, help="port local du point d'accès HTTP /metrics")
+    args = parser.parse_args()
         
-    monitor = PowerQueryMonitor(sys.argv[1])
-    monitor.monitor()
\ No newline at end of file
+    committer = None
+    if args.git:
+        from git_committer import GitCommitter
+        committer = GitCommitter(os.path.dirname(os.path.abspath(args.excel_path)))
+    if args.versions:
+        from version_store import VersionStore, combine_sinks
+        versions = VersionStore(os.path.join(os.path.dirname(os.path.abspath(args.excel_path)), args.versions))
+        committer = combine_sinks(committer, versions)
+    # Un seul moteur pour les macros VBA, les requêtes Power Query et les connexions
+    targets = (VBA, POWERQUERY, CONNECTIONS) + ((SHEETS,) if args.sheets else ())
+    stream = None
+    if args.stream:
+        from change_stream import ChangeStreamServer
+        stream = ChangeStreamServer(args.stream).start()
+    monitor = ExtractionEngine(args.excel_path, targets=targets, committer=committer, stream=stream)
+    dumper = server = None
+    if args.stats or args.metrics_port is not None:
+        dumper, server = metrics.enable(args.stats, http_port=args.metrics_port)
+    try:
+        monitor.monitor()
+    finally:
+        if dumper:
+            dumper.stop()
+        if server:
+            server.shutdown()
+        if stream:
+            stream.stop()
\ No newline at end of file
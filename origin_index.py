@@ -0,0 +1,54 @@
+import os
+import time
+import threading
+
+# Index d'origine partagé entre les deux sens de synchronisation : pour chaque
+# artefact (fichier exporté ou composant VBA) on retient la dernière empreinte
+# écrite et qui l'a écrite. Un changement dont l'empreinte correspond à une
+# écriture de l'autre sens est un écho et ne doit pas être réappliqué.
+
+EXCEL = 'excel'
+DISK = 'disk'
+
+
+def path_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def component_key(name):
+    return f"vba:{name.lower()}"
+
+
+class OriginIndex:
+    def __init__(self, ttl=None, max_entries=10000, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = {}
+        self._lock = threading.Lock()
+        # Tenu par un sens de synchronisation pendant qu'il applique ses changements
+        self.apply_lock = threading.RLock()
+
+    def record(self, key, digest, origin):
+        with self._lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (digest, origin, self.clock())
+            if len(self.entries) > self.max_entries:
+                # Les entrées les plus anciennes sont en tête (ordre d'insertion)
+                for old_key in list(self.entries)[:len(self.entries) - self.max_entries]:
+                    del self.entries[old_key]
+
+    def origin_of(self, key, digest):
+        """Origine de la dernière écriture de ce contenu, ou None"""
+        with self._lock:
+            entry = self.entries.get(key)
+        if not entry or entry[0] != digest:
+            return None
+        if self.ttl is not None and self.clock() - entry[2] > self.ttl:
+            return None
+        return entry[1]
+
+    def is_echo(self, key, digest, origin):
+        """Vrai si ce contenu a été écrit par l'autre sens de synchronisation"""
+        written_by = self.origin_of(key, digest)
+        return written_by is not None and written_by != origin
@@ -0,0 +1,203 @@
+import time
+import logging
+import threading
+from collections import deque
+
+from metrics import METRICS
+
+# Étages d'export découplés : le thread COM ne fait que relever des
+# instantanés, un thread compare chaque instantané au précédent et un pool
+# d'écrivains (un par partition des noms) écrit les fichiers. Les étages sont
+# reliés par des files bornées qui fusionnent au lieu de grossir : un
+# instantané pas encore comparé est remplacé par le suivant, et les lots en
+# attente d'un écrivain en retard sont fusionnés (la dernière version d'un
+# fichier remplace les précédentes). Le thread COM relève et soumet même si
+# un instantané attend encore : il est remplacé, et aucun réveil n'est perdu.
+# À l'arrêt, les changements en cours sont écrits avant de rendre la main.
+
+_CLOSED = object()
+
+
+class StageQueue:
+    """File bornée entre deux étages. Pleine : put fusionne l'élément avec le
+    dernier en attente si merge est fourni, sinon attend de la place.
+    Mesure la profondeur et le temps d'attente des éléments."""
+
+    def __init__(self, name, maxsize=1, merge=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.merge = merge
+        self.items = deque()
+        self.closed = False
+        self.max_depth = 0
+        self.coalesced = 0
+        self.blocked = 0.0
+        self.waited = 0.0
+        self.count = 0
+        self._condition = threading.Condition()
+
+    def depth(self):
+        with self._condition:
+            return len(self.items)
+
+    def full(self):
+        with self._condition:
+            return len(self.items) >= self.maxsize
+
+    def put(self, item):
+        with self._condition:
+            if len(self.items) >= self.maxsize and self.merge is not None:
+                queued_at, last = self.items[-1]
+                # L'attente court depuis le plus ancien élément fusionné
+                self.items[-1] = (queued_at, self.merge(last, item))
+                self.coalesced += 1
+                return
+            start = time.perf_counter()
+            while len(self.items) >= self.maxsize and not self.closed:
+                self._condition.wait()
+            self.blocked += time.perf_counter() - start
+            self.items.append((time.perf_counter(), item))
+            self.max_depth = max(self.max_depth, len(self.items))
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        """Élément suivant ; _CLOSED une fois la file fermée et vidée, None
+        si rien n'est arrivé en timeout secondes"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while not self.items and not self.closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            if not self.items:
+                return _CLOSED
+            queued_at, item = self.items.popleft()
+            self._condition.notify_all()
+        wait = time.perf_counter() - queued_at
+        self.waited += wait
+        self.count += 1
+        METRICS.observe(f"pipeline.{self.name}.wait", wait)
+        return item
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            depth = len(self.items)
+        return {
+            'depth': depth,
+            'max_depth': self.max_depth,
+            'items': self.count,
+            'coalesced': self.coalesced,
+            'wait_ms': round(self.waited / self.count * 1000, 3) if self.count else 0.0,
+            'blocked_ms': round(self.blocked * 1000, 3),
+        }
+
+
+def merge_changes(older, newer):
+    """Deux lots {nom: valeur} : la valeur la plus récente l'emporte"""
+    merged = dict(older)
+    merged.update(newer)
+    return merged
+
+
+class ExportPipeline:
+    def __init__(self, diff, write, writers=2, batches=4, report_interval=60.0, name='export', retry_delay=5.0):
+        """diff(précédent, instantané) -> {nom: valeur, None si supprimé} ;
+        write(index de l'écrivain, lot) écrit un lot ; un lot en échec est
+        réessayé après retry_delay secondes, fusionné avec les lots suivants"""
+        self.diff = diff
+        self.write = write
+        self.retry_delay = retry_delay
+        self.name = name
+        self.report_interval = report_interval
+        # Un instantané non encore comparé est remplacé par le suivant
+        self.snapshots = StageQueue(f"{name}.scan", 1, merge=lambda older, newer: newer)
+        self.shards = [StageQueue(f"{name}.write{index}", batches, merge=merge_changes) for index in range(writers)]
+        self.previous = None
+        self.errors = 0
+        self._threads = []
+        self._last_report = time.monotonic()
+
+    def start(self, previous=None):
+        """previous : instantané déjà exporté (réconciliation au démarrage)"""
+        self.previous = previous
+        self._threads = [threading.Thread(target=self._diff_loop, name=f"{self.name}-diff", daemon=True)]
+        self._threads += [threading.Thread(target=self._write_loop, args=(index,), name=f"{self.name}-write{index}",
+                                           daemon=True) for index in range(len(self.shards))]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def submit(self, snapshot):
+        self.snapshots.put(snapshot)
+
+    def shard(self, key):
+        return hash(key) % len(self.shards)
+
+    def _diff_loop(self):
+        try:
+            while True:
+                snapshot = self.snapshots.get()
+                if snapshot is _CLOSED:
+                    break
+                with METRICS.timer(f"pipeline.{self.name}.diff"):
+                    changes = self.diff(self.previous or {}, snapshot)
+                self.previous = snapshot
+                parts = {}
+                for key, value in changes.items():
+                    parts.setdefault(self.shard(key), {})[key] = value
+                for index, part in parts.items():
+                    self.shards[index].put(part)
+                self.report()
+        finally:
+            for shard in self.shards:
+                shard.close()
+
+    def _write_loop(self, index):
+        shard = self.shards[index]
+        # Changements d'un lot en échec : l'instantané précédent les a déjà
+        # absorbés, ils ne réapparaîtront pas dans un diff
+        failed = {}
+        while True:
+            changes = shard.get(self.retry_delay if failed else None)
+            closed = changes is _CLOSED
+            if closed and not failed:
+                break
+            changes = merge_changes(failed, changes if isinstance(changes, dict) else {})
+            try:
+                with METRICS.timer(f"pipeline.{self.name}.write"):
+                    self.write(index, changes)
+                failed = {}
+            except Exception as e:
+                self.errors += 1
+                failed = changes
+                logging.error(f"Erreur d'écriture ({', '.join(sorted(map(str, changes)))}): {e}"
+                              + (" - abandonné à l'arrêt" if closed else f" - nouvel essai dans {self.retry_delay:.0f}s"))
+            if closed:
+                break
+
+    def stop(self, timeout=None):
+        """Ferme l'entrée et attend que tous les changements en cours soient écrits"""
+        self.snapshots.close()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self.report(force=True)
+
+    def stats(self):
+        return {queue.name: queue.stats() for queue in [self.snapshots] + self.shards}
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_report < self.report_interval:
+            return
+        self._last_report = now
+        parts = [f"{name.split('.', 1)[1]} {stats['depth']}/{stats['max_depth']} "
+                 f"(attente {stats['wait_ms']:.1f} ms, fusionnés {stats['coalesced']})"
+                 for name, stats in self.stats().items()]
+        logging.info(f"Étages {self.name}: " + ", ".join(parts))
@@ -0,0 +1,202 @@
+import io
+import os
+import re
+import sys
+import base64
+import struct
+import hashlib
+import logging
+import zipfile
+
+# Extraction des requêtes Power Query sans Excel : les formules sont stockées
+# dans une partie customXml/itemN.xml contenant un élément <DataMashup> encodé
+# en base64 (MS-QDEFF), lui-même porteur d'un package zip avec Formulas/Section1.m.
+
+DATAMASHUP_TAG = re.compile(r'<(?:\w+:)?DataMashup\b[^>]*>(.*?)</(?:\w+:)?DataMashup>', re.S)
+SECTION_PART = 'Formulas/Section1.m'
+
+TOKEN_PATTERN = re.compile(r'''
+    (?P<whitespace>\s+)
+  | (?P<comment>//[^\r\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<quoted_identifier>\#"(?:[^"]|"")*")
+  | (?P<string>"(?:[^"]|"")*")
+  | (?P<keyword>\#[A-Za-z_]\w*)
+  | (?P<identifier>[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)
+  | (?P<number>0[xX][0-9A-Fa-f]+|\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<punct>=>|<=|>=|<>|\.\.\.|\.\.|[^\s])
+''', re.S | re.X)
+
+
+class PowerQueryExtractionError(Exception):
+    pass
+
+
+def tokenize(text):
+    """Découpe un texte M en jetons (type, valeur, début, fin)"""
+    for match in TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        yield kind, match.group(kind), match.start(), match.end()
+
+
+def identifier_name(token_kind, value):
+    """Nom d'identifiant M, #"..." compris"""
+    if token_kind == 'quoted_identifier':
+        return value[2:-1].replace('""', '"')
+    return value
+
+
+def split_section(text):
+    """Découpe un document de section M en {nom: formule}"""
+    queries = {}
+    tokens = [t for t in tokenize(text) if t[0] not in ('whitespace', 'comment')]
+    i = 0
+    while i < len(tokens):
+        kind, value, _, _ = tokens[i]
+        if not (kind == 'identifier' and value == 'shared') or i + 2 >= len(tokens):
+            i += 1
+            continue
+        name_kind, name_value, _, _ = tokens[i + 1]
+        if tokens[i + 2][1] != '=':
+            i += 1
+            continue
+        name = identifier_name(name_kind, name_value)
+        body_start = tokens[i + 2][3]
+        depth = 0
+        j = i + 3
+        while j < len(tokens):
+            token_value = tokens[j][1]
+            if token_value in ('(', '[', '{'):
+                depth += 1
+            elif token_value in (')', ']', '}'):
+                depth -= 1
+            elif token_value == ';' and depth <= 0:
+                break
+            j += 1
+        body_end = tokens[j][2] if j < len(tokens) else len(text)
+        queries[name] = text[body_start:body_end].strip()
+        i = j + 1
+    return queries
+
+
+def decode_datamashup(xml_bytes):
+    """Retourne le contenu binaire du DataMashup d'une partie customXml, ou None"""
+    if xml_bytes[:2] in (b'\xff\xfe', b'\xfe\xff'):
+        text = xml_bytes.decode('utf-16')
+    else:
+        text = xml_bytes.decode('utf-8-sig', errors='replace')
+    match = DATAMASHUP_TAG.search(text)
+    if not match:
+        return None
+    return base64.b64decode(''.join(match.group(1).split()))
+
+
+def read_section(mashup):
+    """Extrait le texte de Formulas/Section1.m du binaire DataMashup"""
+    if len(mashup) < 8:
+        raise PowerQueryExtractionError("DataMashup tronqué")
+    _, package_size = struct.unpack_from('<II', mashup, 0)
+    package = mashup[8:8 + package_size]
+    with zipfile.ZipFile(io.BytesIO(package)) as archive:
+        try:
+            return archive.read(SECTION_PART).decode('utf-8-sig')
+        except KeyError:
+            raise PowerQueryExtractionError(f"{SECTION_PART} absent du DataMashup")
+
+
+class DataMashupReader:
+    """Lecture hors-ligne des requêtes Power Query d'un classeur, avec cache"""
+
+    def __init__(self, excel_path):
+        self.excel_path = os.path.abspath(excel_path)
+        self._stat_key = None
+        self._part_name = None
+        self._part_key = None
+        self._part_hash = None
+        self._queries = {}
+
+    def _find_part(self, archive):
+        # La partie DataMashup a presque toujours le même nom d'un
+        # enregistrement à l'autre : on la teste en premier
+        names = [info.filename for info in archive.infolist()
+                 if info.filename.startswith('customXml/item') and info.filename.endswith('.xml')
+                 and not info.filename.startswith('customXml/itemProps')]
+        if self._part_name in names:
+            names.remove(self._part_name)
+            names.insert(0, self._part_name)
+        for name in names:
+            data = archive.read(name)
+            mashup = decode_datamashup(data)
+            if mashup is not None:
+                return name, data, mashup
+        return None, None, None
+
+    def get_power_queries(self):
+        """Même contrat que PowerQueryMonitor.get_power_queries, sans COM"""
+        stat = os.stat(self.excel_path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._stat_key:
+            return self._queries
+
+        with zipfile.ZipFile(self.excel_path) as archive:
+            if self._part_name:
+                try:
+                    info = archive.getinfo(self._part_name)
+                    if (info.CRC, info.file_size) == self._part_key:
+                        self._stat_key = stat_key
+                        return self._queries
+                except KeyError:
+                    pass
+
+            name, data, mashup = self._find_part(archive)
+            if name is None:
+                logging.warning(f"Aucune partie DataMashup dans {self.excel_path}")
+                self._part_name = self._part_key = self._part_hash = None
+                self._queries = {}
+            else:
+                info = archive.getinfo(name)
+                part_hash = hashlib.sha1(data).hexdigest()
+                if part_hash != self._part_hash:
+                    formulas = split_section(read_section(mashup))
+                    self._queries = {query: {'formula': formula} for query, formula in formulas.items()}
+                    self._part_hash = part_hash
+                    for query in self._queries:
+                        logging.debug(f"Requête extraite: {query}")
+                self._part_name = name
+                self._part_key = (info.CRC, info.file_size)
+        self._stat_key = stat_key
+        return self._queries
+
+
+def export_queries(queries, export_path):
+    """Écrit les requêtes extraites dans le dossier d'export"""
+    os.makedirs(export_path, exist_ok=True)
+    for name, data in queries.items():
+        file_path = os.path.join(export_path, f"{name}.m")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(data['formula'])
+        logging.info(f"Requête exportée: {file_path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    if len(sys.argv) < 2:
+        print("Usage: python powerquery_extractor.py [--export dossier] fichier.xlsm [fichier.xlsm ...]")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    export_root = None
+    if args[0] == '--export':
+        export_root = args[1]
+        args = args[2:]
+
+    for path in args:
+        try:
+            queries = DataMashupReader(path).get_power_queries()
+        except (PowerQueryExtractionError, zipfile.BadZipFile) as e:
+            logging.error(f"Erreur extraction {path}: {e}")
+            continue
+        logging.info(f"{path}: {len(queries)} requêtes")
+        if export_root:
+            workbook_name = os.path.splitext(os.path.basename(path))[0]
+            target = os.path.join(export_root, workbook_name) if len(args) > 1 else export_root
+            export_queries(queries, target)
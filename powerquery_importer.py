@@ -0,0 +1,104 @@
+import os
+import logging
+
+from export_manifest import content_digest
+from metrics import METRICS
+
+# Application de fichiers .m aux requêtes Power Query d'un classeur ouvert
+# (sens disque -> Excel). Réécrire Formula invalide le cache de la requête et
+# déclenche son rafraîchissement : seules les formules qui diffèrent sont
+# réécrites.
+
+
+def query_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def read_formula(path):
+    """Contenu exact du fichier, tel qu'écrit par l'export (UTF-8, newline='')"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+class QueryImporter:
+    def __init__(self, graph=None):
+        """graph : QueryGraph tenu à jour avec les formules appliquées"""
+        # Empreinte de la formule de chaque requête telle qu'elle est dans le classeur
+        self.digests = {}
+        self.graph = graph
+        # Requêtes ajoutées, modifiées ou supprimées par le dernier lot
+        self.last_changed = set()
+        self.updated = 0
+        self.added = 0
+        self.deleted = 0
+        self.unchanged = 0
+
+    def prime(self, wb):
+        """Mémorise les empreintes des formules du classeur (une énumération)"""
+        formulas = {query.Name: query.Formula for query in wb.Queries}
+        self.digests = {name: content_digest(formula) for name, formula in formulas.items()}
+        if self.graph is not None:
+            self.graph.update_all(formulas)
+
+    def apply_batch(self, wb, paths):
+        """Applique un lot de fichiers .m en une passe ; retourne ceux traités"""
+        wanted = {}
+        done = []
+        self.last_changed = set()
+        for path in paths:
+            name = query_name(path)
+            if not os.path.exists(path):
+                wanted[name] = (path, None)
+                continue
+            try:
+                formula = read_formula(path)
+            except OSError as e:
+                logging.error(f"Erreur lecture {path}: {e}")
+                continue
+            if self.digests.get(name) == content_digest(formula):
+                # Même formule que dans le classeur : aucun appel COM
+                self.unchanged += 1
+                done.append(path)
+                continue
+            wanted[name] = (path, formula)
+        if not wanted:
+            return done
+
+        with METRICS.timer('com.Queries.apply'):
+            queries = wb.Queries
+            existing = {query.Name: query for query in queries}
+            for name, (path, formula) in wanted.items():
+                query = existing.get(name)
+                try:
+                    if formula is None:
+                        if query is not None:
+                            query.Delete()
+                            self.deleted += 1
+                            self.last_changed.add(name)
+                            logging.info(f"Requête supprimée depuis le disque: {name}")
+                        self.digests.pop(name, None)
+                        if self.graph is not None:
+                            self.graph.remove(name)
+                    elif query is None:
+                        queries.Add(name, formula)
+                        self.added += 1
+                        self.last_changed.add(name)
+                        self.digests[name] = content_digest(formula)
+                        logging.info(f"Requête ajoutée depuis le disque: {name}")
+                    else:
+                        digest = content_digest(formula)
+                        # Le cache peut dater d'avant une modification dans Excel
+                        if content_digest(query.Formula) != digest:
+                            query.Formula = formula
+                            self.updated += 1
+                            self.last_changed.add(name)
+                            logging.info(f"Requête mise à jour depuis le disque: {name}")
+                        else:
+                            self.unchanged += 1
+                        self.digests[name] = digest
+                    if formula is not None and self.graph is not None:
+                        self.graph.update(name, formula)
+                    done.append(path)
+                except Exception as e:
+                    logging.error(f"Erreur lors de l'application de {path}: {e}")
+        return done
@@ -1,129 +1,126 @@
-import win32com.client
 import os
 import time
 import sys
 import logging
-from datetime import datetime
-import shutil
-import json
+import threading
+import pythoncom
+from scheduler import AdaptiveScheduler, POWERQUERY, attach_excel_events
+from export_manifest import ExportManifest, content_digest
+from export_writer import ExportWriter
+from metrics import METRICS
+from origin_index import EXCEL, OriginIndex
+from connections_mirror import ConnectionsMirror, find_connections_folder
+from log_setup import configure_logging
+from com_session import COMSession, CircuitOpen, WorkbookClosed
+from pipeline import ExportPipeline
 
 class PowerQueryMonitor:
-    def __init__(self, excel_path):
+    def __init__(self, excel_path, committer=None, export_path=None, mirror_connections=True, origins=None,
+                 writers=2):
+        """writers : threads d'écriture des exports pendant la surveillance"""
         self.excel_path = os.path.abspath(excel_path)
-        self.export_path = os.path.join(os.path.dirname(self.excel_path), 'powerquery_export')
+        self.export_path = os.path.abspath(export_path or os.path.join(os.path.dirname(self.excel_path), 'powerquery_export'))
         self.connections_path = os.path.join(self.export_path, 'Connections')
         self.excel = None
         self.wb = None
         self.previous_queries = {}
         self.last_known_queries = {}
+        self.scheduler = AdaptiveScheduler(pump=pythoncom.PumpWaitingMessages)
+        self.event_handlers = []
+        self.session = None
+        # Partagé avec le sens disque -> Excel (powerquery_sync.py)
+        self.origins = origins or OriginIndex()
+        self.opened = threading.Event()
         self.setup_logging()
         os.makedirs(self.export_path, exist_ok=True)
         os.makedirs(self.connections_path, exist_ok=True)
-        self.cleanup_old_files()
+        self.manifest = ExportManifest(self.export_path).load()
+        # Commits git des exports (GitCommitter), alimentés à chaque flush
+        self.committer = committer
+        on_change = committer.submit if committer else None
+        # Un ExportWriter par écrivain du pipeline, sur le même manifeste, chacun
+        # avec son dossier de préparation
+        self.shard_writers = [
+            ExportWriter(self.manifest, origins=self.origins, origin=EXCEL, on_change=on_change,
+                         staging=str(index))
+            for index in range(max(1, writers))
+        ]
+        self.writer = self.shard_writers[0]
+        self.pipeline = None
+        # Les connexions ont leur propre manifeste, tenu par le thread du miroir
+        for rel in [rel for rel in self.manifest.entries if rel.endswith('.json')]:
+            self.manifest.forget(rel)
+        self.connections = None
+        if mirror_connections:
+            self.connections = ConnectionsMirror(self.find_connections_folder, self.connections_path, on_change=on_change)
 
     def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(message)s',
-            handlers=[
-                logging.FileHandler('powerquery_monitor.log'),
-                logging.StreamHandler()
-            ]
-        )
-
-    def cleanup_old_files(self):
-        # Nettoyage des fichiers .m
-        for file in os.listdir(self.export_path):
-            if file.endswith('.m'):
-                try:
-                    os.remove(os.path.join(self.export_path, file))
-                    logging.info(f"Ancien fichier Power Query supprimé: {file}")
-                except Exception as e:
-                    logging.error(f"Erreur suppression {file}: {e}")
-        
-        # Nettoyage du dossier Connections
-        if os.path.exists(self.connections_path):
-            shutil.rmtree(self.connections_path)
-            os.makedirs(self.connections_path)
-            logging.info("Dossier Connections nettoyé")
+        configure_logging('powerquery_monitor.log')
+
+    def reconcile_exports(self, current_queries):
+        """Aligne les exports existants sur le manifeste au lieu de tout réécrire"""
+        expected = {f"{name}.m": content_digest(data['formula']) for name, data in current_queries.items()}
+        to_write = self.manifest.reconcile(expected, ('.m',))
+        for name, data in current_queries.items():
+            if f"{name}.m" in to_write:
+                self.save_query(name, data['formula'])
+        logging.info(f"Exports Power Query réconciliés: {len(to_write)} fichier(s) réécrit(s)")
+        self.writer.flush()
+
+    def find_connections_folder(self):
+        return find_connections_folder(self.excel_path)
 
     def get_power_queries(self):
         queries = {}
         try:
             # Accéder aux requêtes Power Query
-            workbook_queries = self.wb.Queries
-            for query in workbook_queries:
-                queries[query.Name] = {
-                    'formula': query.Formula,
-                }
-                logging.info(f"Requête trouvée: {query.Name}")
-
-            # Copier le dossier Connections s'il existe
-            excel_dir = os.path.dirname(self.excel_path)
-            workbook_name = os.path.splitext(os.path.basename(self.excel_path))[0]
-            logging.info(f"Recherche des connexions dans: {excel_dir}")
-            logging.info(f"Nom du workbook: {workbook_name}")
-            
-            # Chercher avec les deux formats possibles
-            source_connections = os.path.join(excel_dir, f"{workbook_name}_Connections")
-            if not os.path.exists(source_connections):
-                source_connections = os.path.join(excel_dir, "Connections")
-            
-            if os.path.exists(source_connections):
-                logging.info(f"Dossier de connexions trouvé: {source_connections}")
-                # Copier tous les fichiers .json
-                for file in os.listdir(source_connections):
-                    if file.endswith('.json'):
-                        source_file = os.path.join(source_connections, file)
-                        dest_file = os.path.join(self.connections_path, file)
-                        shutil.copy2(source_file, dest_file)
-                        logging.info(f"Fichier de connexion copié: {file}")
-            else:
-                logging.warning(f"Aucun dossier de connexions trouvé à: {source_connections}")
-            if os.path.exists(source_connections):
-                # Copier tous les fichiers .json
-                for file in os.listdir(source_connections):
-                    if file.endswith('.json'):
-                        shutil.copy2(
-                            os.path.join(source_connections, file),
-                            os.path.join(self.connections_path, file)
-                        )
-                        logging.info(f"Fichier de connexion copié: {file}")
+            with METRICS.timer('com.Queries') as timer:
+                for query in self.wb.Queries:
+                    # Un aller-retour COM par propriété : Name n'est lu qu'une fois
+                    name = query.Name
+                    formula = query.Formula
+                    queries[name] = {
+                        'formula': formula,
+                    }
+                    timer.bytes += len(formula)
+                    logging.debug(f"Requête trouvée: {name}")
 
         except Exception as e:
             logging.error(f"Erreur Power Query: {e}")
             raise
         return queries
 
-    def save_query(self, name, formula):
+    def save_query(self, name, formula, writer=None):
         file_path = os.path.join(self.export_path, f"{name}.m")
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(formula)
-            logging.info(f"Requête sauvegardée: {file_path}")
+            if (writer or self.writer).write_text(f"{name}.m", formula):
+                logging.info(f"Requête sauvegardée: {file_path}")
+            return True
         except Exception as e:
             logging.error(f"Erreur sauvegarde requête {name}: {e}")
+            return False
 
     def save_queries_from_cache(self):
+        """Ne réécrit que les requêtes dont l'export diffère du cache"""
         for name, data in self.last_known_queries.items():
             file_path = os.path.join(self.export_path, f"{name}.m")
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(data['formula'])
-                logging.info(f"Requête sauvegardée depuis le cache: {file_path}")
+                if self.writer.write_text(f"{name}.m", data['formula']):
+                    logging.info(f"Requête sauvegardée depuis le cache: {file_path}")
             except Exception as e:
                 logging.error(f"Erreur sauvegarde cache {name}: {e}")
+        self.writer.flush()
 
     def handle_query_changes(self, current_queries):
+        """Exporte les requêtes modifiées ; retourne True si quelque chose a changé"""
+        changed = False
         # Vérifier les modifications et suppressions
         for name, data in self.previous_queries.items():
             if name not in current_queries:
                 logging.info(f"Requête supprimée: {name}")
+                changed = True
                 try:
-                    file_path = os.path.join(self.export_path, f"{name}.m")
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        logging.info(f"Fichier supprimé: {file_path}")
+                    self.writer.remove(f"{name}.m")
                 except Exception as e:
                     logging.error(f"Erreur lors de la suppression de {name}: {e}")
 
@@ -133,69 +130,128 @@ class PowerQueryMonitor:
                 self.previous_queries[name]['formula'] != data['formula']):
                 logging.info(f"Modification détectée pour {name}")
                 self.save_query(name, data['formula'])
-
-    def initialize_excel(self):
-        try:
-            self.excel = win32com.client.GetActiveObject("Excel.Application")
-            self.excel = win32com.client.Dispatch("Excel.Application")
-        except:
-            self.excel = win32com.client.Dispatch("Excel.Application")
-        self.excel.Visible = True
+                changed = True
+        self.writer.flush()
+        return changed
 
     def cleanup(self):
-        if self.wb:
-            try:
-                self.wb.Close(False)
-                self.excel.Quit()
-            except:
-                pass
+        if self.session:
+            self.session.close()
+
+    def reattach(self, excel, wb):
+        """Connexion COM rétablie : nouveau proxy vers le même classeur"""
+        self.excel = excel
+        self.wb = wb
+        self.event_handlers = attach_excel_events(excel, wb, self.scheduler, self.excel_path)
+
+    def start_session(self):
+        """Reprise à chaud : seuls les exports différents du manifeste sont réécrits"""
+        if self.connections:
+            self.connections.start()
+        with self.origins.apply_lock:
+            current_queries = self.get_power_queries()
+            self.last_known_queries = current_queries.copy()
+            self.reconcile_exports(current_queries)
+            self.previous_queries = current_queries
+        self.opened.set()
+
+    def poll(self):
+        """Un cycle de scan et d'export ; lève une exception si le classeur est fermé"""
+        # Pas de scan pendant qu'un import depuis le disque est en cours
+        with self.origins.apply_lock, METRICS.cycle('cycle.powerquery'):
+            _ = self.wb.Name
+            current_queries = self.get_power_queries()
+            self.last_known_queries = current_queries.copy()
+            changed = self.handle_query_changes(current_queries)
+            self.previous_queries = current_queries
+        return changed
+
+    def scan(self):
+        """Relevé COM seul, l'export est fait par les étages du pipeline"""
+        with self.origins.apply_lock, METRICS.timer('pipeline.powerquery.scan'):
+            _ = self.wb.Name
+            current_queries = self.get_power_queries()
+        self.last_known_queries = current_queries
+        return current_queries
+
+    def diff_queries(self, previous, current):
+        """{nom: formule, None si supprimée} entre deux relevés"""
+        changes = {name: None for name in previous if name not in current}
+        for name, data in current.items():
+            if name not in previous or previous[name]['formula'] != data['formula']:
+                changes[name] = data['formula']
+        return changes
+
+    def write_changes(self, index, changes):
+        """Écrivain index du pipeline : exporte un lot de changements"""
+        writer = self.shard_writers[index]
+        failed = []
+        for name, formula in changes.items():
+            if formula is None:
+                logging.info(f"Requête supprimée: {name}")
+                try:
+                    writer.remove(f"{name}.m")
+                except Exception as e:
+                    logging.error(f"Erreur lors de la suppression de {name}: {e}")
+                    failed.append(name)
+            else:
+                logging.info(f"Modification détectée pour {name}")
+                if not self.save_query(name, formula, writer):
+                    failed.append(name)
+        writer.flush()
+        if failed:
+            # Le pipeline réessaie le lot
+            raise OSError(f"Requêtes non exportées: {', '.join(failed)}")
 
     def monitor(self):
+        self.session = COMSession(self.excel_path)
+        self.session.on_reattach.append(self.reattach)
         try:
-            self.initialize_excel()
+            self.wb = self.session.open()
+            self.excel = self.session.excel
             logging.info(f"Surveillance des requêtes Power Query: {self.excel_path}")
+            self.event_handlers = attach_excel_events(self.excel, self.wb, self.scheduler, self.excel_path)
+            if self.committer:
+                self.committer.start()
             
-            self.wb = self.excel.Workbooks.Open(self.excel_path)
-            logging.info("Fichier Excel ouvert avec succès")
-            
-            # Force l'export initial de toutes les requêtes
-            current_queries = self.get_power_queries()
-            self.last_known_queries = current_queries.copy()
-            self.handle_query_changes(current_queries)
-            self.previous_queries = current_queries
+            self.start_session()
+            # Relevés sur ce thread COM, comparaison et écritures sur les threads du pipeline
+            self.pipeline = ExportPipeline(self.diff_queries, self.write_changes, writers=len(self.shard_writers),
+                                           name='powerquery').start(self.previous_queries)
             
             while True:
+                wakeup = self.scheduler.wait()
+                if not wakeup.wants(POWERQUERY):
+                    continue
                 try:
-                    try:
-                        _ = self.wb.Name
-                        try:
-                            current_queries = self.get_power_queries()
-                            self.last_known_queries = current_queries.copy()
-                        except Exception as e:
-                            if "RPC_E_CALL_REJECTED" not in str(e):
-                                logging.info(f"Requête en cours de chargement - attente...")
-                                time.sleep(10)
-                                continue
-                            raise
-                    except:
-                        logging.info("Excel fermé par l'utilisateur - Sauvegarde depuis le cache...")
-                        self.save_queries_from_cache()
-                        sys.exit(0)
-                    
-                    self.handle_query_changes(current_queries)
-                    self.previous_queries = current_queries
-                    time.sleep(10)
-                    
+                    current_queries = self.session.call(self.scan)
+                except WorkbookClosed:
+                    logging.info("Excel fermé par l'utilisateur - écriture des changements en cours...")
+                    break
+                except CircuitOpen as e:
+                    logging.info(f"{e}")
+                    time.sleep(self.session.breaker.remaining())
+                    continue
                 except Exception as e:
-                    if str(e).find("RPC_E_CALL_REJECTED") >= 0:
-                        logging.info("Excel fermé - Sauvegarde depuis le cache...")
-                        self.save_queries_from_cache()
-                        sys.exit(0)
-                    logging.error(f"Erreur pendant la surveillance: {e}")
-                    sys.exit(1)
+                    # Requête en cours de chargement, erreur passagère... : nouvel essai au prochain cycle
+                    logging.info(f"Scan impossible ({e}) - attente...")
+                    # Pas une activité : le poll ralentit au lieu de rester au minimum
+                    self.scheduler.record_activity(False)
+                    continue
+                changed = current_queries != self.previous_queries
+                if changed:
+                    self.pipeline.submit(current_queries)
+                self.previous_queries = current_queries
+                self.scheduler.record_activity(changed)
                     
         except Exception as e:
             logging.error(f"Erreur lors de l'ouverture du fichier: {e}")
             sys.exit(1)
         finally:
+            if self.pipeline:
+                self.pipeline.stop()
+            if self.connections:
+                self.connections.stop()
+            if self.committer:
+                self.committer.stop()
             self.cleanup()
\ No newline at end of file
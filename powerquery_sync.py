@@ -0,0 +1,115 @@
+import os
+import sys
+import logging
+import pythoncom
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+from com_session import running_workbook
+from import_queue import DebouncedImportQueue
+from origin_index import OriginIndex
+from powerquery_importer import QueryImporter
+from powerquery_monitor import PowerQueryMonitor
+from query_graph import QueryGraph, QueryRefresher
+
+# Sens disque -> Excel des requêtes Power Query : les fichiers .m édités dans
+# powerquery_export/ sont réappliqués à wb.Queries (QueryImporter) en une
+# passe par lot ; un fichier ajouté crée la requête, un fichier supprimé la
+# supprime. Les exports du moniteur Power Query sont écartés grâce à l'index
+# d'origine partagé. Avec --refresh, seules les requêtes modifiées et celles
+# qui en dépendent sont ensuite rafraîchies (query_graph.py).
+
+
+class PowerQuerySync:
+    def __init__(self, excel_path, watch_folder=None, refresh=False):
+        self.origins = OriginIndex()
+        self.refresh = refresh
+        self.graph = QueryGraph()
+        self.exporter = PowerQueryMonitor(excel_path, origins=self.origins)
+        self.watch_folder = os.path.abspath(watch_folder or self.exporter.export_path)
+        self.wb = None
+        self.importer = QueryImporter(self.graph)
+        self.queue = DebouncedImportQueue(
+            self.import_batch,
+            thread_init=self.attach_workbook,
+            thread_exit=pythoncom.CoUninitialize,
+            origins=self.origins,
+            removals=True
+        )
+
+    def attach_workbook(self):
+        """Rattache le thread d'import au classeur ouvert par le moniteur Power Query"""
+        pythoncom.CoInitialize()
+        self.exporter.opened.wait()
+        self.wb = running_workbook(self.exporter.excel_path)
+        if self.wb is None:
+            raise Exception(f"Classeur introuvable dans la ROT: {self.exporter.excel_path}")
+        with self.origins.apply_lock:
+            self.importer.prime(self.wb)
+        logging.info("Thread d'import Power Query rattaché au classeur")
+
+    def import_batch(self, file_paths):
+        """Applique les fichiers prêts, sans scan Power Query concurrent"""
+        with self.origins.apply_lock:
+            done = self.importer.apply_batch(self.wb, file_paths)
+            levels = self.graph.refresh_plan(self.importer.last_changed)
+        if levels:
+            logging.info(f"À rafraîchir: {sum(len(level) for level in levels)} requête(s) en {len(levels)} niveau(x)")
+            if self.refresh:
+                try:
+                    QueryRefresher(self.wb).run(levels)
+                except Exception as e:
+                    logging.error(f"Erreur de rafraîchissement: {e}")
+        return done
+
+    def run(self):
+        self.queue.prime(
+            os.path.join(self.watch_folder, file) for file in os.listdir(self.watch_folder)
+            if file.lower().endswith('.m')
+        )
+        self.queue.start()
+
+        observer = Observer()
+        observer.schedule(QueryFileHandler(self.queue), self.watch_folder, recursive=False)
+        observer.start()
+        logging.info(f"Synchronisation Power Query: {self.exporter.excel_path} <-> {self.watch_folder}")
+        try:
+            self.exporter.monitor()
+        finally:
+            observer.stop()
+            observer.join()
+            self.queue.stop()
+
+
+class QueryFileHandler(FileSystemEventHandler):
+    def __init__(self, queue):
+        self.queue = queue
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.submit(event.src_path)
+
+    def on_created(self, event):
+        self.on_modified(event)
+
+    def on_deleted(self, event):
+        self.on_modified(event)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            # Renommage : l'ancienne requête disparaît, la nouvelle apparaît
+            self.submit(event.src_path)
+            self.submit(event.dest_path)
+
+    def submit(self, file_path):
+        if file_path.lower().endswith('.m'):
+            self.queue.submit(file_path)
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != '--refresh']
+    if len(args) not in (1, 2):
+        print("Usage: python powerquery_sync.py chemin_vers_fichier.xlsm [dossier_export] [--refresh]")
+        sys.exit(1)
+
+    sync = PowerQuerySync(args[0], args[1] if len(args) == 2 else None, refresh='--refresh' in sys.argv)
+    sync.run()
@@ -0,0 +1,318 @@
+import os
+import sys
+import time
+import logging
+
+from export_manifest import content_digest
+from powerquery_extractor import tokenize, identifier_name
+
+# Graphe de dépendances entre requêtes Power Query, construit à partir des
+# jetons M (tokenizer de powerquery_extractor.py) : une requête dépend des
+# autres requêtes qu'elle nomme, directement ou via #shared[Nom]. Seules les
+# formules modifiées sont réanalysées. À partir d'un ensemble de requêtes
+# modifiées, refresh_plan donne les requêtes à rafraîchir (les modifiées et
+# tout ce qui en dépend) par niveaux : les requêtes d'un même niveau ne
+# dépendent pas les unes des autres et peuvent être rafraîchies en parallèle.
+#
+#     python query_graph.py powerquery_export [requête_modifiée ...]
+
+# Mots réservés du langage M, découpés comme des identifiants par le tokenizer
+M_KEYWORDS = {'and', 'as', 'each', 'else', 'error', 'false', 'if', 'in', 'is', 'let', 'meta', 'not',
+              'null', 'or', 'otherwise', 'section', 'shared', 'then', 'true', 'try', 'type'}
+
+
+def expression_end(tokens, start):
+    """Position qui suit l'expression commençant en start : virgule, point-virgule
+    ou in d'un let englobant, ou fermeture d'une parenthèse englobante"""
+    depth = nested = 0
+    for j in range(start, len(tokens)):
+        value = tokens[j][1]
+        if value in ('(', '[', '{'):
+            depth += 1
+        elif value in (')', ']', '}'):
+            depth -= 1
+            if depth < 0:
+                return j
+        elif depth:
+            continue
+        elif value == 'let':
+            nested += 1
+        elif value == 'in':
+            if not nested:
+                return j
+            nested -= 1
+        elif not nested and value in (',', ';'):
+            return j
+    return len(tokens)
+
+
+def function_scopes(tokens):
+    """(positions des paramètres, début, fin) de chaque fonction
+    (x, optional y as text) => ... : ses paramètres ne sont visibles que
+    dans son corps"""
+    scopes = []
+    openings = []
+    for i, (_, value, _, _) in enumerate(tokens):
+        if value == '(':
+            openings.append(i)
+        elif value == ')' and openings:
+            start = openings.pop()
+            after = i + 1
+            if after < len(tokens) and tokens[after][1] == 'as':
+                after += 1
+                if after < len(tokens) and tokens[after][1] == 'nullable':
+                    after += 1
+                after += 1
+            if after < len(tokens) and tokens[after][1] == '=>':
+                parameters = {}
+                for j in range(start + 1, i):
+                    if tokens[j - 1][1] in ('(', ',', 'optional') and tokens[j][0] in ('identifier', 'quoted_identifier'):
+                        parameters[j] = identifier_name(tokens[j][0], tokens[j][1])
+                scopes.append((parameters, start, expression_end(tokens, after + 1)))
+    return scopes
+
+
+def let_scopes(tokens):
+    """(positions des étapes, début, fin) de chaque let : ses étapes ne sont
+    visibles qu'entre le let et la fin de son expression in"""
+    scopes = []
+    for start, (_, value, _, _) in enumerate(tokens):
+        if value != 'let':
+            continue
+        steps = {}
+        depth = nested = 0
+        body = False
+        end = len(tokens)
+        for j in range(start + 1, len(tokens)):
+            value = tokens[j][1]
+            if value in ('(', '[', '{'):
+                depth += 1
+            elif value in (')', ']', '}'):
+                depth -= 1
+                if depth < 0:
+                    end = j
+                    break
+            elif depth:
+                continue
+            elif value == 'let':
+                nested += 1
+            elif value == 'in':
+                if nested:
+                    nested -= 1
+                else:
+                    body = True
+            elif nested:
+                continue
+            elif body and value in (',', ';'):
+                end = j
+                break
+            elif not body and value == '=' and tokens[j - 1][0] in ('identifier', 'quoted_identifier') \
+                    and tokens[j - 2][1] in ('let', ','):
+                steps[j - 1] = identifier_name(tokens[j - 1][0], tokens[j - 1][1])
+        scopes.append((steps, start, end))
+    return scopes
+
+
+def formula_names(formula):
+    """(noms libres, accès dynamique) : identifiants utilisés par la formule
+    qui ne sont ni des mots-clés, ni des types, ni des étapes de let ou des
+    paramètres visibles à cet endroit, ni des champs [x]"""
+    tokens = [t for t in tokenize(formula) if t[0] not in ('whitespace', 'comment')]
+    scopes = let_scopes(tokens) + function_scopes(tokens)
+    used = set()
+    dynamic = False
+    brackets = []
+    for i, (kind, value, _, _) in enumerate(tokens):
+        previous = tokens[i - 1][1] if i > 0 else None
+        following = tokens[i + 1][1] if i + 1 < len(tokens) else None
+        if value in ('(', '[', '{'):
+            brackets.append(value)
+        elif value in (')', ']', '}') and brackets:
+            brackets.pop()
+        if kind == 'keyword' and value == '#shared':
+            # #shared passé tel quel (Expression.Evaluate(..., #shared)) : dépendances inconnues
+            if following == '[' and i + 2 < len(tokens) and tokens[i + 2][0] in ('identifier', 'quoted_identifier'):
+                used.add(identifier_name(tokens[i + 2][0], tokens[i + 2][1]))
+            elif following != '[':
+                dynamic = True
+            continue
+        if kind not in ('identifier', 'quoted_identifier'):
+            continue
+        if kind == 'identifier' and (value in M_KEYWORDS or previous in ('as', 'nullable')):
+            # Mot réservé, ou type d'un paramètre ou d'un retour (as table)
+            continue
+        name = identifier_name(kind, value)
+        if previous == '[' and following in (']', '='):
+            # Accès à un champ, ou premier champ d'un enregistrement
+            continue
+        if previous == ',' and following == '=' and brackets and brackets[-1] == '[':
+            # Champ suivant d'un enregistrement [a = 1, b = 2]
+            continue
+        if any(i in names or (start < i < end and name in names.values()) for names, start, end in scopes):
+            # Étape d'un let ou paramètre, ou référence à l'un d'eux qui masque
+            # la requête du même nom dans sa portée
+            continue
+        used.add(name)
+    return used, dynamic
+
+
+class QueryGraph:
+    def __init__(self):
+        # nom -> (empreinte de la formule, noms libres, accès dynamique)
+        self.nodes = {}
+        self.parsed = 0
+
+    def update(self, name, formula):
+        """Réanalyse la formule seulement si elle a changé ; True si c'est le cas"""
+        digest = content_digest(formula)
+        node = self.nodes.get(name)
+        if node and node[0] == digest:
+            return False
+        names, dynamic = formula_names(formula)
+        self.nodes[name] = (digest, names, dynamic)
+        self.parsed += 1
+        return True
+
+    def remove(self, name):
+        return self.nodes.pop(name, None) is not None
+
+    def update_all(self, queries):
+        """Aligne le graphe sur {nom: formule ou {'formula': ...}} ; retourne les noms modifiés"""
+        changed = set()
+        for name, data in queries.items():
+            formula = data['formula'] if isinstance(data, dict) else data
+            if self.update(name, formula):
+                changed.add(name)
+        for name in list(self.nodes):
+            if name not in queries:
+                self.remove(name)
+                changed.add(name)
+        return changed
+
+    @classmethod
+    def from_folder(cls, folder):
+        """Graphe des fichiers .m exportés, sans Excel"""
+        graph = cls()
+        for file in sorted(os.listdir(folder)):
+            if file.endswith('.m'):
+                with open(os.path.join(folder, file), 'r', encoding='utf-8', newline='') as f:
+                    graph.update(file[:-2], f.read())
+        return graph
+
+    def dependencies(self, name):
+        """Requêtes dont name dépend directement"""
+        _, names, dynamic = self.nodes[name]
+        if dynamic:
+            return set(self.nodes) - {name}
+        return {other for other in names if other in self.nodes and other != name}
+
+    def dependents(self):
+        """nom -> requêtes qui en dépendent directement"""
+        reverse = {name: set() for name in self.nodes}
+        for name in self.nodes:
+            for dependency in self.dependencies(name):
+                reverse[dependency].add(name)
+        return reverse
+
+    def affected(self, changed):
+        """Requêtes modifiées et tout ce qui en dépend, transitivement"""
+        reverse = self.dependents()
+        result = set()
+        pending = [name for name in changed if name in self.nodes]
+        while pending:
+            name = pending.pop()
+            if name in result:
+                continue
+            result.add(name)
+            pending.extend(reverse[name] - result)
+        return result
+
+    @staticmethod
+    def _reachable(name, remaining):
+        """Requêtes restantes dont name dépend, transitivement"""
+        seen = set()
+        pending = list(remaining[name] & set(remaining))
+        while pending:
+            other = pending.pop()
+            if other not in seen:
+                seen.add(other)
+                pending.extend(remaining[other] & set(remaining))
+        return seen
+
+    def refresh_plan(self, changed):
+        """Niveaux de rafraîchissement : chaque requête après celles dont elle dépend"""
+        remaining = {name: self.dependencies(name) for name in self.affected(changed)}
+        levels = []
+        while remaining:
+            ready = sorted(name for name, needs in remaining.items() if not needs & set(remaining))
+            if not ready:
+                # Référence circulaire (refusée par Excel) : les requêtes d'un cycle
+                # qui ne dépend d'aucun autre passent ensemble, leurs dépendants après
+                reach = {name: self._reachable(name, remaining) for name in remaining}
+                ready = sorted(name for name in remaining
+                               if name in reach[name] and all(name in reach[other] for other in reach[name]))
+                logging.warning(f"Dépendances circulaires entre: {', '.join(ready)}")
+            levels.append(ready)
+            for name in ready:
+                del remaining[name]
+        return levels
+
+
+class QueryRefresher:
+    """Rafraîchit un plan niveau par niveau via les connexions « Requête - Nom » :
+    les requêtes d'un niveau en arrière-plan simultanément, puis attente de
+    leur fin avant le niveau suivant"""
+
+    def __init__(self, wb, poll_interval=0.2, timeout=600.0, sleep=time.sleep, clock=time.monotonic):
+        self.wb = wb
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.sleep = sleep
+        self.clock = clock
+
+    def connections(self):
+        """nom de requête -> WorkbookConnection (requêtes chargées ou « connexion uniquement »)"""
+        found = {}
+        for connection in self.wb.Connections:
+            name = connection.Name
+            for prefix in ('Query - ', 'Requête - '):
+                if name.startswith(prefix):
+                    found[name[len(prefix):]] = connection
+        return found
+
+    def run(self, levels):
+        """Retourne le nombre de requêtes rafraîchies"""
+        connections = self.connections()
+        refreshed = 0
+        for level in levels:
+            started = []
+            for name in level:
+                connection = connections.get(name)
+                if connection is None:
+                    # Fonction ou requête sans connexion : évaluée par ses dépendants
+                    continue
+                connection.OLEDBConnection.BackgroundQuery = True
+                connection.Refresh()
+                started.append(connection)
+            deadline = self.clock() + self.timeout
+            while any(connection.OLEDBConnection.Refreshing for connection in started):
+                if self.clock() > deadline:
+                    raise TimeoutError(f"Rafraîchissement trop long: {', '.join(level)}")
+                self.sleep(self.poll_interval)
+            refreshed += len(started)
+            logging.info(f"Rafraîchi: {', '.join(level)}")
+        return refreshed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    if len(sys.argv) < 2:
+        print("Usage: python query_graph.py dossier_export [requête_modifiée ...]")
+        sys.exit(1)
+
+    graph = QueryGraph.from_folder(sys.argv[1])
+    for name in sorted(graph.nodes):
+        print(f"{name} <- {', '.join(sorted(graph.dependencies(name))) or '-'}")
+    if len(sys.argv) > 2:
+        for index, level in enumerate(graph.refresh_plan(sys.argv[2:]), 1):
+            print(f"niveau {index}: {', '.join(level)}")
@@ -0,0 +1,374 @@
+import os
+import time
+import logging
+import threading
+
+# Ordonnancement des scans : les événements Excel déclenchent un scan immédiat
+# et ciblé, sinon un poll de secours dont l'intervalle s'allonge quand le
+# classeur est inactif et se raccourcit dès qu'il y a de l'activité.
+
+VBA = 'vba'
+POWERQUERY = 'powerquery'
+CONNECTIONS = 'connections'
+SHEETS = 'sheets'
+
+
+class Wakeup:
+    def __init__(self, reason, targets=None):
+        self.reason = reason
+        self.targets = targets
+
+    def wants(self, target):
+        """Vrai si ce réveil demande un scan de cette cible (None = tout)"""
+        return self.targets is None or target in self.targets
+
+    def __repr__(self):
+        return f"Wakeup({self.reason!r}, {self.targets!r})"
+
+
+class AdaptiveScheduler:
+    def __init__(self, min_interval=0.5, max_interval=60.0, backoff=2.0,
+                 pump=None, pump_interval=0.1, clock=time.monotonic):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.pump = pump
+        self.pump_interval = pump_interval
+        self.clock = clock
+        self._condition = threading.Condition(threading.RLock())
+        self._reasons = []
+        self._targets = set()
+        self._full_scan = False
+        self._touched = False
+        self.wakeups = 0
+
+    def notify(self, reason, targets=None):
+        """Demande un scan immédiat (targets=None : toutes les cibles)"""
+        with self._condition:
+            self._reasons.append(reason)
+            if targets is None:
+                self._full_scan = True
+            else:
+                self._targets.update(targets)
+            self._condition.notify_all()
+
+    def touch(self):
+        """Signale de l'activité sans exiger de scan immédiat"""
+        with self._condition:
+            self._touched = True
+            self._condition.notify_all()
+
+    def record_activity(self, changed):
+        """Ajuste l'intervalle après un scan : court après un changement, puis recul"""
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+
+    def _take(self):
+        reason = ', '.join(dict.fromkeys(self._reasons))
+        targets = None if self._full_scan else frozenset(self._targets)
+        self._reasons = []
+        self._targets = set()
+        self._full_scan = False
+        return Wakeup(reason, targets)
+
+    def wait(self):
+        """Bloque jusqu'au prochain événement ou à l'échéance du poll de secours"""
+        deadline = self.clock() + self.interval
+        while True:
+            if self.pump:
+                # Les événements COM ne sont délivrés que pendant le pompage des messages
+                self.pump()
+            with self._condition:
+                if self._reasons:
+                    self.wakeups += 1
+                    return self._take()
+                if self._touched:
+                    self._touched = False
+                    self.interval = self.min_interval
+                    deadline = min(deadline, self.clock() + self.min_interval)
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    self.wakeups += 1
+                    return Wakeup('poll')
+                timeout = min(remaining, self.pump_interval) if self.pump else remaining
+                self._condition.wait(timeout)
+
+
+class ScheduledWorkbook:
+    """État d'un classeur dans le SharedScheduler"""
+
+    def __init__(self, key, priority, min_interval, max_interval, backoff, now):
+        self.key = key
+        self.priority = priority
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        # Premier scan immédiat
+        self.due = now
+        self.not_before = now
+        self.running = False
+        self.reasons = []
+        self.targets = set()
+        self.full_scan = False
+        self.scans = 0
+        self.max_wait = 0.0
+
+    def ready_at(self):
+        # Un événement n'attend que la limite de débit et la contre-pression
+        return self.not_before if self.reasons else max(self.due, self.not_before)
+
+
+class SchedulerHandle:
+    """notify/touch d'un classeur, interface attendue par attach_excel_events"""
+
+    def __init__(self, scheduler, key):
+        self.scheduler = scheduler
+        self.key = key
+
+    def notify(self, reason, targets=None):
+        self.scheduler.notify(self.key, reason, targets)
+
+    def touch(self):
+        self.scheduler.touch(self.key)
+
+    @property
+    def max_interval(self):
+        return self.scheduler.slots[self.key].max_interval
+
+    @max_interval.setter
+    def max_interval(self, value):
+        self.scheduler.bound(self.key, value)
+
+
+class SharedScheduler:
+    """Ordonnanceur commun à plusieurs classeurs, servi par un pool de workers.
+
+    Chaque classeur garde le poll adaptatif d'AdaptiveScheduler ; en plus,
+    min_interval limite le débit de ses scans (événements compris), la
+    priorité départage les classeurs prêts en même temps avec un
+    vieillissement (aging secondes d'attente valent un point de priorité),
+    et la contre-pression impose après chaque scan un repos proportionnel à
+    sa durée : un classeur ne peut occuper plus de duty_cycle de son worker.
+    """
+
+    def __init__(self, duty_cycle=0.25, aging=30.0, clock=time.monotonic):
+        self.duty_cycle = duty_cycle
+        self.aging = aging
+        self.clock = clock
+        self.slots = {}
+        self._condition = threading.Condition()
+
+    def register(self, key, priority=0, min_interval=0.5, max_interval=60.0, backoff=2.0):
+        with self._condition:
+            self.slots[key] = ScheduledWorkbook(key, priority, min_interval, max_interval, backoff, self.clock())
+            self._condition.notify_all()
+        return SchedulerHandle(self, key)
+
+    def bound(self, key, max_interval):
+        """Intervalle maximal du poll d'un classeur (borne exigée par ses extracteurs)"""
+        with self._condition:
+            slot = self.slots[key]
+            slot.max_interval = max_interval
+            slot.interval = min(slot.interval, max_interval)
+            slot.due = min(slot.due, self.clock() + max_interval)
+            self._condition.notify_all()
+
+    def unregister(self, key):
+        with self._condition:
+            self.slots.pop(key, None)
+
+    def notify(self, key, reason, targets=None):
+        with self._condition:
+            slot = self.slots.get(key)
+            if not slot:
+                return
+            slot.reasons.append(reason)
+            if targets is None:
+                slot.full_scan = True
+            else:
+                slot.targets.update(targets)
+            self._condition.notify_all()
+
+    def touch(self, key):
+        with self._condition:
+            slot = self.slots.get(key)
+            if not slot:
+                return
+            slot.interval = slot.min_interval
+            slot.due = min(slot.due, self.clock() + slot.min_interval)
+            self._condition.notify_all()
+
+    def pick(self, keys, now=None):
+        """Classeur prêt le plus prioritaire parmi keys, marqué en cours de scan.
+
+        Retourne (clé, Wakeup) ou (None, prochaine échéance / None)."""
+        now = self.clock() if now is None else now
+        with self._condition:
+            best = None
+            next_ready = None
+            for key in keys:
+                slot = self.slots.get(key)
+                if not slot or slot.running:
+                    continue
+                ready_at = slot.ready_at()
+                if ready_at > now:
+                    next_ready = ready_at if next_ready is None else min(next_ready, ready_at)
+                    continue
+                score = slot.priority + (now - ready_at) / self.aging
+                if best is None or score > best[0]:
+                    best = (score, slot, ready_at)
+            if best is None:
+                return None, next_ready
+            _, slot, ready_at = best
+            slot.running = True
+            slot.scans += 1
+            slot.max_wait = max(slot.max_wait, now - ready_at)
+            if slot.reasons:
+                reason = ', '.join(dict.fromkeys(slot.reasons))
+                wakeup = Wakeup(reason, None if slot.full_scan else frozenset(slot.targets))
+            else:
+                wakeup = Wakeup('poll')
+            slot.reasons = []
+            slot.targets = set()
+            slot.full_scan = False
+            return slot.key, wakeup
+
+    def next_for(self, keys, timeout):
+        """Bloque au plus timeout secondes (pour laisser pomper les messages COM)"""
+        deadline = self.clock() + timeout
+        with self._condition:
+            while True:
+                now = self.clock()
+                key, result = self.pick(keys, now)
+                if key is not None:
+                    return key, result
+                remaining = deadline - now
+                if remaining <= 0:
+                    return None, None
+                if result is not None:
+                    remaining = min(remaining, max(result - now, 0.001))
+                self._condition.wait(remaining)
+
+    def done(self, key, changed, duration, now=None):
+        """Fin de scan : intervalle adaptatif, limite de débit et contre-pression"""
+        now = self.clock() if now is None else now
+        with self._condition:
+            slot = self.slots.get(key)
+            if not slot:
+                return
+            slot.running = False
+            if changed:
+                slot.interval = slot.min_interval
+            else:
+                slot.interval = min(slot.max_interval, slot.interval * slot.backoff)
+            slot.due = now + slot.interval
+            rest = duration * (1 - self.duty_cycle) / self.duty_cycle
+            slot.not_before = max(now - duration + slot.min_interval, now + rest)
+            self._condition.notify_all()
+
+
+class WorkbookEventsMixin:
+    """Base commune des gestionnaires d'événements ; filtre sur le classeur surveillé"""
+    scheduler = None
+    workbook_path = None
+    # Zones modifiées des feuilles (sheet_extractor.DirtyRanges), si exportées
+    dirty = None
+
+    def _is_watched(self, wb):
+        if self.workbook_path is None:
+            return True
+        try:
+            return os.path.abspath(wb.FullName).lower() == self.workbook_path.lower()
+        except Exception:
+            return True
+
+
+class ExcelApplicationEvents(WorkbookEventsMixin):
+    """Événements Excel.Application (à brancher via win32com.client.WithEvents)"""
+
+    def OnWorkbookBeforeSave(self, Wb, SaveAsUI, Cancel):
+        if self._is_watched(Wb):
+            if self.dirty is not None:
+                self.dirty.add_meta()
+            self.scheduler.notify('WorkbookBeforeSave')
+
+    def OnWorkbookAfterSave(self, Wb, Success):
+        if self._is_watched(Wb):
+            self.scheduler.notify('WorkbookAfterSave')
+
+    def OnSheetChange(self, Sh, Target):
+        if self._is_watched(Sh.Parent):
+            if self.dirty is None:
+                self.scheduler.touch()
+                return
+            self.dirty.add(Sh.Name, Target.Address)
+            self.scheduler.notify('SheetChange', {SHEETS})
+
+    def OnSheetCalculate(self, Sh):
+        # Un rafraîchissement de requête redimensionne les tableaux sans SheetChange
+        if self.dirty is not None and self._is_watched(Sh.Parent):
+            self.dirty.add_meta(Sh.Name)
+            self.scheduler.touch()
+
+    def OnWorkbookActivate(self, Wb):
+        if self._is_watched(Wb):
+            self.scheduler.touch()
+
+    def OnWorkbookBeforeClose(self, Wb, Cancel):
+        if self._is_watched(Wb):
+            self.scheduler.notify('WorkbookBeforeClose')
+
+
+class VBComponentsEvents:
+    """Événements VBE sur les composants (ajout, suppression, renommage)"""
+    scheduler = None
+
+    def OnItemAdded(self, VBComponent):
+        self.scheduler.notify('VBComponent ajouté', {VBA})
+
+    def OnItemRemoved(self, VBComponent):
+        self.scheduler.notify('VBComponent supprimé', {VBA})
+
+    def OnItemRenamed(self, VBComponent, OldName):
+        self.scheduler.notify('VBComponent renommé', {VBA})
+
+    def OnItemActivated(self, VBComponent):
+        # Édition probable dans ce composant : vérification complète (vba_monitor.py)
+        self.scheduler.notify('VBComponent activé', {VBA})
+
+    def OnItemSelected(self, VBComponent):
+        self.scheduler.touch()
+
+
+def attach_excel_events(excel, wb, scheduler, workbook_path=None, dirty=None):
+    """Branche les événements Excel et VBE sur l'ordonnanceur ; dirty
+    (DirtyRanges) reçoit les zones modifiées des feuilles.
+
+    Retourne les gestionnaires à conserver en vie ; en cas d'échec (VBE non
+    accessible, bibliothèque de types absente) le poll adaptatif suffit.
+    """
+    import win32com.client
+
+    handlers = []
+    try:
+        app_events = win32com.client.WithEvents(excel, ExcelApplicationEvents)
+        app_events.scheduler = scheduler
+        app_events.workbook_path = workbook_path
+        app_events.dirty = dirty
+        handlers.append(app_events)
+        if dirty is not None:
+            dirty.connected = True
+    except Exception as e:
+        logging.warning(f"Événements Excel indisponibles: {e}")
+    try:
+        source = excel.VBE.Events.VBComponentsEvents(wb.VBProject)
+        vbe_events = win32com.client.WithEvents(source, VBComponentsEvents)
+        vbe_events.scheduler = scheduler
+        handlers.append(vbe_events)
+    except Exception as e:
+        logging.warning(f"Événements VBE indisponibles: {e}")
+    return handlers
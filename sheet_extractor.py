@@ -0,0 +1,335 @@
+import re
+import time
+import logging
+import threading
+
+from cell_address import MAX_COLUMNS, MAX_ROWS, area_address, column_letter, parse_area
+from export_manifest import content_digest
+from metrics import METRICS
+
+# Formules des feuilles, noms définis, tableaux (ListObjects) et validations
+# exportés en texte (une cellule ou un élément par ligne, triés) pour que git
+# en montre les différences. Après le premier relevé complet (une lecture
+# Range.Formula de la plage utilisée par feuille), seules les zones signalées
+# par les événements SheetChange sont relues, en une lecture de tableau par
+# zone ; SheetCalculate et l'enregistrement font relire tableaux et
+# validations. Chaque zone est lue avec une ligne et une colonne de garde :
+# si la garde ne correspond plus au cache, des cellules ont été insérées ou
+# supprimées avec décalage. Décalage, lignes/colonnes entières, feuille
+# renommée ou supprimée : Excel a pu réécrire les références des autres
+# feuilles, tout le classeur est relu. L'enregistrement relit aussi tout le
+# classeur, et une relecture complète a lieu au plus tard toutes les
+# connected_interval secondes (couper-coller, qui ne signale que la destination).
+
+SHEETS_FOLDER = 'sheets_export'
+NAMES_FILE = 'names.txt'
+TABLES_FILE = 'tables.txt'
+VALIDATION_FILE = 'validation.txt'
+
+XL_CELL_TYPE_ALL_VALIDATION = -4174
+# Au-delà de ce nombre de cellules, une zone modifiée est bornée à la plage utilisée
+CLIP_CELLS = 10000
+
+
+def whole_lines(bounds):
+    """Lignes ou colonnes entières : insertion ou suppression probable"""
+    r1, c1, r2, c2 = bounds
+    return (c1 == 1 and c2 == MAX_COLUMNS) or (r1 == 1 and r2 == MAX_ROWS)
+
+
+def as_rows(value):
+    """Range.Formula : une valeur seule pour une cellule, un tableau de lignes sinon"""
+    if isinstance(value, (tuple, list)):
+        return value
+    return ((value,),)
+
+
+def sheet_file(name):
+    # Caractères permis dans un nom de feuille mais pas dans un nom de fichier
+    return re.sub(r'[<>"|]', '_', name) + '.formulas.txt'
+
+
+def escape(text):
+    # Formules sur plusieurs lignes (Alt+Entrée) : une ligne par cellule dans l'export
+    return str(text).replace('\r\n', '\n').replace('\n', '\\n').replace('\t', '\\t')
+
+
+class DirtyRanges:
+    """Zones modifiées par feuille, alimentées par les gestionnaires
+    d'événements Excel et consommées à chaque passe par SheetsReader"""
+
+    def __init__(self, max_areas=64):
+        self.max_areas = max_areas
+        # feuille -> adresses modifiées, None pour toute la feuille
+        self.areas = {}
+        self.meta = set()
+        self.names = False
+        # Tout le classeur à relire (enregistrement)
+        self.full = False
+        # Vrai une fois les événements Excel branchés
+        self.connected = False
+        self._lock = threading.Lock()
+
+    def add(self, sheet, address):
+        with self._lock:
+            if sheet in self.areas and self.areas[sheet] is None:
+                return
+            addresses = self.areas.setdefault(sheet, [])
+            addresses.extend(address.split(','))
+            if len(addresses) > self.max_areas:
+                # Trop de zones éparses : une relecture complète coûte moins cher
+                self.areas[sheet] = None
+
+    def add_meta(self, sheet=None):
+        """Tableaux et validations d'une feuille à relire ; None : tout le
+        classeur, cellules et noms compris"""
+        with self._lock:
+            if sheet is None:
+                self.names = True
+                self.full = True
+                self.meta.add(None)
+            else:
+                self.meta.add(sheet)
+
+    def take(self):
+        with self._lock:
+            taken = (self.areas, self.meta, self.names, self.full)
+            self.areas, self.meta, self.names, self.full = {}, set(), False, False
+            return taken
+
+    def restore(self, taken):
+        """Passe échouée : les zones prises seront relues à la suivante"""
+        areas, meta, names, full = taken
+        for sheet, addresses in areas.items():
+            if addresses is None:
+                with self._lock:
+                    self.areas[sheet] = None
+            else:
+                self.add(sheet, ','.join(addresses))
+        with self._lock:
+            self.meta |= meta
+            self.names = self.names or names
+            self.full = self.full or full
+
+
+class SheetsReader:
+    def __init__(self, dirty=None, full_interval=60.0, connected_interval=600.0, clock=time.monotonic):
+        """full_interval : sans événements Excel, relecture complète au plus
+        toutes les full_interval secondes ; connected_interval : de même avec
+        les événements, pour ce qu'ils ne signalent pas"""
+        self.dirty = dirty or DirtyRanges()
+        self.full_interval = full_interval
+        self.connected_interval = connected_interval
+        self.clock = clock
+        # feuille -> {ligne: {colonne: formule}}
+        self.cells = {}
+        # feuille -> {ligne: texte de la ligne} : seules les lignes touchées sont refaites
+        self.lines = {}
+        self.tables = {}
+        self.validations = {}
+        self.names = []
+        self.texts = {}
+        # fichier -> (texte, empreinte) : seuls les textes régénérés sont rehachés
+        self.digests = {}
+        self.last_full = None
+        self.range_reads = 0
+        self.cells_read = 0
+
+    def read_range(self, ws, bounds):
+        """Une lecture Range.Formula en bloc ; {ligne: {colonne: formule}} des seules formules"""
+        r1, c1, r2, c2 = bounds
+        with METRICS.timer('com.Range.Formula') as timer:
+            rows = as_rows(ws.Range(area_address(r1, c1, r2, c2)).Formula)
+        self.range_reads += 1
+        found = {}
+        for i, row in enumerate(rows):
+            for j, formula in enumerate(row):
+                if isinstance(formula, str) and formula.startswith('='):
+                    found.setdefault(r1 + i, {})[c1 + j] = formula
+                    timer.bytes += len(formula)
+        self.cells_read += (r2 - r1 + 1) * (c2 - c1 + 1)
+        return found
+
+    def used_bounds(self, ws):
+        try:
+            return parse_area(ws.UsedRange.Address)
+        except ValueError:
+            return None
+
+    def full_read(self, name, ws):
+        bounds = self.used_bounds(ws)
+        self.cells[name] = self.read_range(ws, bounds) if bounds else {}
+        self.lines[name] = {}
+        self.read_meta(name, ws, reread=False)
+        self.texts.pop(name, None)
+
+    def read_area(self, name, ws, bounds, guard=False):
+        """Relit une zone dans le cache ; guard : lit aussi la ligne sous la
+        zone et la colonne à sa droite, et retourne True (cache non modifié)
+        si elles ne correspondent plus au cache : cellules décalées"""
+        if (bounds[2] - bounds[0] + 1) * (bounds[3] - bounds[1] + 1) > CLIP_CELLS:
+            used = self.used_bounds(ws)
+            if used is None:
+                return False
+            bounds = (max(bounds[0], used[0]), max(bounds[1], used[1]),
+                      min(bounds[2], used[2]), min(bounds[3], used[3]))
+            if bounds[0] > bounds[2] or bounds[1] > bounds[3]:
+                return False
+        cells = self.cells[name]
+        lines = self.lines[name]
+        r1, c1, r2, c2 = bounds
+        if guard:
+            extended = (r1, c1, min(r2 + 1, MAX_ROWS), min(c2 + 1, MAX_COLUMNS))
+            found = self.read_range(ws, extended)
+            for row in range(r1, extended[2] + 1):
+                for col in range(c1, extended[3] + 1):
+                    if row > r2 or col > c2:
+                        if found.get(row, {}).get(col) != cells.get(row, {}).get(col):
+                            return True
+        else:
+            found = self.read_range(ws, bounds)
+        for row in range(r1, r2 + 1):
+            current = cells.get(row)
+            if current is None and row not in found:
+                continue
+            current = {col: formula for col, formula in (current or {}).items() if not c1 <= col <= c2}
+            current.update(found.get(row, {}))
+            if current:
+                cells[row] = current
+            else:
+                cells.pop(row, None)
+            lines.pop(row, None)
+        self.texts.pop(name, None)
+        return False
+
+    def read_meta(self, name, ws, reread=True):
+        """Tableaux et validations d'une feuille ; reread : relit aussi les
+        plages des tableaux (un rafraîchissement de requête ne déclenche pas SheetChange)"""
+        tables = []
+        for table in ws.ListObjects:
+            address = table.Range.Address
+            try:
+                headers = '|'.join(str(header) for header in as_rows(table.HeaderRowRange.Value)[0])
+            except Exception:
+                headers = ''
+            tables.append(f"{name}\t{table.Name}\t{address}\t{headers}")
+            if reread:
+                try:
+                    self.read_area(name, ws, parse_area(address))
+                except ValueError:
+                    pass
+        self.tables[name] = sorted(tables)
+
+        validations = []
+        try:
+            areas = ws.Cells.SpecialCells(XL_CELL_TYPE_ALL_VALIDATION).Areas
+        except Exception:
+            # Aucune cellule avec validation
+            areas = []
+        for area in areas:
+            address = area.Address
+            try:
+                validation = area.Validation
+                parts = [str(validation.Type)]
+                for attribute in ('Operator', 'Formula1', 'Formula2'):
+                    try:
+                        parts.append(escape(getattr(validation, attribute)))
+                    except Exception:
+                        parts.append('')
+            except Exception:
+                # Plusieurs règles dans une même zone contiguë
+                parts = ['mixte']
+            validations.append(f"{name}!{address}\t" + '\t'.join(parts).rstrip('\t'))
+        self.validations[name] = sorted(validations)
+
+    def read_names(self, wb):
+        names = []
+        for defined in wb.Names:
+            names.append(f"{defined.Name}\t{escape(defined.RefersTo)}")
+        self.names = sorted(names)
+
+    def update(self, wb):
+        """Relit ce que les événements ont signalé ; retourne l'instantané des exports"""
+        taken = self.dirty.take()
+        try:
+            self._update(wb, *taken)
+        except Exception:
+            self.dirty.restore(taken)
+            raise
+        return self.snapshot()
+
+    def _update(self, wb, areas, meta, names, full):
+        sheets = {ws.Name: ws for ws in wb.Worksheets}
+        vanished = [name for name in self.cells if name not in sheets]
+        for name in vanished:
+            for store in (self.cells, self.lines, self.tables, self.validations, self.texts):
+                store.pop(name, None)
+        now = self.clock()
+        interval = self.connected_interval if self.dirty.connected else self.full_interval
+        if vanished and self.last_full is not None:
+            logging.info(f"Feuille renommée ou supprimée ({', '.join(vanished)}) - relecture complète")
+            full = True
+        full = full or self.last_full is None or now - self.last_full >= interval
+        if not full:
+            full = self.read_changes(sheets, areas, meta)
+        if full:
+            self.last_full = now
+            for name, ws in sheets.items():
+                self.full_read(name, ws)
+        if full or names:
+            self.read_names(wb)
+
+    def read_changes(self, sheets, areas, meta):
+        """Relit les zones signalées ; True si tout le classeur est à relire"""
+        for name, ws in sheets.items():
+            if name not in self.cells:
+                self.full_read(name, ws)
+                continue
+            addresses = areas.get(name, [])
+            if addresses is None:
+                self.full_read(name, ws)
+                continue
+            try:
+                bounds = [parse_area(address) for address in addresses]
+            except ValueError as e:
+                logging.info(f"{e} - relecture complète de {name}")
+                self.full_read(name, ws)
+                continue
+            if any(whole_lines(area) for area in bounds):
+                logging.info(f"Lignes ou colonnes insérées ou supprimées dans {name} - relecture complète")
+                return True
+            for area in bounds:
+                if self.read_area(name, ws, area, guard=True):
+                    logging.info(f"Cellules décalées dans {name} - relecture complète")
+                    return True
+            if name in meta or None in meta:
+                self.read_meta(name, ws)
+        return False
+
+    def sheet_text(self, name):
+        if name not in self.texts:
+            cells = self.cells[name]
+            lines = self.lines[name]
+            for row in cells:
+                if row not in lines:
+                    lines[row] = ''.join(f"{column_letter(col)}{row}\t{escape(cells[row][col])}\n"
+                                         for col in sorted(cells[row]))
+            self.texts[name] = ''.join(lines[row] for row in sorted(cells))
+        return self.texts[name]
+
+    def snapshot(self):
+        """{fichier: {'hash', 'text'}} : une feuille par fichier, puis noms, tableaux, validations"""
+        files = {sheet_file(name): self.sheet_text(name) for name in self.cells}
+        files[NAMES_FILE] = ''.join(f"{line}\n" for line in self.names)
+        files[TABLES_FILE] = ''.join(f"{line}\n" for name in sorted(self.tables) for line in self.tables[name])
+        files[VALIDATION_FILE] = ''.join(f"{line}\n" for name in sorted(self.validations)
+                                         for line in self.validations[name])
+        snapshot = {}
+        for rel, text in files.items():
+            cached = self.digests.get(rel)
+            if cached is None or cached[0] is not text:
+                cached = self.digests[rel] = (text, content_digest(text))
+            snapshot[rel] = {'hash': cached[1], 'text': text}
+        for rel in [rel for rel in self.digests if rel not in files]:
+            del self.digests[rel]
+        return snapshot
@@ -0,0 +1,93 @@
+import os
+import sys
+import logging
+import pythoncom
+import win32com.client
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+from import_queue import DebouncedImportQueue
+from origin_index import OriginIndex
+from vba_importer import SUPPORTED_EXTENSIONS, VBAPatcher
+from vba_monitor import ExcelVBAMonitor
+
+# Synchronisation bidirectionnelle dans un seul processus : le moniteur VBA
+# exporte vers macros_export/ pendant qu'une surveillance du même dossier
+# réimporte les fichiers édités. Les deux sens partagent un index d'origine
+# pour ne jamais réappliquer leurs propres écritures.
+
+
+class BidirectionalSync:
+    def __init__(self, excel_path, watch_folder=None):
+        self.origins = OriginIndex()
+        self.exporter = ExcelVBAMonitor(excel_path, origins=self.origins)
+        self.watch_folder = os.path.abspath(watch_folder or self.exporter.export_path)
+        self.wb = None
+        self.patcher = VBAPatcher(self.origins)
+        self.queue = DebouncedImportQueue(
+            self.import_batch,
+            thread_init=self.attach_workbook,
+            thread_exit=pythoncom.CoUninitialize,
+            origins=self.origins
+        )
+
+    def attach_workbook(self):
+        """Rattache le thread d'import au classeur ouvert par le moniteur VBA"""
+        pythoncom.CoInitialize()
+        self.exporter.opened.wait()
+        # GetObject sur le chemin retrouve le classeur déjà ouvert (ROT)
+        self.wb = win32com.client.GetObject(self.exporter.excel_path)
+        logging.info("Thread d'import rattaché au classeur")
+
+    def import_batch(self, file_paths):
+        """Importe les fichiers prêts, sans scan VBA concurrent"""
+        with self.origins.apply_lock:
+            return [path for path in file_paths if self.patcher.apply(self.wb, path)]
+
+    def run(self):
+        watched_files = [
+            os.path.join(self.watch_folder, file) for file in os.listdir(self.watch_folder)
+            if file.lower().endswith(SUPPORTED_EXTENSIONS)
+        ]
+        self.queue.prime(watched_files)
+        self.patcher.prime(watched_files)
+        self.queue.start()
+
+        observer = Observer()
+        observer.schedule(SyncFileHandler(self.queue), self.watch_folder, recursive=False)
+        observer.start()
+        logging.info(f"Synchronisation bidirectionnelle: {self.exporter.excel_path} <-> {self.watch_folder}")
+        try:
+            self.exporter.monitor()
+        finally:
+            observer.stop()
+            observer.join()
+            self.queue.stop()
+
+
+class SyncFileHandler(FileSystemEventHandler):
+    def __init__(self, queue):
+        self.queue = queue
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.submit(event.src_path)
+
+    def on_created(self, event):
+        self.on_modified(event)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.submit(event.dest_path)
+
+    def submit(self, file_path):
+        if file_path.lower().endswith(SUPPORTED_EXTENSIONS):
+            self.queue.submit(file_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python sync.py chemin_vers_fichier.xlsm [dossier_surveillance]")
+        sys.exit(1)
+
+    sync = BidirectionalSync(sys.argv[1], sys.argv[2] if len(sys.argv) == 3 else None)
+    sync.run()
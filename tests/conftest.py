@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# Les modules du dépôt sont à la racine, le faux modèle objet Excel à côté des tests
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.dirname(os.path.abspath(__file__))):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import fake_excel  # noqa: E402
+
+# win32com/pythoncom factices quand pywin32 est absent (Linux, CI)
+fake_excel.install()
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Journaux des moniteurs (chemins relatifs) dans un dossier temporaire"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,853 @@
+import io
+import os
+import re
+import sys
+import importlib.util
+import time
+import types
+import base64
+import struct
+import zipfile
+
+from cell_address import MAX_COLUMNS, MAX_ROWS, column_letter, parse_area
+
+# Faux modèle objet Excel/VBE pour exécuter les moniteurs sans Excel (Linux, CI,
+# benchmarks). Chaque accès à un membre public (nom en majuscule, comme les
+# propriétés et méthodes COM) compte pour un aller-retour COM, avec une
+# latence configurable (ComCallCounter(latency=...)) pour simuler Excel, et
+# des pannes injectables (ComCallCounter.fail) pour les tests de reprise.
+
+# Erreurs injectées, avec le nom du HRESULT comme les com_error relayées
+BUSY_ERROR = "Appel rejeté par l'appelé (RPC_E_CALL_REJECTED)"
+UNAVAILABLE_ERROR = "Le serveur RPC n'est pas disponible (RPC_S_SERVER_UNAVAILABLE)"
+
+PROCEDURE_HEADER = re.compile(
+    r'^\s*(?:(?:Public|Private|Friend|Static)\s+)*(?:Sub|Function|Property\s+(?:Get|Let|Set))\s+(\w+)',
+    re.IGNORECASE)
+
+
+def _procedure_header(line):
+    match = PROCEDURE_HEADER.match(line)
+    return match.group(1) if match else None
+
+
+class ComCallCounter:
+    def __init__(self, latency=0.0):
+        """latency : durée simulée d'un aller-retour COM, en secondes"""
+        self.calls = 0
+        self.by_member = {}
+        self.chars = 0
+        self.latency = latency
+        self.fault = None
+        self.failed = 0
+        # Appelé à chaque modification du projet VBA (FakeApplication.after_edit)
+        self.on_edit = None
+
+    def fail(self, message=BUSY_ERROR, seconds=1.0):
+        """Tous les appels lèvent message pendant seconds secondes"""
+        self.fault = (message, time.monotonic() + seconds)
+
+    def hit(self, member):
+        self.calls += 1
+        self.by_member[member] = self.by_member.get(member, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fault:
+            message, until = self.fault
+            if time.monotonic() < until:
+                self.failed += 1
+                raise Exception(message)
+            self.fault = None
+
+    def edited(self):
+        if self.on_edit:
+            self.on_edit()
+
+    def reset(self):
+        self.calls = 0
+        self.by_member = {}
+        self.chars = 0
+
+
+class FakeComObject:
+    def __init__(self, counter):
+        object.__setattr__(self, '_counter', counter)
+
+    def __getattribute__(self, name):
+        if name[:1].isupper():
+            object.__getattribute__(self, '_counter').hit(f"{type(self).__name__}.{name}")
+        return object.__getattribute__(self, name)
+
+
+class FakeCodeModule(FakeComObject):
+    def __init__(self, counter, code=''):
+        super().__init__(counter)
+        self._lines = code.split('\r\n') if code else []
+
+    @property
+    def CountOfLines(self):
+        return len(self._lines)
+
+    @property
+    def CountOfDeclarationLines(self):
+        for index, line in enumerate(self._lines):
+            if _procedure_header(line):
+                return index
+        return len(self._lines)
+
+    def Lines(self, start, count):
+        text = '\r\n'.join(self._lines[start - 1:start - 1 + count])
+        self._counter.chars += len(text)
+        return text
+
+    def ProcOfLine(self, line, kind=0):
+        for index in range(min(line, len(self._lines)) - 1, -1, -1):
+            name = _procedure_header(self._lines[index])
+            if name:
+                return name
+        return ''
+
+    def ReplaceLine(self, line, code):
+        self._lines[line - 1] = code
+        self._counter.edited()
+
+    def DeleteLines(self, start, count=1):
+        del self._lines[start - 1:start - 1 + count]
+        self._counter.edited()
+
+    def InsertLines(self, line, code):
+        self._counter.chars += len(code)
+        self._lines[line - 1:line - 1] = code.split('\r\n')
+        self._counter.edited()
+
+    def text(self):
+        return '\r\n'.join(self._lines)
+
+    def set_text(self, code):
+        self._lines = code.split('\r\n') if code else []
+
+
+class FakeVBComponent(FakeComObject):
+    def __init__(self, counter, name, comp_type=1, code=''):
+        super().__init__(counter)
+        self.Name = name
+        self.Type = comp_type
+        self.CodeModule = FakeCodeModule(counter, code)
+
+    def Export(self, path):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(f'Attribute VB_Name = "{object.__getattribute__(self, "Name")}"\r\n')
+            f.write(object.__getattribute__(self, 'CodeModule').text())
+
+
+class FakeVBComponents(FakeComObject):
+    def __init__(self, counter):
+        super().__init__(counter)
+        self._items = {}
+
+    def __iter__(self):
+        object.__getattribute__(self, '_counter').hit('FakeVBComponents._NewEnum')
+        return iter(list(self._items.values()))
+
+    def __call__(self, name):
+        object.__getattribute__(self, '_counter').hit('FakeVBComponents.Item')
+        try:
+            return self._items[name]
+        except KeyError:
+            raise Exception(f"Composant introuvable: {name}")
+
+    @property
+    def Count(self):
+        return len(self._items)
+
+    def Remove(self, component):
+        del self._items[object.__getattribute__(component, 'Name')]
+        self._counter.edited()
+
+    def Import(self, path):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            lines = f.read().split('\r\n')
+        if not any(line.startswith('Attribute VB_Name = ') for line in lines):
+            raise Exception(f"Fichier non valide pour l'import: {path}")
+        self._counter.edited()
+        name = os.path.splitext(os.path.basename(path))[0]
+        for line in lines:
+            if line.startswith('Attribute VB_Name = '):
+                name = line.split('"')[1]
+        code = '\r\n'.join(line for line in lines if not line.startswith('Attribute '))
+        comp_type = {'.cls': 2, '.frm': 3}.get(os.path.splitext(path)[1].lower(), 1)
+        return self.add(name, comp_type, code)
+
+    def add(self, name, comp_type=1, code=''):
+        component = FakeVBComponent(object.__getattribute__(self, '_counter'), name, comp_type, code)
+        self._items[name] = component
+        return component
+
+
+class FakeVBProject(FakeComObject):
+    def __init__(self, counter):
+        super().__init__(counter)
+        self.VBComponents = FakeVBComponents(counter)
+
+
+class FakeQuery(FakeComObject):
+    def __init__(self, counter, name, formula, queries=None):
+        super().__init__(counter)
+        object.__setattr__(self, '_queries', queries)
+        object.__setattr__(self, 'Name', name)
+        object.__setattr__(self, 'Formula', formula)
+
+    def __setattr__(self, name, value):
+        if name == 'Formula':
+            # Dans Excel, réécrire la formule invalide le cache de la requête
+            object.__getattribute__(self, '_counter').hit('FakeQuery.Formula=')
+        object.__setattr__(self, name, value)
+
+    def Delete(self):
+        object.__getattribute__(self, '_queries').remove(object.__getattribute__(self, 'Name'))
+
+
+class FakeQueries(FakeComObject):
+    def __init__(self, counter):
+        super().__init__(counter)
+        self._items = {}
+
+    def __iter__(self):
+        object.__getattribute__(self, '_counter').hit('FakeQueries._NewEnum')
+        return iter(list(self._items.values()))
+
+    @property
+    def Count(self):
+        return len(self._items)
+
+    def __call__(self, name):
+        object.__getattribute__(self, '_counter').hit('FakeQueries.Item')
+        try:
+            return self._items[name]
+        except KeyError:
+            raise Exception(f"Requête introuvable: {name}")
+
+    def Add(self, Name, Formula, Description=''):
+        return self.add(Name, Formula)
+
+    def add(self, name, formula):
+        self._items[name] = FakeQuery(object.__getattribute__(self, '_counter'), name, formula, self)
+        return self._items[name]
+
+    def remove(self, name):
+        del self._items[name]
+
+
+class FakeOLEDBConnection(FakeComObject):
+    def __init__(self, counter):
+        super().__init__(counter)
+        self.BackgroundQuery = False
+        self._until = 0.0
+
+    @property
+    def Refreshing(self):
+        return time.monotonic() < self._until
+
+
+class FakeConnection(FakeComObject):
+    """Connexion « Query - Nom » d'une requête ; Refresh dure duration secondes,
+    en arrière-plan si OLEDBConnection.BackgroundQuery"""
+
+    def __init__(self, counter, name, duration=0.0):
+        super().__init__(counter)
+        self.Name = name
+        self.OLEDBConnection = FakeOLEDBConnection(counter)
+        self._duration = duration
+
+    def Refresh(self):
+        connection = object.__getattribute__(self, 'OLEDBConnection')
+        duration = object.__getattribute__(self, '_duration')
+        if object.__getattribute__(connection, 'BackgroundQuery'):
+            connection._until = time.monotonic() + duration
+        else:
+            time.sleep(duration)
+
+
+class FakeRange(FakeComObject):
+    """Plage rectangulaire d'une FakeWorksheet ; Formula et Value se lisent et
+    s'écrivent en bloc (une valeur seule pour une cellule, des lignes sinon)"""
+
+    def __init__(self, counter, ws, bounds, areas=None):
+        super().__init__(counter)
+        self._ws = ws
+        self._bounds = bounds
+        self._areas = areas
+
+    def _block(self, convert):
+        r1, c1, r2, c2 = self._bounds
+        cells = self._ws._cells
+        rows = tuple(tuple(convert(cells.get((row, col), '')) for col in range(c1, c2 + 1))
+                     for row in range(r1, r2 + 1))
+        self._counter.chars += sum(len(str(value)) for row in rows for value in row)
+        return rows[0][0] if (r1, c1) == (r2, c2) else rows
+
+    @property
+    def Formula(self):
+        # Comme Excel : les constantes sont lues en texte
+        return self._block(str)
+
+    @Formula.setter
+    def Formula(self, value):
+        self._counter.hit('FakeRange.Formula=')
+        r1, c1, r2, c2 = self._bounds
+        rows = value if isinstance(value, (tuple, list)) else [[value] * (c2 - c1 + 1)] * (r2 - r1 + 1)
+        for i, row in enumerate(rows):
+            for j, cell in enumerate(row):
+                self._ws.set(r1 + i, c1 + j, cell)
+
+    @property
+    def Value(self):
+        return self._block(lambda value: value)
+
+    @Value.setter
+    def Value(self, value):
+        self._counter.hit('FakeRange.Value=')
+        r1, c1, r2, c2 = self._bounds
+        rows = value if isinstance(value, (tuple, list)) else [[value] * (c2 - c1 + 1)] * (r2 - r1 + 1)
+        for i, row in enumerate(rows):
+            for j, cell in enumerate(row):
+                self._ws.set(r1 + i, c1 + j, cell)
+
+    @property
+    def Address(self):
+        r1, c1, r2, c2 = self._bounds
+        first = f"${column_letter(c1)}${r1}"
+        return first if (r1, c1) == (r2, c2) else f"{first}:${column_letter(c2)}${r2}"
+
+    @property
+    def Areas(self):
+        return self._areas if self._areas is not None else [self]
+
+    @property
+    def Validation(self):
+        for bounds, rule in self._ws._validations:
+            if bounds == self._bounds:
+                return FakeValidation(self._counter, *rule)
+        raise Exception("Validation non uniforme sur la plage")
+
+    def SpecialCells(self, cell_type):
+        ws = self._ws
+        if not ws._validations:
+            raise Exception("Aucune cellule correspondante n'a été trouvée")
+        areas = [FakeRange(self._counter, ws, bounds) for bounds, rule in ws._validations]
+        return FakeRange(self._counter, ws, self._bounds, areas)
+
+
+class FakeValidation(FakeComObject):
+    def __init__(self, counter, validation_type, operator, formula1, formula2=''):
+        super().__init__(counter)
+        self.Type = validation_type
+        self.Operator = operator
+        self.Formula1 = formula1
+        self.Formula2 = formula2
+
+
+class FakeListObject(FakeComObject):
+    def __init__(self, counter, ws, name, bounds):
+        super().__init__(counter)
+        self.Name = name
+        self.Range = FakeRange(counter, ws, bounds)
+        self.HeaderRowRange = FakeRange(counter, ws, (bounds[0], bounds[1], bounds[0], bounds[3]))
+
+
+class FakeWorksheet(FakeComObject):
+    def __init__(self, counter, name, parent=None):
+        super().__init__(counter)
+        self.Name = name
+        self.Parent = parent
+        self.ListObjects = []
+        # (ligne, colonne) -> formule ou constante
+        self._cells = {}
+        self._validations = []
+
+    def Range(self, address):
+        return FakeRange(self._counter, self, parse_area(address))
+
+    @property
+    def Cells(self):
+        return FakeRange(self._counter, self, (1, 1, MAX_ROWS, MAX_COLUMNS))
+
+    @property
+    def UsedRange(self):
+        if not self._cells:
+            return FakeRange(self._counter, self, (1, 1, 1, 1))
+        rows = [row for row, col in self._cells]
+        cols = [col for row, col in self._cells]
+        return FakeRange(self._counter, self, (min(rows), min(cols), max(rows), max(cols)))
+
+    def Calculate(self):
+        pass
+
+    def set(self, row, col, value):
+        """Écrit une cellule sans compter d'appel COM ('' : cellule vidée)"""
+        if value == '' or value is None:
+            self._cells.pop((row, col), None)
+        else:
+            self._cells[(row, col)] = value
+
+    def add_table(self, name, address):
+        table = FakeListObject(self._counter, self, name, parse_area(address))
+        self.ListObjects.append(table)
+        return table
+
+    def add_validation(self, address, validation_type, operator, formula1, formula2=''):
+        self._validations.append((parse_area(address), (validation_type, operator, formula1, formula2)))
+
+
+class FakeWorksheets(FakeComObject):
+    def __init__(self, counter, parent=None):
+        super().__init__(counter)
+        self._items = {}
+        self._parent = parent
+
+    def __iter__(self):
+        object.__getattribute__(self, '_counter').hit('FakeWorksheets._NewEnum')
+        return iter(list(self._items.values()))
+
+    @property
+    def Count(self):
+        return len(self._items)
+
+    def __call__(self, name):
+        object.__getattribute__(self, '_counter').hit('FakeWorksheets.Item')
+        items = list(self._items.values())
+        if isinstance(name, int) and 1 <= name <= len(items):
+            return items[name - 1]
+        try:
+            return self._items[name]
+        except KeyError:
+            raise Exception(f"Feuille introuvable: {name}")
+
+    def add(self, name):
+        self._items[name] = FakeWorksheet(object.__getattribute__(self, '_counter'), name, self._parent)
+        return self._items[name]
+
+    def remove(self, name):
+        del self._items[name]
+
+
+class FakeName(FakeComObject):
+    def __init__(self, counter, name, refers_to):
+        super().__init__(counter)
+        self.Name = name
+        self.RefersTo = refers_to
+
+
+class FakeWorkbook(FakeComObject):
+    def __init__(self, counter, full_name):
+        super().__init__(counter)
+        self.FullName = os.path.abspath(full_name)
+        self.Name = os.path.basename(full_name)
+        self.VBProject = FakeVBProject(counter)
+        self.Queries = FakeQueries(counter)
+        self.Connections = []
+        self.Worksheets = FakeWorksheets(counter, self)
+        self.Names = []
+        self.Saved = True
+        object.__setattr__(self, 'closed', False)
+
+    def __getattribute__(self, name):
+        if name[:1].isupper() and object.__getattribute__(self, 'closed'):
+            # Comme un classeur fermé par l'utilisateur : l'objet COM est mort
+            raise Exception("Classeur fermé (RPC_E_DISCONNECTED)")
+        return super().__getattribute__(name)
+
+    def Save(self):
+        self.Saved = True
+
+    def QueryInterface(self, iid):
+        return self
+
+    def Close(self, SaveChanges=False):
+        object.__setattr__(self, 'closed', True)
+
+
+class FakeWorkbooks(FakeComObject):
+    """Workbooks d'une FakeApplication ; Open retrouve les classeurs enregistrés
+    par FakeApplication.register (sinon classeur vide)"""
+
+    def __init__(self, counter, application=None):
+        super().__init__(counter)
+        self._application = application
+        self._known = {}
+        self._open = {}
+
+    def __iter__(self):
+        object.__getattribute__(self, '_counter').hit('FakeWorkbooks._NewEnum')
+        return iter([wb for wb in self._open.values() if not object.__getattribute__(wb, 'closed')])
+
+    def __call__(self, name):
+        object.__getattribute__(self, '_counter').hit('FakeWorkbooks.Item')
+        for wb in self._open.values():
+            if object.__getattribute__(wb, 'Name').lower() == name.lower():
+                return wb
+        raise Exception(f"Classeur introuvable: {name}")
+
+    @property
+    def Count(self):
+        return len(list(self.__iter__()))
+
+    def Open(self, path):
+        key = os.path.normcase(os.path.abspath(path))
+        wb = self._known.get(key) or FakeWorkbook(object.__getattribute__(self, '_counter'), path)
+        object.__setattr__(wb, 'closed', False)
+        wb.Application = self._application
+        self._open[key] = wb
+        return wb
+
+
+class FakeApplication(FakeComObject):
+    def __init__(self, counter=None, recalc_latency=0.0, repaint_latency=0.0, events_latency=0.0):
+        """*_latency : coût simulé, après chaque modification du projet VBA, du
+        recalcul automatique, du rafraîchissement d'écran et des événements"""
+        counter = counter or ComCallCounter()
+        super().__init__(counter)
+        self.Workbooks = FakeWorkbooks(counter, self)
+        self.Visible = False
+        self.DisplayAlerts = True
+        self.ScreenUpdating = True
+        self.EnableEvents = True
+        self.Calculation = -4105
+        self.quit = False
+        self.latencies = (recalc_latency, repaint_latency, events_latency)
+        self.recalcs = 0
+        counter.on_edit = self.after_edit
+
+    def after_edit(self):
+        recalc, repaint, events = object.__getattribute__(self, 'latencies')
+        delay = 0.0
+        if object.__getattribute__(self, 'Calculation') == -4105:
+            object.__setattr__(self, 'recalcs', object.__getattribute__(self, 'recalcs') + 1)
+            delay += recalc
+        if object.__getattribute__(self, 'ScreenUpdating'):
+            delay += repaint
+        if object.__getattribute__(self, 'EnableEvents'):
+            delay += events
+        if delay:
+            time.sleep(delay)
+
+    def register(self, wb):
+        """Rend un classeur synthétique ouvrable par Workbooks.Open(son chemin)"""
+        workbooks = object.__getattribute__(self, 'Workbooks')
+        workbooks._known[os.path.normcase(object.__getattribute__(wb, 'FullName'))] = wb
+        return wb
+
+    def Quit(self):
+        object.__setattr__(self, 'quit', True)
+
+
+class FakeMoniker:
+    def __init__(self, wb):
+        self.wb = wb
+
+    def GetDisplayName(self, context, to_left):
+        return object.__getattribute__(self.wb, 'FullName')
+
+
+class FakeRunningObjectTable:
+    """ROT factice : les classeurs ouverts de l'application installée"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __iter__(self):
+        application = self.client.application
+        if application is None:
+            return iter([])
+        return iter([FakeMoniker(wb) for wb in application.Workbooks])
+
+    def GetObject(self, moniker):
+        return moniker.wb
+
+
+class FakeEventSource:
+    """Source d'événements factice : appelle directement les méthodes On* d'un
+    gestionnaire, comme le ferait win32com.client.WithEvents"""
+
+    def __init__(self, handler_class, **attributes):
+        self.handler = handler_class()
+        for name, value in attributes.items():
+            setattr(self.handler, name, value)
+
+    def fire(self, event, *args):
+        getattr(self.handler, f"On{event}")(*args)
+
+
+def build_workbook(path, modules=10, lines_per_module=200, counter=None, queries=0):
+    """Classeur synthétique avec des modules standards de taille donnée"""
+    counter = counter or ComCallCounter()
+    wb = FakeWorkbook(counter, path)
+    components = wb.VBProject.VBComponents
+    components.add('ThisWorkbook', 100, '')
+    for index in range(modules):
+        components.add(f"Module{index + 1}", 1, synthetic_module(index, lines_per_module))
+    for index in range(queries):
+        wb.Queries.add(f"Requête{index + 1}", synthetic_query(index))
+    counter.reset()
+    return wb, counter
+
+
+def synthetic_module(index, lines):
+    body = ['Option Explicit', '']
+    procedure = 0
+    while len(body) < lines:
+        body.append(f"Public Sub Proc{index}_{procedure}()")
+        body.extend(f"    Debug.Print {procedure} + {n}" for n in range(8))
+        body.append("End Sub")
+        procedure += 1
+    return '\r\n'.join(body[:lines])
+
+
+def synthetic_query(index):
+    return (f'let\r\n    Source = Csv.Document(File.Contents("C:\\data\\table{index}.csv")),\r\n'
+            f'    Typed = Table.TransformColumnTypes(Source, {{{{"Montant", type number}}}})\r\nin\r\n    Typed')
+
+
+def ovba_compress(data):
+    """CompressedContainer MS-OVBA (section 2.4.1.3) : recherche gloutonne de
+    la plus longue copie, bloc non compressé si la compression n'y gagne rien"""
+    out = bytearray(b'\x01')
+    for chunk_start in range(0, len(data), 4096):
+        chunk = data[chunk_start:chunk_start + 4096]
+        body = bytearray()
+        positions = {}
+        pos = 0
+        while pos < len(chunk):
+            flags_at = len(body)
+            body.append(0)
+            for bit in range(8):
+                if pos >= len(chunk):
+                    break
+                bit_count = max((pos - 1).bit_length(), 4)
+                max_length = (0xFFFF >> bit_count) + 3
+                best_length = best_offset = 0
+                for candidate in reversed(positions.get(chunk[pos:pos + 3], [])[-8:]):
+                    length = 0
+                    while length < max_length and pos + length < len(chunk) \
+                            and chunk[candidate + length] == chunk[pos + length]:
+                        length += 1
+                    if length > best_length:
+                        best_length, best_offset = length, pos - candidate
+                step = best_length if best_length >= 3 else 1
+                if step > 1:
+                    body[flags_at] |= 1 << bit
+                    body += struct.pack('<H', ((best_offset - 1) << (16 - bit_count)) | (best_length - 3))
+                else:
+                    body.append(chunk[pos])
+                for index in range(pos, pos + step):
+                    positions.setdefault(chunk[index:index + 3], []).append(index)
+                pos += step
+        if len(body) > 4096 and len(chunk) == 4096:
+            out += struct.pack('<H', 0x3FFF) + chunk
+        else:
+            out += struct.pack('<H', 0xB000 | (len(body) - 1)) + body
+    return bytes(out)
+
+
+def vba_project_bin(components, codepage=1252):
+    """vbaProject.bin (MS-CFB) lisible par vba_extractor : flux PROJECT, VBA/dir
+    et un flux compressé par composant {nom: {'type', 'code'}}"""
+    encoding = f'cp{codepage}'
+    kinds = {1: 'Module', 2: 'Class', 3: 'BaseClass', 100: 'Document'}
+    project = ['ID="{00000000-0000-0000-0000-000000000000}"']
+    project += [f"{kinds[data['type']]}={name}" + ('/&H00000000' if data['type'] == 100 else '')
+                for name, data in components.items()]
+
+    def record(record_id, value):
+        return struct.pack('<HI', record_id, len(value)) + value
+
+    directory = record(0x0001, struct.pack('<I', 3)) + record(0x0003, struct.pack('<H', codepage))
+    streams = {}
+    for name, data in components.items():
+        encoded = name.encode(encoding)
+        directory += (record(0x0019, encoded) + record(0x0047, name.encode('utf-16-le'))
+                      + record(0x001A, encoded) + record(0x0032, name.encode('utf-16-le'))
+                      + record(0x0031, struct.pack('<I', 64))
+                      + record(0x0021 if data['type'] == 1 else 0x0022, b'') + record(0x002B, b''))
+        # 64 octets de cache de performance avant le source compressé
+        source = f'Attribute VB_Name = "{name}"\r\n' + data['code']
+        streams[f"VBA/{name}"] = bytes(64) + ovba_compress(source.encode(encoding))
+    directory += record(0x0010, b'')
+    streams['VBA/dir'] = ovba_compress(directory)
+    streams['PROJECT'] = ('\r\n'.join(project) + '\r\n').encode(encoding)
+    return compound_file(streams)
+
+
+def compound_file(streams):
+    """Fichier composé OLE v3 (secteurs de 512 octets) : {'stockage/flux': octets}.
+    Flux de moins de 4096 octets dans le mini-flux, frères chaînés à droite"""
+    entries = [['Root Entry', 5, None, b'']]
+    storages = {'': 0}
+    for path, data in streams.items():
+        parent = ''
+        for part in path.split('/')[:-1]:
+            key = f"{parent}/{part}" if parent else part
+            if key not in storages:
+                storages[key] = len(entries)
+                entries.append([part, 1, storages[parent], b''])
+            parent = key
+        entries.append([path.split('/')[-1], 2, storages[parent], data])
+
+    sectors = []
+
+    def allocate(data, size):
+        start = len(sectors)
+        padded = data + bytes(-len(data) % size)
+        sectors.extend(padded[i:i + size] for i in range(0, len(padded), size))
+        return start, len(padded) // size
+
+    mini_sectors = []
+    placed = {}
+    for index, (_, kind, _, data) in enumerate(entries):
+        if kind != 2:
+            continue
+        if len(data) < 4096:
+            padded = data + bytes(-len(data) % 64)
+            placed[index] = ('mini', len(mini_sectors), len(padded) // 64)
+            mini_sectors.extend(padded[i:i + 64] for i in range(0, len(padded), 64))
+        else:
+            placed[index] = ('fat',) + allocate(data, 512)
+    minifat = []
+    for kind, start, count in placed.values():
+        if kind == 'mini':
+            minifat.extend(range(start + 1, start + count))
+            minifat.append(0xFFFFFFFE)
+    mini_start, mini_count = allocate(b''.join(mini_sectors), 512) if mini_sectors else (0xFFFFFFFE, 0)
+    minifat_start, minifat_count = allocate(struct.pack(f'<{len(minifat)}I', *minifat), 512)
+
+    children = {}
+    for index, entry in enumerate(entries[1:], 1):
+        children.setdefault(entry[2], []).append(index)
+    directory = bytearray()
+    for index, (name, kind, _, data) in enumerate(entries):
+        siblings = children.get(entries[index][2], []) if index else []
+        position = siblings.index(index) if index else 0
+        right = siblings[position + 1] if index and position + 1 < len(siblings) else 0xFFFFFFFF
+        child = children.get(index, [0xFFFFFFFF])[0]
+        if index == 0:
+            start, size = mini_start, len(mini_sectors) * 64
+        elif kind == 2:
+            start, size = placed[index][1], len(data)
+        else:
+            start, size = 0, 0
+        encoded = name.encode('utf-16-le') + b'\x00\x00'
+        directory += (encoded.ljust(64, b'\x00') + struct.pack('<HBB', len(encoded), kind, 1)
+                      + struct.pack('<III', 0xFFFFFFFF, right, child) + bytes(36)
+                      + struct.pack('<IQ', start, size))
+    directory_start, directory_count = allocate(bytes(directory), 512)
+
+    # Chaînes : secteurs consécutifs de chaque allocation, puis FAT elle-même
+    chains = [(start, count) for kind, start, count in placed.values() if kind == 'fat']
+    chains += [(mini_start, mini_count), (minifat_start, minifat_count), (directory_start, directory_count)]
+    data_sectors = len(sectors)
+    fat_count = 1
+    while (data_sectors + fat_count) > fat_count * 128:
+        fat_count += 1
+    fat = [0xFFFFFFFF] * (fat_count * 128)
+    for start, count in chains:
+        for sector in range(start, start + count):
+            fat[sector] = sector + 1 if sector + 1 < start + count else 0xFFFFFFFE
+    for sector in range(data_sectors, data_sectors + fat_count):
+        fat[sector] = 0xFFFFFFFD
+    if fat_count > 109:
+        raise ValueError("Projet trop grand pour une FAT sans DIFAT")
+    difat = list(range(data_sectors, data_sectors + fat_count)) + [0xFFFFFFFF] * (109 - fat_count)
+    header = (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + bytes(16) + struct.pack('<HHHHH', 0x3E, 3, 0xFFFE, 9, 6)
+              + bytes(10) + struct.pack('<IIIIIIII', fat_count, directory_start, 0, 4096,
+                                        minifat_start if minifat else 0xFFFFFFFE, minifat_count,
+                                        0xFFFFFFFE, 0)
+              + struct.pack('<109I', *difat))
+    return header + b''.join(sectors) + struct.pack(f'<{len(fat)}I', *fat)
+
+
+def datamashup_part(section):
+    """Partie customXml (UTF-16, comme Excel) portant un DataMashup (MS-QDEFF)
+    dont le package contient Formulas/Section1.m"""
+    package = io.BytesIO()
+    with zipfile.ZipFile(package, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', '<?xml version="1.0" encoding="utf-8"?><Types/>')
+        archive.writestr('Formulas/Section1.m', section.encode('utf-8-sig'))
+    package = package.getvalue()
+    # Version, package, puis permissions et métadonnées (vides ici)
+    mashup = struct.pack('<II', 0, len(package)) + package + struct.pack('<III', 0, 0, 0)
+    xml = ('<?xml version="1.0" encoding="utf-16" standalone="no"?>'
+           '<DataMashup xmlns="http://schemas.microsoft.com/DataMashup">'
+           + base64.b64encode(mashup).decode('ascii') + '</DataMashup>')
+    return b'\xff\xfe' + xml.encode('utf-16-le')
+
+
+def write_xlsm(path, components=None, section=None, part='customXml/item1.xml', extra=''):
+    """Classeur .xlsm réduit à son projet VBA et à ses requêtes Power Query
+    (section M), pour la lecture hors-ligne ; extra : contenu d'une autre
+    partie, pour un réenregistrement qui ne touche ni l'un ni l'autre"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', '<?xml version="1.0" encoding="UTF-8"?><Types/>')
+        archive.writestr('xl/workbook.xml', f'<workbook>{extra}</workbook>')
+        if components is not None:
+            archive.writestr('xl/vbaProject.bin', vba_project_bin(components))
+        if section is not None:
+            archive.writestr('customXml/itemProps1.xml', '<ds:datastoreItem/>')
+            archive.writestr(part, datamashup_part(section))
+
+
+def install(application=None):
+    """Enregistre des modules win32com/pythoncom factices si pywin32 est absent.
+
+    Avec une FakeApplication, Dispatch/DispatchEx/GetActiveObject la retournent
+    et GetObject(chemin) retrouve ses classeurs ouverts ; sinon COM est indisponible.
+    """
+    client = sys.modules.get('win32com.client')
+    if client is not None and getattr(client, 'fake', False):
+        client.application = application
+        return True
+    if importlib.util.find_spec('win32com') is not None:
+        # pywin32 installé : le vrai COM
+        return False
+    package = types.ModuleType('win32com')
+    client = types.ModuleType('win32com.client')
+    client.fake = True
+    client.application = application
+
+    def unavailable():
+        raise Exception("COM indisponible (faux win32com)")
+
+    def dispatch(prog_id, *args, **kwargs):
+        if not isinstance(prog_id, str):
+            # Dispatch(objet) : enveloppe d'un objet déjà obtenu (ROT)
+            return prog_id
+        if client.application is None:
+            unavailable()
+        return client.application
+
+    def get_object(path=None, *args, **kwargs):
+        if client.application is None:
+            unavailable()
+        return client.application.Workbooks.Open(path)
+
+    def with_events(*args, **kwargs):
+        raise Exception("Événements COM indisponibles (faux win32com)")
+
+    client.Dispatch = dispatch
+    client.DispatchEx = dispatch
+    client.GetActiveObject = dispatch
+    client.GetObject = get_object
+    client.WithEvents = with_events
+    client.DispatchWithEvents = with_events
+    package.client = client
+    pythoncom = types.ModuleType('pythoncom')
+    pythoncom.CoInitialize = lambda: None
+    pythoncom.CoUninitialize = lambda: None
+    pythoncom.PumpWaitingMessages = lambda: 0
+    pythoncom.com_error = Exception
+    pythoncom.IID_IDispatch = None
+    pythoncom.CreateBindCtx = lambda flags=0: None
+    pythoncom.GetRunningObjectTable = lambda: FakeRunningObjectTable(client)
+    sys.modules.setdefault('win32com', package)
+    sys.modules.setdefault('win32com.client', client)
+    sys.modules.setdefault('pythoncom', pythoncom)
+    return True
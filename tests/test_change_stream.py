@@ -0,0 +1,104 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from change_stream import MODIFIED, ChangeFilter, ChangeStreamServer, read_events
+
+
+@pytest.fixture
+def server():
+    server = ChangeStreamServer('127.0.0.1:0', heartbeat=0.2).start()
+    yield server
+    server.stop()
+
+
+def collect(address, count, timeout=5.0, **filters):
+    async def run():
+        events = []
+        async for seq, event, data in read_events(address, **filters):
+            events.append((seq, event, data))
+            if len(events) >= count:
+                break
+        return events
+    return asyncio.run(asyncio.wait_for(run(), timeout))
+
+
+def wait_subscribers(server, count):
+    deadline = time.monotonic() + 5
+    while len(server.subscribers) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_filter_matches_patterns():
+    change_filter = ChangeFilter(artifacts=['Module*'], targets=['vba'])
+    event = {'workbook': 'a.xlsm', 'target': 'vba', 'artifact': 'Module1.bas', 'kind': MODIFIED}
+
+    assert change_filter.matches(event)
+    assert not change_filter.matches(dict(event, target='powerquery'))
+    assert not change_filter.matches(dict(event, artifact='Feuil1.cls'))
+
+
+def test_history_is_replayed_with_diffs(server):
+    server.publish('a.xlsm', 'vba', 'Module1.bas', 'added', new='h1', text='Sub A()\n')
+    server.publish('a.xlsm', 'powerquery', 'Ventes.m', 'added', new='q1', text='let\n')
+    server.publish('a.xlsm', 'vba', 'Module1.bas', MODIFIED, old='h1', new='h2', text='Sub B()\n')
+
+    events = collect(server.address, 2, since=0, target='vba', diff='1')
+
+    assert [seq for seq, _, _ in events] == [1, 3]
+    assert events[1][2]['kind'] == MODIFIED
+    assert '-Sub A()\n+Sub B()\n' in events[1][2]['diff']
+
+
+def test_live_events_and_resume(server):
+    server.publish('a.xlsm', 'vba', 'Module1.bas', 'added', new='h1')
+
+    async def run():
+        events = []
+        async for seq, event, data in read_events(server.address, since=1):
+            events.append(seq)
+            break
+        return events
+
+    received = {}
+
+    def subscribe():
+        received['events'] = asyncio.run(asyncio.wait_for(run(), 5))
+
+    thread = threading.Thread(target=subscribe)
+    thread.start()
+    wait_subscribers(server, 1)
+    server.publish('a.xlsm', 'vba', 'Module2.bas', 'added', new='h2')
+    thread.join(5)
+
+    assert received['events'] == [2]
+
+
+def test_slow_subscriber_gets_overflow():
+    server = ChangeStreamServer('127.0.0.1:0', buffer=4).start()
+    try:
+        reader = {}
+
+        async def run():
+            reader['events'] = []
+            async for seq, event, data in read_events(server.address):
+                reader['events'].append((event, data))
+                if event == 'overflow':
+                    break
+                # Premier événement lu, puis le client cesse de lire
+                await asyncio.sleep(1.0)
+
+        thread = threading.Thread(target=lambda: asyncio.run(asyncio.wait_for(run(), 10)))
+        thread.start()
+        wait_subscribers(server, 1)
+        for n in range(2000):
+            server.publish('a.xlsm', 'vba', f"Module{n}.bas", 'added', new='x' * 200)
+        thread.join(10)
+
+        assert server.overflows == 1
+        event, data = reader['events'][-1]
+        assert event == 'overflow' and 0 <= data['resume'] < server.seq
+    finally:
+        server.stop()
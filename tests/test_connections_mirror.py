@@ -0,0 +1,51 @@
+from connections_mirror import ConnectionsMirror
+
+
+def test_mirror_copies_only_changes(tmp_path):
+    source = tmp_path / 'Classeur_Connections'
+    source.mkdir()
+    (source / 'a.json').write_text('{"a": 1}')
+    (source / 'b.json').write_text('{"b": 1}')
+    mirror = ConnectionsMirror(lambda: str(source), str(tmp_path / 'export'), fsync=False)
+
+    assert mirror.scan() == 2
+    assert mirror.scan() == 0
+    assert mirror.stats['files_read'] == 2
+
+    (source / 'a.json').write_text('{"a": 2}')
+    (source / 'b.json').unlink()
+    assert mirror.scan() == 2
+    assert (tmp_path / 'export' / 'a.json').read_text() == '{"a": 2}'
+    assert not (tmp_path / 'export' / 'b.json').exists()
+
+
+def test_existing_copies_are_adopted(tmp_path):
+    source = tmp_path / 'Connections'
+    source.mkdir()
+    (source / 'a.json').write_text('{"a": 1}')
+    export = tmp_path / 'export'
+    export.mkdir()
+    (export / 'a.json').write_text('{"a": 1}')
+    mirror = ConnectionsMirror(lambda: str(source), str(export), fsync=False)
+    mirror.scan()
+
+    assert mirror.stats['copied'] == 0
+
+
+def test_first_scan_removes_only_files_the_manifest_recorded(tmp_path):
+    source = tmp_path / 'Connections'
+    source.mkdir()
+    (source / 'a.json').write_text('{"a": 1}')
+    (source / 'b.json').write_text('{"b": 1}')
+    export = tmp_path / 'export'
+    ConnectionsMirror(lambda: str(source), str(export), fsync=False).scan()
+    # Pendant l'arrêt du miroir : source supprimée, fichier de l'utilisateur ajouté
+    (source / 'b.json').unlink()
+    (export / 'notes.json').write_text('{"mes": "réglages"}', encoding='utf-8')
+
+    mirror = ConnectionsMirror(lambda: str(source), str(export), fsync=False)
+    mirror.scan()
+
+    assert not (export / 'b.json').exists()
+    assert (export / 'notes.json').read_text(encoding='utf-8') == '{"mes": "réglages"}'
+    assert (export / 'a.json').read_text() == '{"a": 1}'
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+import fake_excel
+from com_session import Backoff
+from daemon import COMWorker, WorkbookJob
+from scheduler import POWERQUERY, VBA, SharedScheduler
+
+
+@pytest.fixture
+def worker(tmp_path):
+    path = str(tmp_path / 'classeur.xlsm')
+    counter = fake_excel.ComCallCounter()
+    app = fake_excel.FakeApplication(counter)
+    wb, _ = fake_excel.build_workbook(path, modules=3, counter=counter, queries=2)
+    app.register(wb)
+    fake_excel.install(app)
+    scheduler = SharedScheduler()
+    job = WorkbookJob({'path': path, 'extract': [VBA, POWERQUERY], 'export': str(tmp_path / 'exports'),
+                       'min_interval': 0.0}, scheduler)
+    worker = COMWorker(0, scheduler, backoff=Backoff(base=0.0))
+    worker.assign(job)
+    # Essais de la session espacés de 50 ms, sans gigue
+    job.session.sleep = lambda delay: time.sleep(0.05)
+    assert worker.open_job(job)
+    worker.step()
+    yield worker, job, counter
+    worker.jobs.clear()
+    job.close()
+    fake_excel.install(None)
+
+
+def step_until(worker, condition, timeout=2.0):
+    """Le repos imposé après un scan peut dépasser l'attente d'un step"""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        worker.step()
+    return condition()
+
+
+def exported(tmp_path, job, name):
+    job.engine.stop_pipeline()
+    with open(tmp_path / 'exports' / 'powerquery_export' / name, encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+def edit_query(job, index):
+    job.wb.Queries.add('Requête1', fake_excel.synthetic_query(index))
+
+
+def test_call_rejected_is_retried_and_job_kept(tmp_path, worker):
+    worker, job, counter = worker
+    edit_query(job, 99)
+    counter.fail(fake_excel.BUSY_ERROR, 0.12)
+    passes = job.engine.passes
+
+    assert step_until(worker, lambda: job.engine.passes > passes)
+
+    assert counter.failed >= 1
+    assert job.session.retries >= 1
+    assert job.path in worker.jobs and job.wb is not None
+    assert exported(tmp_path, job, 'Requête1.m') == fake_excel.synthetic_query(99)
+
+
+def test_disconnection_reattaches_through_the_rot(tmp_path, worker):
+    worker, job, counter = worker
+    edit_query(job, 98)
+    counter.fail(fake_excel.UNAVAILABLE_ERROR, 0.12)
+    passes = job.engine.passes
+
+    assert step_until(worker, lambda: job.engine.passes > passes)
+
+    assert job.session.reattaches == 1
+    assert job.path in worker.jobs
+    assert exported(tmp_path, job, 'Requête1.m') == fake_excel.synthetic_query(98)
+
+
+def test_closed_workbook_is_reopened_and_job_kept(tmp_path, worker):
+    worker, job, counter = worker
+    wb = job.wb
+    wb.Close()
+
+    assert step_until(worker, lambda: job.wb is None)
+    assert job.path in worker.jobs
+    assert job.wb is None and job.engine.pipeline is None
+    assert job.failures == 1
+
+    assert step_until(worker, lambda: job.wb is wb)
+    assert job.failures == 0
+    edit_query(job, 97)
+    passes = job.engine.passes
+    assert step_until(worker, lambda: job.engine.passes > passes)
+    assert exported(tmp_path, job, 'Requête1.m') == fake_excel.synthetic_query(97)
+
+
+def test_engine_uses_the_shared_scheduler(worker):
+    worker, job, counter = worker
+
+    assert job.engine.scheduler is job.handle
+    # Borne de la vérification tournante des modules VBA
+    assert job.handle.max_interval == job.engine.poll_bound() == 30.0
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+import fake_excel
+from engine import ExtractionEngine
+from scheduler import POWERQUERY, VBA
+
+
+def make_engine(tmp_path):
+    path = os.path.join(str(tmp_path), 'classeur.xlsm')
+    wb, counter = fake_excel.build_workbook(path, modules=3, queries=2)
+    engine = ExtractionEngine(path, targets=(VBA, POWERQUERY), export_root=str(tmp_path / 'exports'))
+    engine.attach(None, wb)
+    return engine, wb
+
+
+def edit(wb):
+    wb.Queries.add('Requête1', fake_excel.synthetic_query(99))
+    module = wb.VBProject.VBComponents('Module1').CodeModule
+    module.set_text(module.text() + "\r\n' modifié")
+
+
+def read(tmp_path, folder, name):
+    with open(tmp_path / 'exports' / folder / name, encoding='utf-8', errors='replace', newline='') as f:
+        return f.read()
+
+
+def test_pipeline_writes_off_the_com_thread(tmp_path):
+    engine, wb = make_engine(tmp_path)
+    flushes = []
+    for extractor in engine.extractors:
+        flush = extractor.flush
+        extractor.flush = lambda flush=flush, target=extractor.target: (
+            flushes.append((target, threading.current_thread().name)), flush())
+    engine.start_pipeline()
+    edit(wb)
+
+    assert engine.tick()
+    engine.stop_pipeline()
+
+    assert sorted(flushes) == [(POWERQUERY, 'engine-write0'), (VBA, 'engine-write0')]
+    assert fake_excel.synthetic_query(99) in read(tmp_path, 'powerquery_export', 'Requête1.m')
+    assert "' modifié" in read(tmp_path, 'macros_export', 'Module1.bas')
+
+
+def test_without_pipeline_tick_writes_synchronously(tmp_path):
+    engine, wb = make_engine(tmp_path)
+    edit(wb)
+
+    assert engine.tick()
+    assert fake_excel.synthetic_query(99) in read(tmp_path, 'powerquery_export', 'Requête1.m')
+    assert not engine.tick()
+
+
+def test_changes_queued_behind_a_slow_writer_are_all_written(tmp_path):
+    engine, wb = make_engine(tmp_path)
+    release = threading.Event()
+    powerquery = engine.extractors[1]
+    flush = powerquery.flush
+    powerquery.flush = lambda: (release.wait(5), flush())
+    engine.start_pipeline()
+    wb.Queries.add('Requête1', fake_excel.synthetic_query(98))
+    engine.tick()
+    wb.Queries.add('Requête2', fake_excel.synthetic_query(97))
+    engine.tick()
+    wb.Queries.remove('Requête1')
+    engine.tick()
+    release.set()
+    engine.stop_pipeline()
+
+    assert not os.path.exists(tmp_path / 'exports' / 'powerquery_export' / 'Requête1.m')
+    assert fake_excel.synthetic_query(97) in read(tmp_path, 'powerquery_export', 'Requête2.m')
+
+
+def test_failed_write_is_retried_by_the_pipeline(tmp_path):
+    engine, wb = make_engine(tmp_path)
+    powerquery = engine.extractors[1]
+    save_query = powerquery.monitor.save_query
+    attempts = []
+
+    def locked_once(name, formula, writer=None):
+        # Premier essai : fichier verrouillé (save_query journalise et retourne False)
+        attempts.append(name)
+        return len(attempts) > 1 and save_query(name, formula, writer)
+
+    powerquery.monitor.save_query = locked_once
+    engine.start_pipeline()
+    engine.pipeline.retry_delay = 0.05
+    wb.Queries.add('Requête1', fake_excel.synthetic_query(96))
+
+    assert engine.tick()
+    deadline = time.monotonic() + 5
+    while len(attempts) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    engine.stop_pipeline()
+
+    assert fake_excel.synthetic_query(96) in read(tmp_path, 'powerquery_export', 'Requête1.m')
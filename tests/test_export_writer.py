@@ -0,0 +1,160 @@
+import os
+import threading
+
+import fake_excel
+from export_manifest import ExportManifest, content_digest
+from export_writer import STAGING_DIR, ExportWriter
+
+
+def make_writer(root, **kwargs):
+    return ExportWriter(ExportManifest(str(root)).load(), **kwargs)
+
+
+def test_identical_content_is_not_rewritten(tmp_path):
+    writer = make_writer(tmp_path)
+    assert writer.write_text('Module1.bas', 'Sub A()\r\nEnd Sub')
+    writer.flush()
+    mtime = os.stat(tmp_path / 'Module1.bas').st_mtime_ns
+
+    assert not writer.write_text('Module1.bas', 'Sub A()\r\nEnd Sub')
+    stats = writer.flush()
+
+    assert stats['files_written'] == 0
+    assert stats['files_skipped'] == 1
+    assert os.stat(tmp_path / 'Module1.bas').st_mtime_ns == mtime
+
+
+def test_files_appear_only_at_flush(tmp_path):
+    writer = make_writer(tmp_path)
+    writer.write_text('Query1.m', 'let\r\n    Source = 1\r\nin\r\n    Source')
+
+    assert not (tmp_path / 'Query1.m').exists()
+    writer.flush()
+    assert (tmp_path / 'Query1.m').read_bytes() == b'let\r\n    Source = 1\r\nin\r\n    Source'
+    assert not os.listdir(tmp_path / STAGING_DIR)
+
+
+def test_on_change_receives_written_and_removed_paths(tmp_path):
+    changes = []
+    writer = make_writer(tmp_path, on_change=lambda written, removed: changes.append((written, removed)))
+    writer.write_text('a.m', 'a')
+    writer.write_text('b.m', 'b')
+    writer.flush()
+    writer.remove('a.m')
+    writer.flush()
+    # Rien de changé : pas de notification
+    writer.write_text('b.m', 'b')
+    writer.flush()
+
+    assert [(sorted(written), removed) for written, removed in changes] == [
+        ([str(tmp_path / 'a.m'), str(tmp_path / 'b.m')], []),
+        ([], [str(tmp_path / 'a.m')]),
+    ]
+    assert not (tmp_path / 'a.m').exists()
+
+
+def test_manifest_survives_restart(tmp_path):
+    writer = make_writer(tmp_path)
+    writer.write_text('a.m', 'a', source='source-a')
+    writer.flush()
+
+    manifest = ExportManifest(str(tmp_path)).load()
+    assert manifest.matches('a.m', 'source-a')
+    assert not manifest.matches('a.m', 'source-b')
+
+
+def test_discard_drops_staged_files(tmp_path):
+    writer = make_writer(tmp_path)
+    writer.write_text('a.m', 'a')
+    writer.discard()
+    writer.flush()
+
+    assert not (tmp_path / 'a.m').exists()
+
+
+def test_staged_edit_reverted_before_flush_keeps_the_published_version(tmp_path):
+    writer = make_writer(tmp_path)
+    writer.write_text('a.m', 'v1', source='s1')
+    writer.flush()
+
+    assert writer.write_text('a.m', 'v2', source='s2')
+    assert not writer.write_text('a.m', 'v1', source='s1')
+    writer.flush()
+
+    assert (tmp_path / 'a.m').read_text() == 'v1'
+    assert writer.manifest.matches('a.m', 's1')
+    assert not os.listdir(tmp_path / STAGING_DIR)
+
+
+def test_reverted_component_export_is_not_published(tmp_path):
+    wb, _ = fake_excel.build_workbook(str(tmp_path / 'classeur.xlsm'), modules=1, lines_per_module=10)
+    component = wb.VBProject.VBComponents('Module1')
+    original = component.CodeModule.text()
+    writer = make_writer(tmp_path)
+    writer.export_component(component, ['Module1.bas'], 's1')
+    writer.flush()
+    published = (tmp_path / 'Module1.bas').read_bytes()
+
+    component.CodeModule.set_text(original + "\r\n' v2")
+    assert writer.export_component(component, ['Module1.bas'], 's2')
+    component.CodeModule.set_text(original)
+    assert not writer.export_component(component, ['Module1.bas'], 's1')
+    writer.flush()
+
+    assert (tmp_path / 'Module1.bas').read_bytes() == published
+    assert writer.manifest.matches('Module1.bas', 's1')
+
+
+def test_revert_during_a_flush_is_published_after_it(tmp_path):
+    writer = make_writer(tmp_path)
+    writer.write_text('a.m', 'v1', source='s1')
+    writer.flush()
+    commit = writer._commit_staged
+
+    def commit_while_reverted(staged):
+        # Le thread COM revient à v1 pendant que le pipeline publie v2
+        assert writer.write_text('a.m', 'v1', source='s1')
+        commit(staged)
+
+    writer.write_text('a.m', 'v2', source='s2')
+    writer._commit_staged = commit_while_reverted
+    writer.flush()
+    writer._commit_staged = commit
+    writer.flush()
+
+    assert (tmp_path / 'a.m').read_text() == 'v1'
+    assert writer.manifest.matches('a.m', 's1')
+
+
+def test_shard_writers_share_the_manifest_but_not_their_staging(tmp_path):
+    manifest = ExportManifest(str(tmp_path)).load()
+    first, second = (ExportWriter(manifest, fsync=False, staging=str(index)) for index in range(2))
+    first.write_text('a.m', 'a')
+    second.write_text('b.m', 'b')
+
+    second.discard()
+    first.flush()
+
+    assert (tmp_path / 'a.m').read_text() == 'a'
+    assert not (tmp_path / 'b.m').exists()
+
+
+def test_concurrent_shard_flushes_record_every_file(tmp_path):
+    manifest = ExportManifest(str(tmp_path)).load()
+    writers = [ExportWriter(manifest, fsync=False, staging=str(index)) for index in range(4)]
+
+    def run(index, writer):
+        for n in range(25):
+            writer.write_text(f"q{index}_{n}.m", f"{index} {n}")
+            writer.flush()
+
+    threads = [threading.Thread(target=run, args=(index, writer)) for index, writer in enumerate(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reloaded = ExportManifest(str(tmp_path)).load()
+    assert len(reloaded.entries) == 100
+    assert all(reloaded.matches(f"q{index}_{n}.m", content_digest(f"{index} {n}"))
+               for index in range(4) for n in range(25))
@@ -0,0 +1,50 @@
+import subprocess
+
+from git_committer import GitCommitter
+
+
+def git(repo, *args):
+    return subprocess.run(['git', *args], cwd=repo, stdout=subprocess.PIPE, check=True).stdout.decode()
+
+
+def test_batch_becomes_one_commit(tmp_path):
+    committer = GitCommitter(str(tmp_path), quiet_period=60)
+    paths = []
+    for name in ('Module1.bas', 'Module2.bas', 'Requête.m'):
+        path = tmp_path / name
+        path.write_text(name)
+        paths.append(str(path))
+    committer.start()
+    for path in paths:
+        committer.submit(written=[path])
+    committer.stop(timeout=10)
+
+    assert committer.commits == 1
+    assert git(tmp_path, 'rev-list', '--count', 'HEAD').strip() == '1'
+    assert sorted(git(tmp_path, 'ls-tree', '--name-only', '-z', 'HEAD').strip('\0').split('\0')) == \
+        ['Module1.bas', 'Module2.bas', 'Requête.m']
+
+
+def test_unchanged_files_make_no_commit(tmp_path):
+    committer = GitCommitter(str(tmp_path))
+    path = tmp_path / 'Module1.bas'
+    path.write_text('x')
+    assert committer.commit({str(path): 'write'})
+    assert committer.commit({str(path): 'write'}) is None
+
+    path.unlink()
+    assert committer.commit({str(path): 'remove'})
+    assert git(tmp_path, 'ls-tree', '--name-only', 'HEAD') == ''
+
+
+def test_user_index_is_left_alone(tmp_path):
+    committer = GitCommitter(str(tmp_path))
+    staged = tmp_path / 'notes.txt'
+    staged.write_text('en cours')
+    git(tmp_path, 'add', 'notes.txt')
+    path = tmp_path / 'Module1.bas'
+    path.write_text('x')
+    committer.commit({str(path): 'write'})
+
+    assert git(tmp_path, 'ls-tree', '--name-only', 'HEAD').split() == ['Module1.bas']
+    assert git(tmp_path, 'diff', '--cached', '--name-only').split() == ['notes.txt']
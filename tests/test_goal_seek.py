@@ -0,0 +1,57 @@
+import numpy as np
+
+import fake_excel
+from goal_seek import (COLUMNS, END_COL, ROWS, START_COL, START_ROW, TARGET_ROW, SheetEvaluator,
+                       batched_goal_seek, sequential_goal_seek)
+
+
+def column_sums(grid):
+    # Ligne cible : somme pondérée de la colonne, croissante comme le suppose la macro
+    return (grid * np.linspace(0.01, 0.02, ROWS)[:, None]).sum(axis=0) * np.linspace(1, 2, COLUMNS)
+
+
+def test_batched_matches_sequential():
+    for target in (30, 50, 60):
+        batched = batched_goal_seek(column_sums, target)
+        sequential = sequential_goal_seek(column_sums, target)
+
+        assert np.array_equal(batched.found, sequential.found)
+        assert np.allclose(batched.grid, sequential.grid)
+        assert batched.evaluations < sequential.evaluations / 4
+
+
+def test_unreachable_columns_are_reported():
+    result = batched_goal_seek(column_sums, 1000)
+
+    assert result.failed_columns() == [chr(64 + col) for col in range(START_COL, END_COL + 1)]
+
+
+class SheetModel:
+    """Feuille factice : la ligne cible suit le bloc à chaque Calculate"""
+
+    def __init__(self, ws):
+        self.ws = ws
+
+    def __call__(self):
+        grid = np.array([[float(self.ws._cells.get((START_ROW + row, START_COL + col), 0))
+                          for col in range(COLUMNS)] for row in range(ROWS)])
+        for col, value in enumerate(column_sums(grid)):
+            self.ws.set(TARGET_ROW, START_COL + col, value)
+
+
+def test_sheet_evaluator_uses_three_calls_per_iteration():
+    wb, counter = fake_excel.build_workbook('goalseek.xlsm', modules=0)
+    ws = wb.Worksheets.add('Feuil1')
+    model = SheetModel(ws)
+    object.__setattr__(ws, 'Calculate', model)
+    evaluator = SheetEvaluator(ws)
+    counter.reset()
+
+    result = batched_goal_seek(evaluator, 50)
+    expected = batched_goal_seek(column_sums, 50)
+
+    assert np.array_equal(result.found, expected.found)
+    assert np.allclose(result.grid, expected.grid)
+    assert evaluator.calculations == result.evaluations
+    assert counter.by_member['FakeWorksheet.Calculate'] == result.evaluations
+    assert counter.calls <= 4 * result.evaluations
@@ -0,0 +1,115 @@
+import os
+import time
+
+from import_queue import DebouncedImportQueue
+from origin_index import EXCEL, OriginIndex, path_key
+from export_manifest import file_digest
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+
+
+def run_burst(queue, paths, events_per_file=5):
+    queue.start()
+    for _ in range(events_per_file):
+        for path in paths:
+            queue.submit(path)
+    queue.stop(timeout=5)
+
+
+def test_burst_is_imported_once_per_file(tmp_path):
+    paths = [str(tmp_path / f"Module{index}.bas") for index in range(3)]
+    for path in paths:
+        write(path, f"code de {path}")
+    batches = []
+    queue = DebouncedImportQueue(lambda batch: batches.append(batch), quiet_period=0.05)
+    run_burst(queue, paths)
+
+    assert queue.events == 15
+    assert queue.batches == 1
+    assert queue.imports == 3
+    assert batches == [sorted(os.path.abspath(path) for path in paths)]
+
+
+def test_unchanged_content_is_not_imported(tmp_path):
+    path = str(tmp_path / "Module1.bas")
+    write(path, "Sub A()\r\nEnd Sub")
+    batches = []
+    queue = DebouncedImportQueue(lambda batch: batches.append(batch), quiet_period=0.05)
+    queue.prime([path])
+    run_burst(queue, [path])
+
+    assert batches == []
+    assert queue.skipped == 1
+
+
+def test_files_exported_by_excel_are_echoes(tmp_path):
+    path = str(tmp_path / "Module1.bas")
+    write(path, "Sub A()\r\nEnd Sub")
+    origins = OriginIndex()
+    origins.record(path_key(path), file_digest(path), EXCEL)
+    batches = []
+    queue = DebouncedImportQueue(lambda batch: batches.append(batch), quiet_period=0.05, origins=origins)
+    run_burst(queue, [path])
+
+    assert batches == []
+    assert queue.echoes == 1
+
+
+def test_only_reported_files_count_as_imported(tmp_path):
+    paths = [str(tmp_path / "A.bas"), str(tmp_path / "B.bas")]
+    for path in paths:
+        write(path, path)
+    queue = DebouncedImportQueue(lambda batch: batch[:1], quiet_period=0.05)
+    run_burst(queue, paths, events_per_file=1)
+
+    assert queue.imports == 1
+    # B n'a pas été importé : le même contenu sera retenté
+    assert os.path.abspath(paths[1]) not in queue.digests
+
+
+def test_removed_files_are_forwarded(tmp_path):
+    path = str(tmp_path / "Module1.bas")
+    write(path, "x")
+    batches = []
+    queue = DebouncedImportQueue(lambda batch: batches.append(batch), quiet_period=0.05, removals=True)
+    queue.prime([path])
+    os.remove(path)
+    run_burst(queue, [path], events_per_file=2)
+
+    assert batches == [[os.path.abspath(path)]]
+    assert queue.digests == {}
+
+
+def test_events_wait_for_quiet_period(tmp_path):
+    path = str(tmp_path / "Module1.bas")
+    write(path, "x")
+    batches = []
+    queue = DebouncedImportQueue(lambda batch: batches.append(time.monotonic()), quiet_period=0.2).start()
+    start = time.monotonic()
+    queue.submit(path)
+    time.sleep(0.1)
+    queue.submit(path)
+    deadline = time.monotonic() + 5
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    queue.stop(timeout=5)
+
+    assert len(batches) == 1
+    assert batches[0] - start >= 0.3
+
+
+def test_failed_thread_init_stops_the_queue():
+    exits = []
+
+    def thread_init():
+        raise Exception("Excel indisponible")
+
+    queue = DebouncedImportQueue(lambda batch: batch, thread_init=thread_init,
+                                 thread_exit=lambda: exits.append(True)).start()
+    queue._thread.join(5)
+
+    assert not queue.is_alive()
+    assert exits == [True]
@@ -0,0 +1,32 @@
+import logging
+
+from log_setup import RepeatFilter
+
+
+def emit(repeat_filter, level, message, created):
+    record = logging.LogRecord('test', level, __file__, 0, message, None, None)
+    record.created = created
+    return repeat_filter.filter(record), record
+
+
+def test_repeated_info_is_limited_per_window():
+    repeat_filter = RepeatFilter(window=60.0)
+    kept = [emit(repeat_filter, logging.INFO, "Requête trouvée: Query1", poll * 0.5)[0] for poll in range(10)]
+
+    assert kept == [True] + [False] * 9
+    passed, record = emit(repeat_filter, logging.INFO, "Requête trouvée: Query1", 61.0)
+    assert passed and record.repeated == 9
+
+
+def test_warnings_and_errors_always_pass():
+    repeat_filter = RepeatFilter(window=60.0)
+    for level in (logging.WARNING, logging.ERROR):
+        assert all(emit(repeat_filter, level, "Erreur pendant la surveillance: RPC", poll)[0] for poll in range(5))
+    assert repeat_filter.suppressed == 0
+
+
+def test_change_messages_always_pass():
+    repeat_filter = RepeatFilter(window=60.0)
+    for message in ("Modification détectée pour Module1", "Fichier écrit: Module1.bas", "Requête supprimée: Q"):
+        assert all(emit(repeat_filter, logging.INFO, message, poll)[0] for poll in range(3))
+    assert repeat_filter.suppressed == 0
@@ -0,0 +1,68 @@
+import threading
+
+from metrics import Metrics
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    with metrics.timer('com.Lines') as timer:
+        timer.bytes = 10
+    metrics.observe('x', 1.0)
+
+    assert metrics.snapshot()['totals'] == {}
+
+
+def test_cycle_moves_measures_into_totals():
+    metrics = Metrics(enabled=True)
+    for _ in range(2):
+        with metrics.cycle():
+            with metrics.timer('com.Lines') as timer:
+                timer.bytes = 100
+            metrics.observe('io.flush', 0.002)
+    snapshot = metrics.snapshot()
+
+    assert snapshot['cycles']['count'] == 2
+    assert snapshot['last_cycle']['com.Lines']['count'] == 1
+    assert snapshot['totals']['com.Lines']['count'] == 2
+    assert snapshot['totals']['com.Lines']['bytes'] == 200
+    assert snapshot['totals']['io.flush']['buckets'] == {'le_5': 2}
+
+
+def test_prometheus_histogram_is_cumulative():
+    metrics = Metrics(enabled=True)
+    with metrics.cycle():
+        metrics.observe('com.Lines', 0.0002)
+        metrics.observe('com.Lines', 0.003)
+    text = metrics.prometheus()
+
+    assert 'excel_sync_com_Lines_seconds_bucket{le="0.0005"} 1' in text
+    assert 'excel_sync_com_Lines_seconds_bucket{le="+Inf"} 2' in text
+    assert 'excel_sync_com_Lines_seconds_count 2' in text
+
+
+def test_cycles_keep_only_their_own_thread_measures():
+    metrics = Metrics(enabled=True)
+    started, release = threading.Event(), threading.Event()
+
+    def writer():
+        with metrics.cycle('cycle.mirror'):
+            metrics.observe('io.copy', 0.001)
+            started.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    started.wait(5)
+    with metrics.cycle('cycle.engine'):
+        metrics.observe('com.Lines', 0.001)
+    engine_cycle = metrics.snapshot()['last_cycle']
+    # Mesure d'un écrivain du pipeline, hors de tout cycle
+    metrics.observe('io.flush', 0.001)
+    release.set()
+    thread.join()
+    snapshot = metrics.snapshot()
+
+    assert set(engine_cycle) == {'cycle.engine', 'com.Lines'}
+    assert set(snapshot['last_cycle']) == {'cycle.mirror', 'io.copy'}
+    assert {name: data['count'] for name, data in snapshot['totals'].items()} == {
+        'cycle.engine': 1, 'com.Lines': 1, 'cycle.mirror': 1, 'io.copy': 1, 'io.flush': 1}
@@ -0,0 +1,28 @@
+from origin_index import DISK, EXCEL, OriginIndex, component_key
+
+
+def test_write_from_other_side_is_an_echo():
+    origins = OriginIndex()
+    origins.record('a.bas', 'd1', EXCEL)
+
+    assert origins.is_echo('a.bas', 'd1', DISK)
+    assert not origins.is_echo('a.bas', 'd1', EXCEL)
+    # Contenu différent : vraie modification
+    assert not origins.is_echo('a.bas', 'd2', DISK)
+
+
+def test_entries_expire_after_ttl():
+    now = [0.0]
+    origins = OriginIndex(ttl=10, clock=lambda: now[0])
+    origins.record('a.bas', 'd1', EXCEL)
+    now[0] = 11.0
+
+    assert origins.origin_of('a.bas', 'd1') is None
+
+
+def test_oldest_entries_are_evicted():
+    origins = OriginIndex(max_entries=2)
+    for name in ('A', 'B', 'C'):
+        origins.record(component_key(name), name, DISK)
+
+    assert list(origins.entries) == ['vba:b', 'vba:c']
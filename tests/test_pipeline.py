@@ -0,0 +1,104 @@
+import threading
+
+from pipeline import ExportPipeline, StageQueue, merge_changes
+
+
+def diff(previous, snapshot):
+    changes = {name: value for name, value in snapshot.items() if previous.get(name) != value}
+    changes.update({name: None for name in previous if name not in snapshot})
+    return changes
+
+
+def test_full_queue_merges_instead_of_blocking():
+    queue = StageQueue('test', 1, merge=merge_changes)
+    queue.put({'a': 1})
+    queue.put({'a': 2, 'b': 1})
+
+    assert queue.get() == {'a': 2, 'b': 1}
+    assert queue.stats()['coalesced'] == 1
+
+
+def test_pipeline_writes_latest_state_before_stopping():
+    written = {}
+    lock = threading.Lock()
+
+    def write(index, changes):
+        with lock:
+            written.update(changes)
+
+    pipeline = ExportPipeline(diff, write, writers=3).start({'old': 1})
+    for version in range(50):
+        pipeline.submit({f"Requête{n}": version for n in range(10)})
+    pipeline.stop(timeout=10)
+
+    assert written == dict({f"Requête{n}": 49 for n in range(10)}, old=None)
+    assert pipeline.errors == 0
+
+
+def test_slow_writer_does_not_block_submit():
+    release = threading.Event()
+    writes = []
+
+    def write(index, changes):
+        release.wait(5)
+        writes.append(changes)
+
+    pipeline = ExportPipeline(diff, write, writers=1, batches=1).start()
+    for version in range(20):
+        pipeline.submit({'a': version})
+    release.set()
+    pipeline.stop(timeout=10)
+
+    # Les lots en attente de l'écrivain bloqué ont été fusionnés
+    assert len(writes) < 20
+    assert writes[-1] == {'a': 19}
+
+
+def test_write_errors_are_counted():
+    def write(index, changes):
+        raise OSError("disque plein")
+
+    pipeline = ExportPipeline(diff, write, writers=1).start()
+    pipeline.submit({'a': 1})
+    pipeline.stop(timeout=10)
+
+    # Échec, puis dernier essai du lot à l'arrêt
+    assert pipeline.errors == 2
+
+
+def test_failed_batch_is_retried_without_a_new_change():
+    attempts = []
+    written = threading.Event()
+
+    def write(index, changes):
+        attempts.append(dict(changes))
+        if len(attempts) == 1:
+            raise OSError("fichier verrouillé")
+        written.set()
+
+    pipeline = ExportPipeline(diff, write, writers=1, retry_delay=0.05).start()
+    pipeline.submit({'a': 1})
+
+    assert written.wait(5)
+    pipeline.stop(timeout=10)
+    assert attempts == [{'a': 1}, {'a': 1}]
+    assert pipeline.errors == 1
+
+
+def test_failed_changes_are_merged_into_the_next_batch():
+    attempts = []
+    failed = threading.Event()
+
+    def write(index, changes):
+        attempts.append(dict(changes))
+        if len(attempts) == 1:
+            failed.set()
+            raise OSError("disque plein")
+
+    pipeline = ExportPipeline(diff, write, writers=1, retry_delay=60.0).start()
+    pipeline.submit({'a': 1})
+    assert failed.wait(5)
+    pipeline.submit({'a': 1, 'b': 2})
+    pipeline.stop(timeout=10)
+
+    assert attempts == [{'a': 1}, {'a': 1, 'b': 2}]
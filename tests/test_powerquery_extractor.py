@@ -0,0 +1,69 @@
+import os
+
+import fake_excel
+import powerquery_extractor
+from powerquery_extractor import DataMashupReader, split_section, tokenize
+
+SECTION = '''section Section1;
+
+// shared Commentaire = 1;
+shared #"Ventes ""2024""" = let
+    Source = "a;b shared Chaîne = 2;", /* ; shared Bloc = 3; */
+    Masque = 0xFF
+in
+    Source;
+
+shared Clients = Table.FromRows({{1}});
+'''
+
+
+def test_split_section_handles_quoted_names_comments_and_strings():
+    queries = split_section(SECTION)
+
+    assert list(queries) == ['Ventes "2024"', 'Clients']
+    assert queries['Ventes "2024"'] == ('let\n    Source = "a;b shared Chaîne = 2;", /* ; shared Bloc = 3; */\n'
+                                        '    Masque = 0xFF\nin\n    Source')
+    assert queries['Clients'] == 'Table.FromRows({{1}})'
+
+
+def test_hexadecimal_numbers_are_one_token():
+    tokens = [(kind, value) for kind, value, _, _ in tokenize('0xFF + 1.5e3') if kind != 'whitespace']
+
+    assert tokens == [('number', '0xFF'), ('punct', '+'), ('number', '1.5e3')]
+
+
+def test_reader_extracts_the_queries_of_the_workbook(tmp_path):
+    path = str(tmp_path / 'classeur.xlsm')
+    fake_excel.write_xlsm(path, section=SECTION)
+
+    queries = DataMashupReader(path).get_power_queries()
+
+    assert queries == {name: {'formula': formula} for name, formula in split_section(SECTION).items()}
+
+
+def test_reader_parses_again_only_when_the_datamashup_changes(tmp_path, monkeypatch):
+    path = str(tmp_path / 'classeur.xlsm')
+    fake_excel.write_xlsm(path, section=SECTION)
+    parses = []
+    split = powerquery_extractor.split_section
+    monkeypatch.setattr(powerquery_extractor, 'split_section', lambda text: parses.append(1) or split(text))
+    reader = DataMashupReader(path)
+
+    reader.get_power_queries()
+    reader.get_power_queries()
+    # Réenregistré : une autre partie change, pas le DataMashup
+    fake_excel.write_xlsm(path, section=SECTION, extra='<sheet/>')
+    os.utime(path, ns=(0, 10 ** 9))
+    reader.get_power_queries()
+    assert len(parses) == 1
+
+    fake_excel.write_xlsm(path, section=SECTION.replace('{{1}}', '{{2}}'))
+    os.utime(path, ns=(0, 2 * 10 ** 9))
+    assert reader.get_power_queries()['Clients'] == {'formula': 'Table.FromRows({{2}})'}
+    assert len(parses) == 2
+
+    # Partie renommée d'un enregistrement à l'autre : retrouvée, contenu identique
+    fake_excel.write_xlsm(path, section=SECTION.replace('{{1}}', '{{2}}'), part='customXml/item2.xml')
+    os.utime(path, ns=(0, 3 * 10 ** 9))
+    assert reader.get_power_queries()['Clients'] == {'formula': 'Table.FromRows({{2}})'}
+    assert len(parses) == 2
@@ -0,0 +1,39 @@
+import fake_excel
+from powerquery_importer import QueryImporter
+from query_graph import QueryGraph
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+
+
+def test_only_differing_formulas_are_written(tmp_path):
+    wb, counter = fake_excel.build_workbook(str(tmp_path / 'classeur.xlsm'), modules=0, queries=3)
+    importer = QueryImporter()
+    importer.prime(wb)
+    write(tmp_path / 'Requête1.m', wb.Queries('Requête1').Formula)
+    write(tmp_path / 'Requête2.m', 'let\r\n    Source = 2\r\nin\r\n    Source')
+    counter.reset()
+
+    done = importer.apply_batch(wb, [str(tmp_path / 'Requête1.m'), str(tmp_path / 'Requête2.m')])
+
+    assert len(done) == 2
+    assert counter.by_member.get('FakeQuery.Formula=') == 1
+    assert importer.updated == 1 and importer.unchanged == 1
+    assert importer.last_changed == {'Requête2'}
+    assert wb.Queries('Requête2').Formula == 'let\r\n    Source = 2\r\nin\r\n    Source'
+
+
+def test_new_and_removed_files(tmp_path):
+    wb, _ = fake_excel.build_workbook(str(tmp_path / 'classeur.xlsm'), modules=0, queries=1)
+    graph = QueryGraph()
+    importer = QueryImporter(graph)
+    importer.prime(wb)
+    write(tmp_path / 'Ventes.m', 'let\r\n    Source = Requête1\r\nin\r\n    Source')
+
+    importer.apply_batch(wb, [str(tmp_path / 'Ventes.m'), str(tmp_path / 'Requête1.m')])
+
+    assert [query.Name for query in wb.Queries] == ['Ventes']
+    assert importer.added == 1 and importer.deleted == 1
+    assert 'Requête1' not in graph.nodes
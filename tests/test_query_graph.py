@@ -0,0 +1,79 @@
+from query_graph import QueryGraph, formula_names
+
+
+def names(formula):
+    used, dynamic = formula_names(formula)
+    assert not dynamic
+    return used
+
+
+def test_quoted_identifiers_are_unquoted():
+    used = names('let Source = #"Ventes 2024", Joint = Table.Join(Source, #"Clients ""VIP""") in Joint')
+
+    assert used == {'Ventes 2024', 'Clients "VIP"', 'Table.Join'}
+
+
+def test_let_steps_shadow_queries_of_the_same_name():
+    used = names('let Clients = Table.FromRows({}), #"Étape 2" = Table.Join(Clients, Ventes) in #"Étape 2"')
+
+    assert used == {'Table.FromRows', 'Table.Join', 'Ventes'}
+
+
+def test_let_steps_are_only_visible_inside_their_let():
+    used = names('let A = let Clients = 1 in Clients, B = Clients in B')
+
+    assert used == {'Clients'}
+
+
+def test_strings_comments_and_record_fields_are_ignored():
+    formula = ('// Clients\r\n'
+               'let /* Produits */ Source = "Clients",\r\n'
+               '    Filtre = Table.SelectRows(Ventes, each [Nom] = "Produits"),\r\n'
+               '    Options = [Clients = 1, Produits = 2],\r\n'
+               '    Résultat = Stocks\r\n'
+               'in Résultat')
+
+    assert names(formula) == {'Table.SelectRows', 'Ventes', 'Stocks'}
+
+
+def test_keywords_parameters_and_types_are_not_dependencies():
+    assert names('(Clients as table, optional n as nullable number) as table => Table.FirstN(Clients, n)') == \
+        {'Table.FirstN'}
+
+
+def test_parameters_are_only_visible_inside_their_function():
+    assert names('let f = (Sales) => Sales + 1, r = f(Sales) in r') == {'Sales'}
+    assert names('let f = (x as table) as nullable table => let t = x in t, r = f(x) in r') == {'x'}
+    assert names('List.Transform(Ventes, (Ventes) => Ventes * 2)') == {'List.Transform', 'Ventes'}
+
+
+def test_shared_access():
+    assert formula_names('#shared[Ventes]') == ({'Ventes'}, False)
+    assert formula_names('Expression.Evaluate("Ventes", #shared)') == ({'Expression.Evaluate'}, True)
+
+
+def test_refresh_plan_orders_dependents_after_their_dependencies():
+    graph = QueryGraph()
+    graph.update_all({'Source': '1', 'Ventes': 'Source', 'Clients': 'Source', 'Rapport': 'Table.Join(Ventes, Clients)',
+                      'Autre': '2'})
+
+    assert graph.refresh_plan({'Source'}) == [['Source'], ['Clients', 'Ventes'], ['Rapport']]
+    assert graph.refresh_plan({'Ventes'}) == [['Ventes'], ['Rapport']]
+
+
+def test_refresh_plan_releases_a_cycle_before_its_dependents(caplog):
+    graph = QueryGraph()
+    graph.update_all({'Source': '1', 'A': 'B + Source', 'B': 'A', 'Rapport': 'A', 'C': 'D', 'D': 'C + Rapport'})
+
+    assert graph.refresh_plan({'Source'}) == [['Source'], ['A', 'B'], ['Rapport'], ['C', 'D']]
+    assert "Dépendances circulaires entre: A, B" in caplog.text
+    assert "Dépendances circulaires entre: C, D" in caplog.text
+
+
+def test_only_changed_formulas_are_parsed_again():
+    graph = QueryGraph()
+    graph.update_all({'A': '1', 'B': 'A'})
+
+    assert graph.update_all({'A': '1', 'B': 'A + 1'}) == {'B'}
+    assert graph.parsed == 3
+    assert graph.update_all({'A': '1'}) == {'B'}
@@ -0,0 +1,91 @@
+import fake_excel
+from scheduler import (SHEETS, VBA, AdaptiveScheduler, ExcelApplicationEvents, SharedScheduler,
+                       VBComponentsEvents)
+from sheet_extractor import DirtyRanges
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_poll_interval_backs_off_and_resets():
+    scheduler = AdaptiveScheduler(min_interval=0.5, max_interval=4.0)
+    for expected in (1.0, 2.0, 4.0, 4.0):
+        scheduler.record_activity(False)
+        assert scheduler.interval == expected
+    scheduler.record_activity(True)
+    assert scheduler.interval == 0.5
+
+
+def test_notify_wakes_up_with_merged_targets():
+    scheduler = AdaptiveScheduler(min_interval=60)
+    scheduler.notify('VBComponent ajouté', {VBA})
+    scheduler.notify('SheetChange', {SHEETS})
+    wakeup = scheduler.wait()
+
+    assert wakeup.reason == 'VBComponent ajouté, SheetChange'
+    assert wakeup.targets == {VBA, SHEETS}
+    assert not wakeup.wants('powerquery')
+
+
+def test_untargeted_notify_scans_everything():
+    scheduler = AdaptiveScheduler(min_interval=60)
+    scheduler.notify('SheetChange', {SHEETS})
+    scheduler.notify('WorkbookAfterSave')
+
+    assert scheduler.wait().targets is None
+
+
+def test_excel_events_record_dirty_ranges():
+    scheduler = AdaptiveScheduler(min_interval=60)
+    dirty = DirtyRanges()
+    wb, _ = fake_excel.build_workbook('classeur.xlsm', modules=0)
+    ws = wb.Worksheets.add('Feuil1')
+    events = fake_excel.FakeEventSource(ExcelApplicationEvents, scheduler=scheduler, dirty=dirty,
+                                        workbook_path=wb.FullName)
+    events.fire('SheetChange', ws, ws.Range('B2:C3'))
+    other, _ = fake_excel.build_workbook('autre.xlsm', modules=0)
+    events.fire('SheetChange', other.Worksheets.add('Feuil1'), ws.Range('A1'))
+
+    assert dirty.take()[0] == {'Feuil1': ['$B$2:$C$3']}
+    assert scheduler.wait().targets == {SHEETS}
+
+
+def test_vbe_events_target_vba():
+    scheduler = AdaptiveScheduler(min_interval=60)
+    events = fake_excel.FakeEventSource(VBComponentsEvents, scheduler=scheduler)
+    events.fire('ItemRenamed', None, 'Module1')
+
+    assert scheduler.wait().targets == {VBA}
+
+
+def test_shared_scheduler_prefers_priority_then_waiting_time():
+    clock = Clock()
+    scheduler = SharedScheduler(clock=clock)
+    scheduler.register('bas', priority=0)
+    scheduler.register('haut', priority=1)
+
+    key, wakeup = scheduler.pick(['bas', 'haut'])
+    assert key == 'haut' and wakeup.reason == 'poll'
+    # Déjà en cours de scan : l'autre classeur passe
+    assert scheduler.pick(['bas', 'haut'])[0] == 'bas'
+
+
+def test_shared_scheduler_backpressure():
+    clock = Clock()
+    scheduler = SharedScheduler(duty_cycle=0.25, clock=clock)
+    scheduler.register('a', min_interval=0.5)
+    scheduler.pick(['a'])
+    clock.now = 1.0
+    # Scan d'une seconde : trois secondes de repos, même sur événement
+    scheduler.done('a', changed=True, duration=1.0)
+    scheduler.notify('a', 'SheetChange')
+
+    key, ready_at = scheduler.pick(['a'])
+    assert key is None and ready_at == 4.0
+    clock.now = 4.0
+    assert scheduler.pick(['a'])[1].reason == 'SheetChange'
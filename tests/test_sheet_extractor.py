@@ -0,0 +1,127 @@
+import fake_excel
+from sheet_extractor import DirtyRanges, SheetsReader
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_workbook():
+    wb, _ = fake_excel.build_workbook('classeur.xlsm', modules=0)
+    data = wb.Worksheets.add('Feuil1')
+    for row in range(1, 6):
+        data.set(row, 1, row)
+        data.set(row, 2, f"=A{row}*2")
+    report = wb.Worksheets.add('Feuil2')
+    report.set(1, 1, '=Feuil1!B4')
+    return wb, data, report
+
+
+def make_reader(wb):
+    clock = Clock()
+    dirty = DirtyRanges()
+    dirty.connected = True
+    reader = SheetsReader(dirty, clock=clock)
+    reader.update(wb)
+    return reader, dirty, clock
+
+
+def fresh(wb):
+    reader = SheetsReader()
+    return {rel: data['text'] for rel, data in reader.update(wb).items()}
+
+
+def texts(snapshot):
+    return {rel: data['text'] for rel, data in snapshot.items()}
+
+
+def test_single_cell_edit_reads_one_range():
+    wb, data, report = make_workbook()
+    reader, dirty, clock = make_reader(wb)
+    data.set(2, 2, '=A2*3')
+    dirty.add('Feuil1', '$B$2')
+    reads = reader.range_reads
+
+    snapshot = reader.update(wb)
+
+    assert reader.range_reads - reads == 1
+    assert 'B2\t=A2*3\n' in snapshot['Feuil1.formulas.txt']['text']
+
+
+def test_partial_insert_with_shift_rereads_every_sheet():
+    wb, data, report = make_workbook()
+    reader, dirty, clock = make_reader(wb)
+    # Insertion de B3 avec décalage vers le bas : Excel réécrit Feuil2!A1
+    for row in (5, 4, 3):
+        data.set(row + 1, 2, data._cells[(row, 2)])
+    data.set(3, 2, '')
+    report.set(1, 1, '=Feuil1!B5')
+    dirty.add('Feuil1', '$B$3')
+
+    snapshot = texts(reader.update(wb))
+
+    assert snapshot['Feuil2.formulas.txt'] == 'A1\t=Feuil1!B5\n'
+    assert snapshot == fresh(wb)
+
+
+def test_whole_row_insert_rereads_every_sheet():
+    wb, data, report = make_workbook()
+    reader, dirty, clock = make_reader(wb)
+    for row in (5, 4):
+        for col in (1, 2):
+            data.set(row + 1, col, data._cells[(row, col)])
+    data.set(4, 1, '')
+    data.set(4, 2, '')
+    report.set(1, 1, '=Feuil1!B5')
+    dirty.add('Feuil1', '$4:$4')
+
+    assert texts(reader.update(wb)) == fresh(wb)
+
+
+def test_renamed_sheet_rereads_every_sheet():
+    wb, data, report = make_workbook()
+    reader, dirty, clock = make_reader(wb)
+    items = wb.Worksheets._items
+    items['Données'] = items.pop('Feuil1')
+    data.Name = 'Données'
+    report.set(1, 1, '=Données!B4')
+
+    snapshot = texts(reader.update(wb))
+
+    assert 'Feuil1.formulas.txt' not in snapshot
+    assert snapshot['Feuil2.formulas.txt'] == 'A1\t=Données!B4\n'
+
+
+def test_save_rereads_every_sheet():
+    wb, data, report = make_workbook()
+    reader, dirty, clock = make_reader(wb)
+    # Couper-coller : seule la destination est signalée
+    report.set(1, 1, '=Feuil1!C9')
+
+    assert texts(reader.update(wb))['Feuil2.formulas.txt'] == 'A1\t=Feuil1!B4\n'
+    dirty.add_meta()
+    assert texts(reader.update(wb))['Feuil2.formulas.txt'] == 'A1\t=Feuil1!C9\n'
+
+
+def test_periodic_full_read_while_connected():
+    wb, data, report = make_workbook()
+    reader, dirty, clock = make_reader(wb)
+    report.set(1, 1, '=Feuil1!C9')
+
+    clock.now = reader.connected_interval - 1
+    assert texts(reader.update(wb))['Feuil2.formulas.txt'] == 'A1\t=Feuil1!B4\n'
+    clock.now = reader.connected_interval
+    assert texts(reader.update(wb))['Feuil2.formulas.txt'] == 'A1\t=Feuil1!C9\n'
+
+
+def test_failed_pass_restores_full_read():
+    dirty = DirtyRanges()
+    dirty.add_meta()
+    taken = dirty.take()
+    assert not dirty.full
+    dirty.restore(taken)
+    assert dirty.full and dirty.names
@@ -0,0 +1,47 @@
+import os
+
+import fake_excel
+import vba_extractor
+from vba_extractor import VBAProjectReader
+
+COMPONENTS = {
+    'ThisWorkbook': {'type': 100, 'code': "Private Sub Workbook_Open()\r\nEnd Sub"},
+    'Module1': {'type': 1, 'code': fake_excel.synthetic_module(0, 40)},
+    # Flux de plus de 4096 octets compressés : hors du mini-flux
+    'Module2': {'type': 1, 'code': fake_excel.synthetic_module(1, 3000)},
+    'Classe1': {'type': 2, 'code': "Option Explicit\r\nPublic Valeur As Long"},
+}
+
+
+def test_extracts_the_same_components_as_the_com_walk(tmp_path):
+    path = str(tmp_path / 'classeur.xlsm')
+    fake_excel.write_xlsm(path, COMPONENTS)
+
+    components = VBAProjectReader(path).get_vba_components()
+
+    assert components == {name: data for name, data in COMPONENTS.items() if data['type'] != 100}
+    assert VBAProjectReader(path, include_documents=True).get_vba_components() == COMPONENTS
+
+
+def test_project_is_parsed_again_only_when_its_zip_entry_changes(tmp_path, monkeypatch):
+    path = str(tmp_path / 'classeur.xlsm')
+    fake_excel.write_xlsm(path, COMPONENTS)
+    parses = []
+    extract = vba_extractor.extract_vba_project
+    monkeypatch.setattr(vba_extractor, 'extract_vba_project', lambda *args: parses.append(1) or extract(*args))
+    reader = VBAProjectReader(path)
+
+    reader.get_vba_components()
+    reader.get_vba_components()
+    # Réenregistré sans modification du projet VBA
+    fake_excel.write_xlsm(path, COMPONENTS)
+    os.utime(path, ns=(0, 10 ** 9))
+    reader.get_vba_components()
+    assert len(parses) == 1
+
+    edited = dict(COMPONENTS, Module1={'type': 1, 'code': COMPONENTS['Module1']['code'] + "\r\n' modifié"})
+    fake_excel.write_xlsm(path, edited)
+    os.utime(path, ns=(0, 2 * 10 ** 9))
+
+    assert reader.get_vba_components()['Module1']['code'].endswith("' modifié")
+    assert len(parses) == 2
@@ -0,0 +1,131 @@
+import os
+import importlib.util
+
+import pytest
+
+import fake_excel
+import vba_importer
+from vba_importer import VBAPatcher, import_order
+
+MODULES = 6
+
+
+@pytest.fixture
+def suspensions(monkeypatch):
+    """Entrées et sorties d'ExcelSuspended, dans l'ordre"""
+    events = []
+
+    class RecordingSuspended(vba_importer.ExcelSuspended):
+        def __enter__(self):
+            events.append('enter')
+            return super().__enter__()
+
+        def __exit__(self, *exc):
+            events.append('exit')
+            return super().__exit__(*exc)
+
+    monkeypatch.setattr(vba_importer, 'ExcelSuspended', RecordingSuspended)
+    return events
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Classeur de MODULES modules exportés dans un dossier, un fichier modifié par module"""
+    counter = fake_excel.ComCallCounter()
+    app = fake_excel.FakeApplication(counter)
+    wb, _ = fake_excel.build_workbook(str(tmp_path / 'classeur.xlsm'), MODULES, lines_per_module=40,
+                                      counter=counter)
+    folder = tmp_path / 'vba'
+    folder.mkdir()
+    paths = []
+    for index in range(MODULES):
+        path = str(folder / f"Module{index + 1}.bas")
+        wb.VBProject.VBComponents(f"Module{index + 1}").Export(path)
+        paths.append(path)
+    patcher = VBAPatcher()
+    patcher.prime(paths)
+    original = {name: code_of(wb, name) for name in component_names(wb)}
+    for path in paths:
+        with open(path, encoding='utf-8', newline='') as f:
+            text = f.read()
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text.replace('Debug.Print 0 + 3', 'Debug.Print 0 + 30', 1))
+    counter.reset()
+    return app, wb, counter, patcher, paths, original
+
+
+def component_names(wb):
+    return list(object.__getattribute__(wb.VBProject.VBComponents, '_items'))
+
+
+def code_of(wb, name):
+    return object.__getattribute__(wb.VBProject.VBComponents, '_items')[name].CodeModule.text()
+
+
+def code_module_calls(counter):
+    return sum(count for member, count in counter.by_member.items() if member.startswith('FakeCodeModule.'))
+
+
+def test_batch_suspends_excel_once_and_patches_in_place(project, suspensions):
+    app, wb, counter, patcher, paths, original = project
+
+    applied = patcher.apply_batch(wb, paths, app)
+
+    assert applied == import_order(paths)
+    assert suspensions == ['enter', 'exit']
+    # Un recalcul par modification sans suspension ; aucun pendant le lot
+    assert app.recalcs == 0
+    assert (app.ScreenUpdating, app.EnableEvents, app.Calculation) == (True, True, -4105)
+    # Par fichier : CountOfLines, Lines de vérification du hunk, ReplaceLine
+    assert code_module_calls(counter) == 3 * MODULES
+    assert counter.by_member.get('FakeVBComponents.Import', 0) == 0
+    assert patcher.patched == MODULES and patcher.imported == 0
+    assert all('Debug.Print 0 + 30' in code_of(wb, f"Module{index + 1}") for index in range(MODULES))
+
+
+def test_failed_batch_rolls_back_every_component(project, suspensions, tmp_path):
+    app, wb, counter, patcher, paths, original = project
+    bodies = dict(patcher.bodies)
+    # Nouveau composant sans Attribute VB_Name : l'import échoue, en dernier dans l'ordre du lot
+    broken = str(tmp_path / 'vba' / 'Zzz.bas')
+    with open(broken, 'w', encoding='utf-8', newline='') as f:
+        f.write("Sub Cassé(\r\n")
+
+    applied = patcher.apply_batch(wb, paths + [broken], app)
+
+    assert applied == []
+    assert suspensions == ['enter', 'exit']
+    assert (app.ScreenUpdating, app.EnableEvents, app.Calculation) == (True, True, -4105)
+    assert sorted(component_names(wb)) == sorted(original)
+    assert {name: code_of(wb, name) for name in original} == original
+    assert patcher.bodies == bodies
+
+
+def test_local_files_monitor_bulk_path_uses_one_batch(project, suspensions):
+    pytest.importorskip('watchdog')
+    app, wb, counter, patcher, paths, original = project
+    spec = importlib.util.spec_from_file_location(
+        'local_files_monitor', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'local-files-monitor.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monitor = module.LocalFilesMonitor(wb.FullName, os.path.dirname(paths[0]))
+    monitor.excel, monitor.wb, monitor.patcher = app, wb, patcher
+
+    imported = monitor.import_batch(paths)
+
+    assert sorted(imported) == sorted(paths)
+    assert suspensions == ['enter', 'exit']
+    assert code_module_calls(counter) == 3 * MODULES
+
+
+def test_vbe_edit_with_the_same_line_count_is_not_left_behind(project):
+    app, wb, counter, patcher, paths, original = project
+    module = object.__getattribute__(wb.VBProject.VBComponents, '_items')['Module1'].CodeModule
+    # Édition dans le VBE, ailleurs que dans le hunk du fichier, sans changer le nombre de lignes
+    module.set_text(module.text().replace('Debug.Print 1 + 5', 'Debug.Print 1 + 50', 1))
+
+    assert patcher.apply(wb, paths[0])
+
+    with open(paths[0], encoding='utf-8', newline='') as f:
+        body = vba_importer.split_module_file(f.read())[1]
+    assert code_of(wb, 'Module1') == '\r\n'.join(body)
@@ -0,0 +1,110 @@
+import os
+
+import fake_excel
+from scheduler import AdaptiveScheduler, VBA, VBComponentsEvents, Wakeup
+from vba_monitor import ExcelVBAMonitor
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_monitor(tmp_path, modules=200, staleness=30.0):
+    wb, counter = fake_excel.build_workbook(str(tmp_path / 'classeur.xlsm'), modules)
+    clock = Clock()
+    monitor = ExcelVBAMonitor(wb.FullName, export_path=str(tmp_path / 'macros_export'), staleness=staleness,
+                              clock=clock)
+    monitor.wb = wb
+    monitor.start_session()
+    counter.reset()
+    return monitor, wb, counter, clock
+
+
+def edit_in_place(wb, name='Module1'):
+    """Même nombre de lignes, mêmes procédures : l'empreinte ne change pas"""
+    module = wb.VBProject.VBComponents(name).CodeModule
+    module.ReplaceLine(4, module.Lines(4, 1) + "  ' modifié")
+
+
+def exported(monitor, name='Module1'):
+    with open(os.path.join(monitor.export_path, f"{name}.bas"), encoding='utf-8') as f:
+        return "' modifié" in f.read()
+
+
+def test_same_line_count_edit_is_exported_within_staleness(tmp_path):
+    monitor, wb, counter, clock = make_monitor(tmp_path, modules=200, staleness=30.0)
+    monitor.poll()
+    edit_in_place(wb)
+
+    while not exported(monitor):
+        assert clock.now <= monitor.staleness
+        clock.now += 0.5
+        monitor.poll()
+
+
+def test_rotation_is_sized_from_the_staleness_bound(tmp_path):
+    monitor, wb, counter, clock = make_monitor(tmp_path, modules=200, staleness=30.0)
+    polls = 60
+    for _ in range(polls):
+        clock.now += 0.5
+        monitor.poll()
+
+    # 200 modules en 30 s, un poll toutes les 0,5 s : environ 4 lectures par poll
+    assert counter.by_member['FakeCodeModule.Lines'] <= polls * 4
+    assert all(clock.now - verified <= 30.0 for verified in monitor.verified.values())
+
+
+def test_slow_polls_verify_everything_overdue(tmp_path):
+    monitor, wb, counter, clock = make_monitor(tmp_path, modules=50, staleness=30.0)
+    edit_in_place(wb, 'Module7')
+    counter.reset()
+    clock.now += 30.0
+    monitor.poll()
+
+    assert counter.by_member['FakeCodeModule.Lines'] == 50
+    assert exported(monitor, 'Module7')
+
+
+def test_save_forces_full_verification(tmp_path):
+    monitor, wb, counter, clock = make_monitor(tmp_path)
+    monitor.poll()
+    edit_in_place(wb, 'Module150')
+    clock.now += 0.5
+    monitor.request_verification(Wakeup('SheetChange, WorkbookAfterSave'))
+    monitor.poll()
+
+    assert exported(monitor, 'Module150')
+
+
+def test_vbe_activation_forces_full_verification(tmp_path):
+    monitor, wb, counter, clock = make_monitor(tmp_path)
+    monitor.poll()
+    scheduler = AdaptiveScheduler(min_interval=60)
+    events = fake_excel.FakeEventSource(VBComponentsEvents, scheduler=scheduler)
+    edit_in_place(wb, 'Module99')
+    events.fire('ItemActivated', wb.VBProject.VBComponents('Module99'))
+    wakeup = scheduler.wait()
+    assert wakeup.wants(VBA)
+
+    clock.now += 0.5
+    monitor.request_verification(wakeup)
+    monitor.poll()
+    assert exported(monitor, 'Module99')
+
+
+def test_monitor_poll_never_sleeps_past_staleness(tmp_path):
+    monitor, *_ = make_monitor(tmp_path, modules=1, staleness=20.0)
+
+    assert monitor.scheduler.max_interval == 20.0
+
+
+def test_engine_poll_respects_vba_staleness(tmp_path):
+    from engine import ExtractionEngine
+
+    engine = ExtractionEngine(str(tmp_path / 'classeur.xlsm'), targets=(VBA,))
+
+    assert engine.scheduler.max_interval == engine.extractors[0].monitor.staleness
@@ -0,0 +1,82 @@
+import os
+
+from version_store import VersionStore, apply_delta, combine_sinks, make_delta
+
+
+def test_delta_roundtrip():
+    base = b''.join(b"ligne %d\r\n" % n for n in range(100))
+    data = base.replace(b"ligne 50\r\n", b"ligne cinquante\r\n") + b"fin"
+    delta = make_delta(base, data)
+
+    assert apply_delta(base, delta) == data
+    assert len(delta) < len(data) // 4
+
+
+def test_revisions_are_deduplicated_and_readable(tmp_path):
+    store = VersionStore(str(tmp_path / 'versions'))
+    module = str(tmp_path / 'Module1.bas')
+    first = b''.join(b"Debug.Print %d\r\n" % n for n in range(500))
+    second = first + b"Debug.Print 500\r\n"
+
+    a = store.record(store.artifact(module), first, ts=1)
+    b = store.record(store.artifact(module), second, ts=2)
+    assert store.record(store.artifact(module), second, ts=3) is None
+    # Même contenu dans un autre fichier : aucun nouvel objet
+    store.record(store.artifact(str(tmp_path / 'Copie.bas')), first, ts=4)
+
+    assert store.stored == 2 and store.deduplicated == 2
+    assert store.depth(b) == 1
+    assert store.read(a) == first and store.read(b) == second
+    assert store.at(store.find('Module1.bas'), 1.5) == first
+
+
+def test_removed_files_and_restore(tmp_path):
+    store = VersionStore(str(tmp_path / 'versions'))
+    path = tmp_path / 'Requête.m'
+    artifact = store.artifact(str(path))
+    store.record(artifact, b'v1', ts=1)
+    store.record(artifact, None, ts=2)
+
+    assert store.at(artifact, 3) is None
+    store.restore(artifact, 1)
+    assert path.read_bytes() == b'v1'
+
+
+def test_index_is_reloaded(tmp_path):
+    root = str(tmp_path / 'versions')
+    store = VersionStore(root)
+    store.record('a.m', b'v1', ts=1)
+    store.record('a.m', b'v2', ts=2)
+
+    assert [digest for _, digest in VersionStore(root).versions('a.m')] == \
+        [digest for _, digest in store.versions('a.m')]
+
+
+def test_compaction_keeps_latest_revisions_readable(tmp_path):
+    store = VersionStore(str(tmp_path / 'versions'), keep_all_days=1, keep_days=2)
+    day = 86400
+    texts = [b''.join(b"%d-%d\n" % (version, n) if n == version else b"%d\n" % n for n in range(200))
+             for version in range(10)]
+    for version, text in enumerate(texts):
+        store.record('a.m', text, ts=version * day / 2)
+    now = 10 * day / 2
+
+    assert store.compact(now) > 0
+    for ts, digest in store.versions('a.m'):
+        assert store.read(digest) == texts[int(ts * 2 / day)]
+    assert store.latest('a.m') and store.read(store.latest('a.m')) == texts[-1]
+    assert len(os.listdir(store.objects_path)) >= 1
+
+
+def test_combine_sinks():
+    class Sink:
+        def __init__(self):
+            self.seen = []
+
+        def submit(self, written=(), removed=()):
+            self.seen.append((list(written), list(removed)))
+
+    a, b = Sink(), Sink()
+    assert combine_sinks(None, a) is a
+    combine_sinks(a, None, b).submit(['x'], ['y'])
+    assert a.seen[-1] == b.seen[-1] == (['x'], ['y'])
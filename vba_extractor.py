@@ -0,0 +1,361 @@
+import os
+import re
+import sys
+import time
+import codecs
+import struct
+import logging
+import zipfile
+
+# Extraction des macros VBA sans Excel : le .xlsm est un zip, xl/vbaProject.bin
+# est un fichier composé OLE (MS-CFB) dont les flux de modules sont compressés
+# selon MS-OVBA. Aucune dépendance Windows, fonctionne sous Linux.
+
+VBA_PROJECT_PART = 'xl/vbaProject.bin'
+
+CFB_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+FREESECT = 0xFFFFFFFF
+ENDOFCHAIN = 0xFFFFFFFE
+NOSTREAM = 0xFFFFFFFF
+
+# Types de composants tels que renvoyés par VBComponent.Type
+VBEXT_CT_STDMODULE = 1
+VBEXT_CT_CLASSMODULE = 2
+VBEXT_CT_MSFORM = 3
+VBEXT_CT_DOCUMENT = 100
+
+ATTRIBUTE_LINE = re.compile(r'^Attribute\s', re.IGNORECASE)
+
+
+class VBAExtractionError(Exception):
+    pass
+
+
+class CompoundFile:
+    """Lecteur minimal de fichier composé OLE (MS-CFB), en lecture seule"""
+
+    def __init__(self, data):
+        if data[:8] != CFB_SIGNATURE:
+            raise VBAExtractionError("Signature OLE invalide")
+        self.data = data
+        (sector_shift, mini_shift) = struct.unpack_from('<HH', data, 0x1E)
+        self.sector_size = 1 << sector_shift
+        self.mini_sector_size = 1 << mini_shift
+        (num_fat, first_dir, _, self.mini_cutoff,
+         first_minifat, num_minifat, first_difat, num_difat) = struct.unpack_from('<IIIIIIII', data, 0x2C)
+
+        self.fat = self._read_fat(num_fat, first_difat, num_difat)
+        self.entries = self._read_directory(first_dir)
+        root = self.entries[0]
+        self.mini_stream = self._read_chain(root['start'], root['size'])
+        self.minifat = []
+        if num_minifat and first_minifat != ENDOFCHAIN:
+            raw = self._read_chain(first_minifat)
+            self.minifat = list(struct.unpack('<%dI' % (len(raw) // 4), raw))
+
+    def _sector(self, index):
+        offset = (index + 1) * self.sector_size
+        return self.data[offset:offset + self.sector_size]
+
+    def _read_fat(self, num_fat, first_difat, num_difat):
+        difat = list(struct.unpack_from('<109I', self.data, 0x4C))
+        per_sector = self.sector_size // 4 - 1
+        sector = first_difat
+        for _ in range(num_difat):
+            if sector in (ENDOFCHAIN, FREESECT):
+                break
+            values = struct.unpack('<%dI' % (per_sector + 1), self._sector(sector))
+            difat.extend(values[:per_sector])
+            sector = values[per_sector]
+        fat = []
+        for sector in difat[:num_fat]:
+            if sector == FREESECT:
+                continue
+            fat.extend(struct.unpack('<%dI' % (self.sector_size // 4), self._sector(sector)))
+        return fat
+
+    def _read_chain(self, start, size=None):
+        chunks = []
+        sector = start
+        seen = 0
+        while sector not in (ENDOFCHAIN, FREESECT):
+            if sector >= len(self.fat) or seen > len(self.fat):
+                raise VBAExtractionError("Chaîne de secteurs corrompue")
+            chunks.append(self._sector(sector))
+            sector = self.fat[sector]
+            seen += 1
+        data = b''.join(chunks)
+        return data if size is None else data[:size]
+
+    def _read_mini_chain(self, start, size):
+        chunks = []
+        sector = start
+        seen = 0
+        while sector not in (ENDOFCHAIN, FREESECT):
+            if sector >= len(self.minifat) or seen > len(self.minifat):
+                raise VBAExtractionError("Chaîne de mini-secteurs corrompue")
+            offset = sector * self.mini_sector_size
+            chunks.append(self.mini_stream[offset:offset + self.mini_sector_size])
+            sector = self.minifat[sector]
+            seen += 1
+        return b''.join(chunks)[:size]
+
+    def _read_directory(self, first_dir):
+        raw = self._read_chain(first_dir)
+        entries = []
+        for offset in range(0, len(raw) - 127, 128):
+            name_len, = struct.unpack_from('<H', raw, offset + 64)
+            name = raw[offset:offset + max(name_len - 2, 0)].decode('utf-16-le', errors='replace')
+            entry_type = raw[offset + 66]
+            left, right, child = struct.unpack_from('<III', raw, offset + 68)
+            start, size = struct.unpack_from('<IQ', raw, offset + 116)
+            if self.sector_size == 512:
+                size &= 0xFFFFFFFF
+            entries.append({
+                'name': name, 'type': entry_type, 'left': left, 'right': right,
+                'child': child, 'start': start, 'size': size,
+            })
+        return entries
+
+    def _children(self, index):
+        """Enfants d'un stockage (parcours de l'arbre rouge-noir des frères)"""
+        children = {}
+        stack = [self.entries[index]['child']]
+        while stack:
+            current = stack.pop()
+            if current == NOSTREAM or current >= len(self.entries):
+                continue
+            entry = self.entries[current]
+            children[entry['name'].upper()] = current
+            stack.append(entry['left'])
+            stack.append(entry['right'])
+        return children
+
+    def find(self, path):
+        index = 0
+        for part in path.split('/'):
+            index = self._children(index).get(part.upper())
+            if index is None:
+                return None
+        return index
+
+    def open_stream(self, path):
+        index = self.find(path)
+        if index is None:
+            raise VBAExtractionError(f"Flux introuvable: {path}")
+        entry = self.entries[index]
+        if entry['size'] < self.mini_cutoff:
+            return self._read_mini_chain(entry['start'], entry['size'])
+        return self._read_chain(entry['start'], entry['size'])
+
+    def exists(self, path):
+        return self.find(path) is not None
+
+
+def decompress(data, offset=0):
+    """Décompression d'un CompressedContainer MS-OVBA (section 2.4.1)"""
+    if offset >= len(data) or data[offset] != 0x01:
+        raise VBAExtractionError("Signature de conteneur compressé invalide")
+    out = bytearray()
+    pos = offset + 1
+    end = len(data)
+    while pos < end - 1:
+        header, = struct.unpack_from('<H', data, pos)
+        chunk_end = min(pos + (header & 0x0FFF) + 3, end)
+        pos += 2
+        if not header & 0x8000:
+            out += data[pos:pos + 4096]
+            pos += 4096
+            continue
+        chunk_start = len(out)
+        while pos < chunk_end:
+            flags = data[pos]
+            pos += 1
+            for bit in range(8):
+                if pos >= chunk_end:
+                    break
+                if not flags & (1 << bit):
+                    out.append(data[pos])
+                    pos += 1
+                    continue
+                token, = struct.unpack_from('<H', data, pos)
+                pos += 2
+                difference = len(out) - chunk_start
+                bit_count = max((difference - 1).bit_length(), 4)
+                length_mask = 0xFFFF >> bit_count
+                length = (token & length_mask) + 3
+                copy_offset = (token >> (16 - bit_count)) + 1
+                source = len(out) - copy_offset
+                if source < 0:
+                    raise VBAExtractionError("Jeton de copie hors limites")
+                # Copie éventuellement chevauchante : motif de copy_offset octets répété
+                segment = out[source:source + length]
+                if copy_offset < length:
+                    segment = (segment * (length // copy_offset + 1))[:length]
+                out += segment
+        pos = chunk_end
+    return bytes(out)
+
+
+def parse_dir_stream(data):
+    """Retourne (encodage, [modules]) à partir du flux VBA/dir décompressé"""
+    codepage = 1252
+    modules = []
+    current = None
+    pos = 0
+    while pos + 6 <= len(data):
+        record_id, size = struct.unpack_from('<HI', data, pos)
+        pos += 6
+        if record_id == 0x0009:
+            # PROJECTVERSION : la taille annoncée (4) ignore MinorVersion
+            size = 6
+        value = data[pos:pos + size]
+        pos += size
+        if record_id == 0x0003:
+            codepage, = struct.unpack('<H', value[:2])
+        elif record_id == 0x0019:
+            current = {'name': value, 'stream': None, 'offset': 0, 'procedural': True}
+            modules.append(current)
+        elif current is None:
+            if record_id == 0x0010:
+                break
+        elif record_id == 0x0047:
+            current['name_unicode'] = value.decode('utf-16-le', errors='replace')
+        elif record_id == 0x001A:
+            current['stream'] = value
+        elif record_id == 0x0032:
+            current['stream_unicode'] = value.decode('utf-16-le', errors='replace')
+        elif record_id == 0x0031:
+            current['offset'], = struct.unpack('<I', value[:4])
+        elif record_id == 0x0021:
+            current['procedural'] = True
+        elif record_id == 0x0022:
+            current['procedural'] = False
+        elif record_id == 0x0010:
+            break
+    encoding = _codepage_encoding(codepage)
+    for module in modules:
+        module['name'] = module.pop('name_unicode', None) or module['name'].decode(encoding, errors='replace')
+        stream = module.pop('stream_unicode', None)
+        if not stream and module['stream'] is not None:
+            stream = module['stream'].decode(encoding, errors='replace')
+        module['stream'] = stream or module['name']
+    return encoding, modules
+
+
+def _codepage_encoding(codepage):
+    encoding = 'utf-8' if codepage == 65001 else f'cp{codepage}'
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        encoding = 'cp1252'
+    return encoding
+
+
+def parse_project_stream(data, encoding):
+    """Types de modules déclarés dans le flux PROJECT (Module=, Class=, BaseClass=, Document=)"""
+    kinds = {
+        'module': VBEXT_CT_STDMODULE,
+        'class': VBEXT_CT_CLASSMODULE,
+        'baseclass': VBEXT_CT_MSFORM,
+        'document': VBEXT_CT_DOCUMENT,
+    }
+    types = {}
+    for line in data.decode(encoding, errors='replace').splitlines():
+        key, sep, value = line.partition('=')
+        kind = kinds.get(key.strip().lower())
+        if not sep or kind is None:
+            continue
+        types[value.split('/')[0].strip()] = kind
+    return types
+
+
+def strip_attributes(source):
+    """Retire les lignes Attribute, invisibles dans CodeModule.Lines"""
+    lines = source.splitlines()
+    code = '\r\n'.join(line for line in lines if not ATTRIBUTE_LINE.match(line))
+    return code
+
+
+def extract_vba_project(data, include_documents=False):
+    """Extrait {nom: {'type', 'code'}} d'un contenu vbaProject.bin"""
+    ole = CompoundFile(data)
+    encoding, modules = parse_dir_stream(decompress(ole.open_stream('VBA/dir')))
+    declared = {}
+    if ole.exists('PROJECT'):
+        declared = parse_project_stream(ole.open_stream('PROJECT'), encoding)
+
+    components = {}
+    for module in modules:
+        name = module['name']
+        comp_type = declared.get(name)
+        if comp_type is None:
+            comp_type = VBEXT_CT_STDMODULE if module['procedural'] else VBEXT_CT_CLASSMODULE
+        # Même filtrage que get_vba_components : on ignore les modules de document
+        if comp_type == VBEXT_CT_DOCUMENT and not include_documents:
+            continue
+        stream = ole.open_stream(f"VBA/{module['stream']}")
+        source = decompress(stream, module['offset']).decode(encoding, errors='replace')
+        components[name] = {
+            'type': comp_type,
+            'code': strip_attributes(source)
+        }
+    return components
+
+
+class VBAProjectReader:
+    """Lecture hors-ligne des composants VBA d'un classeur .xlsm, avec cache"""
+
+    def __init__(self, excel_path, include_documents=False):
+        self.excel_path = os.path.abspath(excel_path)
+        self.include_documents = include_documents
+        self._stat_key = None
+        self._entry_key = None
+        self._components = {}
+
+    def get_vba_components(self):
+        """Même contrat que ExcelVBAMonitor.get_vba_components, sans COM"""
+        stat = os.stat(self.excel_path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._stat_key:
+            return self._components
+
+        with zipfile.ZipFile(self.excel_path) as archive:
+            try:
+                info = archive.getinfo(VBA_PROJECT_PART)
+            except KeyError:
+                raise VBAExtractionError(f"Pas de projet VBA dans {self.excel_path}")
+            entry_key = (info.CRC, info.file_size)
+            # Le classeur a été réenregistré mais le projet VBA n'a pas bougé
+            if entry_key != self._entry_key:
+                self._components = extract_vba_project(archive.read(info), self.include_documents)
+                self._entry_key = entry_key
+                for name, data in self._components.items():
+                    logging.debug(f"Composant extrait: {name} (Type: {data['type']})")
+        self._stat_key = stat_key
+        return self._components
+
+
+def export_components(components, export_path):
+    """Écrit les composants extraits dans le dossier d'export"""
+    os.makedirs(export_path, exist_ok=True)
+    for name, data in components.items():
+        file_ext = {1: '.bas', 2: '.cls', 3: '.frm'}.get(data['type'], '.txt')
+        file_path = os.path.join(export_path, f"{name}{file_ext}")
+        with open(file_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(data['code'])
+        logging.info(f"Composant exporté: {file_path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python vba_extractor.py chemin_vers_fichier.xlsm [dossier_export]")
+        sys.exit(1)
+
+    excel_path = os.path.abspath(sys.argv[1])
+    export_path = sys.argv[2] if len(sys.argv) == 3 else os.path.join(os.path.dirname(excel_path), 'macros_export')
+    start = time.perf_counter()
+    components = VBAProjectReader(excel_path).get_vba_components()
+    export_components(components, export_path)
+    logging.info(f"{len(components)} composants extraits en {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,329 @@
+import os
+import re
+import time
+import shutil
+import difflib
+import logging
+import tempfile
+
+from export_manifest import content_digest, file_digest
+from metrics import METRICS
+from origin_index import DISK, component_key, path_key
+
+# Import de fichiers .bas/.cls/.frm dans le projet VBA d'un classeur ouvert,
+# partagé par les surveillances de dossier et la synchronisation bidirectionnelle.
+
+SUPPORTED_EXTENSIONS = ('.bas', '.cls', '.frm')
+
+XL_CALCULATION_MANUAL = -4135
+# Classes et formulaires avant les modules qui les utilisent
+EXTENSION_ORDER = {'.cls': 0, '.frm': 1, '.bas': 2}
+TYPE_REFERENCE = re.compile(r'\b(?:Implements|As\s+New|As)\s+(\w+)', re.IGNORECASE)
+
+
+def import_vba_component(wb, file_path, origins=None):
+    """Remplace (ou ajoute) le composant correspondant au fichier.
+
+    Si un index d'origine est fourni, le contenu importé y est enregistré
+    pour que le sens Excel -> disque ne le réexporte pas.
+    """
+    try:
+        file_name = os.path.basename(file_path)
+        name, ext = os.path.splitext(file_name)
+
+        if ext.lower() not in ['.bas', '.cls', '.frm', '.frx']:
+            logging.warning(f"Extension non supportée: {ext}")
+            return False
+
+        components = wb.VBProject.VBComponents
+        # Supprimer le composant s'il existe déjà
+        try:
+            existing_comp = components(name)
+            components.Remove(existing_comp)
+        except:
+            pass
+
+        # Importer le nouveau composant
+        with METRICS.timer('com.Import'):
+            components.Import(file_path)
+        logging.info(f"Composant {name} importé avec succès")
+
+        if origins is not None:
+            origins.record(path_key(file_path), file_digest(file_path), DISK)
+            module = components(name).CodeModule
+            count = module.CountOfLines
+            code = module.Lines(1, count) if count > 0 else ''
+            origins.record(component_key(name), content_digest(code), DISK)
+        return True
+
+    except Exception as e:
+        logging.error(f"Erreur lors de l'import de {file_path}: {str(e)}")
+        return False
+
+
+def component_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def import_order(paths):
+    """Ordre d'application d'un lot : un composant après ceux du lot qu'il
+    référence (Implements, As [New] Type), puis classes, formulaires et modules"""
+    by_name = {component_name(path).lower(): path for path in paths}
+    depends = {}
+    for name, path in by_name.items():
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                references = {match.lower() for match in TYPE_REFERENCE.findall(f.read())}
+        except OSError:
+            references = set()
+        depends[name] = (references & set(by_name)) - {name}
+
+    def rank(name):
+        return EXTENSION_ORDER.get(os.path.splitext(by_name[name])[1].lower(), 3), name
+
+    ordered = []
+    remaining = dict(depends)
+    while remaining:
+        ready = [name for name, needs in remaining.items() if not needs & set(remaining)]
+        # Dépendance circulaire : on la casse dans l'ordre par défaut
+        name = min(ready or remaining, key=rank)
+        ordered.append(by_name[name])
+        del remaining[name]
+    return ordered
+
+
+class ExcelSuspended:
+    """Suspend affichage, événements et recalcul le temps d'un lot, et rétablit
+    l'état d'origine même en cas d'erreur"""
+
+    SETTINGS = (('ScreenUpdating', False), ('EnableEvents', False), ('Calculation', XL_CALCULATION_MANUAL))
+
+    def __init__(self, excel):
+        self.excel = excel
+        self.saved = []
+
+    def __enter__(self):
+        if self.excel is None:
+            return self
+        for name, value in self.SETTINGS:
+            try:
+                self.saved.append((name, getattr(self.excel, name)))
+                setattr(self.excel, name, value)
+            except Exception as e:
+                logging.warning(f"Impossible de modifier {name}: {e}")
+        return self
+
+    def __exit__(self, *exc):
+        for name, value in reversed(self.saved):
+            try:
+                setattr(self.excel, name, value)
+            except Exception as e:
+                logging.error(f"Impossible de rétablir {name}: {e}")
+        self.saved = []
+        return False
+
+
+def split_module_file(text):
+    """Sépare l'en-tête d'un fichier exporté (VERSION/BEGIN...END, Attribute)
+    du code visible dans le CodeModule. Retourne (en-tête, lignes de code)."""
+    lines = text.split('\r\n') if '\r\n' in text else text.split('\n')
+    index = 0
+    if lines and lines[0].upper().startswith('VERSION '):
+        depth = 0
+        for index in range(1, len(lines)):
+            word = lines[index].strip().split(' ')[0].upper()
+            if word in ('BEGIN', 'BEGINPROPERTY'):
+                depth += 1
+            elif word in ('END', 'ENDPROPERTY'):
+                depth -= 1
+                if depth == 0:
+                    break
+        index += 1
+    while index < len(lines) and lines[index].startswith('Attribute '):
+        index += 1
+    header = '\r\n'.join(lines[:index])
+    body = lines[index:]
+    while body and body[-1] == '':
+        body.pop()
+    return header, body
+
+
+def diff_hunks(old, new):
+    """Hunks (début, fin dans old, lignes de remplacement) pour passer de old à new"""
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    old_middle = old[prefix:len(old) - suffix]
+    new_middle = new[prefix:len(new) - suffix]
+    if not old_middle and not new_middle:
+        return []
+    matcher = difflib.SequenceMatcher(None, old_middle, new_middle, autojunk=False)
+    return [(prefix + i1, prefix + i2, new_middle[j1:j2])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def apply_hunks(module, hunks):
+    """Applique les hunks du bas vers le haut pour garder les numéros de ligne valides"""
+    for start, end, replacement in reversed(hunks):
+        removed = end - start
+        if removed == len(replacement) and removed <= 3:
+            for offset, line in enumerate(replacement):
+                module.ReplaceLine(start + offset + 1, line)
+            continue
+        if removed:
+            module.DeleteLines(start + 1, removed)
+        if replacement:
+            module.InsertLines(start + 1, '\r\n'.join(replacement))
+
+
+class VBAPatcher:
+    """Applique les modifications d'un fichier par hunks dans le CodeModule
+    existant ; Remove + Import seulement pour un nouveau composant ou un
+    en-tête (attributs, VERSION/BEGIN) modifié"""
+
+    def __init__(self, origins=None):
+        self.origins = origins
+        self.headers = {}
+        self.bodies = {}
+        self.patched = 0
+        self.imported = 0
+
+    def prime(self, paths):
+        """Mémorise en-têtes et code des fichiers exportés, identiques aux composants"""
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+                    header, body = split_module_file(f.read())
+            except OSError:
+                continue
+            self.headers[self._key(path)] = header
+            self.bodies[self._key(path)] = body
+
+    def _key(self, path):
+        return component_name(path).lower()
+
+    def apply_batch(self, wb, paths, excel=None):
+        """Applique un lot en une transaction : Excel suspendu (ExcelSuspended),
+        composants sauvegardés avant modification, et tout le lot annulé si un
+        seul fichier échoue. Retourne les fichiers appliqués ([] si annulé)."""
+        ordered = import_order(paths)
+        backup_dir = tempfile.mkdtemp(prefix='vba_backup_')
+        applied = []
+        start = time.perf_counter()
+        try:
+            with ExcelSuspended(excel), METRICS.timer('com.bulk_import'):
+                for path in ordered:
+                    key = self._key(path)
+                    backup = (self.backup_component(wb, component_name(path), backup_dir),
+                              self.headers.get(key), self.bodies.get(key))
+                    applied.append((path, backup))
+                    if not self.apply(wb, path):
+                        raise RuntimeError(f"échec de l'import de {path}")
+        except Exception as e:
+            logging.error(f"Lot de {len(ordered)} fichier(s) annulé ({e})")
+            self.rollback(wb, applied)
+            return []
+        finally:
+            shutil.rmtree(backup_dir, ignore_errors=True)
+        logging.info(f"Lot de {len(ordered)} fichier(s) appliqué en {time.perf_counter() - start:.2f}s")
+        return ordered
+
+    def backup_component(self, wb, name, backup_dir):
+        """('new',) si le composant n'existe pas, ('file', export) pour un
+        module, classe ou formulaire, ('code', texte) pour un module de document"""
+        try:
+            component = wb.VBProject.VBComponents(name)
+        except Exception:
+            return ('new',)
+        if component.Type == 100:
+            module = component.CodeModule
+            count = module.CountOfLines
+            return ('code', module.Lines(1, count) if count > 0 else '')
+        extension = {2: '.cls', 3: '.frm'}.get(component.Type, '.bas')
+        path = os.path.join(backup_dir, name + extension)
+        component.Export(path)
+        return ('file', path)
+
+    def rollback(self, wb, applied):
+        """Rétablit les composants du lot dans l'ordre inverse"""
+        components = wb.VBProject.VBComponents
+        for path, (backup, header, body) in reversed(applied):
+            name = component_name(path)
+            key = self._key(path)
+            try:
+                if backup[0] == 'code':
+                    module = components(name).CodeModule
+                    count = module.CountOfLines
+                    if count:
+                        module.DeleteLines(1, count)
+                    if backup[1]:
+                        module.InsertLines(1, backup[1])
+                else:
+                    try:
+                        components.Remove(components(name))
+                    except Exception:
+                        pass
+                    if backup[0] == 'file':
+                        components.Import(backup[1])
+            except Exception as e:
+                logging.error(f"Erreur lors de la restauration de {name}: {e}")
+            if header is None:
+                self.headers.pop(key, None)
+                self.bodies.pop(key, None)
+            else:
+                self.headers[key] = header
+                self.bodies[key] = body
+
+    def apply(self, wb, file_path):
+        key = self._key(file_path)
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+                header, body = split_module_file(f.read())
+        except OSError as e:
+            logging.error(f"Erreur lecture {file_path}: {e}")
+            return False
+
+        patchable = (self.headers.get(key) == header
+                     and not any(line.startswith('Attribute ') for line in body))
+        if patchable and self.patch(wb, file_path, body):
+            self.bodies[key] = body
+            return True
+        if import_vba_component(wb, file_path, self.origins):
+            self.headers[key] = header
+            self.bodies[key] = body
+            self.imported += 1
+            return True
+        return False
+
+    def patch(self, wb, file_path, body):
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        try:
+            module = wb.VBProject.VBComponents(name).CodeModule
+        except Exception:
+            # Nouveau composant : import complet
+            return False
+        try:
+            # Hunks calculés sur le contenu actuel du CodeModule, relu en un
+            # appel : une édition dans le VBE à nombre de lignes constant
+            # ferait diverger le classeur et le fichier
+            count = module.CountOfLines
+            current = module.Lines(1, count).split('\r\n') if count > 0 else []
+            previous = self.bodies.get(self._key(file_path))
+            if previous is not None and current != previous:
+                logging.info(f"Composant {name} modifié dans le VBE depuis son export : hunks recalculés")
+            hunks = diff_hunks(current, body)
+            with METRICS.timer('com.patch'):
+                apply_hunks(module, hunks)
+        except Exception as e:
+            logging.error(f"Erreur lors du patch de {name}, import complet: {e}")
+            return False
+        logging.info(f"Composant {name} mis à jour en place ({len(hunks)} hunk(s))")
+        self.patched += 1
+        if self.origins is not None:
+            self.origins.record(path_key(file_path), file_digest(file_path), DISK)
+            self.origins.record(component_key(name), content_digest('\r\n'.join(body)), DISK)
+        return True
@@ -1,187 +1,313 @@
-import win32com.client
+import pythoncom
 import os
+import math
 import time
 import sys
 import logging
+import threading
 from datetime import datetime
+from export_manifest import ExportManifest, content_digest
+from export_writer import ExportWriter
+from metrics import METRICS
+from origin_index import EXCEL, OriginIndex, component_key
+from scheduler import AdaptiveScheduler, VBA, attach_excel_events
+from log_setup import configure_logging
+from com_session import COMSession, CircuitOpen, WorkbookClosed
+
+# Réveils après lesquels tous les composants sont relus intégralement :
+# enregistrement du classeur, activation d'un composant dans le VBE
+FULL_VERIFY_REASONS = ('WorkbookBeforeSave', 'WorkbookAfterSave', 'VBComponent activé')
+
 
 class ExcelVBAMonitor:
-    def __init__(self, excel_path):
+    def __init__(self, excel_path, origins=None, committer=None, export_path=None, staleness=30.0,
+                 clock=time.monotonic):
+        """staleness : chaque composant est relu intégralement au moins toutes
+        les staleness secondes, même si son empreinte n'a pas changé"""
         self.excel_path = os.path.abspath(excel_path)
-        self.export_path = os.path.join(os.path.dirname(self.excel_path), 'macros_export')
+        self.export_path = os.path.abspath(export_path or os.path.join(os.path.dirname(self.excel_path), 'macros_export'))
         self.excel = None
         self.wb = None
         self.previous_components = {}
         self.last_known_components = {}
+        self.unexported_components = {}
+        # Vérification tournante : nom -> instant de la dernière lecture complète
+        self.staleness = staleness
+        self.clock = clock
+        self.verified = {}
+        self.verify_names = set()
+        self.verify_all = False
+        self.last_scan = None
+        # Le poll de secours ne dort jamais plus longtemps que staleness
+        self.scheduler = AdaptiveScheduler(max_interval=staleness, pump=pythoncom.PumpWaitingMessages)
+        self.event_handlers = []
+        self.session = None
+        # Partagé avec le sens disque -> Excel en synchronisation bidirectionnelle
+        self.origins = origins or OriginIndex()
+        self.opened = threading.Event()
         self.setup_logging()
         os.makedirs(self.export_path, exist_ok=True)
-        self.cleanup_old_files()
+        self.manifest = ExportManifest(self.export_path).load()
+        # Commits git des exports (GitCommitter), alimentés à chaque flush
+        self.committer = committer
+        self.writer = ExportWriter(self.manifest, origins=self.origins, origin=EXCEL,
+                                   on_change=committer.submit if committer else None)
 
     def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(message)s',
-            handlers=[
-                logging.FileHandler('macro_monitor.log'),
-                logging.StreamHandler()
-            ]
-        )
+        configure_logging('macro_monitor.log')
+
+    def component_fingerprint(self, comp_type, module):
+        """Empreinte peu coûteuse d'un module : nombre de lignes, déclarations et
+        procédures aux lignes échantillonnées, sans rapatrier le code"""
+        count = module.CountOfLines
+        declarations = module.CountOfDeclarationLines
+        samples = ()
+        if count > declarations:
+            samples = tuple(str(module.ProcOfLine(line, 0)) for line in {(declarations + count + 1) // 2, count})
+        return (comp_type, count, declarations, samples)
 
     def get_vba_components(self):
+        """Retourne {nom: {'type', 'hash', 'fingerprint'}} ; le code n'est lu
+        (clé 'code') que pour les composants dont l'empreinte a changé"""
         components = {}
+        now = self.clock()
+        self.verify_names = self.select_verification(now)
         try:
-            for comp in self.wb.VBProject.VBComponents:
+            with METRICS.timer('com.VBComponents'):
+                vb_components = list(self.wb.VBProject.VBComponents)
+            for comp in vb_components:
+                comp_type = comp.Type
                 # Ignorer les composants de type Worksheet (100) et ThisWorkbook (100)
-                if comp.Type == 100:
+                if comp_type == 100:
                     continue
-                    
-                count = comp.CodeModule.CountOfLines
-                code = ''
-                if count > 0:
-                    code = comp.CodeModule.Lines(1, count)
-                components[comp.Name] = {
-                    'type': comp.Type,
+
+                name = comp.Name
+                module = comp.CodeModule
+                with METRICS.timer('com.fingerprint'):
+                    fingerprint = self.component_fingerprint(comp_type, module)
+                previous = self.previous_components.get(name)
+                if previous and previous['fingerprint'] == fingerprint and name not in self.verify_names:
+                    components[name] = previous
+                    continue
+
+                # Composant suspect (ou vérification tournante) : lecture complète
+                count = fingerprint[1]
+                with METRICS.timer('com.CodeModule.Lines') as timer:
+                    code = module.Lines(1, count) if count > 0 else ''
+                    timer.bytes = len(code)
+                components[name] = {
+                    'type': comp_type,
+                    'hash': content_digest(code),
+                    'fingerprint': fingerprint,
                     'code': code
                 }
-                logging.info(f"Composant trouvé: {comp.Name} (Type: {comp.Type})")
+                self.verified[name] = now
+                logging.debug(f"Composant lu: {name} (Type: {comp_type})")
         except Exception as e:
             logging.error(f"Erreur VBA: {e}")
             raise
+        self.last_scan = now
+        for name in [name for name in self.verified if name not in components]:
+            del self.verified[name]
         return components
 
-    def export_component(self, component, comp_type):
+    def request_verification(self, wakeup):
+        """Enregistrement ou activation dans le VBE : le prochain scan relit tout"""
+        if any(reason in wakeup.reason.split(', ') for reason in FULL_VERIFY_REASONS):
+            self.verify_all = True
+
+    def select_verification(self, now):
+        """Une modification qui ne change ni le nombre de lignes ni les procédures
+        échappe à l'empreinte : à chaque cycle, les composants les moins
+        récemment vérifiés sont relus intégralement, assez pour que chacun le
+        soit au moins toutes les staleness secondes"""
+        names = list(self.previous_components)
+        if self.verify_all:
+            self.verify_all = False
+            return set(names)
+        if not names:
+            return set()
+        elapsed = self.staleness if self.last_scan is None else now - self.last_scan
+        count = math.ceil(len(names) * min(elapsed, self.staleness) / self.staleness)
+        oldest = sorted(names, key=lambda name: self.verified.get(name, -math.inf))
+        overdue = {name for name in names if now - self.verified.get(name, -math.inf) >= self.staleness}
+        return set(oldest[:count]) | overdue
+
+    def component_files(self, name, comp_type):
+        """Fichiers produits par l'export d'un composant (le .frx accompagne le .frm)"""
+        extensions = {1: ['.bas'], 2: ['.cls'], 3: ['.frm', '.frx']}
+        return [f"{name}{ext}" for ext in extensions.get(comp_type, [])]
+
+    def export_component(self, component, comp_type, source=None):
         extensions = {1: '.bas', 2: '.cls', 3: '.frm'}
         if comp_type in extensions:
-            file_path = os.path.join(self.export_path, f"{component.Name}{extensions[comp_type]}")
+            name = component.Name
+            file_path = os.path.join(self.export_path, f"{name}{extensions[comp_type]}")
             try:
-                component.Export(file_path)
-                logging.info(f"Composant exporté: {file_path}")
+                if self.writer.export_component(component, self.component_files(name, comp_type), source):
+                    logging.info(f"Composant exporté: {file_path}")
+                return True
             except Exception as e:
-                logging.error(f"Erreur export {component.Name}: {e}")
+                logging.error(f"Erreur export {name}: {e}")
+        return False
 
     def save_components_from_cache(self):
-        """Sauvegarde les composants depuis le cache en fichiers texte"""
-        for name, data in self.last_known_components.items():
+        """Sauvegarde en fichiers texte les composants dont l'export a échoué.
+        Le cache ne garde que des empreintes : le code n'est conservé que
+        pour ces composants-là, les autres sont déjà à jour sur disque."""
+        for name, data in self.unexported_components.items():
             file_ext = {1: '.bas', 2: '.cls', 3: '.frm'}.get(data['type'], '.txt')
             file_path = os.path.join(self.export_path, f"{name}{file_ext}")
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(data['code'])
-                logging.info(f"Composant sauvegardé depuis le cache: {file_path}")
+                if self.writer.write_text(f"{name}{file_ext}", data['code']):
+                    logging.info(f"Composant sauvegardé depuis le cache: {file_path}")
             except Exception as e:
                 logging.error(f"Erreur sauvegarde cache {name}: {e}")
-
-    def initialize_excel(self):
-        try:
-            self.excel = win32com.client.GetActiveObject("Excel.Application")
-            self.excel = win32com.client.Dispatch("Excel.Application")
-        except:
-            self.excel = win32com.client.Dispatch("Excel.Application")
-        self.excel.Visible = True
+        self.writer.flush()
 
     def cleanup(self):
-        if self.wb:
-            try:
-                self.wb.Close(False)
-                self.excel.Quit()
-            except:
-                pass
+        if self.session:
+            self.session.close()
+
+    def reattach(self, excel, wb):
+        """Connexion COM rétablie : nouveau proxy vers le même classeur"""
+        self.excel = excel
+        self.wb = wb
+        self.event_handlers = attach_excel_events(excel, wb, self.scheduler, self.excel_path)
 
     def handle_component_changes(self, current_components, force_export=False):
+        """Exporte les composants modifiés ; retourne True si quelque chose a changé"""
+        changed = False
         # Vérifier les modifications et suppressions
         for name, data in self.previous_components.items():
             if name not in current_components:
-                logging.info(f"Macro supprimée: {name}")
-                try:
-                    file_ext = {1: '.bas', 2: '.cls', 3: '.frm'}.get(data['type'], '.txt')
-                    file_path = os.path.join(self.export_path, f"{name}{file_ext}")
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        logging.info(f"Fichier supprimé: {file_path}")
-                        
-                        # Si c'est un UserForm, supprimer aussi le .frx
-                        if data['type'] == 3:  # Type 3 = UserForm
-                            frx_path = os.path.join(self.export_path, f"{name}.frx")
-                            if os.path.exists(frx_path):
-                                os.remove(frx_path)
-                                logging.info(f"Fichier .frx supprimé: {frx_path}")
-                except Exception as e:
-                    logging.error(f"Erreur lors de la suppression de {name}: {e}")
+                changed = True
+                self.remove_component(name, data)
 
         # Vérifier les modifications
         for name, data in current_components.items():
-            if force_export or (name not in self.previous_components or 
-                self.previous_components[name]['code'] != data['code']):
-                logging.info(f"Modification détectée pour {name}")
-                comp = self.wb.VBProject.VBComponents(name)
-                self.export_component(comp, data['type'])
+            if force_export or (name not in self.previous_components or
+                self.previous_components[name]['hash'] != data['hash']):
+                changed = True
+                self.export_component_change(name, data)
+        self.writer.flush()
+        return changed
 
-        # Vérifier les modifications
+    def remove_component(self, name, data):
+        logging.info(f"Macro supprimée: {name}")
+        self.unexported_components.pop(name, None)
+        try:
+            # Si c'est un UserForm, le .frx est supprimé avec le .frm
+            for rel in self.component_files(name, data['type']):
+                self.writer.remove(rel)
+        except Exception as e:
+            logging.error(f"Erreur lors de la suppression de {name}: {e}")
+
+    def export_component_change(self, name, data):
+        if self.origins.is_echo(component_key(name), data['hash'], EXCEL):
+            # Importé depuis le dossier surveillé : le fichier est déjà la source
+            logging.info(f"Import local de {name}, pas de réexport")
+            for rel in self.component_files(name, data['type']):
+                if os.path.exists(self.manifest.full_path(rel)):
+                    self.manifest.record(rel, data['hash'])
+            return
+        logging.info(f"Modification détectée pour {name}")
+        self.export_changed_component(name, data)
+
+    def export_changed_component(self, name, data):
+        comp = self.wb.VBProject.VBComponents(name)
+        if self.export_component(comp, data['type'], data['hash']):
+            self.unexported_components.pop(name, None)
+        elif 'code' in data:
+            self.unexported_components[name] = {'type': data['type'], 'code': data['code']}
+
+    def forget_code(self, components):
+        """Ne garde en mémoire que les empreintes des composants"""
+        return {name: {key: value for key, value in data.items() if key != 'code'}
+                for name, data in components.items()}
+
+    def reconcile_exports(self, current_components):
+        """Aligne les exports existants sur le manifeste au lieu de tout réexporter"""
+        expected = {}
         for name, data in current_components.items():
-            if (name not in self.previous_components or 
-                self.previous_components[name]['code'] != data['code']):
-                logging.info(f"Modification détectée pour {name}")
-                comp = self.wb.VBProject.VBComponents(name)
-                self.export_component(comp, data['type'])
-
-    def cleanup_old_files(self):
-        """Supprime tous les fichiers de surveillance précédents"""
-        for file in os.listdir(self.export_path):
-            # Ne garder que les fichiers .bas, .cls, .frm et .frx
-            if file.endswith(('.txt', '.frm', '.frx')):
-                try:
-                    os.remove(os.path.join(self.export_path, file))
-                    logging.info(f"Ancien fichier supprimé: {file}")
-                except Exception as e:
-                    logging.error(f"Erreur suppression {file}: {e}")
+            for rel in self.component_files(name, data['type']):
+                expected[rel] = data['hash']
+        to_write = self.manifest.reconcile(expected, ('.bas', '.cls', '.frm', '.frx', '.txt'))
+        exported = 0
+        for name, data in current_components.items():
+            if any(rel in to_write for rel in self.component_files(name, data['type'])):
+                self.export_changed_component(name, data)
+                exported += 1
+        logging.info(f"Exports VBA réconciliés: {exported} composant(s) réexporté(s)")
+        self.writer.flush()
+
+    def start_session(self):
+        """Reprise à chaud : seuls les composants différents du manifeste sont réexportés"""
+        with self.origins.apply_lock:
+            current_components = self.get_vba_components()
+            self.reconcile_exports(current_components)
+            self.previous_components = self.last_known_components = self.forget_code(current_components)
+        self.opened.set()
+
+    def poll(self):
+        """Un cycle de scan et d'export ; lève une exception si le classeur est fermé"""
+        with self.origins.apply_lock, METRICS.cycle('cycle.vba'):
+            _ = self.wb.Name
+            current_components = self.get_vba_components()
+            changed = self.handle_component_changes(current_components)
+            self.previous_components = self.last_known_components = self.forget_code(current_components)
+        return changed
 
+    def monitor(self):
+        self.session = COMSession(self.excel_path)
+        self.session.on_reattach.append(self.reattach)
         try:
-            self.initialize_excel()
+            self.wb = self.session.open()
+            self.excel = self.session.excel
             logging.info(f"Surveillance du fichier: {self.excel_path}")
+            self.event_handlers = attach_excel_events(self.excel, self.wb, self.scheduler, self.excel_path)
+            if self.committer:
+                self.committer.start()
             
-            self.wb = self.excel.Workbooks.Open(self.excel_path)
-            logging.info("Fichier Excel ouvert avec succès")
-            
-            # Force l'export initial de tous les composants
-            current_components = self.get_vba_components()
-            self.last_known_components = current_components.copy()
-            self.handle_component_changes(current_components, force_export=True)
-            self.previous_components = current_components
+            self.start_session()
             
             while True:
+                wakeup = self.scheduler.wait()
+                if not wakeup.wants(VBA):
+                    continue
+                self.request_verification(wakeup)
                 try:
-                    # Vérifier si le workbook est encore ouvert
-                    try:
-                        _ = self.wb.Name
-                        current_components = self.get_vba_components()
-                        self.last_known_components = current_components.copy()
-                    except:
-                        logging.info("Excel fermé par l'utilisateur - Sauvegarde depuis le cache...")
-                        self.save_components_from_cache()
-                        sys.exit(0)
-                    
-                    self.handle_component_changes(current_components)
-                    self.previous_components = current_components
-                    time.sleep(10)
-                    
+                    changed = self.session.call(self.poll)
+                except WorkbookClosed:
+                    logging.info("Excel fermé par l'utilisateur - Sauvegarde depuis le cache...")
+                    self.save_components_from_cache()
+                    sys.exit(0)
+                except CircuitOpen as e:
+                    logging.info(f"{e}")
+                    time.sleep(self.session.breaker.remaining())
+                    continue
                 except Exception as e:
-                    if str(e).find("RPC_E_CALL_REJECTED") >= 0:
-                        logging.info("Excel fermé - Sauvegarde depuis le cache...")
-                        self.save_components_from_cache()
-                        sys.exit(0)
+                    # Erreur passagère ou inattendue : la session continue, le disjoncteur limite les essais
                     logging.error(f"Erreur pendant la surveillance: {e}")
-                    sys.exit(1)
+                    changed = False
+                self.scheduler.record_activity(changed)
                     
         except Exception as e:
             logging.error(f"Erreur lors de l'ouverture du fichier: {e}")
             sys.exit(1)
         finally:
+            if self.committer:
+                self.committer.stop()
             self.cleanup()
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python script.py chemin_vers_fichier.xlsm")
+    if len(sys.argv) not in (2, 3) or (len(sys.argv) == 3 and sys.argv[2] != '--git'):
+        print("Usage: python script.py chemin_vers_fichier.xlsm [--git]")
         sys.exit(1)
         
-    monitor = ExcelVBAMonitor(sys.argv[1])
+    committer = None
+    if '--git' in sys.argv:
+        from git_committer import GitCommitter
+        committer = GitCommitter(os.path.dirname(os.path.abspath(sys.argv[1])))
+    monitor = ExcelVBAMonitor(sys.argv[1], committer=committer)
     monitor.monitor()
\ No newline at end of file
@@ -0,0 +1,471 @@
+import os
+import sys
+import json
+import zlib
+import time
+import queue
+import bisect
+import struct
+import difflib
+import logging
+import threading
+from datetime import datetime
+
+from export_manifest import content_digest
+
+# Historique local de toutes les révisions exportées, entre deux commits git :
+# chaque contenu distinct est stocké une seule fois sous son empreinte
+# (objects/ab/cdef...), compressé en entier ou en delta de lignes par rapport
+# à la révision précédente du même fichier, et un index en ajout seul
+# (index.jsonl) retient (horodatage, artefact, empreinte). Le magasin peut
+# être partagé par plusieurs classeurs : un contenu identique n'est stocké
+# qu'une fois. Il reçoit les chemins de ExportWriter comme GitCommitter.
+#
+#     python version_store.py dossier_versions log [fichier]
+#     python version_store.py dossier_versions show fichier [date]
+#     python version_store.py dossier_versions restore fichier [empreinte|date]
+#     python version_store.py dossier_versions compact
+
+INDEX_NAME = 'index.jsonl'
+OBJECTS_DIR = 'objects'
+
+FULL = b'F'
+DELTA = b'D'
+COPY = b'C'
+INSERT = b'I'
+
+
+def make_delta(base, data):
+    """Delta de lignes : copies de plages de base et insertions"""
+    base_lines = base.splitlines(keepends=True)
+    lines = data.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    parts = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            parts.append(COPY + struct.pack('>II', i1, i2))
+        elif j2 > j1:
+            inserted = b''.join(lines[j1:j2])
+            parts.append(INSERT + struct.pack('>I', len(inserted)) + inserted)
+    return b''.join(parts)
+
+
+def apply_delta(base, delta):
+    base_lines = base.splitlines(keepends=True)
+    out = []
+    position = 0
+    while position < len(delta):
+        op = delta[position:position + 1]
+        if op == COPY:
+            i1, i2 = struct.unpack_from('>II', delta, position + 1)
+            out.extend(base_lines[i1:i2])
+            position += 9
+        else:
+            size, = struct.unpack_from('>I', delta, position + 1)
+            out.append(delta[position + 5:position + 5 + size])
+            position += 5 + size
+    return b''.join(out)
+
+
+def parse_when(value):
+    """Horodatage depuis un nombre (epoch) ou une date ISO"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class VersionStore:
+    def __init__(self, root, max_chain=20, keep_all_days=7, keep_days=90, compact_every=5000):
+        """max_chain : longueur maximale d'une chaîne de deltas (coût de lecture) ;
+        la compaction garde toutes les révisions de moins de keep_all_days jours,
+        puis une par jour jusqu'à keep_days jours, et toujours la dernière"""
+        self.root = os.path.abspath(root)
+        self.objects_path = os.path.join(self.root, OBJECTS_DIR)
+        self.index_path = os.path.join(self.root, INDEX_NAME)
+        self.max_chain = max_chain
+        self.keep_all_days = keep_all_days
+        self.keep_days = keep_days
+        self.compact_every = compact_every
+        os.makedirs(self.objects_path, exist_ok=True)
+        # artefact -> [(horodatage, empreinte ou None si supprimé)], par date
+        self.history = {}
+        self.records = 0
+        self.depths = {}
+        self._cache = {}
+        self._lock = threading.RLock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self.stored = 0
+        self.deduplicated = 0
+        self.load()
+
+    def load(self):
+        self.history = {}
+        self.records = 0
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Dernière ligne incomplète (arrêt brutal)
+                        continue
+                    self._remember(entry['ts'], entry['artifact'], entry['hash'])
+        except FileNotFoundError:
+            pass
+        return self
+
+    def _remember(self, ts, artifact, digest):
+        revisions = self.history.setdefault(artifact, [])
+        if revisions and revisions[-1][0] > ts:
+            # Ligne écrite en retard par un autre processus
+            revisions.insert(bisect.bisect_right([t for t, _ in revisions], ts), (ts, digest))
+        else:
+            revisions.append((ts, digest))
+        self.records += 1
+
+    def artifact(self, path):
+        return os.path.abspath(path).replace(os.sep, '/')
+
+    def latest(self, artifact):
+        revisions = self.history.get(artifact)
+        return revisions[-1][1] if revisions else None
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_path, digest[:2], digest[2:])
+
+    def has(self, digest):
+        return os.path.exists(self.object_path(digest))
+
+    def _write_object(self, digest, payload):
+        path = self.object_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def _read_object(self, digest):
+        with open(self.object_path(digest), 'rb') as f:
+            return f.read()
+
+    def base_of(self, digest):
+        payload = self._read_object(digest)
+        return payload[1:41].decode('ascii') if payload[:1] == DELTA else None
+
+    def depth(self, digest):
+        """Longueur de la chaîne de deltas menant à digest"""
+        if digest not in self.depths:
+            base = self.base_of(digest)
+            self.depths[digest] = self.depth(base) + 1 if base else 0
+        return self.depths[digest]
+
+    def _chain(self, digest):
+        chain = []
+        while digest:
+            chain.append(digest)
+            digest = self.base_of(digest)
+        return chain
+
+    def _store(self, digest, data, base):
+        """Écrit l'objet, en delta de base si c'est plus petit et si la chaîne le permet"""
+        payload = FULL + zlib.compress(data)
+        depth = 0
+        if base and base != digest and self.has(base) and self.depth(base) < self.max_chain:
+            delta = DELTA + base.encode('ascii') + zlib.compress(make_delta(self.read(base), data))
+            if len(delta) < len(payload):
+                payload = delta
+                depth = self.depth(base) + 1
+        self._write_object(digest, payload)
+        self.depths[digest] = depth
+
+    def put(self, data, base=None):
+        """Stocke data une seule fois, en delta de base si possible"""
+        digest = content_digest(data)
+        with self._lock:
+            if self.has(digest):
+                self.deduplicated += 1
+                return digest
+            self._store(digest, data, base)
+            self.stored += 1
+            return digest
+
+    def read(self, digest):
+        with self._lock:
+            if digest in self._cache:
+                return self._cache[digest]
+            payload = self._read_object(digest)
+            if payload[:1] == DELTA:
+                data = apply_delta(self.read(payload[1:41].decode('ascii')), zlib.decompress(payload[41:]))
+            else:
+                data = zlib.decompress(payload[1:])
+            if len(self._cache) > 64:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[digest] = data
+            return data
+
+    def record(self, artifact, data, ts=None):
+        """Nouvelle révision (data None : fichier supprimé) ; None si identique à la précédente"""
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            previous = self.latest(artifact)
+            digest = self.put(data, previous) if data is not None else None
+            if digest == previous:
+                return None
+            entry = {'ts': ts, 'artifact': artifact, 'hash': digest}
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._remember(ts, artifact, digest)
+            return digest
+
+    def submit(self, written=(), removed=()):
+        """Appelé par ExportWriter.flush() : le contenu est lu tout de suite
+        (il peut changer avant le traitement), compressé par le thread"""
+        ts = time.time()
+        for path in written:
+            try:
+                with open(path, 'rb') as f:
+                    self._queue.put((ts, self.artifact(path), f.read()))
+            except OSError as e:
+                logging.error(f"Révision non lue {path}: {e}")
+        for path in removed:
+            self._queue.put((ts, self.artifact(path), None))
+
+    def start(self):
+        # Peut être partagé par plusieurs classeurs : un seul thread
+        if self._thread:
+            return self
+        self._thread = threading.Thread(target=self._run, name='version-store', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Arrête le thread après avoir enregistré ce qui est en attente"""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        since_compaction = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                if self.record(item[1], item[2], item[0]):
+                    since_compaction += 1
+                if self.compact_every and since_compaction >= self.compact_every:
+                    self.compact()
+                    since_compaction = 0
+            except Exception as e:
+                logging.error(f"Erreur d'enregistrement de révision {item[1]}: {e}")
+
+    def find(self, name):
+        """Artefact désigné par son chemin complet, ou par la fin de son chemin"""
+        name = name.replace(os.sep, '/')
+        if name in self.history:
+            return name
+        absolute = self.artifact(name)
+        if absolute in self.history:
+            return absolute
+        matches = [artifact for artifact in self.history if artifact.endswith('/' + name)]
+        if len(matches) != 1:
+            raise KeyError(f"{name}: {len(matches)} artefact(s) correspondant(s)")
+        return matches[0]
+
+    def versions(self, artifact):
+        return list(self.history.get(artifact, []))
+
+    def revision_at(self, artifact, when):
+        """Empreinte de la révision en vigueur à la date when (None si absente ou supprimée)"""
+        revisions = self.history.get(artifact, [])
+        position = bisect.bisect_right([ts for ts, _ in revisions], parse_when(when))
+        return revisions[position - 1][1] if position else None
+
+    def at(self, artifact, when):
+        digest = self.revision_at(artifact, when)
+        return self.read(digest) if digest else None
+
+    def restore(self, artifact, revision=None, target=None):
+        """Réécrit le fichier (ou target) avec une révision : empreinte, date,
+        ou la dernière révision par défaut ; retourne l'empreinte restaurée"""
+        known = {digest for _, digest in self.history.get(artifact, []) if digest}
+        prefixed = [digest for digest in known if isinstance(revision, str) and digest.startswith(revision)]
+        if revision is None:
+            digest = self.latest(artifact)
+        elif len(prefixed) == 1:
+            digest = prefixed[0]
+        else:
+            digest = self.revision_at(artifact, revision)
+        if digest is None:
+            raise KeyError(f"Aucune révision de {artifact} pour {revision}")
+        target = target or artifact
+        tmp_path = target + '.restore'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.read(digest))
+        os.replace(tmp_path, target)
+        logging.info(f"Restauré: {target} ({digest[:8]})")
+        return digest
+
+    def retained(self, now=None):
+        """Révisions conservées : récentes, puis une par jour, toujours la dernière"""
+        now = time.time() if now is None else now
+        keep_all = now - self.keep_all_days * 86400
+        keep_any = now - self.keep_days * 86400
+        kept = {}
+        for artifact, revisions in self.history.items():
+            days = {}
+            for ts, digest in revisions:
+                if ts < keep_any:
+                    continue
+                if ts < keep_all:
+                    # Dernière révision de chaque jour
+                    days[datetime.fromtimestamp(ts).date()] = (ts, digest)
+            recent = [(ts, digest) for ts, digest in revisions if ts >= keep_all]
+            selected = sorted(days.values()) + recent
+            if not selected or selected[-1] != revisions[-1]:
+                selected.append(revisions[-1])
+            if len(selected) == 1 and selected[0][1] is None and selected[0][0] < keep_any:
+                # Fichier supprimé depuis longtemps : on l'oublie
+                continue
+            kept[artifact] = selected
+        return kept
+
+    def compact(self, now=None):
+        """Élague l'index, recalcule les deltas dont la base disparaît contre
+        la révision conservée précédente, supprime les objets orphelins ;
+        retourne les octets libérés"""
+        with self._lock:
+            size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+            kept = self.retained(now)
+            live = {digest for revisions in kept.values() for _, digest in revisions if digest}
+            rebased = 0
+            done = set()
+            # Les profondeurs changent avec les nouvelles bases
+            self.depths = {}
+            for revisions in kept.values():
+                previous = None
+                for _, digest in revisions:
+                    if digest and digest not in done:
+                        done.add(digest)
+                        base = self.base_of(digest)
+                        if base and base not in live:
+                            data = self.read(digest)
+                            # Jamais de base qui dépend elle-même de digest
+                            if previous and digest in self._chain(previous):
+                                previous = None
+                            self._store(digest, data, previous)
+                            rebased += 1
+                    previous = digest or previous
+            # Une nouvelle base peut allonger les chaînes qui passent par elle
+            self.depths = {}
+            for digest in sorted(live):
+                if self.depth(digest) > self.max_chain:
+                    self._write_object(digest, FULL + zlib.compress(self.read(digest)))
+                    self.depths = {}
+                    rebased += 1
+
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for artifact, revisions in kept.items():
+                    for ts, digest in revisions:
+                        f.write(json.dumps({'ts': ts, 'artifact': artifact, 'hash': digest}, ensure_ascii=False) + '\n')
+                # Lignes ajoutées par un autre processus pendant la compaction
+                try:
+                    with open(self.index_path, 'r', encoding='utf-8') as old:
+                        old.seek(size)
+                        tail = old.read()
+                    f.write(tail)
+                    for line in tail.splitlines():
+                        entry = json.loads(line)
+                        if entry['hash']:
+                            live.add(entry['hash'])
+                except FileNotFoundError:
+                    pass
+            os.replace(tmp_path, self.index_path)
+
+            freed = 0
+            removed = 0
+            for folder in os.listdir(self.objects_path):
+                folder_path = os.path.join(self.objects_path, folder)
+                for name in os.listdir(folder_path):
+                    if folder + name not in live:
+                        path = os.path.join(folder_path, name)
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+                        removed += 1
+            self._cache = {}
+            self.load()
+        logging.info(f"Historique compacté: {removed} objet(s) supprimé(s) ({freed} octets), {rebased} delta(s) réécrit(s)")
+        return freed
+
+    def disk_usage(self):
+        total = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        for folder, _, files in os.walk(self.objects_path):
+            total += sum(os.path.getsize(os.path.join(folder, name)) for name in files)
+        return total
+
+
+class ChangeSinks:
+    """Plusieurs destinataires des changements d'ExportWriter (GitCommitter,
+    VersionStore) derrière l'interface submit/start/stop d'un seul"""
+
+    def __init__(self, *sinks):
+        self.sinks = [sink for sink in sinks if sink is not None]
+
+    def submit(self, written=(), removed=()):
+        for sink in self.sinks:
+            sink.submit(written, removed)
+
+    def start(self):
+        for sink in self.sinks:
+            sink.start()
+        return self
+
+    def stop(self, timeout=None):
+        for sink in self.sinks:
+            sink.stop(timeout)
+
+
+def combine_sinks(*sinks):
+    """None, le destinataire seul, ou un ChangeSinks"""
+    sinks = [sink for sink in sinks if sink is not None]
+    if len(sinks) <= 1:
+        return sinks[0] if sinks else None
+    return ChangeSinks(*sinks)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    if len(sys.argv) < 3 or sys.argv[2] not in ('log', 'show', 'restore', 'compact'):
+        print("Usage: python version_store.py dossier_versions log [fichier] | show fichier [date] | "
+              "restore fichier [empreinte|date] | compact")
+        sys.exit(1)
+
+    store = VersionStore(sys.argv[1])
+    command, args = sys.argv[2], sys.argv[3:]
+    if command == 'log':
+        artifacts = [store.find(args[0])] if args else sorted(store.history)
+        for artifact in artifacts:
+            print(artifact)
+            for ts, digest in store.versions(artifact):
+                print(f"  {datetime.fromtimestamp(ts).isoformat(timespec='seconds')}  {digest or 'supprimé'}")
+    elif command == 'show':
+        artifact = store.find(args[0])
+        data = store.at(artifact, args[1]) if len(args) > 1 else store.read(store.latest(artifact))
+        if data is None:
+            print("Aucune révision à cette date")
+            sys.exit(1)
+        sys.stdout.buffer.write(data)
+    elif command == 'restore':
+        store.restore(store.find(args[0]), args[1] if len(args) > 1 else None)
+    else:
+        before = store.disk_usage()
+        store.compact()
+        print(f"{before} -> {store.disk_usage()} octets")
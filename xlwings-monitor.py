@@ -3,10 +3,15 @@ import os
 import sys
 import time
 import logging
+import threading
 import pythoncom
 import win32com.client
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from import_queue import DebouncedImportQueue
+from log_setup import configure_logging
+from vba_importer import VBAPatcher
+from com_session import Backoff, is_transient, register_message_filter, running_workbook
 
 class XLWingsMonitor:
     def __init__(self, excel_path, watch_folder):
@@ -15,17 +20,32 @@ class XLWingsMonitor:
         self.watch_folder = os.path.abspath(watch_folder)
         self.app = None
         self.wb = None
+        # Instance créée par le moniteur (à quitter en fin de session)
+        self.own_app = False
         self.setup_logging()
+        self.max_retries = 5
+        self.backoff = Backoff(base=0.5)
+        self.patcher = VBAPatcher()
+        # À partir de ce nombre de fichiers, import transactionnel avec Excel suspendu
+        self.bulk_threshold = 5
+        # Les objets xlwings (self.app, self.wb) sont créés et utilisés
+        # uniquement sur le thread de la file (appartement COM de ce thread)
+        self.ready = threading.Event()
+        self.queue = DebouncedImportQueue(
+            self.import_batch,
+            thread_init=self.init_com_thread,
+            thread_exit=self.cleanup
+        )
 
     def setup_logging(self):
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('xlwings_monitor.log'),
-                logging.StreamHandler()
-            ]
-        )
+        configure_logging('xlwings_monitor.log', level=logging.DEBUG,
+                          console_format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def init_com_thread(self):
+        pythoncom.CoInitialize()
+        register_message_filter()
+        self.initialize_excel()
+        self.ready.set()
 
     def is_excel_running(self):
         try:
@@ -34,15 +54,26 @@ class XLWingsMonitor:
         except:
             return False
 
+    def workbook_still_open(self):
+        """Depuis le thread principal, par la ROT, sans toucher aux objets
+        xlwings du thread d'import ; faux seulement si la ROT confirme la fermeture"""
+        try:
+            return running_workbook(self.excel_path) is not None
+        except Exception:
+            return True
+
     def is_workbook_open(self):
+        """Thread d'import uniquement"""
         try:
             if not self.app:
                 return False
             # Test app connection first
             try:
                 _ = self.app.pid
-                _ = self.app.api.ActiveWindow  # Add this line
-            except:
+            except Exception as e:
+                # Excel occupé (édition de cellule, dialogue) : toujours ouvert
+                if is_transient(e):
+                    return True
                 self.app = None
                 return False
                 
@@ -55,13 +86,27 @@ class XLWingsMonitor:
         except:
             return False
 
+    def find_open_book(self):
+        """Classeur déjà ouvert dans une instance Excel existante"""
+        for app in xw.apps:
+            for book in app.books:
+                if os.path.normcase(os.path.abspath(book.fullname)) == os.path.normcase(self.excel_path):
+                    return app, book
+        return None, None
+
     def initialize_excel(self):
         try:
             logging.debug("Début initialisation Excel...")
-            pythoncom.CoInitialize()
-            
-            # Force création d'une nouvelle instance
+
+            # Rattachement au classeur s'il est déjà ouvert, plutôt que de le rouvrir
+            self.app, self.wb = self.find_open_book()
+            if self.wb:
+                logging.info("Rattaché au classeur déjà ouvert")
+                return
+
+            # Sinon création d'une nouvelle instance
             self.app = xw.App(visible=True)
+            self.own_app = True
             if not self.app:
                 raise Exception("Impossible de créer une instance Excel")
                 
@@ -80,46 +125,76 @@ class XLWingsMonitor:
             raise
 
     def cleanup(self):
+        """Fin du thread d'import : les objets xlwings y sont libérés"""
         try:
-            if self.wb:
+            if self.own_app and self.wb:
                 self.wb.save()
-            if self.app:
+            if self.app and self.own_app:
                 self.app.quit()
         except Exception as e:
             logging.error(f"Erreur cleanup: {str(e)}")
         finally:
+            self.app = None
+            self.wb = None
             pythoncom.CoUninitialize()
 
     def import_vba_component(self, file_path):
-        max_retries = 3
-        for attempt in range(max_retries):
+        for attempt in range(self.max_retries):
             try:
                 if not self.is_workbook_open():
                     self.initialize_excel()
-                    
-                vba = self.wb.api.VBProject
-                # Rest of import logic...
-                return True
-                
+
+                # Patch par hunks dans le CodeModule, Remove + Import si nécessaire
+                if self.patcher.apply(self.wb.api, file_path):
+                    return True
+                error = "import refusé"
             except Exception as e:
-                logging.error(f"Attempt {attempt + 1} failed: {str(e)}")
-                time.sleep(1)
-                
-        logging.error(f"Failed to import {file_path} after {max_retries} attempts")
+                error = str(e)
+            # Délai exponentiel à gigue : pas de rafale synchronisée contre un Excel occupé
+            delay = self.backoff.delay(attempt)
+            logging.error(f"Attempt {attempt + 1} failed: {error} - retry in {delay:.2f}s")
+            time.sleep(delay)
+
+        logging.error(f"Failed to import {file_path} after {self.max_retries} attempts")
+        return False
+
+    def import_batch(self, file_paths):
+        """Importe en une passe les fichiers prêts ; retourne ceux importés"""
+        logging.info(f"Import groupé de {len(file_paths)} fichier(s)")
+        if len(file_paths) >= self.bulk_threshold:
+            try:
+                if not self.is_workbook_open():
+                    self.initialize_excel()
+                return self.patcher.apply_batch(self.wb.api, file_paths, self.app.api)
+            except Exception as e:
+                logging.error(f"Erreur lors de l'import groupé: {e}")
+                return []
+        return [path for path in file_paths if self.import_vba_component(path)]
 
     def start_monitoring(self):
         try:
-            self.initialize_excel()
             logging.info(f"Surveillance du dossier: {self.watch_folder}")
-            
+
+            watched_files = [
+                os.path.join(self.watch_folder, file) for file in os.listdir(self.watch_folder)
+                if file.lower().endswith(('.bas', '.cls', '.frm'))
+            ]
+            self.queue.prime(watched_files)
+            self.patcher.prime(watched_files)
+            # Excel est ouvert par le thread de la file, qui fera tous les appels COM
+            self.queue.start()
+            while not self.ready.wait(0.5):
+                if not self.queue.is_alive():
+                    raise Exception("Excel n'a pas pu être initialisé")
+
             event_handler = VBAFileHandler(self)
             observer = Observer()
             observer.schedule(event_handler, self.watch_folder, recursive=False)
             observer.start()
             
             try:
-                while True:
-                    if not self.is_workbook_open():
+                while self.queue.is_alive():
+                    if not self.workbook_still_open():
                         logging.info("Excel fermé - Arrêt")
                         break
                     time.sleep(1)
@@ -132,7 +207,8 @@ class XLWingsMonitor:
         except Exception as e:
             logging.error(f"Erreur générale: {str(e)}")
         finally:
-            self.cleanup()
+            self.queue.stop()
+            pythoncom.CoUninitialize()
 
 class VBAFileHandler(FileSystemEventHandler):
     def __init__(self, monitor):
@@ -141,13 +217,20 @@ class VBAFileHandler(FileSystemEventHandler):
     def on_modified(self, event):
         if event.is_directory:
             return
-        file_path = event.src_path
+        self.submit(event.src_path)
+
+    def submit(self, file_path):
         if file_path.lower().endswith(('.bas', '.cls', '.frm')):
-            self.monitor.import_vba_component(file_path)
+            self.monitor.queue.submit(file_path)
             
     def on_created(self, event):
         self.on_modified(event)
 
+    def on_moved(self, event):
+        # Enregistrement atomique des éditeurs : fichier temporaire renommé
+        if not event.is_directory:
+            self.submit(event.dest_path)
+
 if __name__ == "__main__":
     if len(sys.argv) != 3:
         print("Usage: python script.py chemin_excel dossier_surveillance")